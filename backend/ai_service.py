@@ -1,18 +1,64 @@
+import hashlib
+import json
 import os
 import pickle
 import pandas as pd
 import numpy as np
 import faiss
 import re
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
+from hashed_tfidf import HashedTfidf
+from gazetteer import COUNTRY_ALIASES, CURATED_CITIES, get_gazetteer
+from near_duplicates import compact_corpus, compaction_enabled, compaction_settings
+from quantization import faiss_index, faiss_quantizer
+
+def corpus_fingerprint(df):
+    """Content hash of the questions and responses a knowledge base was built from."""
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df[['question', 'response']], index=False).values.tobytes())
+    return digest.hexdigest()[:16]
+
 
 class TravelAIService:
-    def __init__(self):
+    # Keywords that show an answer matches the detected question type
+    ANSWER_TYPE_KEYWORDS = {
+        'where': ['location', 'place', 'destination', 'visit', 'go', 'see'],
+        'what': ['attraction', 'activity', 'thing', 'experience', 'sight'],
+        'when': ['time', 'season', 'month', 'weather', 'best time'],
+        'how': ['way', 'method', 'get', 'travel', 'reach', 'arrive'],
+        'cost': ['cost', 'price', 'expensive', 'cheap', 'budget', 'dollar'],
+        'food': ['food', 'restaurant', 'cuisine', 'dish', 'eat', 'dining'],
+        'recommendation': ['recommend', 'best', 'top', 'must', 'popular', 'famous']
+    }
+    
+    def __init__(self, corpus=None, model_dir=None, quantizer=None):
         self.vectorizer = None
         self.index = None
         self.df = None
-        self.model_dir = os.path.join(os.path.dirname(__file__), "travel_qa_model")
+        # Optional already-parsed dataset (see chat_engines.load_corpus)
+        self.corpus = corpus
+        # 'tfidf' (fitted vocabulary) or 'hashing' (fit-free HashedTfidf with persisted idf)
+        self.vectorizer_mode = os.getenv("AI_VECTORIZER", "tfidf").lower()
+        # Query variants searched per question: 1 = cleaned query only,
+        # 2 = plus the joined synonym expansion, 3+ = plus single expansions
+        self.query_variants = max(1, int(os.getenv("AI_QUERY_VARIANTS", "2")))
+        # How the FAISS index stores vectors: 'none' (float32) or fp16 / sq8 /
+        # sq4 scalar or pq product quantization (AI_FAISS_QUANTIZER, see quantization.py)
+        self.quantizer = faiss_quantizer(quantizer)
+        # Per-entry re-scoring features, built by build_rescoring_features()
+        self._entry_texts = None
+        self._entry_location_sets = None
+        self._token_ids = {}
+        self._entry_words = None
+        self._question_words = None
+        self._location_ids = {}
+        self._entry_locations = None
+        self._entry_type_counts = None
+        self._mention_cache = {}
+        # Where the vectorizer / FAISS index / knowledge base are saved and loaded
+        # (an empty directory forces a fresh build, e.g. for benchmarks)
+        self.model_dir = model_dir or os.path.join(os.path.dirname(__file__), "travel_qa_model")
         try:
             self.load_or_initialize()
         except Exception as e:
@@ -24,9 +70,21 @@ class TravelAIService:
         """Load existing model components or initialize from CSV"""
         os.makedirs(self.model_dir, exist_ok=True)
         
-        vectorizer_path = os.path.join(self.model_dir, "tfidf_vectorizer.pkl")
-        faiss_index_path = os.path.join(self.model_dir, "faiss_index.bin")
-        df_path = os.path.join(self.model_dir, "knowledge_base_df.csv")
+        # Each vectorizer mode keeps its own components, so switching modes
+        # never pairs a vectorizer with rows or an index built by the other
+        if self.vectorizer_mode == 'hashing':
+            vectorizer_path = os.path.join(self.model_dir, "hashed_tfidf.npz")
+            faiss_index_path = os.path.join(self.model_dir, "faiss_index_hashed.bin")
+            suffix = "_hashed"
+        else:
+            vectorizer_path = os.path.join(self.model_dir, "tfidf_vectorizer.pkl")
+            faiss_index_path = os.path.join(self.model_dir, "faiss_index.bin")
+            suffix = ""
+        if self.quantizer != 'none':
+            faiss_index_path = faiss_index_path.replace(".bin", f"_{self.quantizer}.bin")
+        df_path = os.path.join(self.model_dir, f"knowledge_base{suffix}.parquet")
+        # Settings the saved components were built with (see build_settings)
+        manifest_path = os.path.join(self.model_dir, f"knowledge_base{suffix}.json")
         # Try multiple possible paths for the CSV file
         possible_paths = [
             os.path.join(os.path.dirname(__file__), "travel_QA (1).csv"),
@@ -45,25 +103,62 @@ class TravelAIService:
         # Check if model components exist
         if (os.path.exists(vectorizer_path) and 
             os.path.exists(faiss_index_path) and 
-            os.path.exists(df_path)):
+            os.path.exists(df_path) and
+            self.saved_with_current_settings(manifest_path, faiss_index_path)):
             try:
                 print("Loading existing model components...")
                 self.load_components(vectorizer_path, faiss_index_path, df_path)
+                corpus = self.read_manifest(manifest_path)['corpus']
+                if self.index.ntotal != len(self.df) or corpus_fingerprint(self.df) != corpus:
+                    raise ValueError(f"{faiss_index_path} was not built over {df_path}")
                 print("Model components loaded successfully!")
                 return
             except Exception as e:
                 print(f"Error loading components: {e}. Reinitializing...")
         
         # Initialize from CSV
-        if csv_source and os.path.exists(csv_source):
+        if self.corpus is not None or (csv_source and os.path.exists(csv_source)):
             print("Initializing model from CSV...")
             self.initialize_from_csv(csv_source)
-            self.save_components(vectorizer_path, faiss_index_path, df_path)
+            self.save_components(vectorizer_path, faiss_index_path, df_path, manifest_path)
             print("Model initialized and saved!")
         else:
             print(f"Warning: CSV file not found")
             print("AI chat will not work until the dataset is available.")
     
+    def build_settings(self):
+        """Settings that change the saved components (vectorizer mode and corpus compaction)."""
+        return {'vectorizer': self.vectorizer_mode, **compaction_settings()}
+    
+    def read_manifest(self, manifest_path):
+        """The manifest written by save_components ({} if missing or unreadable)."""
+        if not os.path.exists(manifest_path):
+            return {}
+        try:
+            with open(manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading {manifest_path}: {e}")
+            return {}
+    
+    def saved_with_current_settings(self, manifest_path, faiss_index_path):
+        """
+        True if the saved components were built with build_settings() and the
+        FAISS index file was built over the saved knowledge base (rebuilt otherwise).
+        """
+        manifest = self.read_manifest(manifest_path)
+        saved = manifest.get('settings')
+        if saved != self.build_settings():
+            print(f"Model components were built with {saved}, current settings are {self.build_settings()}; rebuilding...")
+            return False
+        # Each quantized index file is saved by its own runs; it only matches
+        # the parquet if it was written over the same corpus
+        index_name = os.path.basename(faiss_index_path)
+        if manifest.get('indexes', {}).get(index_name) != manifest.get('corpus'):
+            print(f"{index_name} was built over a different knowledge base; rebuilding...")
+            return False
+        return True
+    
     def classify_question_type(self, text):
         """Classify the type of question being asked"""
         text_lower = text.lower()
@@ -88,7 +183,7 @@ class TravelAIService:
         
         return detected_types if detected_types else ['general']
     
-    def expand_query_synonyms(self, text):
+    def expand_query_synonyms(self, text, return_list=False):
         """Expand query with synonyms and related terms"""
         synonyms = {
             'go': ['visit', 'travel', 'explore', 'see', 'tour'],
@@ -112,8 +207,23 @@ class TravelAIService:
                     if expanded_text != text_lower:
                         expanded_terms.append(expanded_text)
         
+        if return_list:
+            return expanded_terms
         return ' '.join(expanded_terms)
     
+    def build_query_variants(self, query_cleaned):
+        """Build the list of query texts to search, original query first"""
+        variants = [query_cleaned]
+        if self.query_variants > 1:
+            expanded_terms = self.expand_query_synonyms(query_cleaned, return_list=True)
+            candidates = [' '.join(expanded_terms)] + expanded_terms[1:]
+            for variant in candidates:
+                if len(variants) >= self.query_variants:
+                    break
+                if variant not in variants:
+                    variants.append(variant)
+        return variants
+    
     def preprocess_text(self, text):
         """Clean and preprocess text for better matching"""
         if pd.isna(text):
@@ -135,26 +245,8 @@ class TravelAIService:
     
     def extract_locations_from_text(self, text):
         """Extract potential location names from text"""
-        # Common location patterns
-        locations = set()
-        text_lower = text.lower()
-        
-        # Common countries and major cities (expanded list)
-        common_locations = [
-            'jamaica', 'japan', 'tokyo', 'osaka', 'kyoto', 'hokkaido', 'hakuba', 'niseko',
-            'australia', 'sydney', 'melbourne', 'brisbane', 'perth', 'adelaide',
-            'usa', 'united states', 'new york', 'los angeles', 'chicago', 'miami', 'san francisco',
-            'england', 'london', 'paris', 'france', 'italy', 'rome', 'venice', 'spain', 'madrid', 'barcelona',
-            'switzerland', 'zermatt', 'finland', 'lapland', 'norway', 'sweden',
-            'thailand', 'bangkok', 'singapore', 'malaysia', 'indonesia', 'bali', 'jakarta', 'yogyakarta', 'bali', 'sumatra', 'java',
-            'kingston', 'montego bay', 'negril', 'ocho rios', 'port antonio',
-            'aspen', 'colorado', 'lake tahoe', 'california', 'nevada',
-            'india', 'china', 'cambodia', 'myanmar', 'maldives', 'vietnam', 'philippines'
-        ]
-        
-        for loc in common_locations:
-            if loc in text_lower:
-                locations.add(loc)
+        # Known places (canonical names, so 'ubud' and 'bali' agree)
+        locations = {match.place.name for match in get_gazetteer().find(text)}
         
         # Extract capitalized words that might be locations
         capitalized = re.findall(r'\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)\b', text)
@@ -162,24 +254,16 @@ class TravelAIService:
             if len(cap.split()) <= 3:  # Likely a location name
                 locations.add(cap.lower())
         
-        # Also check for location names that appear multiple times (stronger signal)
-        words = text_lower.split()
-        word_counts = {}
-        for word in words:
-            word_counts[word] = word_counts.get(word, 0) + 1
-        
-        # If a location appears multiple times, it's definitely important
-        for loc in common_locations:
-            if word_counts.get(loc, 0) > 1:
-                locations.add(loc)
-        
         return locations
     
     def initialize_from_csv(self, csv_path):
         """Initialize the model from the CSV file with enhanced preprocessing"""
         print("Loading and preprocessing dataset...")
-        # Load CSV
-        df = pd.read_csv(csv_path)
+        # Load CSV (or reuse the shared corpus)
+        if self.corpus is not None:
+            df = self.corpus.copy()
+        else:
+            df = pd.read_csv(csv_path)
         
         # Standardize column names
         df.columns = [col.strip().lower().replace(' ', '_') for col in df.columns]
@@ -189,6 +273,10 @@ class TravelAIService:
         df = df.drop_duplicates()
         print(f"Removed {initial_count - len(df)} duplicate entries")
         
+        # Merge near-duplicate QA pairs too (see near_duplicates.py)
+        if compaction_enabled():
+            df, _ = compact_corpus(df)
+        
         # Clean and preprocess text
         print("Cleaning and preprocessing text...")
         df['question_cleaned'] = df['question'].apply(self.preprocess_text)
@@ -230,18 +318,32 @@ class TravelAIService:
         
         self.df = df
         
-        # Initialize and train TF-IDF Vectorizer with better parameters
-        print("Training enhanced TF-IDF Vectorizer...")
-        self.vectorizer = TfidfVectorizer(
-            max_features=10000,  # Limit vocabulary size for efficiency
-            ngram_range=(1, 3),  # Use unigrams, bigrams, and trigrams
-            min_df=2,  # Ignore terms that appear in less than 2 documents
-            max_df=0.95,  # Ignore terms that appear in more than 95% of documents
-            stop_words='english',  # Remove common English stop words
-            lowercase=True,
-            strip_accents='unicode',
-            analyzer='word'
-        )
+        if self.vectorizer_mode == 'hashing':
+            # Fit-free hashed features; only document frequencies are learned,
+            # so chunks can be hashed in parallel (INDEX_BUILD_WORKERS)
+            print("Building hashed TF-IDF features...")
+            self.vectorizer = HashedTfidf(
+                n_features=8192,  # Dense FAISS vectors, keep the dimension small
+                ngram_range=(1, 3),
+                min_df=2,
+                max_df=0.95,
+                stop_words='english',
+                lowercase=True,
+                strip_accents='unicode'
+            )
+        else:
+            # Initialize and train TF-IDF Vectorizer with better parameters
+            print("Training enhanced TF-IDF Vectorizer...")
+            self.vectorizer = TfidfVectorizer(
+                max_features=10000,  # Limit vocabulary size for efficiency
+                ngram_range=(1, 3),  # Use unigrams, bigrams, and trigrams
+                min_df=2,  # Ignore terms that appear in less than 2 documents
+                max_df=0.95,  # Ignore terms that appear in more than 95% of documents
+                stop_words='english',  # Remove common English stop words
+                lowercase=True,
+                strip_accents='unicode',
+                analyzer='word'
+            )
         
         text_embeddings = self.vectorizer.fit_transform(df['text_content']).toarray()
         print(f"Generated embeddings with shape: {text_embeddings.shape}")
@@ -249,56 +351,75 @@ class TravelAIService:
         # Create FAISS index
         print("Building FAISS index...")
         embedding_dimension = text_embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(embedding_dimension)
+        self.index = faiss_index('flat', embedding_dimension, faiss.METRIC_L2, self.quantizer)
         
         # Convert to float32 for FAISS
         text_embeddings = text_embeddings.astype('float32')
+        if not self.index.is_trained:
+            print(f"Training {self.quantizer} quantizer...")
+            self.index.train(text_embeddings)
         self.index.add(text_embeddings)
         
+        self.build_rescoring_features()
+        
         print(f"Model initialized with {len(df)} entries")
-        print(f"Vocabulary size: {len(self.vectorizer.vocabulary_)}")
+        if hasattr(self.vectorizer, 'vocabulary_'):
+            print(f"Vocabulary size: {len(self.vectorizer.vocabulary_)}")
+        else:
+            print(f"Hashed feature dimension: {self.vectorizer.n_features}")
     
     def load_components(self, vectorizer_path, faiss_index_path, df_path):
         """Load existing model components"""
-        with open(vectorizer_path, 'rb') as f:
-            self.vectorizer = pickle.load(f)
+        if vectorizer_path.endswith('.npz'):
+            self.vectorizer = HashedTfidf.load(vectorizer_path)
+        else:
+            with open(vectorizer_path, 'rb') as f:
+                self.vectorizer = pickle.load(f)
         
         self.index = faiss.read_index(faiss_index_path)
-        self.df = pd.read_csv(df_path)
+        self.df = pd.read_parquet(df_path)
         
-        # Ensure locations column is properly loaded
+        # List columns come back as arrays; turn them into sets once here so
+        # the query path can do plain membership checks
         if 'locations' in self.df.columns:
-            # Convert string representations back to sets
-            def parse_locations(loc_str):
-                if pd.isna(loc_str) or loc_str == '':
-                    return set()
-                if isinstance(loc_str, set):
-                    return loc_str
-                try:
-                    if loc_str.startswith('{'):
-                        return eval(loc_str)
-                    return set(loc_str.split(',')) if ',' in str(loc_str) else {str(loc_str)}
-                except:
-                    return set()
-            
-            self.df['locations'] = self.df['locations'].apply(parse_locations)
+            self.df['locations'] = [frozenset(locs) for locs in self.df['locations']]
         else:
             # Re-extract locations if not present
             print("Re-extracting locations from loaded data...")
             self.df['locations'] = self.df.apply(
-                lambda row: self.extract_locations_from_text(
+                lambda row: frozenset(self.extract_locations_from_text(
                     str(row.get('question', '')) + " " + str(row.get('response', ''))
-                ),
+                )),
                 axis=1
             )
+        
+        self.build_rescoring_features()
     
-    def save_components(self, vectorizer_path, faiss_index_path, df_path):
+    def save_components(self, vectorizer_path, faiss_index_path, df_path, manifest_path):
         """Save model components to disk"""
-        with open(vectorizer_path, 'wb') as f:
-            pickle.dump(self.vectorizer, f)
+        if isinstance(self.vectorizer, HashedTfidf):
+            self.vectorizer.save(vectorizer_path)
+        else:
+            with open(vectorizer_path, 'wb') as f:
+                pickle.dump(self.vectorizer, f)
         
         faiss.write_index(self.index, faiss_index_path)
-        self.df.to_csv(df_path, index=False)
+        
+        # Persist as Parquet with native list columns (no string round-trip)
+        df = self.df.copy()
+        for col in ('locations', 'question_types'):
+            if col in df.columns:
+                df[col] = [sorted(values) for values in df[col]]
+        df.to_parquet(df_path, index=False)
+        
+        # Index files saved earlier over the same corpus stay valid; any
+        # other index file is rebuilt the next time it is loaded
+        corpus = corpus_fingerprint(self.df)
+        manifest = self.read_manifest(manifest_path)
+        indexes = manifest.get('indexes', {}) if manifest.get('corpus') == corpus else {}
+        indexes[os.path.basename(faiss_index_path)] = corpus
+        with open(manifest_path, 'w') as f:
+            json.dump({'settings': self.build_settings(), 'corpus': corpus, 'indexes': indexes}, f, indent=1)
     
     def get_embeddings(self, texts):
         """Get embeddings for text(s)"""
@@ -310,6 +431,75 @@ class TravelAIService:
         
         return self.vectorizer.transform(texts).toarray().astype('float32')
     
+    def build_rescoring_features(self):
+        """Precompute per-entry features used to re-score FAISS candidates"""
+        df = self.df
+        question_texts = [str(q).lower() for q in df['question_cleaned']]
+        response_texts = [str(r).lower() for r in df['response_cleaned']]
+        self._entry_texts = np.array(
+            [q + " " + r for q, r in zip(question_texts, response_texts)], dtype=object
+        )
+        self._entry_location_sets = [locs or frozenset() for locs in df['locations']]
+        
+        # Binary word-presence matrices (same vocabulary for entry and question text)
+        word_counter = CountVectorizer(analyzer=str.split, binary=True, dtype=np.int32)
+        self._entry_words = word_counter.fit_transform(self._entry_texts).tocsr()
+        self._token_ids = word_counter.vocabulary_
+        question_counter = CountVectorizer(
+            analyzer=str.split, binary=True, dtype=np.int32, vocabulary=self._token_ids
+        )
+        self._question_words = question_counter.transform(question_texts).tocsr()
+        
+        # Entry x location membership matrix
+        self._location_ids = {}
+        rows, cols = [], []
+        for row_idx, locs in enumerate(self._entry_location_sets):
+            for loc in locs:
+                col = self._location_ids.setdefault(str(loc).lower(), len(self._location_ids))
+                rows.append(row_idx)
+                cols.append(col)
+        self._entry_locations = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+            shape=(len(df), max(len(self._location_ids), 1))
+        )
+        self._entry_location_counts = np.diff(self._entry_locations.indptr)
+        
+        # How many keywords of each answer type appear in each entry
+        texts = pd.Series(self._entry_texts)
+        self._answer_types = list(self.ANSWER_TYPE_KEYWORDS)
+        self._entry_type_counts = np.zeros((len(df), len(self._answer_types)), dtype=np.int32)
+        for col, q_type in enumerate(self._answer_types):
+            for keyword in self.ANSWER_TYPE_KEYWORDS[q_type]:
+                self._entry_type_counts[:, col] += texts.str.contains(keyword, regex=False).to_numpy()
+        
+        # Mentions of the curated destinations over all entries, computed
+        # once here and only read afterwards (safe to share between threads)
+        self._mention_cache = {
+            loc: self._find_mentions(loc) for loc in list(COUNTRY_ALIASES) + list(CURATED_CITIES)
+        }
+    
+    def _find_mentions(self, location, rows=None):
+        """Boolean array: which entries (all, or those at rows) mention a lowercase location"""
+        texts = self._entry_texts if rows is None else self._entry_texts[rows]
+        entry_locations = self._entry_locations if rows is None else self._entry_locations[rows]
+        mentions = np.fromiter((location in text for text in texts), dtype=bool, count=len(texts))
+        containing = [col for loc, col in self._location_ids.items() if location in loc]
+        if containing:
+            mentions |= entry_locations[:, containing].getnnz(axis=1) > 0
+        return mentions
+    
+    def location_mentions(self, location, rows):
+        """
+        Boolean array: which entries at rows mention a location in their text
+        or stored locations. Other places than the curated destinations are
+        only checked against those rows (no scan over the knowledge base).
+        """
+        location = location.lower()
+        mentions = self._mention_cache.get(location)
+        if mentions is not None:
+            return mentions[rows]
+        return self._find_mentions(location, rows)
+    
     def search_knowledge_base(self, query, k=3):
         """Search the knowledge base for similar entries"""
         if self.index is None or self.vectorizer is None or self.df is None:
@@ -326,6 +516,20 @@ class TravelAIService:
         
         return indices[0], distances[0]
     
+    def search_knowledge_base_batch(self, queries, k=3):
+        """Search several queries in one FAISS call; returns (indices, distances) with one row per query"""
+        if self.index is None or self.vectorizer is None or self.df is None:
+            return None, None
+        
+        query_embeddings = self.get_embeddings(list(queries))
+        
+        if query_embeddings is None:
+            return None, None
+        
+        distances, indices = self.index.search(query_embeddings, k)
+        
+        return indices, distances
+    
     def generate_answer(self, query, k=1):
         """Generate answer from knowledge base with enhanced matching"""
         if self.df is None:
@@ -339,150 +543,110 @@ class TravelAIService:
         query_lower = query_cleaned.lower()
         
         # Expand query with synonyms for better matching
-        expanded_query = self.expand_query_synonyms(query_cleaned)
+        query_variants = self.build_query_variants(query_cleaned)
         
         # Extract locations from query
         query_locations = self.extract_locations_from_text(query)
         
         # Search for similar entries - get many candidates
         num_candidates = min(k * 15, 100)  # Get more candidates for better matching
-        retrieved_indices, distances = self.search_knowledge_base(query_cleaned, num_candidates)
-        
-        # Also search with expanded query for better coverage
-        if expanded_query != query_cleaned:
-            expanded_indices, expanded_distances = self.search_knowledge_base(expanded_query, num_candidates // 2)
-            # Merge results, keeping unique indices
-            all_indices = list(retrieved_indices)
-            all_distances = list(distances)
-            for idx, dist in zip(expanded_indices, expanded_distances):
-                if idx not in all_indices:
-                    all_indices.append(idx)
-                    all_distances.append(dist)
-            retrieved_indices = np.array(all_indices[:num_candidates])
-            distances = np.array(all_distances[:num_candidates])
+        # Original query and its expansions go to FAISS as a single batch
+        all_indices, all_distances = self.search_knowledge_base_batch(query_variants, num_candidates)
+        
+        retrieved_indices, distances = None, None
+        if all_indices is not None:
+            # Original query keeps its full candidate list; expansions add up to half as many
+            retrieved_indices = np.concatenate([all_indices[0], all_indices[1:, :num_candidates // 2].ravel()])
+            distances = np.concatenate([all_distances[0], all_distances[1:, :num_candidates // 2].ravel()])
+            valid = retrieved_indices >= 0
+            retrieved_indices, distances = retrieved_indices[valid], distances[valid]
+            # Merge results, keeping the first occurrence of each index in search order
+            _, first_seen = np.unique(retrieved_indices, return_index=True)
+            keep = np.sort(first_seen)[:num_candidates]
+            retrieved_indices, distances = retrieved_indices[keep], distances[keep]
         
         if retrieved_indices is None or len(retrieved_indices) == 0:
             return "I couldn't find a relevant answer in my knowledge base. Could you try rephrasing your question?"
         
-        # Enhanced scoring with multiple factors
-        scored_results = []
+        # Enhanced scoring with multiple factors, computed for all candidates at once
+        # from the features precomputed in build_rescoring_features()
+        retrieved_indices = np.asarray(retrieved_indices)
         query_words = set(query_lower.split())
+        num_results = len(retrieved_indices)
         
-        for i, idx in enumerate(retrieved_indices):
-            row = self.df.iloc[idx]
-            question_text = str(row.get('question_cleaned', row.get('question', ''))).lower()
-            response_text = str(row.get('response_cleaned', row.get('response', ''))).lower()
-            combined_text = question_text + " " + response_text
-            
-            # Get stored locations for this entry
-            entry_locations = row.get('locations', set())
-            if isinstance(entry_locations, str):
-                try:
-                    entry_locations = eval(entry_locations) if entry_locations.startswith('{') else set()
-                except:
-                    entry_locations = set()
-            
-            distance = distances[i] if i < len(distances) else 1000
-            
-            # Calculate multiple relevance scores
-            scores = {
-                'semantic_distance': distance,
-                'location_match': 0,
-                'location_penalty': 0,
-                'keyword_overlap': 0,
-                'question_similarity': 0
-            }
-            
-            # 1. Location matching (most important for location-specific queries)
-            if query_locations:
-                # Check if entry mentions query locations
-                for q_loc in query_locations:
-                    q_loc_lower = q_loc.lower()
-                    # Check both in text and in stored locations
-                    mentions_location = (q_loc_lower in combined_text or 
-                                       q_loc_lower in entry_locations or
-                                       any(q_loc_lower in str(loc).lower() for loc in entry_locations))
-                    
-                    if mentions_location:
-                        scores['location_match'] += 30  # Very strong boost
-                    else:
-                        scores['location_penalty'] += 20  # Very strong penalty
-                
-                # Extra boost if location appears multiple times in query (user really wants this location)
-                location_count_in_query = sum(1 for loc in query_locations if loc.lower() in query_lower)
-                if location_count_in_query > 1:
-                    scores['location_match'] += 15  # Extra boost for repeated mentions
-                
-                # Extra penalty if entry mentions different locations (especially if query has specific locations)
-                entry_locations_lower = {loc.lower() for loc in entry_locations}
-                query_locations_lower = {loc.lower() for loc in query_locations}
-                different_locations = entry_locations_lower - query_locations_lower
-                
-                # If entry mentions locations NOT in query, heavily penalize
-                if different_locations:
-                    # Count how many query locations are mentioned vs different locations
-                    matching_locs = len(entry_locations_lower & query_locations_lower)
-                    different_locs_count = len(different_locations)
-                    
-                    # If more different locations than matching, heavy penalty
-                    if different_locs_count > matching_locs:
-                        scores['location_penalty'] += 15
-                    elif different_locs_count > 0:
-                        scores['location_penalty'] += 8
-            
-            # 2. Keyword overlap (weighted by importance)
-            entry_words = set(combined_text.split())
-            overlap = len(query_words.intersection(entry_words))
-            # Weight important words more (longer words, location names, etc.)
-            important_words = {w for w in query_words if len(w) > 4 or w in query_locations}
-            important_overlap = len(important_words.intersection(entry_words))
-            scores['keyword_overlap'] = overlap * 0.5 + important_overlap * 1.5
-            
-            # 3. Question similarity (boost if question matches well)
-            question_words = set(question_text.split())
-            question_overlap = len(query_words.intersection(question_words))
-            scores['question_similarity'] = question_overlap * 3  # Questions are very important
-            
-            # 4. Question type matching (boost if answer type matches question type)
-            entry_lower = combined_text.lower()
-            type_keywords = {
-                'where': ['location', 'place', 'destination', 'visit', 'go', 'see'],
-                'what': ['attraction', 'activity', 'thing', 'experience', 'sight'],
-                'when': ['time', 'season', 'month', 'weather', 'best time'],
-                'how': ['way', 'method', 'get', 'travel', 'reach', 'arrive'],
-                'cost': ['cost', 'price', 'expensive', 'cheap', 'budget', 'dollar'],
-                'food': ['food', 'restaurant', 'cuisine', 'dish', 'eat', 'dining'],
-                'recommendation': ['recommend', 'best', 'top', 'must', 'popular', 'famous']
-            }
-            
-            type_match_score = 0
-            for q_type in question_types:
-                if q_type in type_keywords:
-                    type_keyword_count = sum(1 for keyword in type_keywords[q_type] if keyword in entry_lower)
-                    type_match_score += type_keyword_count * 2
+        # 1. Location matching (most important for location-specific queries)
+        location_match = np.zeros(num_results, dtype=np.float32)
+        location_penalty = np.zeros(num_results, dtype=np.float32)
+        if query_locations:
+            for q_loc in query_locations:
+                mentions_location = self.location_mentions(q_loc, retrieved_indices)
+                location_match += np.where(mentions_location, 30, 0)  # Very strong boost
+                location_penalty += np.where(mentions_location, 0, 20)  # Very strong penalty
             
-            scores['question_type_match'] = type_match_score
+            # Extra boost if location appears multiple times in query (user really wants this location)
+            location_count_in_query = sum(1 for loc in query_locations if loc.lower() in query_lower)
+            if location_count_in_query > 1:
+                location_match += 15  # Extra boost for repeated mentions
             
-            # Calculate final score (lower is better)
-            final_score = (
-                scores['semantic_distance'] * 1.0 -  # Base semantic similarity
-                scores['location_match'] +  # Boost for location matches
-                scores['location_penalty'] -  # Penalty for wrong locations
-                scores['keyword_overlap'] -  # Boost for keyword matches
-                scores['question_similarity'] -  # Boost for question similarity
-                scores.get('question_type_match', 0)  # Boost for question type match
+            # Extra penalty if entry mentions locations NOT in query
+            query_location_cols = [self._location_ids[loc.lower()] for loc in query_locations
+                                   if loc.lower() in self._location_ids]
+            candidate_locations = self._entry_locations[retrieved_indices]
+            if query_location_cols:
+                matching_locs = candidate_locations[:, query_location_cols].getnnz(axis=1)
+            else:
+                matching_locs = np.zeros(num_results, dtype=np.int64)
+            different_locs_count = self._entry_location_counts[retrieved_indices] - matching_locs
+            # If more different locations than matching, heavy penalty
+            location_penalty += np.where(
+                different_locs_count > matching_locs, 15,
+                np.where(different_locs_count > 0, 8, 0)
             )
-            
-            scored_results.append({
-                'idx': idx,
-                'score': final_score,
-                'scores': scores,
-                'text': combined_text,
-                'locations': entry_locations
-            })
+        
+        # 2. Keyword overlap (weighted by importance)
+        query_token_cols = [self._token_ids[w] for w in query_words if w in self._token_ids]
+        # Weight important words more (longer words, location names, etc.)
+        important_cols = [self._token_ids[w] for w in query_words
+                          if w in self._token_ids and (len(w) > 4 or w in query_locations)]
+        candidate_words = self._entry_words[retrieved_indices]
+        overlap = np.asarray(candidate_words[:, query_token_cols].sum(axis=1)).ravel()
+        important_overlap = np.asarray(candidate_words[:, important_cols].sum(axis=1)).ravel()
+        keyword_overlap = (overlap * 0.5 + important_overlap * 1.5).astype(np.float32)
+        
+        # 3. Question similarity (boost if question matches well)
+        question_overlap = np.asarray(
+            self._question_words[retrieved_indices][:, query_token_cols].sum(axis=1)
+        ).ravel()
+        question_similarity = (question_overlap * 3).astype(np.float32)  # Questions are very important
+        
+        # 4. Question type matching (boost if answer type matches question type)
+        type_cols = [self._answer_types.index(q_type) for q_type in question_types
+                     if q_type in self.ANSWER_TYPE_KEYWORDS]
+        type_match = (
+            self._entry_type_counts[retrieved_indices][:, type_cols].sum(axis=1) * 2
+        ).astype(np.float32)
+        
+        # Calculate final score (lower is better)
+        final_scores = (
+            np.asarray(distances, dtype=np.float32) * np.float32(1.0) -  # Base semantic similarity
+            location_match +  # Boost for location matches
+            location_penalty -  # Penalty for wrong locations
+            keyword_overlap -  # Boost for keyword matches
+            question_similarity -  # Boost for question similarity
+            type_match  # Boost for question type match
+        )
         
         # Sort by score (lower is better)
-        scored_results.sort(key=lambda x: x['score'])
+        order = np.argsort(final_scores, kind='stable')
+        scored_results = [
+            {
+                'idx': retrieved_indices[i],
+                'score': final_scores[i],
+                'text': self._entry_texts[retrieved_indices[i]],
+                'locations': self._entry_location_sets[retrieved_indices[i]]
+            }
+            for i in order
+        ]
         
         # Get top k results (but ensure we have good matches)
         # Filter out very poor matches first
@@ -572,25 +736,13 @@ class TravelAIService:
                         answer = self.df.iloc[top_results[0]['idx']]['response']
         else:
             # No specific location mentioned, prioritize by question type
-            type_keywords = {
-                'where': ['location', 'place', 'destination', 'visit', 'go', 'see'],
-                'what': ['attraction', 'activity', 'thing', 'experience', 'sight'],
-                'when': ['time', 'season', 'month', 'weather', 'best time'],
-                'how': ['way', 'method', 'get', 'travel', 'reach', 'arrive'],
-                'cost': ['cost', 'price', 'expensive', 'cheap', 'budget', 'dollar'],
-                'food': ['food', 'restaurant', 'cuisine', 'dish', 'eat', 'dining'],
-                'recommendation': ['recommend', 'best', 'top', 'must', 'popular', 'famous']
-            }
+            type_cols = [self._answer_types.index(q_type) for q_type in question_types
+                         if q_type in self.ANSWER_TYPE_KEYWORDS]
             
             best_match = None
             for result in top_results:
-                entry_text_lower = result['text'].lower()
                 # Check if answer matches question type
-                type_match = any(
-                    q_type in type_keywords and any(kw in entry_text_lower for kw in type_keywords[q_type])
-                    for q_type in question_types
-                )
-                if type_match:
+                if self._entry_type_counts[result['idx'], type_cols].any():
                     best_match = result
                     break
             
@@ -602,15 +754,7 @@ class TravelAIService:
         
         # Post-process answer to ensure it's relevant
         answer_lower = answer.lower()
-        type_keywords = {
-            'where': ['location', 'place', 'destination', 'visit', 'go', 'see'],
-            'what': ['attraction', 'activity', 'thing', 'experience', 'sight'],
-            'when': ['time', 'season', 'month', 'weather', 'best time'],
-            'how': ['way', 'method', 'get', 'travel', 'reach', 'arrive'],
-            'cost': ['cost', 'price', 'expensive', 'cheap', 'budget', 'dollar'],
-            'food': ['food', 'restaurant', 'cuisine', 'dish', 'eat', 'dining'],
-            'recommendation': ['recommend', 'best', 'top', 'must', 'popular', 'famous']
-        }
+        type_keywords = self.ANSWER_TYPE_KEYWORDS
         
         # If answer doesn't seem relevant to question type, try to find better match
         if question_types and question_types != ['general']:
@@ -636,10 +780,15 @@ class TravelAIService:
 # Global instance
 _ai_service = None
 
-def get_ai_service():
+def get_ai_service(corpus=None):
     """Get or create the AI service instance"""
     global _ai_service
     if _ai_service is None:
-        _ai_service = TravelAIService()
+        _ai_service = TravelAIService(corpus=corpus)
     return _ai_service
 
+def reset_ai_service():
+    """Reset the global service instance"""
+    global _ai_service
+    _ai_service = None
+
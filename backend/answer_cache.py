@@ -0,0 +1,173 @@
+"""
+TripMate Chat Answer Cache
+For a fixed dataset a chat answer depends only on the (context-enhanced)
+query and top_k, so answers are cached in an on-disk SQLite database that
+every gunicorn worker on the host shares. Entries are keyed by
+(dataset version, normalized query, top_k); a new dataset version simply
+never hits old entries, which are purged when the cache is opened.
+
+    ANSWER_CACHE_PATH=...             # database file (default travel_qa_model/answer_cache.sqlite3)
+    ANSWER_CACHE_SIZE=5000            # max entries, least recently used evicted; 0 disables
+    ANSWER_CACHE_WARM_QUERIES=...     # file with one popular query per line (default popular_queries.txt)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(__file__), "travel_qa_model", "answer_cache.sqlite3")
+DEFAULT_WARM_QUERIES_PATH = os.path.join(os.path.dirname(__file__), "popular_queries.txt")
+
+# Evict only after this many puts, so inserts stay a single-row write
+# (the cache can briefly hold up to this many entries over its size)
+EVICT_EVERY = 100
+
+
+def normalize_query(query: str) -> str:
+    """Chat answers ignore case and spacing, so neither is part of the key."""
+    return ' '.join(query.lower().split())
+
+
+def load_warm_queries(path: Optional[str] = None) -> List[str]:
+    """Popular queries to pre-answer, one per line ('#' comments and blank lines skipped)."""
+    path = path or os.getenv("ANSWER_CACHE_WARM_QUERIES", DEFAULT_WARM_QUERIES_PATH)
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+class AnswerCache:
+    """
+    Size-bounded LRU cache of chat results in SQLite.
+
+    Connections are opened per thread and per process (a connection must
+    not cross a fork, and gunicorn --preload builds the engine before
+    forking). Any database error is logged and treated as a cache miss.
+    """
+
+    def __init__(self, path: str, dataset_version: str, max_entries: int = 5000):
+        self.path = path
+        self.dataset_version = dataset_version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._puts = 0
+        self._open()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _open(self):
+        """Create the table and drop entries of other dataset versions."""
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = self._connection()
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS answers (
+                       version TEXT NOT NULL,
+                       query TEXT NOT NULL,
+                       top_k INTEGER NOT NULL,
+                       result TEXT NOT NULL,
+                       last_used REAL NOT NULL,
+                       PRIMARY KEY (version, query, top_k)
+                   )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+            stale = conn.execute("DELETE FROM answers WHERE version != ?", (self.dataset_version,)).rowcount
+            if stale:
+                print(f"Answer cache: dropped {stale} entries from an older dataset version")
+        except sqlite3.Error as e:
+            print(f"Warning: Could not open answer cache at {self.path}: {e}")
+
+    def __len__(self):
+        try:
+            return self._connection().execute(
+                "SELECT COUNT(*) FROM answers WHERE version = ?", (self.dataset_version,)
+            ).fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def get(self, query: str, top_k: int) -> Optional[Dict]:
+        """Cached result for (query, top_k), or None."""
+        key = (self.dataset_version, normalize_query(query), top_k)
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT result FROM answers WHERE version = ? AND query = ? AND top_k = ?", key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute(
+                "UPDATE answers SET last_used = ? WHERE version = ? AND query = ? AND top_k = ?",
+                (time.time(),) + key
+            )
+            self.hits += 1
+            return json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Warning: Answer cache lookup failed: {e}")
+            return None
+
+    def put(self, query: str, top_k: int, result: Dict):
+        """Store a chat result; evicts the least recently used entries when over size."""
+        try:
+            payload = json.dumps(result)
+        except (TypeError, ValueError):
+            return
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO answers (version, query, top_k, result, last_used) VALUES (?, ?, ?, ?, ?)",
+                (self.dataset_version, normalize_query(query), top_k, payload, time.time())
+            )
+            self._puts += 1
+            if self._puts % EVICT_EVERY == 0:
+                self.evict()
+        except sqlite3.Error as e:
+            print(f"Warning: Answer cache write failed: {e}")
+
+    def evict(self):
+        """Trim the cache to max_entries, dropping the least recently used."""
+        conn = self._connection()
+        excess = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM answers WHERE rowid IN (SELECT rowid FROM answers ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+
+    def contains(self, query: str, top_k: int) -> bool:
+        try:
+            return self._connection().execute(
+                "SELECT 1 FROM answers WHERE version = ? AND query = ? AND top_k = ?",
+                (self.dataset_version, normalize_query(query), top_k)
+            ).fetchone() is not None
+        except sqlite3.Error:
+            return False
+
+    def clear(self):
+        try:
+            self._connection().execute("DELETE FROM answers")
+        except sqlite3.Error as e:
+            print(f"Warning: Could not clear answer cache: {e}")
+
+
+def create_answer_cache(dataset_version: str) -> Optional[AnswerCache]:
+    """Answer cache configured from the environment, or None if disabled."""
+    max_entries = int(os.getenv("ANSWER_CACHE_SIZE", "5000"))
+    if max_entries <= 0:
+        return None
+    return AnswerCache(os.getenv("ANSWER_CACHE_PATH", DEFAULT_CACHE_PATH), dataset_version, max_entries)
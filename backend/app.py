@@ -26,17 +26,14 @@ CORS(
     expose_headers=["Content-Type", "Content-Disposition", "Content-Length"],
 )
 
-# Initialize AI service on startup
+# Build the configured chat engines (CHAT_ENGINES, default "dataset") before
+# the worker starts serving, so the first chat request doesn't pay for it
 try:
-    from ai_service import get_ai_service
-    print("Initializing AI service on startup...")
-    ai_service = get_ai_service()
-    if ai_service.df is not None:
-        print(f"AI service initialized successfully with {len(ai_service.df)} entries!")
-    else:
-        print("AI service initialized but knowledge base not loaded yet.")
+    from chat_engines import warm_engines
+    print("Initializing chat engines on startup...")
+    warm_engines()
 except Exception as e:
-    print(f"Warning: Could not initialize AI service on startup: {e}")
+    print(f"Warning: Could not initialize chat engines on startup: {e}")
     import traceback
     traceback.print_exc()
 
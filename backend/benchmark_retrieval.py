@@ -0,0 +1,392 @@
+"""
+TripMate Retrieval Benchmark
+Measures every retrieval engine / index variant on one labelled evaluation
+set and writes the numbers to a JSON file, so runs can be compared:
+
+    python benchmark_retrieval.py                            # all engines -> benchmark_results.json
+    python benchmark_retrieval.py --engines tfidf,faiss --k 10
+    python benchmark_retrieval.py --baseline old_results.json
+
+The evaluation set is built from the query lists of the test / training
+scripts plus a sample of dataset questions:
+  - topic queries ("where to eat in tokyo"): relevant rows are those about
+    the query's city (or country) with the same question type
+  - known-item queries (a dataset question): relevant rows are those asking
+    the same question (same normalized content words)
+
+Per engine it reports recall@k, hit rate@k and MRR@k (overall and per query
+kind), p50/p95/p99 single-query latency, QPS (one query at a time and
+batched), build time, index size and the process RSS growth of the build.
+Quantized variants (tfidf_int8, faiss_sq8, ...) also report how much of the
+full-precision engine's top k they keep, next to the memory they save.
+"""
+
+import argparse
+import ast
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from chat_engines import load_corpus
+from gazetteer import get_gazetteer
+from question_index import normalize_question
+from travel_retriever import TravelRetriever, question_type
+
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Scripts whose query lists make up the topic queries
+QUERY_SOURCES = ['comprehensive_test.py', 'advanced_test.py', 'continuous_training.py', 'intensive_training.py']
+
+DEFAULT_OUTPUT = os.path.join(BACKEND_DIR, "benchmark_results.json")
+
+
+class EvalQuery(NamedTuple):
+    text: str
+    kind: str  # 'topic' or 'known_item'
+    relevant: FrozenSet[int]  # positions in the reference frame
+
+
+def script_queries(paths: Sequence[str] = QUERY_SOURCES) -> List[str]:
+    """String items of the list / tuple literals in the given scripts that read like chat queries."""
+    queries = []
+    for path in paths:
+        path = os.path.join(BACKEND_DIR, path)
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if not isinstance(node, (ast.List, ast.Tuple)):
+                continue
+            for item in node.elts:
+                if isinstance(item, ast.Constant) and isinstance(item.value, str):
+                    text = item.value.strip()
+                    if '\n' not in text and 2 <= len(text.split()) <= 12 and text not in queries:
+                        queries.append(text)
+    return queries
+
+
+def build_eval_set(reference: pd.DataFrame, queries: Sequence[str], known_item_every: int = 50) -> List[EvalQuery]:
+    """
+    Labelled queries against the reference frame (a TravelRetriever df).
+    Topic queries without a recognizable location or without any relevant
+    row are left out.
+    """
+    gazetteer = get_gazetteer()
+    cities = reference['city'].astype(str).str.lower().values
+    countries = reference['country'].astype(str).str.lower().values
+    types = reference['question_type'].astype(str).values
+
+    eval_set = []
+    for text in queries:
+        locations = gazetteer.extract(text)
+        if locations['cities']:
+            mask = np.isin(cities, [c.lower() for c in locations['cities']])
+        elif locations['countries']:
+            mask = np.isin(countries, [c.lower() for c in locations['countries']])
+        else:
+            continue
+        kind = question_type(text)
+        if kind != 'general':
+            mask &= types == kind
+        relevant = frozenset(np.flatnonzero(mask).tolist())
+        if relevant:
+            eval_set.append(EvalQuery(text, 'topic', relevant))
+
+    keys = [normalize_question(q) for q in reference['question'].astype(str)]
+    by_key: Dict[str, List[int]] = {}
+    for pos, key in enumerate(keys):
+        by_key.setdefault(key, []).append(pos)
+    for pos in range(0, len(reference), known_item_every):
+        if keys[pos]:
+            eval_set.append(EvalQuery(str(reference['question'].iloc[pos]), 'known_item', frozenset(by_key[keys[pos]])))
+    return eval_set
+
+
+def _reference_positions(df: pd.DataFrame, reference_index: Dict) -> np.ndarray:
+    """Map an engine's own rows to reference positions by (question, response); -1 if absent."""
+    return np.array([
+        reference_index.get((str(q), str(r)), -1)
+        for q, r in zip(df['question'], df['response'])
+    ], dtype=np.int64)
+
+
+class BenchEngine:
+    """One retrieval engine under test: search() returns reference positions, best first."""
+
+    def search(self, queries: List[str], k: int) -> List[List[int]]:
+        raise NotImplementedError
+
+    def index_bytes(self) -> int:
+        return 0
+
+
+class SparseEngine(BenchEngine):
+    """TravelRetriever (TF-IDF or hashed TF-IDF cosine over a sparse matrix)."""
+
+    def __init__(self, corpus: pd.DataFrame, reference_index: Dict, mode: str, compact: bool = False,
+                 precision: str = 'float64'):
+        self.retriever = TravelRetriever(None, corpus=corpus, vectorizer_mode=mode, compact=compact, semantic='off')
+        self.retriever.quantize(precision)
+        self.positions = _reference_positions(self.retriever.df, reference_index)
+
+    def search(self, queries, k):
+        return [self.positions[indices].tolist() for indices, _ in self.retriever.rank(queries, [k] * len(queries))]
+
+    def index_bytes(self):
+        if self.retriever.quantized_vectors is not None:
+            return self.retriever.quantized_vectors.nbytes()
+        m = self.retriever.document_vectors
+        return int(m.data.nbytes + m.indices.nbytes + m.indptr.nbytes)
+
+
+class SemanticEngine(SparseEngine):
+    """TravelRetriever with a freshly trained LSA index ('lsa' or 'hybrid', see semantic_index.py)."""
+
+    def __init__(self, corpus: pd.DataFrame, reference_index: Dict, semantic: str, kind: Optional[str] = None,
+                 quantizer: str = 'none'):
+        from semantic_index import SemanticIndex
+        super().__init__(corpus, reference_index, 'tfidf')
+        index = SemanticIndex.fit(self.retriever.document_vectors, kind=kind, quantizer=quantizer)
+        self.retriever.enable_semantic(semantic, index)
+
+    def index_bytes(self):
+        semantic = self.retriever.semantic.nbytes()
+        return semantic + (super().index_bytes() if self.retriever.semantic_mode == 'hybrid' else 0)
+
+
+class FaissEngine(BenchEngine):
+    """TravelAIService's dense FAISS index (raw index search, no re-scoring), built fresh."""
+
+    def __init__(self, corpus: pd.DataFrame, reference_index: Dict, quantizer: str = 'none'):
+        from ai_service import TravelAIService
+        model_dir = tempfile.mkdtemp(prefix="tripmate_bench_")
+        try:
+            self.service = TravelAIService(corpus=corpus, model_dir=model_dir, quantizer=quantizer)
+        finally:
+            shutil.rmtree(model_dir, ignore_errors=True)
+        self.positions = _reference_positions(self.service.df, reference_index)
+
+    def search(self, queries, k):
+        cleaned = [self.service.preprocess_text(q) for q in queries]
+        indices, _ = self.service.search_knowledge_base_batch(cleaned, k)
+        return [[int(self.positions[i]) for i in row if i >= 0] for row in indices]
+
+    def index_bytes(self):
+        import faiss
+        return int(faiss.serialize_index(self.service.index).nbytes)
+
+
+# Engine name -> builder(corpus, reference_index)
+BENCH_ENGINES: Dict[str, Callable[[pd.DataFrame, Dict], BenchEngine]] = {
+    'tfidf': lambda corpus, ref: SparseEngine(corpus, ref, 'tfidf'),
+    'hashing': lambda corpus, ref: SparseEngine(corpus, ref, 'hashing'),
+    # TF-IDF over the corpus with near-duplicate QA pairs merged (near_duplicates.py)
+    'tfidf_compact': lambda corpus, ref: SparseEngine(corpus, ref, 'tfidf', compact=True),
+    'faiss': FaissEngine,
+    # LSA over the TF-IDF index, served from HNSW (lsa_flat: exact search, for the ANN's recall loss)
+    'lsa': lambda corpus, ref: SemanticEngine(corpus, ref, 'lsa'),
+    'lsa_flat': lambda corpus, ref: SemanticEngine(corpus, ref, 'lsa', kind='flat'),
+    'hybrid': lambda corpus, ref: SemanticEngine(corpus, ref, 'hybrid'),
+    # Quantized document vectors (quantization.py)
+    'tfidf_f32': lambda corpus, ref: SparseEngine(corpus, ref, 'tfidf', precision='float32'),
+    'tfidf_f16': lambda corpus, ref: SparseEngine(corpus, ref, 'tfidf', precision='float16'),
+    'tfidf_int8': lambda corpus, ref: SparseEngine(corpus, ref, 'tfidf', precision='int8'),
+    'faiss_fp16': lambda corpus, ref: FaissEngine(corpus, ref, 'fp16'),
+    'faiss_sq8': lambda corpus, ref: FaissEngine(corpus, ref, 'sq8'),
+    'faiss_sq4': lambda corpus, ref: FaissEngine(corpus, ref, 'sq4'),
+    'faiss_pq': lambda corpus, ref: FaissEngine(corpus, ref, 'pq'),
+    'lsa_sq8': lambda corpus, ref: SemanticEngine(corpus, ref, 'lsa', quantizer='sq8'),
+}
+
+# Quantized engine -> the full-precision engine its rankings are compared with
+QUANTIZED_FROM = {
+    'tfidf_f32': 'tfidf', 'tfidf_f16': 'tfidf', 'tfidf_int8': 'tfidf',
+    'faiss_fp16': 'faiss', 'faiss_sq8': 'faiss', 'faiss_sq4': 'faiss', 'faiss_pq': 'faiss',
+    'lsa_sq8': 'lsa',
+}
+
+
+def _rss_bytes() -> Optional[int]:
+    """Resident set size of this process (Linux only)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def quality(results: List[List[int]], eval_set: List[EvalQuery], k: int) -> Dict[str, Dict[str, float]]:
+    """recall@k, hit rate@k and MRR@k, overall and per query kind."""
+    scores: Dict[str, List[tuple]] = {}
+    for ranked, query in zip(results, eval_set):
+        ranked = ranked[:k]
+        hits = [pos in query.relevant for pos in ranked]
+        recall = sum(hits) / min(len(query.relevant), k)
+        reciprocal_rank = next((1.0 / (i + 1) for i, hit in enumerate(hits) if hit), 0.0)
+        for group in ('all', query.kind):
+            scores.setdefault(group, []).append((recall, float(any(hits)), reciprocal_rank))
+    return {
+        group: {
+            'queries': len(values),
+            f'recall@{k}': round(float(np.mean([v[0] for v in values])), 4),
+            f'hit_rate@{k}': round(float(np.mean([v[1] for v in values])), 4),
+            f'mrr@{k}': round(float(np.mean([v[2] for v in values])), 4),
+        }
+        for group, values in scores.items()
+    }
+
+
+def overlap(results: List[List[int]], baseline: List[List[int]], k: int) -> float:
+    """Mean share of the baseline's top k that is also in the top k (how much a ranking changed)."""
+    shares = [len(set(a[:k]) & set(b[:k])) / max(1, len(b[:k])) for a, b in zip(results, baseline)]
+    return round(float(np.mean(shares)), 4) if shares else 1.0
+
+
+def run_engine(name: str, corpus: pd.DataFrame, reference_index: Dict, eval_set: List[EvalQuery],
+               k: int) -> Tuple[Dict, List[List[int]]]:
+    """Benchmark one engine; returns its result summary and its ranking for every query."""
+    rss_before = _rss_bytes()
+    start = time.perf_counter()
+    engine = BENCH_ENGINES[name](corpus, reference_index)
+    build_seconds = time.perf_counter() - start
+    rss_after = _rss_bytes()
+
+    queries = [q.text for q in eval_set]
+    engine.search(queries[:5], k)  # warm-up
+
+    latencies = []
+    results = []
+    for query in queries:
+        t = time.perf_counter()
+        results.extend(engine.search([query], k))
+        latencies.append(time.perf_counter() - t)
+    t = time.perf_counter()
+    engine.search(queries, k)
+    batch_seconds = time.perf_counter() - t
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'build_seconds': round(build_seconds, 3),
+        'index_mb': round(engine.index_bytes() / 2 ** 20, 3),
+        'rss_delta_mb': round((rss_after - rss_before) / 2 ** 20, 1) if rss_before and rss_after else None,
+        'latency_ms': {p: round(float(np.percentile(latencies_ms, q)), 3) for p, q in (('p50', 50), ('p95', 95), ('p99', 99))},
+        'qps': round(len(queries) / float(np.sum(latencies)), 1),
+        'batch_qps': round(len(queries) / batch_seconds, 1),
+        'quality': quality(results, eval_set, k),
+    }, results
+
+
+def compare(current: Dict, baseline: Dict):
+    """Print each engine's headline numbers next to a baseline run's."""
+    k = current['k']
+    for name, result in current['engines'].items():
+        old = baseline.get('engines', {}).get(name)
+        if old is None:
+            print(f"{name}: not in baseline")
+            continue
+        rows = [
+            (f'recall@{k}', result['quality']['all'][f'recall@{k}'], old['quality']['all'].get(f'recall@{k}')),
+            (f'mrr@{k}', result['quality']['all'][f'mrr@{k}'], old['quality']['all'].get(f'mrr@{k}')),
+            ('p50 ms', result['latency_ms']['p50'], old['latency_ms']['p50']),
+            ('p99 ms', result['latency_ms']['p99'], old['latency_ms']['p99']),
+            ('qps', result['qps'], old['qps']),
+            ('build s', result['build_seconds'], old['build_seconds']),
+            ('index MB', result['index_mb'], old['index_mb']),
+        ]
+        print(f"{name}:")
+        for label, new_value, old_value in rows:
+            delta = f"{new_value - old_value:+.4g}" if old_value is not None else "n/a"
+            print(f"  {label:<12} {old_value!s:>10} -> {new_value!s:>10}  ({delta})")
+
+
+def print_quantization_report(results: Dict):
+    """Recall vs memory of every quantized engine that ran next to its full-precision engine."""
+    k = results['k']
+    engines = results['engines']
+    rows = [(name, base) for name, base in QUANTIZED_FROM.items() if name in engines and base in engines]
+    if not rows:
+        return
+    print(f"\nQuantization: recall@{k} and index size vs full precision")
+    print(f"{'engine':<12}{'recall':>16}{'overlap@' + str(k):>12}{'index MB':>20}{'size':>8}")
+    for name, base in rows:
+        new, old = engines[name], engines[base]
+        recall = f"{old['quality']['all'][f'recall@{k}']:.3f} -> {new['quality']['all'][f'recall@{k}']:.3f}"
+        size = f"{old['index_mb']:.1f} -> {new['index_mb']:.1f}"
+        ratio = new['index_mb'] / old['index_mb'] if old['index_mb'] else 0.0
+        print(f"{name:<12}{recall:>16}{new[f'overlap@{k}'][base]:>12.3f}{size:>20}{ratio:>8.0%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark TripMate retrieval engines")
+    parser.add_argument('--engines', default=','.join(BENCH_ENGINES), help=f"comma-separated ({', '.join(BENCH_ENGINES)})")
+    parser.add_argument('--k', type=int, default=10, help="cut-off for recall / MRR (5-25)")
+    parser.add_argument('--known-item-every', type=int, default=50, help="use every Nth dataset question as a known-item query")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="JSON results file")
+    parser.add_argument('--baseline', help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.engines.split(',') if n.strip()]
+    unknown = [n for n in names if n not in BENCH_ENGINES]
+    if unknown:
+        parser.error(f"unknown engines: {', '.join(unknown)}")
+
+    corpus = load_corpus()
+    if corpus is None:
+        print("Travel QA dataset not found")
+        return 1
+
+    print("Building reference frame and evaluation set...")
+    reference = TravelRetriever(None, corpus=corpus, vectorizer_mode='tfidf', compact=False, semantic='off').df
+    reference_index = {}
+    for pos, key in enumerate(zip(reference['question'].astype(str), reference['response'].astype(str))):
+        reference_index.setdefault(key, pos)
+    eval_set = build_eval_set(reference, script_queries(), args.known_item_every)
+    kinds = {kind: sum(q.kind == kind for q in eval_set) for kind in ('topic', 'known_item')}
+    print(f"Evaluation set: {len(eval_set)} queries ({kinds['topic']} topic, {kinds['known_item']} known-item)")
+
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'k': args.k,
+        'corpus_rows': len(corpus),
+        'eval_queries': kinds,
+        'engines': {},
+    }
+    rankings = {}
+    for name in names:
+        print(f"Benchmarking '{name}'...")
+        result, rankings[name] = run_engine(name, corpus, reference_index, eval_set, args.k)
+        base = QUANTIZED_FROM.get(name)
+        if base in rankings:
+            result[f'overlap@{args.k}'] = {base: overlap(rankings[name], rankings[base], args.k)}
+        results['engines'][name] = result
+        overall = result['quality']['all']
+        print(f"  recall@{args.k} {overall[f'recall@{args.k}']:.3f}  mrr@{args.k} {overall[f'mrr@{args.k}']:.3f}  "
+              f"p50 {result['latency_ms']['p50']:.2f}ms  p99 {result['latency_ms']['p99']:.2f}ms  "
+              f"qps {result['qps']:.0f}  build {result['build_seconds']:.1f}s  index {result['index_mb']:.1f}MB")
+
+    print_quantization_report(results)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""
+TripMate Chat Engine Registry
+Loads only the chat engines listed in the CHAT_ENGINES environment variable
+and shares one parsed copy of the travel QA dataset between them. When a
+knowledge pack has been built (python knowledge_pack.py build), engines load
+from it instead of the CSV.
+
+    CHAT_ENGINES=dataset          # default: DatasetOnlyChat (serves /api/ai/chat)
+    CHAT_ENGINES=dataset,faiss    # also build the legacy TravelAIService
+"""
+
+import os
+import threading
+import pandas as pd
+from typing import Callable, Dict, List, Optional
+
+
+DEFAULT_ENGINES = "dataset"
+
+# Candidate dataset locations, in order of preference
+DATASET_PATHS = [
+    os.path.join(os.path.dirname(__file__), "travel_QA (1).csv"),
+    os.path.join(os.path.dirname(__file__), "travel_QA.csv"),
+    os.path.join(os.path.dirname(__file__), "..", "travel_QA (1).csv"),
+    os.path.join(os.path.dirname(__file__), "..", "travel_QA.csv"),
+]
+
+_corpus_cache: Dict[str, pd.DataFrame] = {}
+_lock = threading.RLock()
+# (checked, pack) - the knowledge pack is opened once per process
+_pack_state = [False, None]
+
+
+def find_dataset_csv(csv_path: Optional[str] = None) -> Optional[str]:
+    """Return the first existing travel QA CSV path (or None)."""
+    if csv_path and os.path.exists(csv_path):
+        return csv_path
+    for path in DATASET_PATHS:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def load_corpus(csv_path: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """
+    Load the travel QA dataset once per process.
+
+    Column names are standardized and duplicate rows removed, which is the
+    common preparation every engine did on its own before. Engines must
+    copy the frame before adding columns to it.
+
+    Args:
+        csv_path: Optional path to CSV file
+
+    Returns:
+        DataFrame, or None if no dataset file was found
+    """
+    path = find_dataset_csv(csv_path)
+    if path is None:
+        return None
+    key = os.path.abspath(path)
+    with _lock:
+        if key not in _corpus_cache:
+            print(f"Loading shared travel corpus from {path}...")
+            df = pd.read_csv(path)
+            df.columns = [col.strip().lower().replace(' ', '_') for col in df.columns]
+            initial_count = len(df)
+            df = df.drop_duplicates()
+            print(f"Shared corpus has {len(df)} entries (removed {initial_count - len(df)} duplicates)")
+            _corpus_cache[key] = df
+        return _corpus_cache[key]
+
+
+def load_knowledge_pack():
+    """
+    The knowledge pack if one is present and still matches the dataset,
+    code and settings (see knowledge_pack.py), else None. KNOWLEDGE_PACK=0
+    ignores it.
+    """
+    with _lock:
+        if not _pack_state[0]:
+            _pack_state[0] = True
+            if os.getenv("KNOWLEDGE_PACK", "1") != "0":
+                from knowledge_pack import open_knowledge_pack
+                _pack_state[1] = open_knowledge_pack()
+        return _pack_state[1]
+
+
+def _build_dataset_engine():
+    """DatasetOnlyChat - the engine behind /api/ai/chat."""
+    from retrieval_augmented_ai import get_rai_service
+    pack = load_knowledge_pack()
+    if pack is not None:
+        return get_rai_service(pack=pack)
+    return get_rai_service(corpus=load_corpus())
+
+
+def _build_faiss_engine():
+    """Legacy TravelAIService (dense FAISS over trigram TF-IDF)."""
+    from ai_service import get_ai_service
+    pack = load_knowledge_pack()
+    return get_ai_service(corpus=pack.qa_frame() if pack is not None else load_corpus())
+
+
+ENGINE_FACTORIES: Dict[str, Callable] = {
+    'dataset': _build_dataset_engine,
+    'faiss': _build_faiss_engine,
+}
+
+_engines: Dict[str, object] = {}
+
+
+def configured_engines() -> List[str]:
+    """Engine names from CHAT_ENGINES, unknown names are skipped with a warning."""
+    names = []
+    for name in os.getenv("CHAT_ENGINES", DEFAULT_ENGINES).split(","):
+        name = name.strip().lower()
+        if not name or name in names:
+            continue
+        if name not in ENGINE_FACTORIES:
+            print(f"Warning: Unknown chat engine '{name}' in CHAT_ENGINES (known: {', '.join(ENGINE_FACTORIES)})")
+            continue
+        names.append(name)
+    return names
+
+
+def get_engine(name: str = 'dataset'):
+    """Get (building on first use) the engine registered under name."""
+    if name not in ENGINE_FACTORIES:
+        raise KeyError(f"Unknown chat engine: {name}")
+    with _lock:
+        if name not in _engines:
+            _engines[name] = ENGINE_FACTORIES[name]()
+        return _engines[name]
+
+
+def warm_engines() -> Dict[str, object]:
+    """
+    Build every configured engine so the first request doesn't pay for it.
+    Failures are logged and the engine is left to build lazily later.
+    """
+    warmed = {}
+    for name in configured_engines():
+        try:
+            print(f"Warming chat engine '{name}'...")
+            warmed[name] = get_engine(name)
+            print(f"Chat engine '{name}' ready")
+        except Exception as e:
+            print(f"Warning: Could not initialize chat engine '{name}': {e}")
+            import traceback
+            traceback.print_exc()
+    return warmed
+
+
+def reset_engines():
+    """Drop built engines and the cached corpus (useful for testing or reinitialization)."""
+    with _lock:
+        _engines.clear()
+        _corpus_cache.clear()
+    try:
+        from retrieval_augmented_ai import reset_rai_service
+        reset_rai_service()
+    except Exception:
+        pass
+    try:
+        from ai_service import reset_ai_service
+        reset_ai_service()
+    except Exception:
+        pass
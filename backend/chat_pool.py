@@ -0,0 +1,259 @@
+"""
+TripMate Chat Worker Pool
+Runs chat answering (typo correction, retrieval and response selection) in
+a small pool of worker processes so a CPU-heavy chat call never occupies a
+gunicorn request thread for the whole computation. The pool hands back a
+ChatDraft; its final formatting, which is cheap and which /api/ai/chat/stream
+streams section by section, runs on the request thread. Off by default: chat
+then runs on the request thread, but only CHAT_CONCURRENCY calls at a time
+per gunicorn worker (ChatAdmission), so a burst of chat questions cannot
+take every request thread and the GIL from login, trip and photo requests.
+
+Pool processes are forked from the gunicorn worker by the post_fork hook in
+gunicorn.conf.py, after the chat engine is built (--preload) and before the
+worker starts its request threads, so they share the read-only index and no
+other thread can be holding a lock (engine registry, sqlite, stdio) at the
+fork. A pool that is not started there, or that has to be replaced after a
+process died, is never forked from a request thread: its processes are
+spawned fresh and build the engine themselves.
+
+Each pool process answers one call at a time, so retrieval micro-batching
+(RETRIEVAL_BATCHING, see retrieval_batcher.py) never sees concurrent
+requests inside it: the pool replaces batching rather than stacking with it.
+
+Either way the number of chat calls running or queued is bounded; past
+that new work is refused immediately (ChatPoolBusy) and the route answers
+503 with a Retry-After hint instead of letting requests pile up.
+
+    CHAT_POOL_WORKERS=0               # processes per gunicorn worker (default 0: answer in-process)
+    CHAT_CONCURRENCY=2                # without a pool: chat calls computed at once per gunicorn worker
+    CHAT_POOL_QUEUE=8                 # chat calls allowed to wait for a free process / slot
+    CHAT_POOL_TIMEOUT=60              # seconds before a queued / running call is given up on
+"""
+
+import math
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+
+class ChatPoolBusy(Exception):
+    """The pool is saturated (or failed); retry_after is a hint in seconds."""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _warm_engine(engine_name: str):
+    """Initializer of spawned pool processes: build the engine before the first call."""
+    from chat_engines import get_engine
+    get_engine(engine_name)
+
+
+def _process_id() -> int:
+    return os.getpid()
+
+
+def _run_chat(engine_name: str, query: str, top_k: int):
+    """Prepare a chat answer in a pool process (module level so it can be pickled)."""
+    from chat_engines import get_engine
+    return get_engine(engine_name).prepare_chat(query, top_k=top_k)
+
+
+class ChatPool:
+    """
+    Bounded process pool for chat calls of one engine.
+
+    At most workers + queue_size calls are admitted at a time; admission
+    never blocks. A broken pool (a worker process died) is replaced on the
+    next call.
+    """
+
+    def __init__(self, engine_name: str = 'dataset', workers: int = 2, queue_size: int = 8, timeout: float = 60):
+        self.engine_name = engine_name
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid = None
+        # Moving average of a chat call's run time, for Retry-After hints
+        self._avg_seconds = 0.05
+
+    def start(self):
+        """
+        Fork the pool processes now, sharing the already built engine.
+
+        Only call this while the process is single-threaded (gunicorn's
+        post_fork hook): a fork-context executor launches all its processes
+        at the first submit, which happens here, before its manager thread
+        or any request thread exists.
+        """
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                return
+            if 'fork' not in multiprocessing.get_all_start_methods():
+                return
+            from chat_engines import get_engine
+            get_engine(self.engine_name)
+            executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('fork'))
+            executor.submit(_process_id).result()
+            self._executor, self._pid = executor, os.getpid()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # Called from a request thread: spawn processes (which build
+                # the engine) instead of forking a multithreaded process
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_warm_engine,
+                    initargs=(self.engine_name,)
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free: one queue's worth of average chat calls."""
+        return max(1, math.ceil(self._avg_seconds * (self.queue_size + self.workers) / self.workers))
+
+    def prepare_chat(self, query: str, top_k: int = 6):
+        """
+        The engine's prepare_chat() in the pool (a ChatDraft for the dataset
+        engine); raises ChatPoolBusy when saturated or failed.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise ChatPoolBusy("Chat is busy, please retry shortly", self.retry_after())
+        try:
+            executor = self._get_executor()
+            future = executor.submit(_run_chat, self.engine_name, query, top_k)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the call finishes, even if we stop waiting for it
+        future.add_done_callback(lambda _: self._slots.release())
+        start = time.perf_counter()
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise ChatPoolBusy("Chat took too long, please retry", self.retry_after())
+        except BrokenProcessPool as e:
+            print(f"Warning: Chat worker pool broke, restarting it: {e}")
+            self._discard_executor(executor)
+            raise ChatPoolBusy("Chat workers are restarting, please retry", self.retry_after())
+        self._avg_seconds = 0.9 * self._avg_seconds + 0.1 * (time.perf_counter() - start)
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ChatAdmission:
+    """
+    Bounds chat calls answered on request threads when there is no pool.
+
+    At most concurrency calls compute at once; up to queue_size more wait
+    for a slot (at most timeout seconds). Past that admission refuses at
+    once, like a saturated ChatPool.
+    """
+
+    def __init__(self, concurrency: int = 2, queue_size: int = 8, timeout: float = 60):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(concurrency + queue_size)
+        self._running = threading.BoundedSemaphore(concurrency)
+        # Moving average of a chat call's run time, for Retry-After hints
+        self._avg_seconds = 0.05
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free: one queue's worth of average chat calls."""
+        return max(1, math.ceil(self._avg_seconds * (self.queue_size + self.concurrency) / self.concurrency))
+
+    @contextmanager
+    def admit(self):
+        """Run the with-block as one chat call; raises ChatPoolBusy when saturated."""
+        if not self._slots.acquire(blocking=False):
+            raise ChatPoolBusy("Chat is busy, please retry shortly", self.retry_after())
+        try:
+            if not self._running.acquire(timeout=self.timeout):
+                raise ChatPoolBusy("Chat took too long, please retry", self.retry_after())
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self._running.release()
+                self._avg_seconds = 0.9 * self._avg_seconds + 0.1 * (time.perf_counter() - start)
+        finally:
+            self._slots.release()
+
+
+_pools: Dict[str, ChatPool] = {}
+_pools_lock = threading.Lock()
+_admission: Optional[ChatAdmission] = None
+
+
+def get_chat_pool(engine_name: str = 'dataset') -> Optional[ChatPool]:
+    """
+    Pool for an engine configured from the environment, or None when
+    CHAT_POOL_WORKERS=0 (the default; chat then runs on the request thread,
+    bounded by get_chat_admission()).
+    """
+    workers = int(os.getenv("CHAT_POOL_WORKERS", "0"))
+    if workers <= 0:
+        return None
+    with _pools_lock:
+        if engine_name not in _pools:
+            if os.getenv("RETRIEVAL_BATCHING", "0").lower() in ("1", "true", "yes"):
+                print("Warning: RETRIEVAL_BATCHING has no effect with CHAT_POOL_WORKERS > 0 "
+                      "(each pool process answers one chat call at a time)")
+            _pools[engine_name] = ChatPool(
+                engine_name,
+                workers=workers,
+                queue_size=int(os.getenv("CHAT_POOL_QUEUE", "8")),
+                timeout=float(os.getenv("CHAT_POOL_TIMEOUT", "60"))
+            )
+        return _pools[engine_name]
+
+
+def get_chat_admission() -> Optional[ChatAdmission]:
+    """
+    Admission limit for chat calls answered in-process, or None when
+    CHAT_POOL_WORKERS > 0 (the pool bounds chat calls itself).
+    """
+    global _admission
+    if int(os.getenv("CHAT_POOL_WORKERS", "0")) > 0:
+        return None
+    with _pools_lock:
+        if _admission is None:
+            _admission = ChatAdmission(
+                concurrency=max(1, int(os.getenv("CHAT_CONCURRENCY", "2"))),
+                queue_size=int(os.getenv("CHAT_POOL_QUEUE", "8")),
+                timeout=float(os.getenv("CHAT_POOL_TIMEOUT", "60"))
+            )
+        return _admission
+
+
+def start_chat_pools():
+    """Fork the configured pool's processes; called from gunicorn's post_fork hook (gunicorn.conf.py)."""
+    pool = get_chat_pool('dataset')
+    if pool is not None:
+        pool.start()
+        print(f"Chat worker pool started with {pool.workers} processes")
@@ -0,0 +1,285 @@
+"""
+TripMate Chat Replay
+Drives a stream of chat queries through DatasetOnlyChat.chat() (typo
+correction, context enhancement, question matching, retrieval, location
+filtering, response selection and formatting) with a configurable number of
+concurrent threads, and reports where the time goes and whether the answers
+are still the same:
+
+    python chat_replay.py                                    # test / training script queries, one thread
+    python chat_replay.py --concurrency 8 --repeat 3
+    python chat_replay.py --source scripts,dataset --dataset-sample 300
+    python chat_replay.py --queries recorded.jsonl
+    python chat_replay.py --save-golden golden.json          # snapshot the answers ...
+    python chat_replay.py --golden golden.json               # ... and check a later run against them
+
+Query files hold one query per line, or JSON lines of the form
+{"query": "...", "top_k": 6, "conversation_history": [...]} (top_k and
+history optional), so recorded conversations can be replayed as well.
+
+Per stage it reports how many calls reached it, p50/p95/p99 time and its
+share of the total; end to end it reports p50/p95/p99/max latency and QPS.
+The answer cache is off during a replay (ANSWER_CACHE_SIZE=0) unless
+--with-cache is given, so every call does the full work. Retrieval batching
+(RETRIEVAL_BATCHING) and the other engine settings are read from the
+environment as in the app.
+
+Exit status is 1 when answers differ from the golden snapshot.
+tests/golden_answers.json is the snapshot CI checks (tests/test_golden_replay.py);
+refresh it with --save-golden when answers change on purpose.
+"""
+
+import argparse
+import difflib
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(BACKEND_DIR, "chat_replay_results.json")
+
+# top_k used by /api/ai/chat
+DEFAULT_TOP_K = 6
+
+# Order stages are reported in (the order chat() runs them)
+STAGES = ['cache', 'typo_correction', 'analysis', 'context', 'question_match', 'retrieval',
+          'location_filter', 'selection', 'cleanup', 'formatting', 'other']
+
+
+class ReplayItem(NamedTuple):
+    query: str
+    top_k: int = DEFAULT_TOP_K
+    conversation_history: Optional[List[Dict]] = None
+
+    def key(self) -> str:
+        """Identifies the item in a golden snapshot."""
+        key = f"{self.top_k}|{self.query}"
+        if self.conversation_history:
+            history = json.dumps(self.conversation_history, sort_keys=True)
+            key += "|" + hashlib.sha1(history.encode()).hexdigest()[:12]
+        return key
+
+
+class ReplayResult(NamedTuple):
+    item: ReplayItem
+    response: str
+    path: str  # 'matched', 'clarification' or 'retrieved'
+    stages: Dict[str, float]  # seconds, 'total' included
+
+
+def load_replay_file(path: str, top_k: int = DEFAULT_TOP_K) -> List[ReplayItem]:
+    """Plain query lines or JSON lines; blank lines and '#' comments are skipped."""
+    items = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                record = json.loads(line)
+                items.append(ReplayItem(
+                    str(record['query']),
+                    int(record.get('top_k', top_k)),
+                    record.get('conversation_history') or None
+                ))
+            else:
+                items.append(ReplayItem(line, top_k))
+    return items
+
+
+def dataset_queries(engine, sample: int, seed: int = 0) -> List[str]:
+    """A fixed random sample of the dataset's own questions."""
+    questions = list(dict.fromkeys(engine.retriever.df['question'].astype(str)))
+    return random.Random(seed).sample(questions, min(sample, len(questions)))
+
+
+def build_stream(args, engine) -> List[ReplayItem]:
+    if args.queries:
+        return load_replay_file(args.queries, args.top_k)
+    queries = []
+    for source in (s.strip() for s in args.source.split(',')):
+        if source == 'scripts':
+            from benchmark_retrieval import script_queries
+            queries.extend(script_queries())
+        elif source == 'dataset':
+            queries.extend(dataset_queries(engine, args.dataset_sample))
+        elif source:
+            raise ValueError(f"unknown query source '{source}'")
+    return [ReplayItem(q, args.top_k) for q in dict.fromkeys(queries)]
+
+
+def replay_one(engine, item: ReplayItem) -> ReplayResult:
+    result, stages = engine.timed_chat(item.query, top_k=item.top_k, conversation_history=item.conversation_history)
+    if result.get('matched_question'):
+        path = 'matched'
+    elif result.get('needs_clarification'):
+        path = 'clarification'
+    else:
+        path = 'retrieved'
+    return ReplayResult(item, str(result.get('response', '')), path, stages)
+
+
+def replay(engine, items: Sequence[ReplayItem], concurrency: int = 1) -> Tuple[List[ReplayResult], float]:
+    """Run every item (in order for one thread); returns the results and the wall time."""
+    start = time.perf_counter()
+    if concurrency <= 1:
+        results = [replay_one(engine, item) for item in items]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda item: replay_one(engine, item), items))
+    return results, time.perf_counter() - start
+
+
+def _percentiles_ms(seconds: Sequence[float]) -> Dict[str, float]:
+    ms = np.array(seconds) * 1000
+    return {p: round(float(np.percentile(ms, q)), 3) for p, q in (('p50', 50), ('p95', 95), ('p99', 99))}
+
+
+def summarize(results: List[ReplayResult], wall_seconds: float) -> Dict:
+    """Per-stage and end-to-end timing of a replay."""
+    totals = [r.stages['total'] for r in results]
+    grand_total = float(np.sum(totals))
+    stages = {}
+    for stage in STAGES:
+        times = [r.stages[stage] for r in results if stage in r.stages]
+        if not times:
+            continue
+        stages[stage] = {
+            'calls': len(times),
+            **_percentiles_ms(times),
+            'mean_ms': round(float(np.mean(times)) * 1000, 3),
+            'share': round(float(np.sum(times)) / grand_total, 4) if grand_total else 0.0,
+        }
+    paths = {}
+    for r in results:
+        paths[r.path] = paths.get(r.path, 0) + 1
+    return {
+        'calls': len(results),
+        'wall_seconds': round(wall_seconds, 3),
+        'qps': round(len(results) / wall_seconds, 1) if wall_seconds else None,
+        'latency_ms': {**_percentiles_ms(totals), 'max': round(max(totals) * 1000, 3)},
+        'paths': paths,
+        'stages': stages,
+    }
+
+
+def save_golden(path: str, results: List[ReplayResult]):
+    answers = {r.item.key(): r.response for r in results}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'created': datetime.now().isoformat(timespec='seconds'), 'answers': answers}, f, indent=1)
+    print(f"Golden snapshot of {len(answers)} answers written to {path}")
+
+
+def check_golden(path: str, results: List[ReplayResult], show: int = 5) -> Dict:
+    """Compare answers against a golden snapshot; prints the first `show` differences."""
+    with open(path, encoding='utf-8') as f:
+        golden = json.load(f)['answers']
+    mismatched = {}
+    missing = set()
+    for r in results:
+        key = r.item.key()
+        if key not in golden:
+            missing.add(key)
+        elif golden[key] != r.response:
+            mismatched.setdefault(key, r)
+    checked = len({r.item.key() for r in results}) - len(missing)
+    print(f"Golden check: {checked - len(mismatched)}/{checked} answers unchanged"
+          + (f", {len(missing)} queries not in the snapshot" if missing else ""))
+    for key, r in list(mismatched.items())[:show]:
+        print(f"--- changed: {r.item.query!r}")
+        diff = difflib.unified_diff(golden[key].splitlines(), r.response.splitlines(), 'golden', 'now', lineterm='', n=1)
+        for line in list(diff)[2:40]:
+            print(f"    {line}")
+    return {
+        'checked': checked,
+        'mismatched': len(mismatched),
+        'missing': len(missing),
+        'mismatched_queries': [r.item.query for r in mismatched.values()],
+    }
+
+
+def print_summary(summary: Dict):
+    latency = summary['latency_ms']
+    print(f"{summary['calls']} calls in {summary['wall_seconds']:.2f}s ({summary['qps']} qps)  "
+          f"p50 {latency['p50']:.2f}ms  p95 {latency['p95']:.2f}ms  p99 {latency['p99']:.2f}ms  max {latency['max']:.2f}ms")
+    print("Answer paths: " + ", ".join(f"{path} {count}" for path, count in sorted(summary['paths'].items())))
+    print(f"{'stage':<16}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'share':>8}")
+    for stage, s in summary['stages'].items():
+        print(f"{stage:<16}{s['calls']:>7}{s['p50']:>10.2f}{s['p95']:>10.2f}{s['p99']:>10.2f}{s['share']:>8.1%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay chat queries through DatasetOnlyChat with stage timings")
+    parser.add_argument('--queries', help="query file (plain lines or JSON lines); overrides --source")
+    parser.add_argument('--source', default='scripts', help="comma-separated generated sources: scripts, dataset")
+    parser.add_argument('--dataset-sample', type=int, default=200, help="dataset questions to sample for --source dataset")
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help="top_k for queries without their own")
+    parser.add_argument('--concurrency', type=int, default=1, help="threads calling chat() at once")
+    parser.add_argument('--repeat', type=int, default=1, help="replay the stream this many times")
+    parser.add_argument('--limit', type=int, help="only replay the first N queries")
+    parser.add_argument('--with-cache', action='store_true', help="keep the answer cache enabled")
+    parser.add_argument('--save-golden', help="write the answers to this snapshot file")
+    parser.add_argument('--golden', help="compare the answers with this snapshot file")
+    parser.add_argument('--show-diffs', type=int, default=5, help="changed answers to print")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="JSON results file")
+    args = parser.parse_args(argv)
+
+    if not args.with_cache:
+        os.environ['ANSWER_CACHE_SIZE'] = '0'
+    from chat_engines import get_engine
+    engine = get_engine('dataset')
+    if engine is None:
+        print("Dataset chat engine could not be built")
+        return 1
+
+    items = build_stream(args, engine)
+    if args.limit:
+        items = items[:args.limit]
+    if not items:
+        print("No queries to replay")
+        return 1
+    print(f"Replaying {len(items)} queries x{args.repeat} with concurrency {args.concurrency}...")
+
+    replay(engine, items[:5])  # warm-up
+    results: List[ReplayResult] = []
+    wall = 0.0
+    for _ in range(max(1, args.repeat)):
+        run, seconds = replay(engine, items, args.concurrency)
+        results.extend(run)
+        wall += seconds
+
+    summary = summarize(results, wall)
+    print_summary(summary)
+    output = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'queries': len(items),
+        'repeat': args.repeat,
+        'concurrency': args.concurrency,
+        'answer_cache': args.with_cache,
+        **summary,
+    }
+
+    status = 0
+    if args.golden:
+        output['golden'] = check_golden(args.golden, results, args.show_diffs)
+        status = 1 if output['golden']['mismatched'] else 0
+    if args.save_golden:
+        save_golden(args.save_golden, results)
+
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"Results written to {args.output}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
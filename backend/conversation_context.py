@@ -0,0 +1,275 @@
+"""
+TripMate Conversation Context Store
+Follow-up chat queries ("luxury", "what about food?") are resolved against
+the conversation so far. Instead of the client resending its message history
+and the server re-scanning it every turn, the resolved location, topic and
+whether the assistant is waiting for a clarification are kept per
+(user, conversation) in a small SQLite table shared by every gunicorn worker,
+and updated once per turn. A conversation is one open chat (the client's
+conversation_id); older clients that send none share one per trip.
+
+    CONVERSATION_CONTEXT_PATH=...     # database file (default travel_qa_model/conversation_context.sqlite3)
+    CONVERSATION_CONTEXT_TTL=3600     # seconds of inactivity before a conversation's context is dropped
+    CONVERSATION_CONTEXT_TURNS=3      # user turns a topic / location is carried over for
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+
+DEFAULT_CONTEXT_PATH = os.path.join(os.path.dirname(__file__), "travel_qa_model", "conversation_context.sqlite3")
+
+# Phrases that mark an assistant message as a clarifying question
+CLARIFYING_PHRASES = (
+    "could you tell me", "which city", "which country", "what type",
+    "could you provide", "please tell me", "tell me which",
+    "what type of accommodation", "which area"
+)
+
+# Conversation topics and the user wording that sets them (first match wins)
+TOPIC_KEYWORDS = {
+    'hotel': ['hotel', 'accommodation', 'stay', 'lodging', 'where to stay', 'hotels'],
+    'food': ['food', 'restaurant', 'eat', 'dining', 'cuisine', 'where to eat'],
+    'attraction': ['attraction', 'things to do', 'what to see', 'places to visit'],
+    'transport': ['transport', 'transportation', 'get around', 'how to get'],
+    'weather': ['weather', 'best time', 'when to visit', 'climate'],
+    # Treat itinerary-style queries as a separate topic so follow-ups keep the context
+    'itinerary': ['itinerary', 'itineraries', 'day by day', '1 day', 'one day', 'schedule', 'trip plan', 'daily plan']
+}
+
+# Locations carried over into follow-ups (first match wins)
+LOCATION_KEYWORDS = {
+    'tokyo': ['tokyo'],
+    'kyoto': ['kyoto'],
+    'osaka': ['osaka'],
+    'hokkaido': ['hokkaido'],
+    # Key Japanese cities that often appear in clarifying prompts
+    'sapporo': ['sapporo'],
+    'fukuoka': ['fukuoka'],
+    'hiroshima': ['hiroshima'],
+    'japan': ['japan', 'japanese'],
+    'paris': ['paris'],
+    'london': ['london'],
+    'bangkok': ['bangkok'],
+    'singapore': ['singapore'],
+    'seoul': ['seoul'],
+    'barcelona': ['barcelona'],
+    'rome': ['rome'],
+    'amsterdam': ['amsterdam'],
+    'vienna': ['vienna'],
+    'prague': ['prague'],
+    'budapest': ['budapest'],
+    'istanbul': ['istanbul'],
+    'cairo': ['cairo'],
+    'dubai': ['dubai'],
+    'sydney': ['sydney'],
+    'melbourne': ['melbourne'],
+    'bali': ['bali'],
+    'mumbai': ['mumbai'],
+    'delhi': ['delhi'],
+    'beijing': ['beijing'],
+    # Recognize both Shanghai and Pudong for context
+    'shanghai': ['shanghai', 'pudong']
+}
+
+# Messages of a client-sent history that are looked at (see from_history)
+HISTORY_WINDOW = 6
+
+# Longest client conversation id that is stored as given
+MAX_CONVERSATION_ID = 64
+
+
+def detect_topic(text: str) -> Optional[str]:
+    text = text.lower()
+    for topic, keywords in TOPIC_KEYWORDS.items():
+        if any(kw in text for kw in keywords):
+            return topic
+    return None
+
+
+def detect_location(text: str) -> Optional[str]:
+    text = text.lower()
+    for location, keywords in LOCATION_KEYWORDS.items():
+        if any(kw in text for kw in keywords):
+            return location
+    return None
+
+
+def is_clarifying(text: str) -> bool:
+    text = text.lower()
+    return any(phrase in text for phrase in CLARIFYING_PHRASES)
+
+
+@dataclass
+class ConversationState:
+    """
+    What a conversation has resolved so far. The latest user message that
+    names a topic / location wins, as when scanning the history newest first.
+    """
+    topic: Optional[str] = None
+    location: Optional[str] = None
+    awaiting_clarification: bool = False
+    # Whether the assistant has spoken yet (follow-up handling needs a previous answer)
+    has_reply: bool = False
+    # User messages seen, and the message that last named the topic / location
+    turns: int = 0
+    topic_turn: int = 0
+    location_turn: int = 0
+
+    def observe_user(self, message: str):
+        self.turns += 1
+        topic = detect_topic(message)
+        if topic:
+            self.topic, self.topic_turn = topic, self.turns
+        location = detect_location(message)
+        if location:
+            self.location, self.location_turn = location, self.turns
+
+    def expire(self, max_turns: int):
+        """
+        Forget a topic / location not named in the last max_turns user
+        messages, as a client-sent history window would no longer show it.
+        """
+        if self.topic_turn <= self.turns - max_turns:
+            self.topic = None
+        if self.location_turn <= self.turns - max_turns:
+            self.location = None
+
+    def observe_assistant(self, message: str):
+        self.awaiting_clarification = is_clarifying(message)
+        self.has_reply = True
+
+    def observe_turn(self, user_message: str, assistant_message: str):
+        self.observe_user(user_message)
+        self.observe_assistant(assistant_message)
+
+    @classmethod
+    def from_history(cls, conversation_history: List[Dict]) -> 'ConversationState':
+        """State of a client-sent history ([{"role": "user/assistant", "content": "..."}], oldest first)."""
+        state = cls()
+        if not conversation_history or len(conversation_history) < 2:
+            return state
+        for msg in conversation_history[-HISTORY_WINDOW:]:
+            content = str(msg.get("content", ""))
+            if msg.get("role") == "user":
+                state.observe_user(content)
+            elif msg.get("role") == "assistant":
+                state.observe_assistant(content)
+        return state
+
+
+class ConversationContextStore:
+    """
+    ConversationState per (user, conversation) in SQLite.
+
+    Connections are opened per thread and per process, as in the answer
+    cache. Any database error is logged and treated as an empty context:
+    follow-ups then simply aren't resolved.
+    """
+
+    def __init__(self, path: str, ttl: float = 3600, turns: int = HISTORY_WINDOW // 2):
+        self.path = path
+        self.ttl = ttl
+        self.turns = turns
+        self._local = threading.local()
+        self._open()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _open(self):
+        """Create the table and drop expired conversations."""
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = self._connection()
+            # Contexts used to be kept per (user, trip); they are short-lived,
+            # so the old table is dropped rather than migrated
+            conn.execute("DROP TABLE IF EXISTS contexts")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS conversations (
+                       user_id INTEGER NOT NULL,
+                       conversation TEXT NOT NULL,
+                       state TEXT NOT NULL,
+                       updated REAL NOT NULL,
+                       PRIMARY KEY (user_id, conversation)
+                   )"""
+            )
+            conn.execute("DELETE FROM conversations WHERE updated < ?", (time.time() - self.ttl,))
+        except sqlite3.Error as e:
+            print(f"Warning: Could not open conversation context store at {self.path}: {e}")
+
+    def get(self, user_id: int, conversation: str) -> ConversationState:
+        """
+        Context of one of the user's conversations (see conversation_key);
+        empty if none or expired, without topics / locations older than self.turns.
+        """
+        try:
+            row = self._connection().execute(
+                "SELECT state, updated FROM conversations WHERE user_id = ? AND conversation = ?",
+                (user_id, conversation)
+            ).fetchone()
+            if row is None or row[1] < time.time() - self.ttl:
+                return ConversationState()
+            state = ConversationState(**json.loads(row[0]))
+            state.expire(self.turns)
+            return state
+        except (sqlite3.Error, ValueError, TypeError) as e:
+            print(f"Warning: Conversation context lookup failed: {e}")
+            return ConversationState()
+
+    def put(self, user_id: int, conversation: str, state: ConversationState):
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO conversations (user_id, conversation, state, updated) VALUES (?, ?, ?, ?)",
+                (user_id, conversation, json.dumps(asdict(state)), time.time())
+            )
+        except sqlite3.Error as e:
+            print(f"Warning: Conversation context write failed: {e}")
+
+    def clear(self, user_id: int, conversation: str):
+        try:
+            self._connection().execute(
+                "DELETE FROM conversations WHERE user_id = ? AND conversation = ?", (user_id, conversation)
+            )
+        except sqlite3.Error as e:
+            print(f"Warning: Could not clear conversation context: {e}")
+
+
+def conversation_key(conversation_id: Optional[str], trip_id: Optional[int]) -> str:
+    """
+    Store key of a conversation: the client's conversation id (one per open
+    chat), or for clients that send none, the trip (one shared conversation).
+    """
+    if conversation_id:
+        return "c:" + str(conversation_id)[:MAX_CONVERSATION_ID]
+    return f"trip:{trip_id or 0}"
+
+
+_store: Optional[ConversationContextStore] = None
+_store_lock = threading.Lock()
+
+
+def get_context_store() -> ConversationContextStore:
+    """Process-wide context store configured from the environment."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ConversationContextStore(
+                    os.getenv("CONVERSATION_CONTEXT_PATH", DEFAULT_CONTEXT_PATH),
+                    float(os.getenv("CONVERSATION_CONTEXT_TTL", "3600")),
+                    int(os.getenv("CONVERSATION_CONTEXT_TURNS", str(HISTORY_WINDOW // 2)))
+                )
+    return _store
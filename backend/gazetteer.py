@@ -0,0 +1,506 @@
+"""
+TripMate Location Gazetteer
+One place-name index shared by the chat and retrieval modules. Countries and
+cities come from airports.dat, plus the curated destinations, regions,
+aliases and demonyms the chat has always known about. They are compiled into a
+single token-level Aho-Corasick automaton, so finding every place mentioned in
+a text is one pass over its words with whole-word matching, no matter how many
+names are loaded.
+
+Names are normalized to lowercase ASCII ('São Paulo' -> 'sao paulo') and
+countries to the canonical forms used across the codebase ('usa', 'uk',
+'uae', ...).
+"""
+
+import csv
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, deque, namedtuple
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+AIRPORTS_PATH = os.path.join(os.path.dirname(__file__), "airports.dat")
+
+# kind is 'country', 'city' or 'region'; country is the canonical country
+# name (None for multi-country regions such as 'south america')
+Place = namedtuple('Place', ['name', 'kind', 'country'])
+Match = namedtuple('Match', ['start', 'end', 'surface', 'place'])
+
+# airports.dat country names that the codebase refers to differently
+COUNTRY_CANONICAL = {
+    'united states': 'usa',
+    'united kingdom': 'uk',
+    'united arab emirates': 'uae',
+    'burma': 'myanmar',
+    'east timor': 'timor-leste',
+}
+
+# Aliases and demonyms per canonical country ('us' is deliberately absent:
+# it is far more often the pronoun)
+COUNTRY_ALIASES = {
+    'usa': ['usa', 'united states', 'united states of america', 'america', 'u.s.', 'u.s.a.', 'american'],
+    'uk': ['uk', 'united kingdom', 'britain', 'great britain', 'british', 'england', 'scotland', 'wales'],
+    'uae': ['uae', 'united arab emirates', 'emirates'],
+    'japan': ['japan', 'japanese'],
+    'australia': ['australia', 'australian'],
+    'indonesia': ['indonesia', 'indonesian'],
+    'thailand': ['thailand', 'thai'],
+    'india': ['india', 'indian'],
+    'china': ['china', 'chinese'],
+    'france': ['france', 'french'],
+    'italy': ['italy', 'italian'],
+    'spain': ['spain', 'spanish'],
+    'switzerland': ['switzerland', 'swiss'],
+    'finland': ['finland', 'finnish'],
+    'canada': ['canada', 'canadian'],
+    'vietnam': ['vietnam', 'vietnamese'],
+    'philippines': ['philippines', 'filipino'],
+    'malaysia': ['malaysia', 'malaysian'],
+    'cambodia': ['cambodia', 'cambodian', 'khmer'],
+    'myanmar': ['myanmar', 'burmese', 'burma'],
+    'laos': ['laos', 'laotian'],
+    'brunei': ['brunei'],
+    'timor-leste': ['timor-leste', 'east timor', 'timor'],
+    'maldives': ['maldives', 'maldivian'],
+    'iceland': ['iceland', 'icelandic'],
+    'new zealand': ['new zealand', 'zealand'],
+    'argentina': ['argentina', 'argentinian'],
+    'brazil': ['brazil', 'brazilian'],
+    'chile': ['chile', 'chilean'],
+    'peru': ['peru', 'peruvian'],
+    'colombia': ['colombia', 'colombian'],
+    'mexico': ['mexico', 'mexican'],
+    'south korea': ['south korea', 'korea', 'korean'],
+    'egypt': ['egypt', 'egyptian'],
+    'south africa': ['south africa', 'south african'],
+    'kenya': ['kenya', 'kenyan'],
+    'sweden': ['sweden', 'swedish'],
+    'norway': ['norway', 'norwegian'],
+    'germany': ['germany', 'german'],
+    'greece': ['greece', 'greek'],
+    'portugal': ['portugal', 'portuguese'],
+    'turkey': ['turkey', 'turkish'],
+    'jamaica': ['jamaica', 'jamaican'],
+}
+
+# Countries the dataset covers most heavily; an answer about one of them is
+# off-topic for a question about another
+MAJOR_COUNTRIES = frozenset({'japan', 'usa', 'india', 'australia', 'italy', 'france', 'spain', 'thailand', 'china'})
+
+# Destinations the dataset covers, with their country and aliases. These are
+# all reported as cities, including islands/regions the chat treats as a
+# destination in their own right (bali, hokkaido, palawan, ...)
+CURATED_CITIES = {
+    # Japan
+    'tokyo': ('japan', ['tokyo']),
+    'kyoto': ('japan', ['kyoto']),
+    'osaka': ('japan', ['osaka']),
+    'hokkaido': ('japan', ['hokkaido']),
+    'sapporo': ('japan', ['sapporo']),
+    'fukuoka': ('japan', ['fukuoka']),
+    'hiroshima': ('japan', ['hiroshima']),
+    'nara': ('japan', ['nara']),
+    'niseko': ('japan', ['niseko']),
+    'hakuba': ('japan', ['hakuba']),
+    'kamakura': ('japan', ['kamakura']),
+    'kanazawa': ('japan', ['kanazawa']),
+    # East Asia
+    'shanghai': ('china', ['shanghai', 'pudong']),
+    'beijing': ('china', ['beijing']),
+    'hong kong': ('china', ['hong kong']),
+    'taipei': ('taiwan', ['taipei']),
+    'seoul': ('south korea', ['seoul']),
+    'busan': ('south korea', ['busan']),
+    # Southeast Asia - Malaysia
+    'kuala lumpur': ('malaysia', ['kuala lumpur', 'kl']),
+    'penang': ('malaysia', ['penang', 'george town penang']),
+    'langkawi': ('malaysia', ['langkawi']),
+    'malacca': ('malaysia', ['malacca', 'melaka']),
+    'kota kinabalu': ('malaysia', ['kota kinabalu']),
+    'johor bahru': ('malaysia', ['johor bahru', 'johor']),
+    'ipoh': ('malaysia', ['ipoh']),
+    'kuching': ('malaysia', ['kuching']),
+    'cameron highlands': ('malaysia', ['cameron highlands']),
+    # Southeast Asia - Philippines
+    'manila': ('philippines', ['manila']),
+    'cebu': ('philippines', ['cebu']),
+    'boracay': ('philippines', ['boracay']),
+    'palawan': ('philippines', ['palawan', 'el nido', 'coron']),
+    'siargao': ('philippines', ['siargao']),
+    'baguio': ('philippines', ['baguio']),
+    'davao': ('philippines', ['davao']),
+    'bohol': ('philippines', ['bohol']),
+    # Southeast Asia - Indonesia
+    'bali': ('indonesia', ['bali', 'ubud', 'seminyak', 'kuta bali']),
+    'jakarta': ('indonesia', ['jakarta']),
+    'yogyakarta': ('indonesia', ['yogyakarta', 'jogja', 'jogjakarta']),
+    'bandung': ('indonesia', ['bandung']),
+    'surabaya': ('indonesia', ['surabaya']),
+    'lombok': ('indonesia', ['lombok', 'gili trawangan', 'gili islands']),
+    'medan': ('indonesia', ['medan', 'lake toba']),
+    'semarang': ('indonesia', ['semarang']),
+    # Southeast Asia - Thailand
+    'bangkok': ('thailand', ['bangkok']),
+    'chiang mai': ('thailand', ['chiang mai', 'chiangmai']),
+    'phuket': ('thailand', ['phuket']),
+    'pattaya': ('thailand', ['pattaya']),
+    'krabi': ('thailand', ['krabi', 'railay']),
+    'koh samui': ('thailand', ['koh samui', 'samui']),
+    # Southeast Asia - Vietnam
+    'hanoi': ('vietnam', ['hanoi']),
+    'ho chi minh city': ('vietnam', ['ho chi minh', 'ho chi minh city', 'saigon', 'hcmc']),
+    'da nang': ('vietnam', ['da nang', 'danang']),
+    'hoi an': ('vietnam', ['hoi an', 'hoian']),
+    'nha trang': ('vietnam', ['nha trang']),
+    # Southeast Asia - Cambodia / Myanmar / Laos
+    'siem reap': ('cambodia', ['siem reap', 'angkor']),
+    'phnom penh': ('cambodia', ['phnom penh']),
+    'yangon': ('myanmar', ['yangon', 'rangoon']),
+    'mandalay': ('myanmar', ['mandalay']),
+    'bagan': ('myanmar', ['bagan']),
+    'vientiane': ('laos', ['vientiane']),
+    'luang prabang': ('laos', ['luang prabang']),
+    # Southeast Asia - Singapore & Brunei
+    'singapore': ('singapore', ['singapore']),
+    'bandar seri begawan': ('brunei', ['bandar seri begawan']),
+    # Oceania
+    'sydney': ('australia', ['sydney']),
+    'melbourne': ('australia', ['melbourne']),
+    'brisbane': ('australia', ['brisbane']),
+    'perth': ('australia', ['perth']),
+    'adelaide': ('australia', ['adelaide']),
+    'auckland': ('new zealand', ['auckland']),
+    'wellington': ('new zealand', ['wellington']),
+    'queenstown': ('new zealand', ['queenstown']),
+    # Europe
+    'paris': ('france', ['paris']),
+    'london': ('uk', ['london']),
+    'rome': ('italy', ['rome']),
+    'venice': ('italy', ['venice']),
+    'positano': ('italy', ['positano']),
+    'barcelona': ('spain', ['barcelona']),
+    'madrid': ('spain', ['madrid']),
+    'amsterdam': ('netherlands', ['amsterdam']),
+    'berlin': ('germany', ['berlin']),
+    'munich': ('germany', ['munich']),
+    'prague': ('czech republic', ['prague']),
+    'budapest': ('hungary', ['budapest']),
+    'vienna': ('austria', ['vienna']),
+    'lisbon': ('portugal', ['lisbon']),
+    'athens': ('greece', ['athens']),
+    'dublin': ('ireland', ['dublin']),
+    'zermatt': ('switzerland', ['zermatt']),
+    'lapland': ('finland', ['lapland']),
+    'stockholm': ('sweden', ['stockholm']),
+    # Americas
+    'buenos aires': ('argentina', ['buenos aires', 'buenosaires']),
+    'rio de janeiro': ('brazil', ['rio de janeiro', 'rio']),
+    'sao paulo': ('brazil', ['sao paulo']),
+    'lima': ('peru', ['lima']),
+    'bogota': ('colombia', ['bogota']),
+    'santiago': ('chile', ['santiago']),
+    'mexico city': ('mexico', ['mexico city']),
+    'new york': ('usa', ['new york', 'nyc', 'new york city']),
+    'los angeles': ('usa', ['los angeles']),
+    'chicago': ('usa', ['chicago']),
+    'san francisco': ('usa', ['san francisco']),
+    'miami': ('usa', ['miami']),
+    'seattle': ('usa', ['seattle']),
+    'boston': ('usa', ['boston']),
+    'aspen': ('usa', ['aspen']),
+    'lake tahoe': ('usa', ['lake tahoe']),
+    'sedona': ('usa', ['sedona']),
+    'toronto': ('canada', ['toronto']),
+    'vancouver': ('canada', ['vancouver']),
+    'montreal': ('canada', ['montreal']),
+    'banff': ('canada', ['banff']),
+    'kingston': ('jamaica', ['kingston']),
+    'montego bay': ('jamaica', ['montego bay']),
+    'negril': ('jamaica', ['negril']),
+    'ocho rios': ('jamaica', ['ocho rios']),
+    'port antonio': ('jamaica', ['port antonio']),
+    # Middle East / Africa / South Asia
+    'dubai': ('uae', ['dubai']),
+    'istanbul': ('turkey', ['istanbul']),
+    'cairo': ('egypt', ['cairo']),
+    'cape town': ('south africa', ['cape town']),
+    'nairobi': ('kenya', ['nairobi']),
+    'mumbai': ('india', ['mumbai']),
+    'delhi': ('india', ['delhi', 'new delhi']),
+    'bangalore': ('india', ['bangalore']),
+    'kochi': ('india', ['kochi', 'cochin']),
+    # airports.dat files these under a same-named city elsewhere, or lacks them
+    'glasgow': ('uk', ['glasgow']),
+    'oxford': ('uk', ['oxford']),
+    'jerusalem': ('israel', ['jerusalem']),
+    'santa barbara': ('usa', ['santa barbara']),
+    'beaver creek': ('usa', ['beaver creek']),
+    'la paz': ('bolivia', ['la paz']),
+    'cusco': ('peru', ['cusco', 'cuzco']),
+    'tulum': ('mexico', ['tulum']),
+    'santorini': ('greece', ['santorini']),
+    'kandy': ('sri lanka', ['kandy']),
+    'galle': ('sri lanka', ['galle']),
+}
+
+# States, provinces and other regions (reported as 'region', never as cities)
+REGIONS = {
+    'colorado': ('usa', ['colorado']),
+    'california': ('usa', ['california']),
+    'nevada': ('usa', ['nevada']),
+    'arizona': ('usa', ['arizona']),
+    'hawaii': ('usa', ['hawaii']),
+    'new jersey': ('usa', ['new jersey']),
+    'queensland': ('australia', ['queensland']),
+    'victoria': ('australia', ['victoria']),
+    'tasmania': ('australia', ['tasmania']),
+    'sumatra': ('indonesia', ['sumatra']),
+    'java': ('indonesia', ['java']),
+    'andaman': ('india', ['andaman', 'andaman islands']),
+    'nicobar': ('india', ['nicobar']),
+    'rajasthan': ('india', ['rajasthan']),
+    'kerala': ('india', ['kerala']),
+    'ontario': ('canada', ['ontario']),
+    'amalfi': ('italy', ['amalfi', 'amalfi coast']),
+    'fiordland': ('new zealand', ['fiordland']),
+    'patagonia': (None, ['patagonia']),
+    'south america': (None, ['south america', 'latin america']),
+    'central america': (None, ['central america']),
+    'north america': (None, ['north america']),
+    'southeast asia': (None, ['southeast asia', 'south east asia']),
+    'europe': (None, ['europe']),
+    'asia': (None, ['asia']),
+}
+
+# airports.dat names that are far more often ordinary words in travel questions
+AMBIGUOUS_NAMES = {
+    'ada', 'alabaster', 'albert', 'alert', 'along', 'alpine', 'aurora', 'bath', 'batman', 'bay',
+    'beach', 'best', 'big', 'buffalo', 'caldera', 'caribou', 'carolina', 'center', 'central',
+    'centre', 'chad', 'chase', 'churchill', 'circle', 'city', 'coca', 'cody', 'colon',
+    'columbia', 'concord', 'coronation', 'crystal', 'david', 'dell', 'delta', 'douglas',
+    'eagle', 'ely', 'emerald', 'eureka', 'falls', 'franklin', 'george', 'georgia', 'ghat',
+    'gold', 'golden', 'grand', 'grove', 'guinea', 'hamilton', 'hay', 'hearst', 'helena', 'hola',
+    'holland', 'hon', 'hope', 'hot springs', 'imperial', 'independence', 'island', 'jackson',
+    'jersey', 'kerry', 'lake', 'lawrence', 'liberty', 'lincoln', 'line', 'logan', 'long',
+    'lopez', 'madison', 'male', 'mama', 'man', 'mango', 'manta', 'marathon', 'march', 'mayo',
+    'mesa', 'midway', 'mobile', 'mona', 'mount', 'mountain view', 'mountain village', 'nelson',
+    'newton', 'nice', 'north shore', 'orange', 'page', 'papa', 'paradise', 'pierre', 'pisco',
+    'plains', 'point', 'port', 'price', 'providence', 'reading', 'reunion', 'richmond',
+    'riverside', 'rock', 'sale', 'salmon', 'sandy', 'santo', 'south bend', 'spa', 'split',
+    'springs', 'stanley', 'summit', 'sun', 'temple', 'terrace', 'the valley', 'thompson',
+    'tours', 'trail', 'troy', 'valley', 'van', 'zero',
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, accent-free text ('São Paulo' -> 'sao paulo')."""
+    text = str(text).lower()
+    if text.isascii():
+        return text
+    return ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+
+
+def _tokens(name: str) -> Tuple[str, ...]:
+    return tuple(_TOKEN_RE.findall(normalize(name)))
+
+
+class Gazetteer:
+    """Token-level Aho-Corasick automaton over place names."""
+
+    def __init__(self):
+        self.places: Dict[Tuple[str, ...], Place] = {}
+        self.curated: Set[str] = set()
+        # Automaton: goto[state] maps token -> state, fail[state] is the
+        # failure link, out[state] lists (pattern length, Place) ending here
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Place]]] = [[]]
+
+    def add(self, surface: str, place: Place, curated: bool = False, override: bool = True):
+        """Register a surface form for a place (before compile())."""
+        key = _tokens(surface)
+        if not key:
+            return
+        if override or key not in self.places:
+            self.places[key] = place
+        if curated:
+            self.curated.add(' '.join(key))
+
+    def compile(self):
+        """Build the trie, failure links and merged outputs."""
+        self._goto, self._fail, self._out = [{}], [0], [[]]
+        for key, place in self.places.items():
+            state = 0
+            for token in key:
+                nxt = self._goto[state].get(token)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][token] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append((len(key), place))
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(token, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        self.find.cache_clear()
+        return self
+
+    @lru_cache(maxsize=50000)
+    def find(self, text: str) -> Tuple[Match, ...]:
+        """
+        All place mentions in text, leftmost-longest and non-overlapping,
+        in order of appearance.
+        """
+        normalized = normalize(text)
+        spans = [(m.start(), m.end(), m.group(0)) for m in _TOKEN_RE.finditer(normalized)]
+        candidates = []
+        state = 0
+        for i, (_, _, token) in enumerate(spans):
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            for length, place in self._out[state]:
+                candidates.append((i - length + 1, i, place))
+        if not candidates:
+            return ()
+        candidates.sort(key=lambda c: (c[0], c[0] - c[1]))
+        matches = []
+        last_end = -1
+        for start, end, place in candidates:
+            if start <= last_end:
+                continue
+            char_start, char_end = spans[start][0], spans[end][1]
+            matches.append(Match(char_start, char_end, normalized[char_start:char_end], place))
+            last_end = end
+        return tuple(matches)
+
+    def extract(self, text: str) -> Dict[str, List[str]]:
+        """{'countries': [...], 'cities': [...]} mentioned in text, in order of appearance."""
+        locations = {'countries': [], 'cities': []}
+        for match in self.find(text):
+            key = 'countries' if match.place.kind == 'country' else 'cities' if match.place.kind == 'city' else None
+            if key and match.place.name not in locations[key]:
+                locations[key].append(match.place.name)
+        return locations
+
+    def first_country(self, text: str) -> str:
+        """Country of the first place mentioned that has one ('' if none)."""
+        for match in self.find(text):
+            if match.place.country:
+                return match.place.country
+        return ""
+
+    def first_city(self, text: str) -> str:
+        """First city mentioned ('' if none)."""
+        for match in self.find(text):
+            if match.place.kind == 'city':
+                return match.place.name
+        return ""
+
+    def countries_mentioned(self, text: str, include_cities: bool = False) -> Set[str]:
+        """Countries named in text (optionally also the countries of curated cities mentioned)."""
+        countries = set()
+        for match in self.find(text):
+            if match.place.kind == 'country':
+                countries.add(match.place.country)
+            elif include_cities and match.place.kind == 'city' and match.surface in self.curated and match.place.country:
+                countries.add(match.place.country)
+        return countries
+
+    def has_location(self, text: str) -> bool:
+        return bool(self.find(text))
+
+    def country_of(self, name: str) -> Optional[str]:
+        place = self.places.get(_tokens(name))
+        return place.country if place else None
+
+    def is_place(self, name: str) -> bool:
+        return _tokens(name) in self.places
+
+    def place_names(self) -> List[str]:
+        """Every surface form, space-joined."""
+        return [' '.join(key) for key in self.places]
+
+
+def _load_airports(path: str):
+    """City -> Counter(country) and the set of country names from airports.dat."""
+    city_countries: Dict[str, Counter] = {}
+    countries = set()
+    if not os.path.exists(path):
+        return city_countries, countries
+    with open(path, encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) < 4:
+                continue
+            city, country = normalize(row[2]).strip(), normalize(row[3]).strip()
+            if not country or country == '\\n':
+                continue
+            country = COUNTRY_CANONICAL.get(country, country)
+            countries.add(country)
+            if city and city != '\\n':
+                city_countries.setdefault(city, Counter())[country] += 1
+    return city_countries, countries
+
+
+def build_gazetteer(airports_path: str = AIRPORTS_PATH, extra_places: Iterable[Tuple[str, Place]] = ()) -> Gazetteer:
+    """Compile the gazetteer from airports.dat plus the curated tables."""
+    gazetteer = Gazetteer()
+    city_countries, countries = _load_airports(airports_path)
+
+    # Airport cities first (lowest priority), each mapped to the country
+    # with the most airports of that name
+    for city, country_counts in city_countries.items():
+        key = _tokens(city)
+        if not key or ' '.join(key) in AMBIGUOUS_NAMES or (len(key) == 1 and len(key[0]) < 3):
+            continue
+        gazetteer.add(city, Place(' '.join(key), 'city', country_counts.most_common(1)[0][0]))
+
+    # Countries win over same-named airport cities (luxembourg, panama, ...)
+    for country in countries:
+        if ' '.join(_tokens(country)) in AMBIGUOUS_NAMES:
+            continue
+        gazetteer.add(country, Place(country, 'country', country))
+
+    # Curated tables have the final say
+    for region, (country, aliases) in REGIONS.items():
+        for alias in aliases:
+            gazetteer.add(alias, Place(region, 'region', country), curated=True)
+    for city, (country, aliases) in CURATED_CITIES.items():
+        for alias in aliases:
+            gazetteer.add(alias, Place(city, 'city', country), curated=True)
+    for country, aliases in COUNTRY_ALIASES.items():
+        for alias in aliases:
+            gazetteer.add(alias, Place(country, 'country', country), curated=True)
+    for surface, place in extra_places:
+        gazetteer.add(surface, place, curated=True)
+
+    return gazetteer.compile()
+
+
+_gazetteer = None
+_lock = threading.Lock()
+
+
+def get_gazetteer() -> Gazetteer:
+    """Get or build the per-process gazetteer instance."""
+    global _gazetteer
+    if _gazetteer is None:
+        with _lock:
+            if _gazetteer is None:
+                _gazetteer = build_gazetteer()
+    return _gazetteer
@@ -0,0 +1,14 @@
+"""
+TripMate Gunicorn Hooks
+Read by gunicorn from the working directory (backend/, see Procfile).
+"""
+
+
+def post_fork(server, worker):
+    # The worker is still single-threaded here (its request threads start
+    # later), so this is the one safe place to fork chat pool processes
+    try:
+        from chat_pool import start_chat_pools
+        start_chat_pools()
+    except Exception as e:
+        print(f"Warning: Could not start chat worker pool: {e}")
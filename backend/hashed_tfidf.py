@@ -0,0 +1,186 @@
+"""
+TripMate Hashed TF-IDF
+Fit-free alternative to TfidfVectorizer: terms are hashed into a fixed number
+of columns, so documents can be vectorized chunk by chunk (and in parallel)
+without first building a vocabulary over the whole corpus. Only the document
+frequency table is learned; it is updated incrementally and persisted as a
+small .npz file.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+from typing import Iterable, Iterator, List, Optional
+
+
+def _hash_chunk(hasher: HashingVectorizer, texts: List[str]) -> sparse.csr_matrix:
+    """Raw term counts for one chunk (module level so worker processes can run it)."""
+    return hasher.transform(texts)
+
+
+def build_workers() -> int:
+    """Worker processes for index builds, from INDEX_BUILD_WORKERS (default 1 = in-process)."""
+    try:
+        return max(1, int(os.getenv("INDEX_BUILD_WORKERS", "1")))
+    except ValueError:
+        return 1
+
+
+class HashedTfidf:
+    """
+    TF-IDF over hashed features.
+
+    Produces the same weighting as sklearn's TfidfVectorizer defaults
+    (smooth idf = ln((1 + n) / (1 + df)) + 1, l2-normalized rows), with
+    min_df / max_df applied by zeroing the idf of pruned columns.
+    """
+
+    def __init__(self, n_features: int = 2 ** 18, ngram_range=(1, 2), stop_words='english',
+                 min_df: int = 1, max_df: float = 1.0, lowercase: bool = True,
+                 strip_accents: Optional[str] = 'unicode'):
+        self.n_features = n_features
+        self.ngram_range = tuple(ngram_range)
+        self.stop_words = stop_words
+        self.min_df = min_df
+        self.max_df = max_df
+        self.lowercase = lowercase
+        self.strip_accents = strip_accents
+        self.n_docs = 0
+        self.doc_freq = np.zeros(n_features, dtype=np.int64)
+        self.idf_ = None
+        self._hasher = self._make_hasher()
+
+    def _make_hasher(self) -> HashingVectorizer:
+        return HashingVectorizer(
+            n_features=self.n_features,
+            ngram_range=self.ngram_range,
+            stop_words=self.stop_words,
+            lowercase=self.lowercase,
+            strip_accents=self.strip_accents,
+            alternate_sign=False,
+            norm=None
+        )
+
+    def hash_counts(self, texts: List[str], chunksize: int = 2000, workers: int = 1) -> sparse.csr_matrix:
+        """Raw hashed term counts, split into chunks across worker processes if workers > 1."""
+        texts = list(texts)
+        if workers <= 1 or len(texts) <= chunksize:
+            return _hash_chunk(self._hasher, texts)
+        chunks = [texts[i:i + chunksize] for i in range(0, len(texts), chunksize)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_hash_chunk, repeat(self._hasher), chunks))
+        return sparse.vstack(parts, format='csr')
+
+    def hash_chunks(self, chunks: Iterable[List[str]], workers: int = 1) -> Iterator[sparse.csr_matrix]:
+        """Raw hashed term counts of each chunk of texts, in order, across worker processes if workers > 1."""
+        if workers <= 1:
+            for texts in chunks:
+                yield _hash_chunk(self._hasher, list(texts))
+            return
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            yield from pool.map(_hash_chunk, repeat(self._hasher), chunks)
+
+    def partial_fit_counts(self, counts: sparse.csr_matrix):
+        """Add a block of raw counts to the document frequency table."""
+        self.doc_freq += np.bincount(counts.indices, minlength=self.n_features)
+        self.n_docs += counts.shape[0]
+        self._update_idf()
+        return self
+
+    def partial_fit(self, texts: List[str]):
+        """Add documents to the document frequency table."""
+        return self.partial_fit_counts(self.hash_counts(texts))
+
+    def _update_idf(self):
+        idf = np.log((1 + self.n_docs) / (1 + self.doc_freq)) + 1
+        # Pruned columns (too rare / too common) get zero weight, like a
+        # vocabulary that never contained them
+        max_doc_count = self.max_df if isinstance(self.max_df, int) else self.max_df * self.n_docs
+        pruned = (self.doc_freq < self.min_df) | (self.doc_freq > max_doc_count)
+        idf[pruned] = 0.0
+        self.idf_ = idf
+
+    def weight(self, counts: sparse.csr_matrix) -> sparse.csr_matrix:
+        """Apply idf and l2-normalize raw counts."""
+        if self.idf_ is None:
+            raise ValueError("HashedTfidf has no document frequencies yet; call fit_transform or partial_fit first")
+        weighted = counts.multiply(self.idf_).tocsr()
+        weighted.eliminate_zeros()
+        return normalize(weighted, norm='l2', copy=False)
+
+    def fit_transform(self, texts: Iterable[str], chunksize: int = 2000, workers: Optional[int] = None) -> sparse.csr_matrix:
+        """Hash all texts (in parallel chunks), learn document frequencies and return TF-IDF rows."""
+        counts = self.hash_counts(texts, chunksize=chunksize, workers=build_workers() if workers is None else workers)
+        self.partial_fit_counts(counts)
+        return self.weight(counts)
+
+    def transform(self, texts: Iterable[str]) -> sparse.csr_matrix:
+        """Vectorize new texts with the current idf table (no refit)."""
+        return self.weight(self.hash_counts(list(texts)))
+
+    def save(self, path: str):
+        """Persist config and document frequency table."""
+        np.savez(
+            path,
+            doc_freq=self.doc_freq,
+            n_docs=np.int64(self.n_docs),
+            n_features=np.int64(self.n_features),
+            ngram_range=np.array(self.ngram_range),
+            min_df=np.float64(self.min_df),
+            max_df=np.float64(self.max_df),
+            stop_words=np.array(self.stop_words or ''),
+            lowercase=np.bool_(self.lowercase),
+            strip_accents=np.array(self.strip_accents or '')
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'HashedTfidf':
+        """Load a table written by save()."""
+        with np.load(path) as data:
+            min_df = float(data['min_df'])
+            max_df = float(data['max_df'])
+            model = cls(
+                n_features=int(data['n_features']),
+                ngram_range=tuple(int(n) for n in data['ngram_range']),
+                stop_words=str(data['stop_words']) or None,
+                min_df=int(min_df) if min_df.is_integer() else min_df,
+                max_df=int(max_df) if max_df.is_integer() and max_df > 1 else max_df,
+                lowercase=bool(data['lowercase']),
+                strip_accents=str(data['strip_accents']) or None
+            )
+            model.doc_freq = data['doc_freq'].astype(np.int64)
+            model.n_docs = int(data['n_docs'])
+        model._update_idf()
+        return model
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_hasher', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._hasher = self._make_hasher()
+
+
+def iter_csv_chunks(csv_path: str, chunksize: int = 2000) -> Iterator[pd.DataFrame]:
+    """
+    Stream the travel QA CSV in chunks with standardized column names and
+    duplicates removed across the whole file (first occurrence wins, like
+    DataFrame.drop_duplicates).
+    """
+    seen = set()
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        chunk.columns = [col.strip().lower().replace(' ', '_') for col in chunk.columns]
+        row_hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+        keep = np.zeros(len(chunk), dtype=bool)
+        for i, row_hash in enumerate(row_hashes):
+            if row_hash not in seen:
+                seen.add(row_hash)
+                keep[i] = True
+        yield chunk[keep]
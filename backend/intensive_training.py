@@ -4,46 +4,44 @@ import io
 import time
 import random
 from datetime import datetime
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
 sys.path.insert(0, 'backend')
 from retrieval_augmented_ai import DatasetOnlyChat
 
+# Cities looked for in the dataset responses
+COMMON_CITIES = [
+    'tokyo', 'paris', 'london', 'new york', 'bangkok', 'singapore', 'dubai',
+    'sydney', 'melbourne', 'barcelona', 'rome', 'amsterdam', 'vienna', 'prague',
+    'budapest', 'istanbul', 'cairo', 'marrakech', 'cape town', 'nairobi',
+    'seoul', 'taipei', 'manila', 'ho chi minh', 'hanoi', 'phnom penh',
+    'bogotá', 'lima', 'buenos aires', 'rio de janeiro', 'santiago',
+    'mexico city', 'montreal', 'vancouver', 'edinburgh', 'dublin',
+    'stockholm', 'copenhagen', 'oslo', 'helsinki', 'reykjavik',
+    'lisbon', 'porto', 'athens', 'santorini', 'mykonos',
+    'dubrovnik', 'split', 'zagreb', 'bucharest', 'sofia',
+    'belgrade', 'ljubljana', 'tallinn', 'riga', 'vilnius',
+    'tel aviv', 'jerusalem', 'doha', 'muscat', 'luxor',
+    'fes', 'casablanca', 'johannesburg', 'lagos', 'accra',
+    'dar es salaam', 'addis ababa', 'ulaanbaatar', 'almaty',
+    'tashkent', 'samarkand', 'baku', 'yerevan', 'tbilisi',
+    'cancun', 'playa del carmen', 'tulum', 'guadalajara',
+    'córdoba', 'mendoza', 'são paulo', 'salvador', 'cusco',
+    'arequipa', 'medellín', 'cartagena', 'valparaíso', 'quito',
+    'guayaquil', 'la paz', 'sucre', 'montevideo', 'asunción',
+    'panama city', 'san josé', 'havana', 'santo domingo'
+]
+
+VAGUE_QUERIES = ['what', 'why', 'hello', 'ok', 'hi', 'thanks', 'yes', 'no', 'maybe', 'help']
+
 # Load all cities from dataset to generate comprehensive queries
 def get_all_cities():
-    """Extract cities from dataset"""
-    import pandas as pd
-    import os
-    csv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'travel_QA (1).csv')
-    df = pd.read_csv(csv_path)
-    cities = set()
-    for _, row in df.iterrows():
-        response = str(row.get('response', '')).lower()
-        # Extract common city patterns
-        common_cities = [
-            'tokyo', 'paris', 'london', 'new york', 'bangkok', 'singapore', 'dubai',
-            'sydney', 'melbourne', 'barcelona', 'rome', 'amsterdam', 'vienna', 'prague',
-            'budapest', 'istanbul', 'cairo', 'marrakech', 'cape town', 'nairobi',
-            'seoul', 'taipei', 'manila', 'ho chi minh', 'hanoi', 'phnom penh',
-            'bogotá', 'lima', 'buenos aires', 'rio de janeiro', 'santiago',
-            'mexico city', 'montreal', 'vancouver', 'edinburgh', 'dublin',
-            'stockholm', 'copenhagen', 'oslo', 'helsinki', 'reykjavik',
-            'lisbon', 'porto', 'athens', 'santorini', 'mykonos',
-            'dubrovnik', 'split', 'zagreb', 'bucharest', 'sofia',
-            'belgrade', 'ljubljana', 'tallinn', 'riga', 'vilnius',
-            'tel aviv', 'jerusalem', 'doha', 'muscat', 'luxor',
-            'fes', 'casablanca', 'johannesburg', 'lagos', 'accra',
-            'dar es salaam', 'addis ababa', 'ulaanbaatar', 'almaty',
-            'tashkent', 'samarkand', 'baku', 'yerevan', 'tbilisi',
-            'cancun', 'playa del carmen', 'tulum', 'guadalajara',
-            'córdoba', 'mendoza', 'são paulo', 'salvador', 'cusco',
-            'arequipa', 'medellín', 'cartagena', 'valparaíso', 'quito',
-            'guayaquil', 'la paz', 'sucre', 'montevideo', 'asunción',
-            'panama city', 'san josé', 'havana', 'santo domingo'
-        ]
-        for city in common_cities:
-            if city in response:
-                cities.add(city)
-    return sorted(list(cities))
+    """Extract cities from dataset (those of COMMON_CITIES that some response mentions)"""
+    from chat_engines import load_corpus
+    df = load_corpus()
+    if df is None:
+        return []
+    # One lowercased text of all responses; a city is found if any response contains it
+    text = '\n'.join(df['response'].astype(str).str.lower())
+    return sorted(city for city in set(COMMON_CITIES) if city in text)
 
 def generate_comprehensive_queries():
     """Generate extensive test queries"""
@@ -140,8 +138,7 @@ def generate_comprehensive_queries():
         queries.extend([t.format(city=city) for t in random.sample(practical_templates, 2)])
     
     # Add edge cases and vague queries
-    vague_queries = ['what', 'why', 'hello', 'ok', 'hi', 'thanks', 'yes', 'no', 'maybe', 'help']
-    queries.extend(vague_queries)
+    queries.extend(VAGUE_QUERIES)
     
     # Add broad queries
     broad_queries = [
@@ -168,19 +165,9 @@ def generate_comprehensive_queries():
     
     return queries
 
-def intensive_training(duration_minutes=60):
-    """Run intensive training for specified duration"""
-    print("=" * 80)
-    print("INTENSIVE TRAINING SESSION")
-    print(f"Duration: {duration_minutes} minutes")
-    print(f"Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("=" * 80)
-    
-    chat = DatasetOnlyChat()
-    start_time = time.time()
-    end_time = start_time + (duration_minutes * 60)
-    
-    results = {
+def new_results():
+    """Empty pass / fail tallies, overall and per category"""
+    return {
         'total': 0,
         'passed': 0,
         'failed': 0,
@@ -201,6 +188,83 @@ def intensive_training(duration_minutes=60):
         },
         'gaps': []
     }
+
+def categorize_query(query):
+    """Category of a generated query ('other' if none)"""
+    query_lower = query.lower()
+    if any(word in query_lower for word in ['eat', 'restaurant', 'food', 'dining', 'cuisine', 'dish']):
+        return 'food'
+    elif any(word in query_lower for word in ['attraction', 'things to do', 'what to see', 'activities', 'sight', 'visit']):
+        return 'attractions'
+    elif any(word in query_lower for word in ['stay', 'hotel', 'accommodation']):
+        return 'accommodation'
+    elif any(word in query_lower for word in ['transport', 'get around', 'public transport', 'travel']):
+        return 'transport'
+    elif any(word in query_lower for word in ['weather', 'best time', 'time to visit', 'climate', 'season']):
+        return 'weather'
+    elif 'shopping' in query_lower:
+        return 'shopping'
+    elif any(word in query_lower for word in ['visa', 'currency']):
+        return 'practical'
+    elif query_lower in VAGUE_QUERIES:
+        return 'vague'
+    elif any(word in query_lower for word in ['japan', 'italy', 'france', 'thailand', 'spain', 'germany', 'china', 'india']) and 'city' not in query_lower:
+        return 'broad'
+    elif any(word in query_lower for word in ['mountain', 'surf', 'hiking', 'climb']):
+        return 'special'
+    return 'other'
+
+def record_result(results, query, category, response_text):
+    """Check a response and add it to the tallies; returns whether it passed"""
+    results['total'] += 1
+    if category != 'other':
+        results['categories'][category]['total'] += 1
+    
+    # Check response quality
+    is_clarifying = any(phrase in response_text.lower() for phrase in ['could you', 'which', 'please', 'tell me', 'more specific'])
+    is_sorry = any(phrase in response_text.lower() for phrase in ['sorry', "couldn't find", "couldn't find relevant", "i'm sorry"])
+    is_relevant = len(response_text) > 50 and not is_sorry
+    
+    # Determine expected behavior
+    if category == 'vague':
+        passed, counter, gap = is_sorry, 'sorry', f"Vague query '{query}' didn't return sorry"
+    elif category == 'broad':
+        passed, counter, gap = is_clarifying, 'clarifying', f"Broad query '{query}' didn't ask clarifying question"
+    else:
+        passed, counter, gap = is_relevant, None, f"Query '{query}' returned irrelevant response"
+    
+    if passed:
+        results['passed'] += 1
+        if counter:
+            results[counter] += 1
+        if category != 'other':
+            results['categories'][category]['passed'] += 1
+    else:
+        results['failed'] += 1
+        results['gaps'].append(gap)
+    return passed
+
+def record_error(results, query, category, error):
+    results['total'] += 1
+    if category != 'other':
+        results['categories'][category]['total'] += 1
+    results['errors'] += 1
+    results['failed'] += 1
+    results['gaps'].append(f"Query '{query}' caused error: {str(error)}")
+
+def intensive_training(duration_minutes=60):
+    """Run intensive training for specified duration"""
+    print("=" * 80)
+    print("INTENSIVE TRAINING SESSION")
+    print(f"Duration: {duration_minutes} minutes")
+    print(f"Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("=" * 80)
+    
+    chat = DatasetOnlyChat()
+    start_time = time.time()
+    end_time = start_time + (duration_minutes * 60)
+    
+    results = new_results()
     
     # Generate comprehensive queries
     print("\nGenerating comprehensive test queries...")
@@ -227,83 +291,19 @@ def intensive_training(duration_minutes=60):
                 break
                 
             query_index += 1
-            results['total'] += 1
-            
-            # Categorize
-            category = 'other'
-            query_lower = query.lower()
-            if any(word in query_lower for word in ['eat', 'restaurant', 'food', 'dining', 'cuisine', 'dish']):
-                category = 'food'
-            elif any(word in query_lower for word in ['attraction', 'things to do', 'what to see', 'activities', 'sight', 'visit']):
-                category = 'attractions'
-            elif any(word in query_lower for word in ['stay', 'hotel', 'accommodation']):
-                category = 'accommodation'
-            elif any(word in query_lower for word in ['transport', 'get around', 'public transport', 'travel']):
-                category = 'transport'
-            elif any(word in query_lower for word in ['weather', 'best time', 'time to visit', 'climate', 'season']):
-                category = 'weather'
-            elif 'shopping' in query_lower:
-                category = 'shopping'
-            elif any(word in query_lower for word in ['visa', 'currency']):
-                category = 'practical'
-            elif query_lower in ['what', 'why', 'hello', 'ok', 'hi', 'thanks', 'yes', 'no', 'maybe', 'help']:
-                category = 'vague'
-            elif any(word in query_lower for word in ['japan', 'italy', 'france', 'thailand', 'spain', 'germany', 'china', 'india']) and 'city' not in query_lower:
-                category = 'broad'
-            elif any(word in query_lower for word in ['mountain', 'surf', 'hiking', 'climb']):
-                category = 'special'
-            
-            if category != 'other':
-                results['categories'][category]['total'] += 1
+            category = categorize_query(query)
             
             try:
                 response = chat.chat(query)
                 response_text = response.get('response', '')
-                
-                # Check response quality
-                is_clarifying = any(phrase in response_text.lower() for phrase in ['could you', 'which', 'please', 'tell me', 'more specific'])
-                is_sorry = any(phrase in response_text.lower() for phrase in ['sorry', "couldn't find", "couldn't find relevant", "i'm sorry"])
-                is_relevant = len(response_text) > 50 and not is_sorry
-                
-                # Determine expected behavior
-                is_vague = category == 'vague'
-                is_broad = category == 'broad'
-                
-                if is_vague:
-                    if is_sorry:
-                        results['sorry'] += 1
-                        results['passed'] += 1
-                        if category != 'other':
-                            results['categories'][category]['passed'] += 1
-                    else:
-                        results['failed'] += 1
-                        results['gaps'].append(f"Vague query '{query}' didn't return sorry")
-                elif is_broad:
-                    if is_clarifying:
-                        results['clarifying'] += 1
-                        results['passed'] += 1
-                        if category != 'other':
-                            results['categories'][category]['passed'] += 1
-                    else:
-                        results['failed'] += 1
-                        results['gaps'].append(f"Broad query '{query}' didn't ask clarifying question")
-                else:
-                    if is_relevant:
-                        results['passed'] += 1
-                        if category != 'other':
-                            results['categories'][category]['passed'] += 1
-                    else:
-                        results['failed'] += 1
-                        results['gaps'].append(f"Query '{query}' returned irrelevant response")
+                passed = record_result(results, query, category, response_text)
                 
                 # Print every 50th query
                 if query_index % 50 == 0:
-                    print(f"[{query_index}] Query: '{query[:50]}...' | {'PASS' if is_relevant or (is_vague and is_sorry) or (is_broad and is_clarifying) else 'FAIL'}")
+                    print(f"[{query_index}] Query: '{query[:50]}...' | {'PASS' if passed else 'FAIL'}")
                 
             except Exception as e:
-                results['errors'] += 1
-                results['failed'] += 1
-                results['gaps'].append(f"Query '{query}' caused error: {str(e)}")
+                record_error(results, query, category, e)
                 if query_index % 50 == 0:
                     print(f"[{query_index}] Query: '{query[:50]}...' | ERROR: {str(e)}")
         
@@ -326,6 +326,15 @@ def intensive_training(duration_minutes=60):
     print(f"Total iterations: {iteration}")
     print(f"Duration: {(time.time() - start_time)/60:.1f} minutes")
     
+    print_breakdown(results)
+    
+    print(f"\nCompleted: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("=" * 80)
+    
+    return results
+
+def print_breakdown(results):
+    """Per-category pass rates and the first identified gaps"""
     print("\nCategory Performance:")
     for cat, data in results['categories'].items():
         if data['total'] > 0:
@@ -340,12 +349,8 @@ def intensive_training(duration_minutes=60):
             print(f"  ... and {len(results['gaps']) - 20} more gaps")
     else:
         print("\n[SUCCESS] No gaps identified! AI is performing excellently.")
-    
-    print(f"\nCompleted: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("=" * 80)
-    
-    return results
 
 if __name__ == "__main__":
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
     intensive_training(duration_minutes=60)
 
@@ -0,0 +1,353 @@
+"""
+TripMate Knowledge Pack
+One versioned, checksummed build artifact with everything the chat engines
+otherwise derive from the travel QA CSV at startup:
+  - the prepared retrieval frame (normalized texts, searchable documents,
+    metadata columns stored as dictionary codes)
+  - the fitted TF-IDF vocabulary, idf weights and document matrix
+  - every dataset response pre-rendered by the chat formatters
+  - the typo correction and question match indexes (pickled)
+Loading the pack replaces parsing, cleaning and vectorizing the dataset and
+building those indexes. The TF-IDF arrays are .npy files that are
+memory-mapped, so gunicorn workers share their pages. Tables are
+uncompressed Arrow IPC files, but their text columns become Python strings
+when read, so each worker still holds its own copy of the frame. Still
+built at startup: the accommodation / food section index (small) and the
+TravelAIService FAISS index, which has its own saved components (see
+ai_service.py).
+
+    python knowledge_pack.py build    # build / replace the pack from the dataset CSV
+    python knowledge_pack.py info     # show the manifest and verify the checksums (run on deploy)
+
+A pack is only used while it still matches: the dataset CSV (when present)
+must have the checksum the pack was built from, and the retriever code and
+settings must be the ones it was built with. Otherwise the engines build
+from the CSV as before and a warning says to rebuild the pack. Pre-rendered
+responses are skipped (and rendered at startup) when only the formatters
+changed.
+
+    KNOWLEDGE_PACK=1                  # load the engines from the pack when present (0 ignores it)
+    KNOWLEDGE_PACK_PATH=...           # pack directory (default travel_qa_model/knowledge_pack)
+    KNOWLEDGE_PACK_VERIFY=0           # also check the files' checksums when loading (sizes are always checked)
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+from scipy import sparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PACK_PATH = os.path.join(BACKEND_DIR, "travel_qa_model", "knowledge_pack")
+
+# Bumped whenever the layout below changes
+PACK_FORMAT = 1
+
+MANIFEST = "manifest.json"
+CORPUS_FILE = "corpus.arrow"
+RENDERINGS_FILE = "renderings.arrow"
+NEAR_DUPLICATES_FILE = "near_duplicates.json"
+TFIDF_FILES = ("tfidf_terms.npy", "tfidf_idf.npy", "tfidf_data.npy", "tfidf_indices.npy", "tfidf_indptr.npy")
+TYPO_INDEX_FILE = "typo_index.pickle"
+QUESTION_INDEX_FILE = "question_index.pickle"
+
+# Metadata columns of the retrieval frame stored as dictionary codes
+CODED_COLUMNS = ['country', 'city', 'tags', 'season', 'traveler_type', 'question_type']
+
+# Source files whose changes make the frame / index or the renderings stale
+INDEX_SOURCES = ['travel_retriever.py', 'gazetteer.py', 'airports.dat', 'near_duplicates.py']
+RENDERING_SOURCES = ['retrieval_augmented_ai.py']
+LOOKUP_SOURCES = ['typo_index.py', 'question_index.py', 'gazetteer.py', 'airports.dat']
+
+RENDERING_KINDS = ('format', 'food', 'final')
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def code_fingerprint(sources: List[str]) -> str:
+    """Checksum over the backend source files an artifact was derived with."""
+    digest = hashlib.sha256()
+    for name in sources:
+        path = os.path.join(BACKEND_DIR, name)
+        digest.update(name.encode())
+        if os.path.exists(path):
+            digest.update(_sha256(path).encode())
+    return digest.hexdigest()[:16]
+
+
+def pack_settings() -> Dict[str, object]:
+    """Environment settings that change what a pack contains."""
+    from near_duplicates import compaction_settings
+    return {
+        'vectorizer': os.getenv("RETRIEVER_VECTORIZER", "tfidf").lower(),
+        **compaction_settings(),
+    }
+
+
+def _read_table(path: str) -> pd.DataFrame:
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+
+class KnowledgePack:
+    """A knowledge pack directory whose manifest has been read (and checked by open_knowledge_pack)."""
+
+    def __init__(self, path: str, manifest: Dict):
+        self.path = path
+        self.manifest = manifest
+
+    @property
+    def version(self) -> str:
+        return self.manifest['version']
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def frame(self) -> pd.DataFrame:
+        """The prepared retrieval frame (TravelRetriever.df), with its original index labels."""
+        df = _read_table(self._file(CORPUS_FILE))
+        # Dictionary codes keep the file small; decoded back to plain strings since
+        # categorical columns make the per-row lookups of every retrieval slower
+        for column in CODED_COLUMNS:
+            if column in df.columns:
+                df[column] = df[column].astype(object)
+        return df.set_index('row_label').rename_axis(None)
+
+    def qa_frame(self) -> pd.DataFrame:
+        """Only the question / response columns, as a corpus for engines that prepare their own frame."""
+        table = feather.read_table(self._file(CORPUS_FILE), columns=['question', 'response'], memory_map=True)
+        return table.to_pandas()
+
+    def near_duplicates(self) -> Dict[object, List[object]]:
+        path = self._file(NEAR_DUPLICATES_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return {int(label): merged for label, merged in json.load(f).items()}
+
+    def load_tfidf(self, vectorizer) -> sparse.csr_matrix:
+        """Give an unfitted TfidfVectorizer the packed vocabulary / idf; returns the document matrix."""
+        terms, idf, data, indices, indptr = (np.load(self._file(name), mmap_mode='r') for name in TFIDF_FILES)
+        vectorizer.vocabulary_ = {term: i for i, term in enumerate(terms.tolist())}
+        vectorizer.idf_ = np.asarray(idf)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(terms)), copy=False)
+
+    def renderings(self) -> Optional[Dict[str, Dict[str, str]]]:
+        """kind -> {response: rendered} as built by DatasetOnlyChat, or None if the formatters changed."""
+        if self.manifest['code']['renderings'] != code_fingerprint(RENDERING_SOURCES):
+            print("Knowledge pack renderings are from older formatter code; rendering at startup")
+            return None
+        table = _read_table(self._file(RENDERINGS_FILE))
+        responses = table['response'].tolist()
+        # Identical outputs (often the input itself) share one string object
+        pool: Dict[str, str] = {text: text for text in responses}
+        return {
+            kind: {text: pool.setdefault(out, out) for text, out in zip(responses, table[kind].tolist())}
+            for kind in RENDERING_KINDS
+        }
+
+    def _lookup(self, name: str):
+        """A pickled lookup index, or None if the pack has none or it is from older code."""
+        if name not in self.manifest['files']:
+            return None
+        if self.manifest['code'].get('lookups') != code_fingerprint(LOOKUP_SOURCES):
+            print(f"Knowledge pack {name} is from older code; building it at startup")
+            return None
+        with open(self._file(name), 'rb') as f:
+            return pickle.load(f)
+
+    def typo_index(self):
+        """The TypoIndex built over the packed frame, or None (see _lookup)."""
+        return self._lookup(TYPO_INDEX_FILE)
+
+    def question_index(self, threshold: float):
+        """The QuestionIndex built over the packed frame if it has this threshold, else None."""
+        index = self._lookup(QUESTION_INDEX_FILE)
+        if index is not None and index.threshold != threshold:
+            return None
+        return index
+
+    def verify(self, checksums: bool = True) -> List[str]:
+        """Names of files that are missing, of the wrong size or (if checksums) don't match their checksum."""
+        bad = []
+        for name, info in self.manifest['files'].items():
+            path = self._file(name)
+            if (not os.path.exists(path) or os.path.getsize(path) != info['bytes'] or
+                    (checksums and _sha256(path) != info['sha256'])):
+                bad.append(name)
+        return bad
+
+
+def open_knowledge_pack(path: Optional[str] = None, verify: Optional[bool] = None) -> Optional[KnowledgePack]:
+    """
+    The pack at path (default KNOWLEDGE_PACK_PATH) if it is usable, else None.
+    Reasons for not using an existing pack are logged.
+    """
+    path = path or os.getenv("KNOWLEDGE_PACK_PATH", DEFAULT_PACK_PATH)
+    manifest_path = os.path.join(path, MANIFEST)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path) as f:
+            pack = KnowledgePack(path, json.load(f))
+        manifest = pack.manifest
+        if manifest.get('format') != PACK_FORMAT:
+            print(f"Warning: Knowledge pack at {path} has format {manifest.get('format')}, expected {PACK_FORMAT}; rebuild it")
+            return None
+        # Checksums are verified at build / deploy (info); a worker start
+        # only checks that no file is missing or truncated
+        checksums = verify if verify is not None else os.getenv("KNOWLEDGE_PACK_VERIFY", "0") == "1"
+        bad = pack.verify(checksums)
+        if bad:
+            print(f"Warning: Knowledge pack files fail their {'checksum' if checksums else 'size'} check: "
+                  f"{', '.join(bad)}; rebuild it")
+            return None
+        from chat_engines import find_dataset_csv
+        csv_path = find_dataset_csv()
+        if csv_path is not None and _sha256(csv_path) != manifest['source']['sha256']:
+            print(f"Warning: {csv_path} changed since the knowledge pack was built; "
+                  f"rebuild it with 'python knowledge_pack.py build'")
+            return None
+        if manifest['code']['index'] != code_fingerprint(INDEX_SOURCES):
+            print("Warning: Retriever code changed since the knowledge pack was built; "
+                  "rebuild it with 'python knowledge_pack.py build'")
+            return None
+        if manifest['settings'] != pack_settings():
+            print(f"Warning: Knowledge pack was built with {manifest['settings']}, "
+                  f"current settings are {pack_settings()}; not using it")
+            return None
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: Could not read knowledge pack at {path}: {e}")
+        return None
+    return pack
+
+
+def build_knowledge_pack(path: Optional[str] = None, csv_path: Optional[str] = None) -> KnowledgePack:
+    """
+    Build the pack from the dataset CSV by running the normal engine
+    pipeline once and writing out its results; replaces any existing pack.
+    """
+    from chat_engines import find_dataset_csv, load_corpus
+    from retrieval_augmented_ai import DatasetOnlyChat
+
+    path = path or os.getenv("KNOWLEDGE_PACK_PATH", DEFAULT_PACK_PATH)
+    source = find_dataset_csv(csv_path)
+    if source is None:
+        raise FileNotFoundError("Travel QA dataset not found")
+    settings = pack_settings()
+    if settings['vectorizer'] != 'tfidf':
+        raise ValueError("The knowledge pack holds the fitted TF-IDF index; unset RETRIEVER_VECTORIZER=hashing to build it")
+
+    chat = DatasetOnlyChat(corpus=load_corpus(source))
+    retriever = chat.retriever
+
+    staging = f"{path}.building-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    print(f"Writing knowledge pack to {path}...")
+
+    frame = retriever.df.copy()
+    for column in CODED_COLUMNS:
+        if column in frame.columns:
+            frame[column] = frame[column].astype('category')
+    frame = frame.rename_axis('row_label').reset_index()
+    feather.write_feather(frame, os.path.join(staging, CORPUS_FILE), compression='uncompressed')
+
+    responses = list(chat._renderings['final'])
+    renderings = pd.DataFrame({'response': responses})
+    for kind in RENDERING_KINDS:
+        renderings[kind] = [chat._renderings[kind][text] for text in responses]
+    feather.write_feather(renderings, os.path.join(staging, RENDERINGS_FILE), compression='uncompressed')
+
+    matrix = retriever.document_vectors.tocsr()
+    terms = retriever.vectorizer.get_feature_names_out().astype(str)
+    for name, array in zip(TFIDF_FILES, (terms, retriever.vectorizer.idf_, matrix.data, matrix.indices, matrix.indptr)):
+        np.save(os.path.join(staging, name), np.ascontiguousarray(array), allow_pickle=False)
+
+    for name, index in ((TYPO_INDEX_FILE, chat.typo_index), (QUESTION_INDEX_FILE, chat.question_index)):
+        with open(os.path.join(staging, name), 'wb') as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    if retriever.near_duplicates:
+        with open(os.path.join(staging, NEAR_DUPLICATES_FILE), 'w') as f:
+            json.dump({str(label): [int(m) for m in merged] for label, merged in retriever.near_duplicates.items()}, f)
+
+    files = {}
+    for name in sorted(os.listdir(staging)):
+        file_path = os.path.join(staging, name)
+        files[name] = {'bytes': os.path.getsize(file_path), 'sha256': _sha256(file_path)}
+    manifest = {
+        'format': PACK_FORMAT,
+        'version': hashlib.sha256(json.dumps(files, sort_keys=True).encode()).hexdigest()[:16],
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'source': {'file': os.path.basename(source), 'sha256': _sha256(source)},
+        'code': {
+            'index': code_fingerprint(INDEX_SOURCES),
+            'renderings': code_fingerprint(RENDERING_SOURCES),
+            'lookups': code_fingerprint(LOOKUP_SOURCES),
+        },
+        'settings': settings,
+        'rows': len(frame),
+        'vocabulary': len(terms),
+        'files': files,
+    }
+    with open(os.path.join(staging, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Swap the finished pack in; a reader sees the old pack or the new one
+    previous = f"{path}.previous-{os.getpid()}"
+    if os.path.exists(path):
+        os.rename(path, previous)
+    os.rename(staging, path)
+    shutil.rmtree(previous, ignore_errors=True)
+    total = sum(info['bytes'] for info in files.values())
+    print(f"Knowledge pack {manifest['version']} built: {len(frame)} rows, {len(terms)} terms, {total / 2 ** 20:.1f} MB")
+    return KnowledgePack(path, manifest)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Build or inspect the TripMate knowledge pack")
+    parser.add_argument('command', choices=['build', 'info'])
+    parser.add_argument('--path', help="pack directory (default KNOWLEDGE_PACK_PATH or travel_qa_model/knowledge_pack)")
+    parser.add_argument('--csv', help="dataset CSV (default: the usual locations)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        # The build answers nothing; don't warm or fill the answer cache
+        os.environ['ANSWER_CACHE_SIZE'] = '0'
+        try:
+            build_knowledge_pack(args.path, args.csv)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"Error: {e}")
+            return 1
+        return 0
+
+    path = args.path or os.getenv("KNOWLEDGE_PACK_PATH", DEFAULT_PACK_PATH)
+    pack = open_knowledge_pack(path, verify=True)
+    if pack is None:
+        print(f"No usable knowledge pack at {path}")
+        return 1
+    print(json.dumps({k: v for k, v in pack.manifest.items() if k != 'files'}, indent=2))
+    for name, info in pack.manifest['files'].items():
+        print(f"  {name:<24}{info['bytes'] / 2 ** 20:>8.2f} MB  {info['sha256'][:16]}")
+    print("Checksums OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
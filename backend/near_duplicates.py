@@ -0,0 +1,262 @@
+"""
+TripMate Near-Duplicate Compaction
+The generated city / accommodation entries of the travel QA dataset contain
+many QA pairs that differ only in a word or two. Exact drop_duplicates()
+keeps them all, so they bloat the index and fill the top-k with copies of
+one answer. This finds them with MinHash signatures over word shingles of
+question + response and LSH banding, confirms each candidate pair with the
+exact Jaccard similarity of the shingle sets, clusters the pairs, and keeps
+one canonical row per cluster (the one with the longest response).
+
+Rows about different places are never merged: a blocking key (the row's
+city / country, or the places the gazetteer finds in it) must match.
+
+Run at index build (TravelRetriever, TravelAIService) when enabled, or
+offline to inspect the clusters / write a compacted CSV:
+
+    python near_duplicates.py                                # report for the dataset
+    python near_duplicates.py --threshold 0.85 --write-csv compacted.csv
+
+    NEAR_DUPLICATE_COMPACTION=1       # compact the corpus when building an index (default off)
+    NEAR_DUPLICATE_THRESHOLD=0.9      # Jaccard similarity of the shingle sets to merge at
+    MINHASH_PERMUTATIONS=128          # signature length
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import zlib
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+
+# Shingle hashes and permutations work modulo this Mersenne prime, so
+# a * x + b stays below 2^64
+_PRIME = (1 << 31) - 1
+# Words per shingle
+SHINGLE_SIZE = 3
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def compaction_enabled() -> bool:
+    return os.getenv("NEAR_DUPLICATE_COMPACTION", "0").lower() in ("1", "true", "yes")
+
+
+def compaction_settings() -> Dict[str, object]:
+    """The compaction settings an index was built with (stored with saved indexes)."""
+    return {
+        'near_duplicate_compaction': compaction_enabled(),
+        'near_duplicate_threshold': float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9")),
+        'minhash_permutations': int(os.getenv("MINHASH_PERMUTATIONS", "128")),
+    }
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """Distinct hashed word shingles of a text (a text shorter than size words is one shingle)."""
+    words = _WORD_RE.findall(str(text).lower())
+    grams = {' '.join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+    return np.unique(np.fromiter((zlib.crc32(g.encode()) % _PRIME for g in grams), dtype=np.uint64, count=len(grams)))
+
+
+def lsh_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    (bands, rows) with bands * rows == num_perm whose LSH threshold
+    (1 / bands) ** (1 / rows) is closest below the Jaccard threshold, so
+    pairs at the threshold are very likely to become candidates.
+    """
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    below = [o for o in options if (1 / o[0]) ** (1 / o[1]) <= threshold]
+    return max(below or options, key=lambda o: (1 / o[0]) ** (1 / o[1]))
+
+
+class MinHasher:
+    """MinHash signatures with num_perm universal hash permutations (seeded, so reproducible)."""
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.a = rng.randint(1, _PRIME, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, _PRIME, size=num_perm).astype(np.uint64)
+
+    def signature(self, shingle_hashes: np.ndarray) -> np.ndarray:
+        if len(shingle_hashes) == 0:
+            return np.full(self.num_perm, _PRIME, dtype=np.uint64)
+        return ((np.outer(self.a, shingle_hashes) + self.b[:, None]) % _PRIME).min(axis=1)
+
+    def signatures(self, shingle_sets: Sequence[np.ndarray]) -> np.ndarray:
+        return np.vstack([self.signature(s) for s in shingle_sets]) if shingle_sets else np.empty((0, self.num_perm), dtype=np.uint64)
+
+
+def _jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    inter = len(np.intersect1d(a, b, assume_unique=True))
+    return inter / (len(a) + len(b) - inter) if len(a) + len(b) else 1.0
+
+
+class NearDuplicateClusters(NamedTuple):
+    # cluster id of every row (rows without near-duplicates are their own cluster)
+    labels: np.ndarray
+    # row position -> positions merged into it, for clusters of two or more
+    canonical: Dict[int, List[int]]
+    # pairs whose Jaccard similarity was computed, and those at the threshold
+    candidate_pairs: int
+    confirmed_pairs: int
+
+
+def find_near_duplicates(texts: Sequence[str], keys: Optional[Sequence] = None, threshold: float = 0.9,
+                         num_perm: int = 128, lengths: Optional[Sequence[int]] = None) -> NearDuplicateClusters:
+    """
+    Cluster rows whose texts have shingle-set Jaccard >= threshold (and equal keys).
+
+    Args:
+        texts: Text of every row (question + response)
+        keys: Optional blocking key per row; rows with different keys are never merged
+        threshold: Jaccard similarity to merge at
+        num_perm: MinHash signature length
+        lengths: Preference per row for the canonical row (longest wins, then the first)
+    """
+    n = len(texts)
+    shingle_sets = [shingles(t) for t in texts]
+    signatures = MinHasher(num_perm).signatures(shingle_sets)
+    bands, rows = lsh_bands(num_perm, threshold)
+
+    # Union-find over the confirmed pairs
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    # Rows sharing a band bucket (and a key) are candidates. A row is only
+    # compared with one representative of each cluster already in its
+    # bucket, and pairs already joined or checked are skipped, so a bucket
+    # of m copies of one answer costs m - 1 checks rather than all m^2 / 2
+    # pairs
+    checked = set()
+    confirmed = 0
+    for band in range(bands):
+        buckets: Dict[Tuple, List[int]] = {}
+        block = signatures[:, band * rows:(band + 1) * rows]
+        for i in range(n):
+            bucket_key = (keys[i] if keys is not None else None, block[i].tobytes())
+            buckets.setdefault(bucket_key, []).append(i)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            representatives = [members[0]]
+            for i in members[1:]:
+                for rep in representatives:
+                    ri, rr = find(i), find(rep)
+                    if ri == rr:
+                        break
+                    if (rep, i) in checked:
+                        continue
+                    checked.add((rep, i))
+                    if _jaccard(shingle_sets[rep], shingle_sets[i]) >= threshold:
+                        confirmed += 1
+                        parent[max(ri, rr)] = min(ri, rr)
+                        break
+                else:
+                    representatives.append(i)
+
+    labels = np.array([find(i) for i in range(n)], dtype=np.int64)
+    members: Dict[int, List[int]] = {}
+    for i, label in enumerate(labels):
+        members.setdefault(int(label), []).append(i)
+    lengths = list(lengths) if lengths is not None else [len(str(t)) for t in texts]
+    canonical = {}
+    for group in members.values():
+        if len(group) > 1:
+            best = max(group, key=lambda i: (lengths[i], -i))
+            canonical[best] = [i for i in group if i != best]
+    return NearDuplicateClusters(labels, canonical, len(checked), confirmed)
+
+
+def _row_keys(df: pd.DataFrame) -> List[str]:
+    """Blocking key per row: its city / country columns, or the places the gazetteer finds."""
+    if 'city' in df.columns and 'country' in df.columns:
+        return (df['city'].astype(str).str.lower() + '|' + df['country'].astype(str).str.lower()).tolist()
+    from gazetteer import get_gazetteer
+    gazetteer = get_gazetteer()
+    return [gazetteer.first_city(f"{q} {r}") + '|' + gazetteer.first_country(f"{q} {r}")
+            for q, r in zip(df['question'].astype(str), df['response'].astype(str))]
+
+
+def compact_corpus(df: pd.DataFrame, threshold: Optional[float] = None,
+                   num_perm: Optional[int] = None) -> Tuple[pd.DataFrame, Dict[object, List[object]]]:
+    """
+    Drop near-duplicate QA rows, keeping one canonical row per cluster.
+
+    Returns the compacted frame (original order and index labels) and the
+    back-references: canonical row's index label -> labels of the rows
+    merged into it. A frame with repeated labels (e.g. rows appended
+    without reindexing) is renumbered first so the back-references are
+    unambiguous.
+    """
+    if not df.index.is_unique:
+        df = df.reset_index(drop=True)
+    threshold = threshold if threshold is not None else float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9"))
+    num_perm = num_perm or int(os.getenv("MINHASH_PERMUTATIONS", "128"))
+    questions = df['question'].astype(str)
+    responses = df['response'].astype(str)
+    clusters = find_near_duplicates(
+        (questions + ' ' + responses).tolist(), keys=_row_keys(df), threshold=threshold,
+        num_perm=num_perm, lengths=responses.str.len().tolist()
+    )
+    merged = {pos for positions in clusters.canonical.values() for pos in positions}
+    keep = np.array([i not in merged for i in range(len(df))], dtype=bool)
+    labels = df.index
+    back_references = {labels[c]: [labels[p] for p in positions] for c, positions in clusters.canonical.items()}
+    print(f"Near-duplicate compaction: {len(df)} -> {int(keep.sum())} rows "
+          f"({len(back_references)} clusters, {len(merged)} rows merged, threshold {threshold})")
+    return df[keep], back_references
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find near-duplicate QA pairs in the travel dataset")
+    parser.add_argument('--threshold', type=float, default=float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9")), help="Jaccard similarity to merge at")
+    parser.add_argument('--permutations', type=int, default=int(os.getenv("MINHASH_PERMUTATIONS", "128")), help="MinHash signature length")
+    parser.add_argument('--show', type=int, default=10, help="largest clusters to print")
+    parser.add_argument('--output', help="JSON report of every cluster")
+    parser.add_argument('--write-csv', help="write the compacted dataset (with a merged_rows column) to this CSV")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from chat_engines import load_corpus
+    df = load_corpus()
+    if df is None:
+        print("Travel QA dataset not found")
+        return 1
+    compacted, back_references = compact_corpus(df, args.threshold, args.permutations)
+
+    clusters = sorted(back_references.items(), key=lambda item: -len(item[1]))
+    for label, merged in clusters[:args.show]:
+        print(f"\n[{len(merged) + 1} rows] {df.at[label, 'question']}")
+        for other in merged[:3]:
+            print(f"    ~ {df.at[other, 'question']}")
+
+    if args.output:
+        report = {
+            'rows': len(df),
+            'compacted_rows': len(compacted),
+            'threshold': args.threshold,
+            'clusters': [{'canonical': int(label), 'question': str(df.at[label, 'question']),
+                          'merged': [int(m) for m in merged]} for label, merged in clusters],
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+        print(f"\nReport written to {args.output}")
+    if args.write_csv:
+        out = compacted.copy()
+        out['merged_rows'] = [' '.join(str(m) for m in back_references.get(label, [])) for label in out.index]
+        out.to_csv(args.write_csv, index=False)
+        print(f"Compacted dataset written to {args.write_csv}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
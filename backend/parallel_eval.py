@@ -0,0 +1,123 @@
+"""
+TripMate Parallel Evaluation
+Runs the intensive_training.py gap analysis (same generated queries, same
+categories and pass rules) on every core instead of one query at a time:
+
+    python parallel_eval.py                                  # one worker process per core
+    python parallel_eval.py --workers 4 --output eval.jsonl
+    python parallel_eval.py --queries my_queries.txt         # one query per line instead
+
+The chat engine (retrieval index, typo and question indexes) is built once
+in this process; worker processes are forked from it and share it instead of
+rebuilding it. The query list is sharded into chunks across the workers, and
+each query's result is appended to a JSON lines file as soon as it comes
+back, so a run can be followed with tail -f and what finished survives an
+interruption.
+
+Answers don't depend on query order (the answer cache is off here), so one
+pass over the distinct queries covers what the hour of shuffled repeats in
+intensive_training.py measured.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(BACKEND_DIR, "parallel_eval_results.jsonl")
+
+
+def _answer(query: str) -> Dict:
+    """Answer one query in a worker (module level so it can be pickled)."""
+    from chat_engines import get_engine
+    start = time.perf_counter()
+    try:
+        response = get_engine('dataset').chat(query)
+        return {'query': query, 'response': response.get('response', ''), 'error': None,
+                'seconds': time.perf_counter() - start}
+    except Exception as e:
+        return {'query': query, 'response': '', 'error': str(e), 'seconds': time.perf_counter() - start}
+
+
+def load_queries(path: str) -> List[str]:
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel gap analysis of DatasetOnlyChat")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes (default: one per core)")
+    parser.add_argument('--queries', help="file with one query per line (default: intensive_training.py's generated queries)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed for the generated queries")
+    parser.add_argument('--chunk-size', type=int, help="queries handed to a worker at a time (default: ~8 chunks per worker)")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="JSON lines file of per-query results")
+    args = parser.parse_args(argv)
+
+    # Every query should be answered, not looked up
+    os.environ['ANSWER_CACHE_SIZE'] = '0'
+    from chat_engines import get_engine
+    from intensive_training import categorize_query, generate_comprehensive_queries, new_results, print_breakdown, record_error, record_result
+
+    if args.queries:
+        queries = load_queries(args.queries)
+    else:
+        random.seed(args.seed)
+        queries = generate_comprehensive_queries()
+    queries = list(dict.fromkeys(queries))
+    if not queries:
+        print("No queries to evaluate")
+        return 1
+
+    print("Building chat engine...")
+    get_engine('dataset')
+
+    workers = max(1, args.workers)
+    chunk_size = args.chunk_size or max(1, len(queries) // (workers * 8))
+    print(f"Evaluating {len(queries)} queries on {workers} workers (chunks of {chunk_size})...")
+
+    results = new_results()
+    start = time.perf_counter()
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    with open(args.output, 'w', encoding='utf-8') as out, context.Pool(workers) as pool:
+        for done, answer in enumerate(pool.imap_unordered(_answer, queries, chunksize=chunk_size), 1):
+            query = answer['query']
+            category = categorize_query(query)
+            if answer['error'] is not None:
+                record_error(results, query, category, answer['error'])
+                passed = False
+            else:
+                passed = record_result(results, query, category, answer['response'])
+            out.write(json.dumps({**answer, 'category': category, 'passed': passed,
+                                  'seconds': round(answer['seconds'], 4)}) + '\n')
+            out.flush()
+            if done % 200 == 0:
+                print(f"  {done}/{len(queries)} done, {results['passed']} passed")
+    elapsed = time.perf_counter() - start
+
+    print("\n" + "=" * 80)
+    print("PARALLEL EVALUATION SUMMARY")
+    print("=" * 80)
+    print(f"Total queries tested: {results['total']}")
+    print(f"Passed: {results['passed']} ({results['passed']/results['total']*100:.1f}%)")
+    print(f"Failed: {results['failed']} ({results['failed']/results['total']*100:.1f}%)")
+    print(f"Clarifying questions: {results['clarifying']}")
+    print(f"Sorry messages: {results['sorry']}")
+    print(f"Errors: {results['errors']}")
+    print(f"Duration: {elapsed:.1f}s ({results['total'] / elapsed:.1f} queries/s on {workers} workers)")
+    print_breakdown(results)
+    print(f"\nPer-query results written to {args.output}")
+    print(f"Completed: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
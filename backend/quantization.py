@@ -0,0 +1,146 @@
+"""
+TripMate Vector Quantization
+Lower-precision storage for the document vectors of the retrieval indexes.
+Rankings are decided by coarse score differences (and the chat's re-scoring
+heuristics override small ones), so full precision mostly costs memory in
+every worker:
+
+  - QuantizedTfidf: TravelRetriever's sparse TF-IDF matrix stored by term
+    with float32 / float16 / int8 values (int8 with one scale per document)
+    and 16-bit row ids while the corpus has fewer than 65536 rows. A query
+    only reads the postings of its own terms.
+  - faiss_index(): flat / HNSW / IVF faiss indexes with float16, 8-bit or
+    4-bit scalar quantization or product quantization, for TravelAIService's
+    dense index and the LSA semantic index (semantic_index.py).
+
+    RETRIEVER_PRECISION=float64       # float32, float16 or int8 for TravelRetriever's TF-IDF matrix
+    AI_FAISS_QUANTIZER=none           # fp16, sq8, sq4 or pq for TravelAIService's FAISS index
+    SEMANTIC_QUANTIZER=none           # fp16, sq8 or sq4 for the semantic index
+
+benchmark_retrieval.py has an engine per variant and reports recall, overlap
+with the full-precision ranking and index size for each.
+"""
+
+import os
+from typing import Optional, Sequence
+import faiss
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+PRECISIONS = ('float64', 'float32', 'float16', 'int8')
+FAISS_QUANTIZERS = ('none', 'fp16', 'sq8', 'sq4', 'pq')
+
+_SCALAR_TYPES = {
+    'fp16': faiss.ScalarQuantizer.QT_fp16,
+    'sq8': faiss.ScalarQuantizer.QT_8bit,
+    'sq4': faiss.ScalarQuantizer.QT_4bit,
+}
+# Bits per product quantizer code and k-means iterations when training it
+PQ_BITS = 8
+PQ_TRAINING_ITERATIONS = 10
+
+
+def _choice(value: Optional[str], env: str, default: str, allowed: Sequence[str]) -> str:
+    value = (value or os.getenv(env, default)).strip().lower()
+    if value not in allowed:
+        print(f"Warning: Unknown {env} '{value}' (known: {', '.join(allowed)}); using '{default}'")
+        return default
+    return value
+
+
+def retriever_precision(precision: Optional[str] = None) -> str:
+    """Storage precision of TravelRetriever's document matrix (RETRIEVER_PRECISION)."""
+    return _choice(precision, "RETRIEVER_PRECISION", "float64", PRECISIONS)
+
+
+def faiss_quantizer(quantizer: Optional[str] = None, env: str = "AI_FAISS_QUANTIZER",
+                    allowed: Sequence[str] = FAISS_QUANTIZERS) -> str:
+    return _choice(quantizer, env, "none", allowed)
+
+
+class QuantizedTfidf:
+    """Row-normalized sparse document matrix stored by term in reduced precision."""
+
+    def __init__(self, document_vectors: sparse.spmatrix, precision: str = 'float32'):
+        unit = normalize(sparse.csr_matrix(document_vectors))
+        by_term = unit.tocsc()
+        self.precision = precision
+        self.shape = unit.shape
+        self.indptr = by_term.indptr
+        self.rows = by_term.indices.astype(np.uint16 if unit.shape[0] <= 65536 else np.int32)
+        if precision == 'int8':
+            # One scale per document: its largest weight maps to 127
+            row_max = abs(unit).max(axis=1).toarray().ravel()
+            self.scales = np.where(row_max > 0, row_max / 127.0, 1.0).astype(np.float32)
+            self.values = np.rint(by_term.data / self.scales[by_term.indices]).astype(np.int8)
+        else:
+            self.scales = None
+            self.values = by_term.data.astype(precision)
+
+    def nbytes(self) -> int:
+        scales = self.scales.nbytes if self.scales is not None else 0
+        return int(self.indptr.nbytes + self.rows.nbytes + self.values.nbytes + scales)
+
+    def similarities(self, query_vectors) -> np.ndarray:
+        """Cosine similarity of every query (row) to every document."""
+        queries = normalize(sparse.csr_matrix(query_vectors))
+        scores = np.zeros((queries.shape[0], self.shape[0]))
+        for i in range(queries.shape[0]):
+            terms = queries.indices[queries.indptr[i]:queries.indptr[i + 1]]
+            weights = queries.data[queries.indptr[i]:queries.indptr[i + 1]]
+            starts = self.indptr[terms]
+            lengths = self.indptr[terms + 1] - starts
+            total = int(lengths.sum())
+            if not total:
+                continue
+            # Positions of every posting of the query's terms, in term order
+            positions = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+            contributions = self.values[positions].astype(np.float64) * np.repeat(weights, lengths)
+            scores[i] = np.bincount(self.rows[positions], weights=contributions, minlength=self.shape[0])
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+
+def pq_subvectors(dimension: int) -> int:
+    """Product quantizer sub-vectors: the largest divisor of dimension giving sub-vectors of 16+ dims."""
+    target = max(1, dimension // 16)
+    return max(m for m in range(1, target + 1) if dimension % m == 0)
+
+
+def faiss_index(kind: str, dimension: int, metric: int, quantizer: str = 'none',
+                rows: int = 0, hnsw_m: int = 32):
+    """
+    Empty faiss index of the given kind ('flat', 'hnsw' or 'ivf') storing
+    vectors as given by quantizer ('none', 'fp16', 'sq8', 'sq4' or 'pq').
+    Quantized (and IVF) indexes must be trained before vectors are added.
+    """
+    scalar = _SCALAR_TYPES.get(quantizer)
+    if quantizer not in FAISS_QUANTIZERS:
+        raise ValueError(f"Unknown quantizer '{quantizer}' (known: {', '.join(FAISS_QUANTIZERS)})")
+    if kind == 'flat':
+        if scalar is not None:
+            return faiss.IndexScalarQuantizer(dimension, scalar, metric)
+        if quantizer == 'pq':
+            index = faiss.IndexPQ(dimension, pq_subvectors(dimension), PQ_BITS, metric)
+            index.pq.cp.niter = PQ_TRAINING_ITERATIONS
+            return index
+        return faiss.IndexFlat(dimension, metric)
+    if kind == 'hnsw':
+        if quantizer == 'pq':
+            raise ValueError("Product quantization is only supported for flat and IVF indexes")
+        if scalar is not None:
+            return faiss.IndexHNSWSQ(dimension, scalar, hnsw_m, metric)
+        return faiss.IndexHNSWFlat(dimension, hnsw_m, metric)
+    if kind == 'ivf':
+        nlist = max(1, int(np.sqrt(rows)))
+        coarse = faiss.IndexFlat(dimension, metric)
+        if scalar is not None:
+            return faiss.IndexIVFScalarQuantizer(coarse, dimension, nlist, scalar, metric)
+        if quantizer == 'pq':
+            index = faiss.IndexIVFPQ(coarse, dimension, nlist, pq_subvectors(dimension), PQ_BITS, metric)
+            index.pq.cp.niter = PQ_TRAINING_ITERATIONS
+            return index
+        return faiss.IndexIVFFlat(coarse, dimension, nlist, metric)
+    raise ValueError(f"Unknown faiss index kind '{kind}'")
@@ -0,0 +1,177 @@
+"""
+TripMate Question Match Index
+Short-circuit for chat queries that are (near-)verbatim questions from the
+travel QA dataset. Questions are normalized to their sorted content words,
+so an exact match is a dict lookup; near-duplicates ("paris restaurant" /
+"restaurants in paris?") are found with MinHash signatures over character
+trigrams of those words, bucketed by LSH bands, and verified with the exact
+Jaccard similarity - no scan over the dataset.
+"""
+
+import re
+import zlib
+from collections import namedtuple
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+
+# Stop words that change what a travel question asks for ("when to visit
+# tokyo" is not "tokyo must visit"), so they stay in the normalized key
+INTENT_WORDS = frozenset([
+    'when', 'where', 'how', 'what', 'which', 'why', 'much', 'many',
+    'see', 'do', 'get', 'go', 'around', 'top', 'first', 'last', 'next',
+    'not', 'no', 'without', 'before', 'after', 'during',
+    'one', 'two', 'three', 'four', 'five', 'six', 'eight', 'nine', 'ten',
+    'eleven', 'twelve', 'fifteen', 'twenty',
+])
+STOP_WORDS = frozenset(ENGLISH_STOP_WORDS) - INTENT_WORDS
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Mersenne prime used by the MinHash permutations
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# How far below the threshold a MinHash estimate may fall and still be verified
+ESTIMATE_SLACK = 0.15
+
+QuestionMatch = namedtuple('QuestionMatch', ['question', 'response', 'row', 'score'])
+
+
+def normalize_question(text: str) -> str:
+    """'Where are the best restaurants in Paris?' -> 'best paris restaurants where'."""
+    return ' '.join(sorted({w for w in _TOKEN_RE.findall(text.lower()) if w not in STOP_WORDS}))
+
+
+def shingles(key: str) -> FrozenSet[str]:
+    """Character trigrams of each word of a normalized key (word boundaries marked)."""
+    grams = set()
+    for word in key.split():
+        padded = f"^{word}$"
+        if len(padded) <= 3:
+            grams.add(padded)
+            continue
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return frozenset(grams)
+
+
+class QuestionIndex:
+    """
+    Exact + near-duplicate lookup of dataset questions.
+
+    Only questions whose rows all share one response are answerable: the
+    dataset has questions asked several times with different answers, and
+    picking between those is what the full chat pipeline is for.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, bands: int = 16, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, _PRIME, size=num_perm, dtype=np.uint64)
+        # normalized key -> (question, response, row), or None if the key has several responses
+        self._entries: Dict[str, Optional[Tuple[str, str, int]]] = {}
+        # Answerable keys, their shingle sets and MinHash signatures (row i <-> _keys[i])
+        self._keys: List[str] = []
+        self._shingles: List[FrozenSet[str]] = []
+        self._signatures = np.zeros((0, num_perm), dtype=np.uint64)
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _signature(self, grams: Iterable[str]) -> np.ndarray:
+        """MinHash signature (num_perm values) of a shingle set."""
+        hashes = np.fromiter((zlib.crc32(g.encode('utf-8')) for g in grams), dtype=np.uint64)
+        if not len(hashes):
+            return np.zeros(self.num_perm, dtype=np.uint64)
+        # (a * x + b) mod p, low 32 bits, for every permutation x shingle
+        # (the uint64 product wraps around, which keeps the hash well mixed)
+        with np.errstate(over='ignore'):
+            permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _PRIME
+        return (permuted & _MAX_HASH).min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray):
+        r = self.rows_per_band
+        for band in range(self.bands):
+            yield band, signature[band * r:(band + 1) * r].tobytes()
+
+    def build(self, questions: Iterable[str], responses: Iterable[str]):
+        """Index (question, response) pairs; row numbers are positions in the input."""
+        groups: Dict[str, Tuple[str, Set[str], int]] = {}
+        for row, (question, response) in enumerate(zip(questions, responses)):
+            key = normalize_question(question)
+            if not key:
+                continue
+            if key in groups:
+                groups[key][1].add(response)
+            else:
+                groups[key] = (question, {response}, row)
+
+        self._entries = {}
+        self._keys = []
+        self._shingles = []
+        signatures = []
+        self._buckets = {}
+        for key, (question, answers, row) in groups.items():
+            if len(answers) > 1:
+                self._entries[key] = None
+                continue
+            self._entries[key] = (question, next(iter(answers)), row)
+            grams = shingles(key)
+            signature = self._signature(grams)
+            for band_key in self._band_keys(signature):
+                self._buckets.setdefault(band_key, []).append(len(self._keys))
+            self._keys.append(key)
+            self._shingles.append(grams)
+            signatures.append(signature)
+        if signatures:
+            self._signatures = np.vstack(signatures)
+
+    def lookup(self, text: str) -> Optional[QuestionMatch]:
+        """Best answerable question for text with Jaccard >= threshold (1.0 for an exact match)."""
+        key = normalize_question(text)
+        if not key:
+            return None
+        if key in self._entries:
+            entry = self._entries[key]
+            return QuestionMatch(*entry, 1.0) if entry else None
+        if self.threshold > 1:
+            return None
+
+        grams = shingles(key)
+        signature = self._signature(grams)
+        candidates = set()
+        for band_key in self._band_keys(signature):
+            candidates.update(self._buckets.get(band_key, ()))
+        if not candidates:
+            return None
+
+        # The MinHash agreement estimates Jaccard; only plausible candidates
+        # get the exact (set intersection) check
+        candidates = np.fromiter(candidates, dtype=np.int64)
+        estimates = (self._signatures[candidates] == signature).mean(axis=1)
+        best_key, best_score = None, 0.0
+        for i in candidates[estimates >= self.threshold - ESTIMATE_SLACK]:
+            other = self._shingles[i]
+            score = len(grams & other) / len(grams | other)
+            candidate = self._keys[i]
+            if score > best_score or (score == best_score and best_key is not None and candidate < best_key):
+                best_key, best_score = candidate, score
+        if best_key is None or best_score < self.threshold:
+            return None
+        return QuestionMatch(*self._entries[best_key], best_score)
+
+
+def build_question_index(questions: Iterable[str], responses: Iterable[str], threshold: float = 0.8) -> QuestionIndex:
+    """Question index over the dataset's question / response columns."""
+    index = QuestionIndex(threshold=threshold)
+    index.build(questions, responses)
+    return index
@@ -4,15 +4,418 @@ Uses TF-IDF retrieval to answer questions directly from the dataset.
 No LLM/API calls - pure retrieval and intelligent response selection.
 """
 
-from typing import Dict, List, Optional
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
 import re
+import pandas as pd
 from travel_retriever import TravelRetriever, create_retriever
+from typo_index import build_typo_index
+from question_index import QuestionMatch, build_question_index
+from answer_cache import create_answer_cache, load_warm_queries
+from conversation_context import ConversationState
+from retrieval_batcher import create_retrieval_batcher
+from gazetteer import MAJOR_COUNTRIES, get_gazetteer
 
-# For typo correction
-try:
-    from difflib import SequenceMatcher
-except ImportError:
-    SequenceMatcher = None
+
+# Single-word (or two-word) queries too vague to answer without more detail
+VAGUE_QUERIES = frozenset([
+    'why', 'what', 'how', 'when', 'where', 'who', 'which', 'yes', 'no', 'ok', 'okay',
+    'hi', 'hello', 'hey', 'thanks', 'thank you'
+])
+
+
+# Patterns used by the response formatters and itinerary parsing (compiled once)
+_SENTENCE_BREAK_RE = re.compile(r'\.\s+(?=[A-Z])')
+_MD_HEADER_RE = re.compile(r'\*\*(.+?)\*\*:?\s*')
+_LEADING_BULLET_RE = re.compile(r'^[-•]\s*')
+_ACCOMMODATION_PREFIX_RE = re.compile(r'^[A-Za-z\s]+(?:hotels?|accommodation)\s*:\s*', re.IGNORECASE)
+_ACCOMMODATION_MARKER_RE = re.compile(r'(?:(?:^|(?<=\.\s)|(?<=:\s)))(Luxury|Mid[- ]?[Rr]ange|Budget)', re.IGNORECASE)
+_LEADING_SEPARATOR_RE = re.compile(r'^[\s]*[-–:]+\s*')
+_OPTIONS_INCLUDE_RE = re.compile(r'^options\s+include\s*', re.IGNORECASE)
+_HOTELS_SEPARATOR_RE = re.compile(r'^hotels?\s*[-–:]+\s*', re.IGNORECASE)
+_TRAILING_PERIOD_RE = re.compile(r'\.\s*$')
+_MIDLINE_BULLET_RE = re.compile(r'(?<=\S) +\u2022 +')
+_DASH_ITEM_RE = re.compile(r'^-\s+')
+_NUMBER_PREFIX_RE = re.compile(r'^\d+\.\s*')
+_NUMBERED_ITEM_RE = re.compile(r'^\d+\.\s')
+_NUMBERED_LINE_RE = re.compile(r'^\d+\.', re.MULTILINE)
+_RESTAURANTS_HEADER_RE = re.compile(r'([A-Za-z\s]+)\s+restaurants?:\s*(.+)', re.IGNORECASE | re.DOTALL)
+_DOUBLE_COMMA_RE = re.compile(r',\s*,')
+_LEADING_COMMA_RE = re.compile(r'^\s*,\s*')
+_DASH_LINE_RE = re.compile(r'^\s*-\s', re.MULTILINE)
+_NUMBERED_LIST_LINE_RE = re.compile(r'^\s*\d+\.\s', re.MULTILINE)
+_MEAL_COUNT_RE = re.compile(r'(\d+)\s*(?:time|times|meal|meals|eat|eating)')
+_ATTRACTION_COUNT_RE = re.compile(r'(\d+)\s*(?:attraction|attractions|place|places|see|visit)')
+_TRIP_LENGTH_RE = re.compile(r'\b\d+\s*(?:day|days|night|nights)\b')
+
+
+# Keywords describing each retrieval intent; their TF-IDF vectors are
+# precomputed once and added to the query vector (see TravelRetriever.set_intent_boosts)
+INTENT_BOOST_KEYWORDS = {
+    'is_food': "restaurant cuisine dining food eat meal",
+    'is_accommodation': "hotel accommodation where to stay lodging",
+    'is_surfing': "surfing surf wave waves beach",
+    'is_mountain': "mountain mount peak summit hiking climb hike",
+    'is_skiing': "skiing ski snowboard snow winter sport slope resort niseko hokkaido",
+    'is_trip_length': "things to do attractions what to see sights",
+}
+
+
+def intent_boost_weights() -> Dict[str, float]:
+    """
+    Boost vector weights from INTENT_BOOST_WEIGHT (default for every intent)
+    and INTENT_BOOST_WEIGHTS ("is_food=1.0,is_skiing=0.8"; the is_ prefix is optional).
+    """
+    default = float(os.getenv("INTENT_BOOST_WEIGHT", "1.5"))
+    weights = {intent: default for intent in INTENT_BOOST_KEYWORDS}
+    for item in os.getenv("INTENT_BOOST_WEIGHTS", "").split(','):
+        name, _, value = item.partition('=')
+        name = name.strip()
+        if not name or not value.strip():
+            continue
+        if not name.startswith('is_'):
+            name = 'is_' + name
+        try:
+            weights[name] = float(value)
+        except ValueError:
+            print(f"Warning: Ignoring invalid intent boost weight '{item.strip()}'")
+    return weights
+
+
+# Backend files whose contents shape chat answers; answers cached under other
+# contents are never served (see answer_version)
+ANSWER_SOURCES = [
+    'retrieval_augmented_ai.py', 'travel_retriever.py', 'typo_index.py', 'question_index.py',
+    'gazetteer.py', 'ai_service.py', 'knowledge_pack.py', 'near_duplicates.py', 'hashed_tfidf.py',
+    'semantic_index.py', 'quantization.py', 'airports.dat',
+]
+
+
+def answer_settings() -> Dict[str, object]:
+    """
+    The environment settings that change chat answers, parsed the way the
+    engine parses them (so unset and explicitly-default values agree).
+    """
+    from near_duplicates import compaction_settings
+    from quantization import retriever_precision
+    from semantic_index import semantic_mode
+    settings = {
+        'intent_boost_weights': intent_boost_weights(),
+        'question_match_threshold': float(os.getenv("QUESTION_MATCH_THRESHOLD", "0.8")),
+        'retriever_vectorizer': os.getenv("RETRIEVER_VECTORIZER", "tfidf").lower(),
+        'retriever_precision': retriever_precision(),
+        'retriever_semantic': semantic_mode(),
+        **compaction_settings(),
+    }
+    if settings['retriever_semantic'] != 'off':
+        settings['semantic'] = {name: value for name, value in sorted(os.environ.items()) if name.startswith('SEMANTIC_')}
+    return settings
+
+
+def answer_version(df: pd.DataFrame) -> str:
+    """
+    Version of the answers an engine over df gives: a content hash of the
+    frame, of ANSWER_SOURCES and of a canonical dump of answer_settings().
+    """
+    from knowledge_pack import code_fingerprint
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    digest.update(code_fingerprint(ANSWER_SOURCES).encode())
+    digest.update(json.dumps(answer_settings(), sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+# Accommodation category codes, in display order
+ACCOMMODATION_CATEGORIES = ('Luxury', 'Mid-range', 'Budget')
+
+# Dish / cuisine keywords a food answer can be trimmed to
+FOOD_DISH_KEYWORDS = (
+    'ramen', 'sushi', 'pizza', 'burger', 'burgers', 'steak', 'pasta',
+    'seafood', 'vegan', 'vegetarian', 'dessert', 'bbq', 'barbecue',
+    'noodles', 'dimsum', 'dim sum', 'tapas', 'kebabs', 'kebab',
+    'coffee', 'brunch', 'breakfast'
+)
+
+
+def iter_response_sections(response: str) -> Iterator[str]:
+    """
+    Split a formatted answer into the sections it is streamed in (see
+    /api/ai/chat/stream): blocks separated by blank lines, with a lone
+    header ("Luxury:") kept with its block. Each section is yielded as soon
+    as the block that ends it has been read; '\n\n'.join() gives the answer back.
+    """
+    section = None
+    pending = None
+    for block in response.split('\n\n'):
+        if pending is not None:
+            block = pending + '\n\n' + block
+            pending = None
+        stripped = block.strip()
+        if not stripped or (stripped.endswith(':') and '\n' not in stripped):
+            pending = block
+            continue
+        # A trailing header still joins the last section, so hold one back
+        if section is not None:
+            yield section
+        section = block
+    if pending is not None:
+        section = pending if section is None else section + '\n\n' + pending
+    if section is not None:
+        yield section
+
+
+def response_sections(response: str) -> List[str]:
+    """All sections of a formatted answer (see iter_response_sections)."""
+    return list(iter_response_sections(response))
+
+
+def _normalise_accommodation_category(name: str) -> str:
+    """Map a section header ('5-star', 'Mid Range:', 'Hostels') to its category code."""
+    n = name.lower().strip().rstrip(':')
+    if any(k in n for k in ['luxury', '5-star', '5 star', 'premium', 'deluxe', 'ryokan']):
+        return 'Luxury'
+    if any(k in n for k in ['mid-range', 'mid range', 'midrange', 'moderate']):
+        return 'Mid-range'
+    if any(k in n for k in ['budget', 'cheap', 'affordable', 'hostel', 'economy']):
+        return 'Budget'
+    return name.strip().rstrip(':')
+
+
+def _parse_accommodation_sections(response: str) -> Dict[str, List[str]]:
+    """
+    Split an accommodation response into {category code: [items]}.
+
+    Strategy:
+      1. If text already has markdown headers (**Luxury:**), parse those.
+      2. If text is a flat sentence with clear markers (Luxury …. Mid-range: …. Budget: …),
+         split by those markers.
+      3. If text has newlines with category headers, parse line by line.
+    Returns an empty dict if the text has no recognisable sections.
+    """
+    text = response.strip()
+
+    # ---- 1. Markdown-formatted text (**Category:** with - bullets) ----
+    if '**' in text:
+        sections_dict: Dict[str, list] = {}
+        current_cat = None
+        for line in text.split('\n'):
+            line = line.strip()
+            if not line:
+                continue
+            # Match **Luxury:** or **Mid-Range:** etc.
+            hdr = _MD_HEADER_RE.match(line)
+            if hdr:
+                current_cat = _normalise_accommodation_category(hdr.group(1))
+                sections_dict.setdefault(current_cat, [])
+                remainder = line[hdr.end():].strip()
+                if remainder:
+                    sections_dict[current_cat].append(remainder.lstrip('- ').strip())
+            elif current_cat:
+                item = _LEADING_BULLET_RE.sub('', line).strip()
+                if item:
+                    sections_dict[current_cat].append(item)
+        if sections_dict:
+            return sections_dict
+
+    # ---- 2. Flat-sentence format ----
+    # Patterns seen in data:
+    #   "City hotels: Luxury - item, item. Mid-range - item, item. Budget - item, item."
+    #   "City hotels: Luxury options include item, item. Mid-range: item. Budget: item."
+    #   "City accommodation: Luxury hotels (area), mid-range hotels, ... Budget: price."
+
+    # Strip "City hotels:" / "City accommodation:" prefix to expose category markers
+    body = _ACCOMMODATION_PREFIX_RE.sub('', text, count=1).strip()
+    if not body:
+        body = text
+
+    # Find category markers at sentence boundaries only (start, after ". ", after ": ")
+    # This avoids false matches like "budget hotels" in the middle of a sentence.
+    marker_iter = list(_ACCOMMODATION_MARKER_RE.finditer(body))
+
+    if len(marker_iter) >= 2:
+        sections_dict = {}
+        for i, m in enumerate(marker_iter):
+            cat = _normalise_accommodation_category(m.group(1))
+            start = m.end()
+            # Chunk runs until the next category marker or end of body
+            end = marker_iter[i + 1].start() if i + 1 < len(marker_iter) else len(body)
+            rest = body[start:end].strip()
+
+            # Strip leading separator: " - ", ": ", " options include "
+            rest = _LEADING_SEPARATOR_RE.sub('', rest)
+            rest = _OPTIONS_INCLUDE_RE.sub('', rest)
+            rest = _HOTELS_SEPARATOR_RE.sub('', rest)
+            rest = rest.strip()
+            # Trim trailing content that isn't part of this category
+            # Stop at "Best areas", "Areas:", "Book in advance", trailing sentence about prices, etc.
+            for stop in ['Best areas', 'Areas:', 'Book in advance', 'Budget:', 'Mid-range:', 'Luxury:']:
+                idx = rest.find(stop)
+                if idx != -1 and idx > 5:
+                    rest = rest[:idx]
+            # Remove trailing period/sentence fragments
+            rest = rest.strip().rstrip('.')
+            # Also clean up trailing ". " fragments from sentence splitting
+            rest = _TRAILING_PERIOD_RE.sub('', rest)
+
+            items = [item.strip().rstrip('.') for item in rest.split(',') if item.strip()]
+            sections_dict.setdefault(cat, []).extend(items)
+
+        if sections_dict:
+            return sections_dict
+
+    # ---- 3. Line-by-line (already has newlines with category headers) ----
+    if '\n' in text:
+        sections_dict = {}
+        current_cat = None
+        for line in text.split('\n'):
+            stripped = line.strip()
+            if not stripped:
+                continue
+            # Check if line is a category header
+            for candidate in ['Luxury', 'Mid-range', 'Mid-Range', 'Midrange', 'Budget', 'Hostel']:
+                if stripped.lower().startswith(candidate.lower()):
+                    current_cat = _normalise_accommodation_category(candidate)
+                    sections_dict.setdefault(current_cat, [])
+                    # Grab any content after the colon on the same line
+                    if ':' in stripped:
+                        rest = stripped.split(':', 1)[1].strip()
+                        if rest:
+                            for item in rest.split(','):
+                                item = item.strip().rstrip('.')
+                                if item:
+                                    sections_dict[current_cat].append(item)
+                    break
+            else:
+                if current_cat:
+                    item = _LEADING_BULLET_RE.sub('', stripped).strip().rstrip('.')
+                    if item:
+                        sections_dict[current_cat].append(item)
+        if sections_dict:
+            return sections_dict
+
+    return {}
+
+
+def _render_accommodation_sections(sections_dict: Dict[str, List[str]], focus_cat: Optional[str] = None) -> str:
+    """Turn {category: [items]} into a formatted string (only focus_cat's section if given)."""
+    parts = []
+    order = [c for c in ACCOMMODATION_CATEGORIES if c in sections_dict]
+    # add any remaining categories not in the standard order
+    for c in sections_dict:
+        if c not in order:
+            order.append(c)
+
+    for cat in order:
+        if focus_cat and _normalise_accommodation_category(cat) != _normalise_accommodation_category(focus_cat):
+            continue
+        items = sections_dict[cat]
+        if not items:
+            continue
+        if parts:
+            parts.append('')  # blank line between categories
+        parts.append(f"{cat}:")
+        for item in items:
+            item = item.strip().rstrip('.')
+            if item:
+                parts.append(f"  • {item}")
+    return '\n'.join(parts)
+
+
+def _split_sentences(text: str) -> List[str]:
+    """Paragraphs split into sentences, as used when trimming food answers to a dish."""
+    sentences = []
+    for paragraph in text.split("\n\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        for part in paragraph.replace("! ", ". ").replace("? ", ". ").split(". "):
+            part = part.strip()
+            if part:
+                sentences.append(part)
+    return sentences
+
+
+def _prerendered(kind: str):
+    """
+    Formatter decorator: dataset responses are static, so their output is
+    looked up in the table built by DatasetOnlyChat._build_renderings and only
+    computed for other text (post-processed or combined responses).
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, text, *args, **kwargs):
+            if not args and not kwargs:
+                rendered = self._renderings.get(kind, {}).get(text)
+                if rendered is not None:
+                    return rendered
+            return method(self, text, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class StageTimer:
+    """
+    Wall time of each chat() stage of one call, for profiling (see
+    DatasetOnlyChat.timed_chat and chat_replay.py). Each lap is charged to
+    the stage that just finished.
+    """
+    
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self._start = self._last = time.perf_counter()
+    
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + (now - self._last)
+        self._last = now
+    
+    def finish(self) -> Dict[str, float]:
+        """Charge the time since the last lap to 'other'; returns seconds per stage."""
+        self.lap('other')
+        self.stages['total'] = self._last - self._start
+        return self.stages
+
+
+@dataclass(frozen=True)
+class QueryAnalysis:
+    """
+    Everything chat() needs to know about the query text, computed once per
+    request (see DatasetOnlyChat._analyze_query) and shared by every stage.
+    """
+    text: str                                # typo-corrected (and context-enhanced) query
+    lower: str                               # text.lower()
+    words: Tuple[str, ...]                   # lower.strip().split()
+    intent: Mapping[str, bool]               # _detect_query_intent
+    locations: Mapping[str, Tuple[str, ...]] # {'countries': (...), 'cities': (...)}
+    is_vague: bool
+    
+    @property
+    def has_location(self) -> bool:
+        return bool(self.locations['countries'] or self.locations['cities'])
+
+
+@dataclass(frozen=True)
+class ChatDraft:
+    """
+    A chat answer before its final formatting (DatasetOnlyChat.prepare_chat):
+    ready as soon as retrieval and selection are done, so its metadata can
+    be sent before the text is rendered (DatasetOnlyChat.answer_sections).
+    """
+    result: Dict                                 # the chat() reply without 'response'
+    text: str                                    # selected response text
+    render: bool = False                         # text still needs _render_final
+    cache_key: Optional[Tuple[str, int]] = None  # (query, top_k) to cache the answer under
+
+
+def _draft(result: Dict, render: bool = False) -> ChatDraft:
+    """ChatDraft of a chat() reply dict."""
+    return ChatDraft({k: v for k, v in result.items() if k != 'response'}, result['response'], render)
 
 
 class DatasetOnlyChat:
@@ -21,377 +424,258 @@ class DatasetOnlyChat:
     No LLM/API calls - uses only the dataset.
     """
     
-    def __init__(self, csv_path: Optional[str] = None):
+    def __init__(self, csv_path: Optional[str] = None, corpus=None, pack=None):
         """
         Initialize the dataset-only chat service.
         
         Args:
             csv_path: Optional path to travel_QA CSV file
+            corpus: Optional already-parsed dataset (see chat_engines.load_corpus)
+            pack: Optional KnowledgePack with the prepared index and
+                pre-rendered responses (see knowledge_pack.py)
+        """
+        self.retriever = create_retriever(csv_path, corpus=corpus, pack=pack)
+        self.retriever.set_intent_boosts(INTENT_BOOST_KEYWORDS, intent_boost_weights())
+        # Optional micro-batching of concurrent retrievals (see retrieval_batcher.py)
+        self.batcher = create_retrieval_batcher(self.retriever)
+        # Per-thread StageTimer while a timed_chat() call is running
+        self._timing = threading.local()
+        
+        # Typo correction index over the dataset vocabulary + gazetteer places
+        self.typo_index = pack.typo_index() if pack is not None else None
+        if self.typo_index is None:
+            print("Building typo correction index...")
+            self.typo_index = build_typo_index(
+                list(self.retriever.df['question'].astype(str)) + list(self.retriever.df['response'].astype(str))
+            )
+        print(f"Typo index ready with {len(self.typo_index)} terms ({len(self.typo_index.places)} places)")
+        
+        # Formatter output for every dataset response (see _prerendered)
+        self._renderings: Dict[str, Dict[str, str]] = {}
+        renderings = pack.renderings() if pack is not None else None
+        if renderings is not None:
+            self._renderings = renderings
+        else:
+            self._build_renderings(self.retriever.df['response'].astype(str))
+        
+        # Accommodation category / food dish sections of every dataset response
+        self._sections: Dict[str, Dict[str, object]] = {'accommodation': {}, 'food': {}}
+        self._build_section_index(self.retriever.df['response'].astype(str))
+        
+        # Exact / near-duplicate dataset question lookup (see _match_question)
+        threshold = float(os.getenv("QUESTION_MATCH_THRESHOLD", "0.8"))
+        self.question_index = pack.question_index(threshold) if pack is not None else None
+        if self.question_index is None:
+            print("Building question match index...")
+            self.question_index = build_question_index(
+                self.retriever.df['question'].astype(str),
+                self.retriever.df['response'].astype(str),
+                threshold=threshold
+            )
+        print(f"Question index ready with {len(self.question_index)} questions")
+        
+        # Answers shared between workers through SQLite (see answer_cache.py)
+        self.answer_cache = create_answer_cache(self.dataset_version())
+        if self.answer_cache is not None:
+            self.warm_answer_cache(load_warm_queries())
+    
+    def dataset_version(self) -> str:
+        """
+        Fingerprint of the loaded dataset, the answer-shaping code and
+        settings (see answer_version), so no deploy or config change serves
+        answers computed under another one.
+        """
+        return answer_version(self.retriever.df)
+    
+    def warm_answer_cache(self, queries: List[str], top_k: int = 6):
+        """Answer popular queries ahead of time (top_k=6 is what /api/ai/chat uses)."""
+        if self.answer_cache is None or not queries:
+            return
+        added = 0
+        for query in queries:
+            if not self.answer_cache.contains(query, top_k):
+                self.chat(query, top_k=top_k)
+                added += 1
+        print(f"Answer cache warmed: {added} new of {len(queries)} popular queries ({len(self.answer_cache)} cached)")
+    
+    def _build_renderings(self, responses):
+        """
+        Run the response formatters over every dataset response once, so
+        request-time formatting of a stored response is a dict lookup.
+        """
+        print("Pre-rendering dataset responses...")
+        responses = list(dict.fromkeys(responses))
+        # Identical outputs (often the input itself) share one string object
+        pool: Dict[str, str] = {text: text for text in responses}
+        renderings: Dict[str, Dict[str, str]] = {}
+        for kind, formatter in (('format', self._format_response),
+                                ('food', self._format_food_response),
+                                ('final', self._render_final)):
+            table = {}
+            for text in responses:
+                out = formatter(text)
+                table[text] = pool.setdefault(out, out)
+            renderings[kind] = table
+            # Later formatters reuse earlier tables (_render_final calls _format_response)
+            self._renderings = renderings
+        print(f"Pre-rendered {len(responses)} responses")
+    
+    def _build_section_index(self, responses):
+        """
+        Extract the category sections of every dataset response once:
+        
+        - accommodation: response -> {category code: rendered section, None: all
+          sections} ({} when the response has no luxury / mid-range / budget
+          structure), so a focused hotel answer is a (response, category) lookup
+        - food: response -> (sentences, {dish: sentence indices}) for responses
+          mentioning a FOOD_DISH_KEYWORDS dish, used to trim an answer to the
+          dish the user asked about
         """
-        self.retriever = create_retriever(csv_path)
+        print("Indexing response sections...")
+        accommodation = {}
+        food = {}
+        no_sections = MappingProxyType({})
+        no_dishes = ((), MappingProxyType({}))
+        for text in dict.fromkeys(responses):
+            sections = _parse_accommodation_sections(text)
+            if sections:
+                rendered = {None: _render_accommodation_sections(sections)}
+                for category in sections:
+                    rendered[_normalise_accommodation_category(category)] = _render_accommodation_sections(sections, category)
+                accommodation[text] = rendered
+            else:
+                accommodation[text] = no_sections
+            
+            lower = text.lower()
+            if not any(dish in lower for dish in FOOD_DISH_KEYWORDS):
+                food[text] = no_dishes
+                continue
+            sentences = []
+            dishes = {}
+            for sentence in _split_sentences(text):
+                sentence_lower = sentence.lower()
+                mentioned = [dish for dish in FOOD_DISH_KEYWORDS if dish in sentence_lower]
+                if mentioned:
+                    for dish in mentioned:
+                        dishes.setdefault(dish, []).append(len(sentences))
+                    sentences.append(sentence)
+            food[text] = (tuple(sentences), {dish: tuple(idx) for dish, idx in dishes.items()})
+        self._sections = {'accommodation': accommodation, 'food': food}
+        with_accommodation = sum(1 for rendered in accommodation.values() if rendered)
+        with_dishes = sum(1 for entry in food.values() if entry[0])
+        print(f"Indexed sections: {with_accommodation} accommodation, {with_dishes} food responses")
+    
+    def _trim_to_dishes(self, response: str, query_lower: str) -> Optional[str]:
+        """
+        Only the sentences of a food response about the dishes the query asks
+        for ("ramen", "sushi", ...), or None if it names no dish or the
+        response never mentions one.
+        """
+        dish_keywords = [dish for dish in FOOD_DISH_KEYWORDS if dish in query_lower]
+        if not dish_keywords:
+            return None
+        segments = self._dish_sentences(response, dish_keywords)
+        if not segments:
+            return None
+        trimmed_response = ". ".join(segments)
+        # Add a period at the end if missing
+        if not trimmed_response.endswith((".", "!", "?")):
+            trimmed_response += "."
+        return trimmed_response
+    
+    def _accommodation_focus(self, query_lower: str) -> Optional[str]:
+        """Accommodation category the query asks for ('luxury', 'budget', 'mid-range'), if any."""
+        if 'luxury' in query_lower:
+            return 'luxury'
+        if 'budget' in query_lower:
+            return 'budget'
+        if 'mid-range' in query_lower or 'mid range' in query_lower:
+            return 'mid-range'
+        return None
+    
+    def _dish_sentences(self, response: str, dishes: List[str]) -> List[str]:
+        """Sentences of response that mention any of the dishes, in order."""
+        entry = self._sections['food'].get(response)
+        if entry is None:
+            return [sentence for sentence in _split_sentences(response)
+                    if any(dish in sentence.lower() for dish in dishes)]
+        sentences, index = entry
+        positions = sorted(set().union(*(index.get(dish, ()) for dish in dishes)))
+        return [sentences[i] for i in positions]
     
     def _correct_typos(self, query: str) -> str:
         """
         Correct common typos in user queries.
         Handles:
         - Common word typos (attractions, accommodation, etc.)
-        - Location name typos (hokkaido, tokyo, etc.)
-        """
-        corrected = query
-        
-        # Common word typos
-        word_corrections = {
-            'aatractions': 'attractions',
-            'atractions': 'attractions',
-            'atraction': 'attraction',
-            'accomodation': 'accommodation',
-            'acomodation': 'accommodation',
-            'accomodations': 'accommodations',
-            'resturant': 'restaurant',
-            'restaurants': 'restaurants',
-            'resturants': 'restaurants',
-            'recomendations': 'recommendations',
-            'recomendation': 'recommendation',
-            'recomend': 'recommend',
-            'recomended': 'recommended',
-            'itenerary': 'itinerary',
-            'iteneraries': 'itineraries',
-            'itenerary': 'itinerary',
-            'trasportation': 'transportation',
-            'trasport': 'transport',
-            'trasportation': 'transportation',
-        }
-        
-        # Apply word corrections (case-insensitive)
-        for typo, correct in word_corrections.items():
-            # Use word boundaries to avoid partial matches
-            pattern = r'\b' + re.escape(typo) + r'\b'
-            corrected = re.sub(pattern, correct, corrected, flags=re.IGNORECASE)
-        
-        # Location name typos - explicit corrections for common misspellings
-        location_corrections = {
-            # Common typos for major locations
-            'hokkadio': 'hokkaido',
-            'hokkido': 'hokkaido',
-            'hokkado': 'hokkaido',
-            'tokio': 'tokyo',
-            'tokyio': 'tokyo',
-            'tokyoo': 'tokyo',
-        }
+        - Location name typos (hokkaido, tokyo, kuala lumpur, etc.)
         
-        # Apply location corrections (case-insensitive)
-        corrected_lower = corrected.lower()
-        for typo, correct in location_corrections.items():
-            # Use word boundaries for single-word locations
-            if ' ' not in typo:
-                pattern = r'\b' + re.escape(typo) + r'\b'
-                if re.search(pattern, corrected_lower):
-                    corrected = re.sub(pattern, correct, corrected, flags=re.IGNORECASE)
-            else:
-                # For multi-word locations, replace the whole phrase
-                if typo in corrected_lower:
-                    corrected = re.sub(re.escape(typo), correct, corrected, flags=re.IGNORECASE)
-        
-        # Additional fuzzy matching for location names (if SequenceMatcher is available)
-        # This catches typos not in the explicit list above
-        if SequenceMatcher:
-            # List of all known locations (cities and countries)
-            all_locations = [
-                # Japan
-                'hokkaido', 'tokyo', 'kyoto', 'osaka', 'sapporo', 'fukuoka', 'hiroshima', 'nara',
-                # East Asia
-                'shanghai', 'beijing', 'hong kong', 'taipei', 'seoul', 'busan',
-                # Southeast Asia
-                'bali', 'jakarta', 'yogyakarta', 'bandung', 'surabaya', 'lombok', 'medan', 'semarang',
-                'singapore', 'bangkok', 'chiang mai', 'phuket', 'pattaya', 'krabi', 'koh samui',
-                'kuala lumpur', 'penang', 'langkawi', 'malacca', 'kota kinabalu', 'johor bahru', 'ipoh', 'kuching',
-                'manila', 'cebu', 'boracay', 'palawan', 'siargao', 'baguio', 'davao',
-                'hanoi', 'ho chi minh', 'da nang', 'hoi an', 'nha trang',
-                'siem reap', 'phnom penh', 'yangon', 'mandalay', 'bagan',
-                'vientiane', 'luang prabang', 'brunei',
-                # Europe
-                'paris', 'london', 'rome', 'venice', 'barcelona', 'madrid', 'amsterdam', 'berlin', 'munich',
-                'vienna', 'prague', 'budapest', 'istanbul', 'athens', 'lisbon', 'dublin',
-                # Oceania
-                'sydney', 'melbourne', 'auckland', 'wellington',
-                # Americas
-                'new york', 'los angeles', 'san francisco', 'chicago', 'miami', 'boston', 'seattle',
-                'toronto', 'vancouver', 'montreal',
-                'rio de janeiro', 'sao paulo', 'buenos aires', 'lima', 'bogota', 'santiago',
-                'mexico city', 'dubai', 'cairo', 'cape town', 'nairobi',
-                # Countries
-                'india', 'japan', 'china', 'thailand', 'indonesia', 'malaysia', 'philippines',
-                'vietnam', 'cambodia', 'myanmar', 'laos',
-                'australia', 'usa', 'france', 'italy', 'spain', 'uk', 'germany', 'canada',
-                'brazil', 'argentina', 'mexico'
-            ]
-            
-            words = corrected.lower().split()
-            corrected_words = []
-            i = 0
-            
-            while i < len(words):
-                word = words[i]
-                best_match = word
-                best_ratio = 0.85  # Higher threshold for fuzzy matching
-                matched_location = None
-                matched_length = 1
-                
-                # Check single-word locations
-                for location in all_locations:
-                    if ' ' not in location:
-                        ratio = SequenceMatcher(None, word, location).ratio()
-                        if ratio > best_ratio and ratio < 1.0:  # Only correct if it's a typo
-                            best_match = location
-                            best_ratio = ratio
-                            matched_location = location
-                    else:
-                        # Check multi-word locations
-                        location_words = location.split()
-                        if i + len(location_words) <= len(words):
-                            phrase = ' '.join(words[i:i+len(location_words)])
-                            ratio = SequenceMatcher(None, phrase, location).ratio()
-                            if ratio > best_ratio:
-                                best_match = location
-                                best_ratio = ratio
-                                matched_location = location
-                                matched_length = len(location_words)
-                
-                if matched_location and matched_length > 1:
-                    corrected_words.append(matched_location)
-                    i += matched_length
-                else:
-                    corrected_words.append(best_match)
-                    i += 1
-            
-            # Reconstruct query preserving original structure
-            if corrected_words != words:
-                original_words = corrected.split()
-                if len(original_words) == len(corrected_words):
-                    result_words = []
-                    for orig, corr in zip(original_words, corrected_words):
-                        if orig.lower() == corr.lower():
-                            result_words.append(orig)
-                        else:
-                            # Preserve capitalization style
-                            if orig[0].isupper():
-                                result_words.append(corr.title())
-                            else:
-                                result_words.append(corr)
-                    corrected = ' '.join(result_words)
-                else:
-                    # Length mismatch - use corrected words with smart capitalization
-                    result_words = []
-                    for corr in corrected_words:
-                        # Capitalize if it's a proper noun (location)
-                        if corr in all_locations:
-                            result_words.append(corr.title())
-                        else:
-                            result_words.append(corr)
-                    corrected = ' '.join(result_words)
+        Known misspellings are a dict lookup; anything else unknown to the
+        dataset vocabulary is looked up in the deletion index (see typo_index.py).
+        """
+        return self.typo_index.correct(query)
+    
+    def _analyze_query(self, query: str) -> QueryAnalysis:
+        """Normalize the query and detect its intent, locations and vagueness in one pass."""
+        lower = query.lower()
+        words = tuple(lower.strip().split())
+        locations = self._extract_location_from_query(query)
+        return QueryAnalysis(
+            text=query,
+            lower=lower,
+            words=words,
+            intent=MappingProxyType(self._detect_query_intent(query)),
+            locations=MappingProxyType({key: tuple(values) for key, values in locations.items()}),
+            is_vague=(
+                len(words) == 1 and words[0] in VAGUE_QUERIES or
+                len(query.strip()) < 3 or
+                (len(words) <= 2 and all(word in VAGUE_QUERIES for word in words))
+            )
+        )
+    
+    def _match_question(self, analysis: QueryAnalysis) -> Optional[QuestionMatch]:
+        """
+        Dataset question the query is an exact or near-duplicate of, if that
+        question's answer can be returned as-is.
         
-        return corrected
+        The match must name the same places as the query, and a near (not
+        exact) match must also have the same intent. Country-level food and
+        hotel queries are left to the pipeline, which asks for a city.
+        """
+        if analysis.locations['countries'] and not analysis.locations['cities']:
+            if analysis.intent['is_food'] or analysis.intent['is_accommodation']:
+                return None
+        match = self.question_index.lookup(analysis.text)
+        if match is None:
+            return None
+        match_locations = self._extract_location_from_query(match.question)
+        for kind in ('countries', 'cities'):
+            if set(match_locations[kind]) != set(analysis.locations[kind]):
+                return None
+        if match.score < 1.0 and self._detect_query_intent(match.question) != dict(analysis.intent):
+            return None
+        return match
+    
+    def _render_match(self, response: str, analysis: QueryAnalysis) -> str:
+        """
+        Trim and format a matched dataset answer the way the pipeline does
+        for the query's intent (_render_sections does the final formatting).
+        """
+        if analysis.intent['is_food']:
+            response = self._trim_to_dishes(response, analysis.lower) or self._format_food_response(response)
+        elif analysis.intent['is_accommodation']:
+            focus = self._accommodation_focus(analysis.lower)
+            focused = self._format_accommodation_response(response, focus=focus) if focus else None
+            response = focused or self._format_accommodation_response(response)
+        return response
     
     def _extract_location_from_query(self, query: str) -> Dict[str, List[str]]:
-        """Extract location mentions from query."""
-        query_lower = query.lower()
-        locations = {'countries': [], 'cities': []}
-        
-        # Country keywords
-        country_keywords = {
-            'japan': ['japan', 'japanese'],
-            'usa': ['usa', 'united states', 'america', 'us', 'u.s.'],
-            'australia': ['australia', 'australian'],
-            'indonesia': ['indonesia', 'indonesian'],
-            'thailand': ['thailand', 'thai'],
-            'india': ['india', 'indian'],
-            'china': ['china', 'chinese'],
-            'france': ['france', 'french'],
-            'italy': ['italy', 'italian'],
-            'spain': ['spain', 'spanish'],
-            'switzerland': ['switzerland', 'swiss'],
-            'finland': ['finland', 'finnish'],
-            'canada': ['canada', 'canadian'],
-            'vietnam': ['vietnam', 'vietnamese'],
-            'philippines': ['philippines', 'filipino'],
-            'malaysia': ['malaysia', 'malaysian'],
-            'cambodia': ['cambodia', 'cambodian', 'khmer'],
-            'myanmar': ['myanmar', 'burmese', 'burma'],
-            'laos': ['laos', 'laotian'],
-            'brunei': ['brunei'],
-            'timor-leste': ['timor-leste', 'east timor', 'timor'],
-            'maldives': ['maldives', 'maldivian'],
-            'iceland': ['iceland', 'icelandic'],
-            'new zealand': ['new zealand', 'zealand'],
-            'argentina': ['argentina', 'argentinian'],
-            'brazil': ['brazil', 'brazilian'],
-            'chile': ['chile', 'chilean'],
-            'peru': ['peru', 'peruvian'],
-            'colombia': ['colombia', 'colombian'],
-            'mexico': ['mexico', 'mexican'],
-            'uk': ['uk', 'united kingdom', 'britain', 'british'],
-            'south korea': ['south korea', 'korea', 'korean'],
-            'uae': ['uae', 'united arab emirates'],
-            'egypt': ['egypt', 'egyptian'],
-            'south africa': ['south africa', 'south african'],
-            'kenya': ['kenya', 'kenyan']
-        }
-        
-        # City keywords
-        # NOTE: This list is intentionally biased toward cities that appear
-        # frequently in the dataset or in clarification prompts, so that short
-        # follow‑up answers like "sapporo" are correctly recognized as cities.
-        city_keywords = {
-            # Japan
-            'tokyo': ['tokyo'],
-            'kyoto': ['kyoto'],
-            'osaka': ['osaka'],
-            'hokkaido': ['hokkaido'],
-            'sapporo': ['sapporo'],
-            'fukuoka': ['fukuoka'],
-            'hiroshima': ['hiroshima'],
-            # East Asia
-            'shanghai': ['shanghai', 'pudong'],
-            'beijing': ['beijing'],
-            'hong kong': ['hong kong'],
-            'taipei': ['taipei'],
-            'seoul': ['seoul'],
-            'busan': ['busan'],
-            # Southeast Asia – Malaysia
-            'kuala lumpur': ['kuala lumpur', 'kl'],
-            'penang': ['penang', 'george town penang'],
-            'langkawi': ['langkawi'],
-            'malacca': ['malacca', 'melaka'],
-            'kota kinabalu': ['kota kinabalu'],
-            'johor bahru': ['johor bahru', 'johor'],
-            'ipoh': ['ipoh'],
-            'kuching': ['kuching'],
-            'cameron highlands': ['cameron highlands'],
-            # Southeast Asia – Philippines
-            'manila': ['manila'],
-            'cebu': ['cebu'],
-            'boracay': ['boracay'],
-            'palawan': ['palawan', 'el nido', 'coron'],
-            'siargao': ['siargao'],
-            'baguio': ['baguio'],
-            'davao': ['davao'],
-            'bohol': ['bohol'],
-            # Southeast Asia – Indonesia
-            'bali': ['bali', 'ubud', 'seminyak', 'kuta bali'],
-            'jakarta': ['jakarta'],
-            'yogyakarta': ['yogyakarta', 'jogja', 'jogjakarta'],
-            'bandung': ['bandung'],
-            'surabaya': ['surabaya'],
-            'lombok': ['lombok', 'gili trawangan', 'gili islands'],
-            'medan': ['medan', 'lake toba'],
-            'semarang': ['semarang'],
-            # Southeast Asia – Thailand
-            'bangkok': ['bangkok'],
-            'chiang mai': ['chiang mai', 'chiangmai'],
-            'phuket': ['phuket'],
-            'pattaya': ['pattaya'],
-            'krabi': ['krabi', 'railay'],
-            'koh samui': ['koh samui', 'samui'],
-            # Southeast Asia – Vietnam
-            'hanoi': ['hanoi'],
-            'ho chi minh city': ['ho chi minh', 'saigon', 'hcmc'],
-            'da nang': ['da nang', 'danang'],
-            'hoi an': ['hoi an', 'hoian'],
-            'nha trang': ['nha trang'],
-            # Southeast Asia – Cambodia
-            'siem reap': ['siem reap', 'angkor'],
-            'phnom penh': ['phnom penh'],
-            # Southeast Asia – Myanmar
-            'yangon': ['yangon', 'rangoon'],
-            'mandalay': ['mandalay'],
-            'bagan': ['bagan'],
-            # Southeast Asia – Laos
-            'vientiane': ['vientiane'],
-            'luang prabang': ['luang prabang'],
-            # Southeast Asia – Singapore & Brunei
-            'singapore': ['singapore'],
-            'brunei': ['brunei', 'bandar seri begawan'],
-            # Oceania
-            'sydney': ['sydney'],
-            'melbourne': ['melbourne'],
-            # Europe
-            'paris': ['paris'],
-            'london': ['london'],
-            'rome': ['rome'],
-            'venice': ['venice'],
-            'barcelona': ['barcelona'],
-            'madrid': ['madrid'],
-            'amsterdam': ['amsterdam'],
-            'berlin': ['berlin'],
-            'prague': ['prague'],
-            'budapest': ['budapest'],
-            'vienna': ['vienna'],
-            'lisbon': ['lisbon'],
-            'athens': ['athens'],
-            # Americas
-            'buenos aires': ['buenos aires', 'buenosaires'],
-            'rio de janeiro': ['rio de janeiro', 'rio'],
-            'sao paulo': ['sao paulo', 'são paulo'],
-            'lima': ['lima'],
-            'bogota': ['bogota', 'bogotá'],
-            'santiago': ['santiago'],
-            'mexico city': ['mexico city'],
-            'new york': ['new york', 'nyc'],
-            'los angeles': ['los angeles'],  # removed 'la' alias — matches 'kuala', 'malacca', etc.
-            'chicago': ['chicago'],
-            'san francisco': ['san francisco'],
-            'miami': ['miami'],
-            'seattle': ['seattle'],
-            'boston': ['boston'],
-            # Middle East / Africa
-            'dubai': ['dubai'],
-            'istanbul': ['istanbul'],
-            'cairo': ['cairo'],
-            'cape town': ['cape town'],
-            'nairobi': ['nairobi'],
-        }
-        
-        # Check for countries
-        for country, keywords in country_keywords.items():
-            if any(kw in query_lower for kw in keywords):
-                locations['countries'].append(country)
-        
-        # Check for cities
-        for city, keywords in city_keywords.items():
-            if any(kw in query_lower for kw in keywords):
-                locations['cities'].append(city)
-        
-        return locations
+        """Extract location mentions from query (countries and cities, in order of appearance)."""
+        return get_gazetteer().extract(query)
     
     def _filter_accommodation_by_focus(self, text: str, focus: str) -> str:
-        """Filter formatted accommodation text to only show the specified category."""
-        focus_lower = focus.lower()
-        lines = text.split('\n')
-        filtered_lines = []
-        current_category = None
-        include_category = False
-        
-        for line in lines:
-            line_lower = line.lower()
-            # Check if this is a category header
-            is_category = any(f"{cat}:" in line_lower for cat in ['luxury', 'mid-range', 'budget', 'cheap', 'affordable'])
-            
-            if is_category:
-                current_category = line_lower
-                # Check if this is the category we want
-                if 'luxury' in focus_lower and 'luxury' in line_lower:
-                    include_category = True
-                elif 'budget' in focus_lower and ('budget' in line_lower or 'cheap' in line_lower or 'affordable' in line_lower):
-                    include_category = True
-                elif 'mid' in focus_lower and 'mid' in line_lower:
-                    include_category = True
-                else:
-                    include_category = False
-            
-            if include_category or (not is_category and current_category and include_category):
-                filtered_lines.append(line)
-        
-        return '\n'.join(filtered_lines) if filtered_lines else text
+        """Filter accommodation text to only show the specified category."""
+        return self._format_accommodation_response(text, focus=focus) or text
     
     def _format_accommodation_response(self, response: str, focus: Optional[str] = None) -> str:
         """
@@ -400,157 +684,19 @@ class DatasetOnlyChat:
         If `focus` is provided (e.g. 'luxury', 'budget', 'mid-range'),
         only the matching category section is returned.
 
-        Strategy:
-          1. If text already has markdown headers (**Luxury:**), parse those.
-          2. If text is a flat sentence with clear markers (Luxury …. Mid-range: …. Budget: …),
-             split by those markers and format each section.
-          3. Otherwise return text as-is (let _format_response handle it).
+        Dataset responses are a (response, category) lookup in the section
+        table; other text is parsed with _parse_accommodation_sections.
         """
-        import re
-        text = response.strip()
-
-        # ---- helpers ----
-        _CATEGORY_ORDER = ['Luxury', 'Mid-range', 'Budget']
-
-        def _normalise_category(name: str) -> str:
-            n = name.lower().strip().rstrip(':')
-            if any(k in n for k in ['luxury', '5-star', '5 star', 'premium', 'deluxe', 'ryokan']):
-                return 'Luxury'
-            if any(k in n for k in ['mid-range', 'mid range', 'midrange', 'moderate']):
-                return 'Mid-range'
-            if any(k in n for k in ['budget', 'cheap', 'affordable', 'hostel', 'economy']):
-                return 'Budget'
-            return name.strip().rstrip(':')
-
-        def _build_output(sections_dict: dict, focus_cat: Optional[str] = None) -> str:
-            """Turn {category: [items]} into a formatted string."""
-            parts = []
-            order = [c for c in _CATEGORY_ORDER if c in sections_dict]
-            # add any remaining categories not in the standard order
-            for c in sections_dict:
-                if c not in order:
-                    order.append(c)
-
-            for cat in order:
-                if focus_cat and _normalise_category(cat) != _normalise_category(focus_cat):
-                    continue
-                items = sections_dict[cat]
-                if not items:
-                    continue
-                if parts:
-                    parts.append('')  # blank line between categories
-                parts.append(f"{cat}:")
-                for item in items:
-                    item = item.strip().rstrip('.')
-                    if item:
-                        parts.append(f"  • {item}")
-            return '\n'.join(parts)
-
-        # ---- 1. Markdown-formatted text (**Category:** with - bullets) ----
-        if '**' in text:
-            sections_dict: Dict[str, list] = {}
-            current_cat = None
-            for line in text.split('\n'):
-                line = line.strip()
-                if not line:
-                    continue
-                # Match **Luxury:** or **Mid-Range:** etc.
-                hdr = re.match(r'\*\*(.+?)\*\*:?\s*', line)
-                if hdr:
-                    current_cat = _normalise_category(hdr.group(1))
-                    sections_dict.setdefault(current_cat, [])
-                    remainder = line[hdr.end():].strip()
-                    if remainder:
-                        sections_dict[current_cat].append(remainder.lstrip('- ').strip())
-                elif current_cat:
-                    item = re.sub(r'^[-•]\s*', '', line).strip()
-                    if item:
-                        sections_dict[current_cat].append(item)
-            if sections_dict:
-                return _build_output(sections_dict, focus)
-
-        # ---- 2. Flat-sentence format ----
-        # Patterns seen in data:
-        #   "City hotels: Luxury - item, item. Mid-range - item, item. Budget - item, item."
-        #   "City hotels: Luxury options include item, item. Mid-range: item. Budget: item."
-        #   "City accommodation: Luxury hotels (area), mid-range hotels, ... Budget: price."
-
-        # Strip "City hotels:" / "City accommodation:" prefix to expose category markers
-        body = re.sub(
-            r'^[A-Za-z\s]+(?:hotels?|accommodation)\s*:\s*',
-            '', text, count=1, flags=re.IGNORECASE
-        ).strip()
-        if not body:
-            body = text
-
-        # Find category markers at sentence boundaries only (start, after ". ", after ": ")
-        # This avoids false matches like "budget hotels" in the middle of a sentence.
-        cat_word = r'(?:(?:^|(?<=\.\s)|(?<=:\s)))(Luxury|Mid[- ]?[Rr]ange|Budget)'
-        marker_iter = list(re.finditer(cat_word, body, flags=re.IGNORECASE))
-
-        if len(marker_iter) >= 2:
-            sections_dict = {}
-            for i, m in enumerate(marker_iter):
-                cat = _normalise_category(m.group(1))
-                start = m.end()
-                # Chunk runs until the next category marker or end of body
-                end = marker_iter[i + 1].start() if i + 1 < len(marker_iter) else len(body)
-                rest = body[start:end].strip()
-
-                # Strip leading separator: " - ", ": ", " options include "
-                rest = re.sub(r'^[\s]*[-–:]+\s*', '', rest)
-                rest = re.sub(r'^options\s+include\s*', '', rest, flags=re.IGNORECASE)
-                rest = re.sub(r'^hotels?\s*[-–:]+\s*', '', rest, flags=re.IGNORECASE)
-                rest = rest.strip()
-                # Trim trailing content that isn't part of this category
-                # Stop at "Best areas", "Areas:", "Book in advance", trailing sentence about prices, etc.
-                for stop in ['Best areas', 'Areas:', 'Book in advance', 'Budget:', 'Mid-range:', 'Luxury:']:
-                    idx = rest.find(stop)
-                    if idx != -1 and idx > 5:
-                        rest = rest[:idx]
-                # Remove trailing period/sentence fragments
-                rest = rest.strip().rstrip('.')
-                # Also clean up trailing ". " fragments from sentence splitting
-                rest = re.sub(r'\.\s*$', '', rest)
-
-                items = [item.strip().rstrip('.') for item in rest.split(',') if item.strip()]
-                sections_dict.setdefault(cat, []).extend(items)
-
-            if sections_dict:
-                return _build_output(sections_dict, focus)
-
-        # ---- 3. Line-by-line (already has newlines with category headers) ----
-        if '\n' in text:
-            sections_dict = {}
-            current_cat = None
-            for line in text.split('\n'):
-                stripped = line.strip()
-                if not stripped:
-                    continue
-                # Check if line is a category header
-                for candidate in ['Luxury', 'Mid-range', 'Mid-Range', 'Midrange', 'Budget', 'Hostel']:
-                    if stripped.lower().startswith(candidate.lower()):
-                        current_cat = _normalise_category(candidate)
-                        sections_dict.setdefault(current_cat, [])
-                        # Grab any content after the colon on the same line
-                        if ':' in stripped:
-                            rest = stripped.split(':', 1)[1].strip()
-                            if rest:
-                                for item in rest.split(','):
-                                    item = item.strip().rstrip('.')
-                                    if item:
-                                        sections_dict[current_cat].append(item)
-                        break
-                else:
-                    if current_cat:
-                        item = re.sub(r'^[-•]\s*', '', stripped).strip().rstrip('.')
-                        if item:
-                            sections_dict[current_cat].append(item)
-            if sections_dict:
-                return _build_output(sections_dict, focus)
-
-        # ---- 4. Fallback: return as-is ----
-        return text
+        code = _normalise_accommodation_category(focus) if focus else None
+        rendered = self._sections['accommodation'].get(response)
+        if rendered is None:
+            sections = _parse_accommodation_sections(response)
+            if not sections:
+                return response.strip()
+            return _render_accommodation_sections(sections, focus)
+        if not rendered:
+            return response.strip()
+        return rendered.get(code, '')
     
     def _bullets_to_numbered(self, text: str) -> str:
         """
@@ -560,7 +706,6 @@ class DatasetOnlyChat:
            into a clean sequentially numbered list.
         Numbering restarts after every non-list line (headers, blank lines, plain text).
         """
-        import re
         if not text:
             return text
 
@@ -569,7 +714,7 @@ class DatasetOnlyChat:
         # A line-starting • has only whitespace before it (e.g. "  • item").
         # Use regex to replace mid-line •: any • preceded by a non-whitespace char.
         # Allow variable spaces (but NOT newlines) around the bullet.
-        text = re.sub(r'(?<=\S) +\u2022 +', ', ', text)
+        text = _MIDLINE_BULLET_RE.sub(', ', text)
         # Handle remaining mid-line • without surrounding spaces (rare but possible)
         cleaned_lines = []
         for raw_line in text.split('\n'):
@@ -596,8 +741,8 @@ class DatasetOnlyChat:
 
             # Detect list items: lines starting with •, - (dash list marker), or "1."
             is_bullet = stripped.startswith('\u2022')
-            is_dash = bool(re.match(r'^-\s+', stripped))  # "- item" but NOT "---" separators
-            is_numbered = bool(re.match(r'^\d+\.\s', stripped))
+            is_dash = bool(_DASH_ITEM_RE.match(stripped))  # "- item" but NOT "---" separators
+            is_numbered = bool(_NUMBERED_ITEM_RE.match(stripped))
 
             if is_bullet or is_dash or is_numbered:
                 # Strip all leading markers: bullets, dashes, numbers
@@ -606,14 +751,14 @@ class DatasetOnlyChat:
                 while content.startswith('\u2022'):
                     content = content[1:].lstrip()
                 # Remove leading dash marker  "- "
-                content = re.sub(r'^-\s+', '', content).strip()
+                content = _DASH_ITEM_RE.sub('', content).strip()
                 # Remove leading number prefix  "12. "
-                content = re.sub(r'^\d+\.\s*', '', content).strip()
+                content = _NUMBER_PREFIX_RE.sub('', content).strip()
                 # Handle nested combinations like "• 1. text" or "- • text"
                 while content.startswith('\u2022'):
                     content = content[1:].lstrip()
-                content = re.sub(r'^-\s+', '', content).strip()
-                content = re.sub(r'^\d+\.\s*', '', content).strip()
+                content = _DASH_ITEM_RE.sub('', content).strip()
+                content = _NUMBER_PREFIX_RE.sub('', content).strip()
 
                 if content:
                     counter += 1
@@ -626,6 +771,7 @@ class DatasetOnlyChat:
 
         return '\n'.join(out)
 
+    @_prerendered('format')
     def _format_response(self, response: str) -> str:
         """
         Format any AI response with proper indexing, bullet points, and organized spacing.
@@ -1052,7 +1198,7 @@ class DatasetOnlyChat:
                         part = part.strip()
                         if part:
                             # Remove any existing numbering and use bullet points
-                            part = re.sub(r'^\d+\.\s*', '', part)
+                            part = _NUMBER_PREFIX_RE.sub('', part)
                             formatted_parts.append(f"  • {part}")
                     return '\n'.join(formatted_parts)
         
@@ -1077,13 +1223,52 @@ class DatasetOnlyChat:
         # If all else fails, ensure at least proper spacing
         return text
     
+    @_prerendered('final')
+    def _render_final(self, response: str) -> str:
+        """
+        Final formatting step of chat(). Always apply _bullets_to_numbered so
+        no bullets (•) or dashes (-) remain — only numbered lists.
+        
+        Skip _format_response if the text is already well-structured:
+          - has bullets (•), dashes (- ), or numbered items (\n  1.)
+          - has category headers followed by numbered items (Luxury:\n  1.)
+        """
+        if self._is_formatted(response):
+            return self._bullets_to_numbered(response)
+        return self._bullets_to_numbered(self._format_response(response))
+    
+    def _is_formatted(self, response: str) -> bool:
+        """Whether _render_final can skip _format_response (see there)."""
+        return (
+            '\u2022' in response
+            or bool(_DASH_LINE_RE.search(response))
+            or bool(_NUMBERED_LIST_LINE_RE.search(response))
+            or '\n\n' in response  # Already has paragraph structure (from _format_as_paragraphs)
+        )
+    
+    def _render_sections(self, response: str) -> Iterator[str]:
+        """
+        _render_final() one section at a time: each section of the answer is
+        yielded as soon as it is rendered, and '\n\n'.join() of them is
+        _render_final(response). _bullets_to_numbered restarts its numbering
+        at every blank line, so it can run per section; pre-rendered dataset
+        responses are only split.
+        """
+        rendered = self._renderings.get('final', {}).get(response)
+        if rendered is not None:
+            yield from iter_response_sections(rendered)
+            return
+        if not self._is_formatted(response):
+            response = self._format_response(response)
+        for section in iter_response_sections(response):
+            yield self._bullets_to_numbered(section)
+    
     def _format_as_paragraphs(self, text: str) -> str:
         """
         Format text as flowing paragraphs — keeps comma-separated items inline
         instead of splitting each one onto its own line.  Paragraph breaks are
         inserted at sentence boundaries (". " followed by a capital letter).
         """
-        import re
         if not text or not text.strip():
             return text
         text = text.strip()
@@ -1091,7 +1276,7 @@ class DatasetOnlyChat:
         # Split at sentence boundaries: ". " followed by an uppercase letter.
         # This keeps items like "croissants, baguettes, escargot" flowing on
         # one line while separating distinct sentences into paragraphs.
-        paragraphs = re.split(r'\.\s+(?=[A-Z])', text)
+        paragraphs = _SENTENCE_BREAK_RE.split(text)
 
         # Reassemble: each paragraph gets its trailing period back and we
         # separate paragraphs with a blank line.
@@ -1108,17 +1293,16 @@ class DatasetOnlyChat:
 
         return '\n\n'.join(cleaned)
     
+    @_prerendered('food')
     def _format_food_response(self, response: str) -> str:
         """Format food response for better readability with consistent indexing."""
         text = response.strip()
         
         # PRIORITY: Handle category-based structure like "{City} restaurants: Fine dining - items, items. Cafes - items, items. Markets - items, items."
-        import re
         
         # Pattern: "{City} restaurants: Fine dining - items, items. Cafes - items, items. Markets - items, items."
         # Or: "Fine dining - items, items. Cafes - items, items."
-        category_pattern = r'([A-Za-z\s]+)\s+restaurants?:\s*(.+?)(?:\.\s*|$)'
-        match = re.match(category_pattern, text, re.IGNORECASE)
+        match = _RESTAURANTS_HEADER_RE.match(text)
         
         if match:
             # Extract the rest after "{City} restaurants:"
@@ -1128,7 +1312,7 @@ class DatasetOnlyChat:
         
         # Split by periods to get each category section
         # Pattern: "Fine dining - items, items. Cafes - items, items. Markets - items, items."
-        sections = re.split(r'\.\s+(?=[A-Z])', rest_text)
+        sections = _SENTENCE_BREAK_RE.split(rest_text)
         
         # Check if we have category-like sections (containing " - " pattern)
         has_category_sections = False
@@ -1199,12 +1383,12 @@ class DatasetOnlyChat:
             # Replace • separators with commas, then format as paragraphs
             cleaned = text.replace(' • ', ', ').replace('• ', ', ').replace(' •', ',').replace('•', ',')
             # Clean up double commas or leading commas
-            cleaned = re.sub(r',\s*,', ',', cleaned)
-            cleaned = re.sub(r'^\s*,\s*', '', cleaned)
+            cleaned = _DOUBLE_COMMA_RE.sub(',', cleaned)
+            cleaned = _LEADING_COMMA_RE.sub('', cleaned)
             return self._format_as_paragraphs(cleaned)
         
         # Check if response already has numbered list - ensure consistency
-        if re.search(r'^\d+\.', text, re.MULTILINE):
+        if _NUMBERED_LINE_RE.search(text):
             # Response already has numbers, convert all to bullets
             lines = text.split('\n')
             formatted_lines = []
@@ -1216,9 +1400,9 @@ class DatasetOnlyChat:
                     continue
                 
                 # If line starts with a number, convert to bullet
-                if re.match(r'^\d+\.', line):
+                if _NUMBERED_LINE_RE.match(line):
                     # Extract content after number
-                    content = re.sub(r'^\d+\.\s*', '', line)
+                    content = _NUMBER_PREFIX_RE.sub('', line)
                     formatted_lines.append(f"  • {content}")
                 # If line starts with bullet, keep as is (ensure proper indentation)
                 elif line.startswith(('•', '-')):
@@ -1248,38 +1432,25 @@ class DatasetOnlyChat:
         Returns:
             Enhanced query string
         """
-        if not conversation_history or len(conversation_history) < 2:
-            return current_query
-        
-        # Extract all messages in order
-        messages = conversation_history[-6:]  # Check last 6 messages for better context
-        
-        # Find the most recent assistant message asking for clarification
-        last_assistant_msg = None
-        last_user_msg = None
-        previous_user_msgs = []
+        return self.apply_context(current_query, ConversationState.from_history(conversation_history))
+    
+    def apply_context(self, current_query: str, context: ConversationState) -> str:
+        """
+        Enhance current query with a conversation's resolved context (see
+        conversation_context.py) if it's a follow-up.
         
-        for msg in reversed(messages):
-            role = msg.get("role", "")
-            content = msg.get("content", "").lower()
-            
-            if role == "assistant" and not last_assistant_msg:
-                last_assistant_msg = content
-            elif role == "user":
-                if not last_user_msg:
-                    last_user_msg = content
-                else:
-                    previous_user_msgs.append(content)
+        Args:
+            current_query: Current user query
+            context: Location / topic / clarification state of the conversation so far
         
-        if not last_assistant_msg:
+        Returns:
+            Enhanced query string
+        """
+        if not context.has_reply:
             return current_query
         
-        # Check if last assistant message was asking for clarification
-        is_clarifying = any(phrase in last_assistant_msg for phrase in [
-            "could you tell me", "which city", "which country", "what type",
-            "could you provide", "please tell me", "tell me which",
-            "what type of accommodation", "which area"
-        ])
+        # Was the last assistant message asking for clarification?
+        is_clarifying = context.awaiting_clarification
         
         # Check if current query is very short (likely a follow-up answer)
         # OR contains food/accommodation type keywords (even if longer)
@@ -1298,76 +1469,11 @@ class DatasetOnlyChat:
             has_multiple_parts
         )
         
-        # Extract context from conversation: topic, location, and any modifiers
-        detected_topic = None
-        detected_location = None
+        # Context from the conversation (topic, location) plus any modifier in this query
+        detected_topic = context.topic
+        detected_location = context.location
         detected_modifier = None  # e.g., "luxury", "budget", "best"
         
-        # Check all previous user messages for context
-        all_user_msgs = [last_user_msg] + previous_user_msgs if last_user_msg else previous_user_msgs
-        
-        topic_keywords = {
-            'hotel': ['hotel', 'accommodation', 'stay', 'lodging', 'where to stay', 'hotels'],
-            'food': ['food', 'restaurant', 'eat', 'dining', 'cuisine', 'where to eat'],
-            'attraction': ['attraction', 'things to do', 'what to see', 'places to visit'],
-            'transport': ['transport', 'transportation', 'get around', 'how to get'],
-            'weather': ['weather', 'best time', 'when to visit', 'climate'],
-            # Treat itinerary-style queries as a separate topic so follow-ups keep the context
-            'itinerary': ['itinerary', 'itineraries', 'day by day', '1 day', 'one day', 'schedule', 'trip plan', 'daily plan']
-        }
-        
-        # Extract topic from previous messages
-        for msg in all_user_msgs:
-            for topic, keywords in topic_keywords.items():
-                if any(kw in msg for kw in keywords):
-                    detected_topic = topic
-                    break
-            if detected_topic:
-                break
-        
-        # Extract location from previous messages
-        location_keywords = {
-            'tokyo': ['tokyo'],
-            'kyoto': ['kyoto'],
-            'osaka': ['osaka'],
-            'hokkaido': ['hokkaido'],
-            # Key Japanese cities that often appear in clarifying prompts
-            'sapporo': ['sapporo'],
-            'fukuoka': ['fukuoka'],
-            'hiroshima': ['hiroshima'],
-            'japan': ['japan', 'japanese'],
-            'paris': ['paris'],
-            'london': ['london'],
-            'bangkok': ['bangkok'],
-            'singapore': ['singapore'],
-            'seoul': ['seoul'],
-            'barcelona': ['barcelona'],
-            'rome': ['rome'],
-            'amsterdam': ['amsterdam'],
-            'vienna': ['vienna'],
-            'prague': ['prague'],
-            'budapest': ['budapest'],
-            'istanbul': ['istanbul'],
-            'cairo': ['cairo'],
-            'dubai': ['dubai'],
-            'sydney': ['sydney'],
-            'melbourne': ['melbourne'],
-            'bali': ['bali'],
-            'mumbai': ['mumbai'],
-            'delhi': ['delhi'],
-            'beijing': ['beijing'],
-            # Recognize both Shanghai and Pudong for context
-            'shanghai': ['shanghai', 'pudong']
-        }
-        
-        for msg in all_user_msgs:
-            for location, keywords in location_keywords.items():
-                if any(kw in msg for kw in keywords):
-                    detected_location = location
-                    break
-            if detected_location:
-                break
-        
         # Check if current query is a modifier (luxury, budget, best, etc.)
         modifier_keywords = ['luxury', 'budget', 'cheap', 'expensive', 'affordable', 'best', 'top', 'recommended']
         if any(kw in current_query_lower for kw in modifier_keywords):
@@ -1508,10 +1614,15 @@ class DatasetOnlyChat:
             ]),
             'is_skiing': any(kw in query_lower for kw in [
                 'ski', 'skiing', 'snowboard', 'snowboarding', 'snow', 'winter sport', 'winter sports', 'slope', 'resort'
+            ]),
+            # "tokyo 3 days": a trip length with no topic asks what to fill the days with
+            'is_trip_length': bool(_TRIP_LENGTH_RE.search(query_lower)) and not any(kw in query_lower for kw in [
+                'itinerary', 'plan', 'schedule', 'food', 'eat', 'restaurant', 'hotel', 'stay', 'visa',
+                'currency', 'transport', 'get around', 'budget', 'cost', 'weather'
             ])
         }
     
-    def _select_best_response(self, retrieved_rows: List[Dict], user_query: str, original_retrieved_rows: List[Dict] = None, conversation_history: Optional[List[Dict]] = None) -> str:
+    def _select_best_response(self, retrieved_rows: List[Dict], user_query: str, original_retrieved_rows: List[Dict] = None, conversation_history: Optional[List[Dict]] = None, analysis: Optional[QueryAnalysis] = None) -> str:
         """
         Select or combine the best response(s) from retrieved contexts.
         Enhanced with better intent matching, location filtering, and relevance scoring.
@@ -1520,6 +1631,7 @@ class DatasetOnlyChat:
             retrieved_rows: List of retrieved row dictionaries (after location filtering)
             user_query: User's original query
             original_retrieved_rows: Original retrieved rows before location filtering (for fallback)
+            analysis: Precomputed QueryAnalysis of user_query (computed here if not given)
         
         Returns:
             Combined or selected response string
@@ -1531,11 +1643,13 @@ class DatasetOnlyChat:
         if not retrieved_rows:
             return ""
         
-        query_lower = user_query.lower()
-        intent = self._detect_query_intent(user_query)
+        if analysis is None:
+            analysis = self._analyze_query(user_query)
+        query_lower = analysis.lower
+        intent = analysis.intent
         
         # Extract location from query
-        query_locations = self._extract_location_from_query(user_query)
+        query_locations = analysis.locations
         
         # Filter by location FIRST - if location is specified, only use matching responses
         if query_locations['countries'] or query_locations['cities']:
@@ -1576,22 +1690,12 @@ class DatasetOnlyChat:
                     location_keywords.extend(['osaka'])
             
             # Filter: response must mention query location AND not mention other major locations
-            other_locations = {
-                'japan': ['usa', 'united states', 'america', 'india', 'indian', 'australia', 'australian', 'thailand', 'thai', 'italy', 'italian', 'france', 'french', 'mumbai'],
-                'usa': ['japan', 'japanese', 'india', 'indian', 'australia', 'australian', 'italy', 'italian', 'france', 'french', 'mumbai'],
-                'india': ['japan', 'japanese', 'usa', 'united states', 'america', 'australia', 'australian', 'italy', 'italian', 'france', 'french'],
-                'australia': ['japan', 'japanese', 'usa', 'united states', 'america', 'india', 'indian', 'italy', 'italian', 'france', 'french', 'mumbai'],
-                'italy': ['japan', 'japanese', 'usa', 'united states', 'america', 'india', 'indian', 'australia', 'australian', 'thailand', 'thai', 'mumbai', 'china', 'chinese'],
-                'france': ['japan', 'japanese', 'usa', 'united states', 'america', 'india', 'indian', 'australia', 'australian', 'thailand', 'thai', 'mumbai', 'china', 'chinese'],
-                'spain': ['japan', 'japanese', 'usa', 'united states', 'america', 'india', 'indian', 'australia', 'australian', 'thailand', 'thai', 'mumbai', 'china', 'chinese'],
-                'thailand': ['japan', 'japanese', 'usa', 'united states', 'america', 'india', 'indian', 'australia', 'australian', 'italy', 'italian', 'france', 'french', 'mumbai']
-            }
-            
-            # Determine which locations to exclude
-            exclude_keywords = []
+            # (the other major destination countries, by name, demonym or curated city)
+            gazetteer = get_gazetteer()
+            excluded_countries = set()
             for country in query_locations['countries']:
-                if country.lower() in other_locations:
-                    exclude_keywords.extend(other_locations[country.lower()])
+                if country.lower() in MAJOR_COUNTRIES:
+                    excluded_countries |= MAJOR_COUNTRIES - {country.lower()}
             
             location_filtered = []
             for row in retrieved_rows:
@@ -1611,10 +1715,10 @@ class DatasetOnlyChat:
                 
                 # Check if response mentions excluded locations (other countries)
                 mentions_excluded = False
-                if exclude_keywords:
-                    mentions_excluded = any(
-                        ex_kw in response_text or ex_kw in row_country
-                        for ex_kw in exclude_keywords
+                if excluded_countries:
+                    mentions_excluded = (
+                        row_country in excluded_countries or
+                        bool(gazetteer.countries_mentioned(response_text, include_cities=True) & excluded_countries)
                     )
                 
                 # STRICT: Only include if metadata matches OR (text matches AND doesn't mention excluded)
@@ -1669,11 +1773,12 @@ class DatasetOnlyChat:
                                     if query_city_lower not in row_city:
                                         continue  # Skip if city not mentioned
                                 
-                                # Exclude if starts with another location
-                                response_start = response_text[:150].lower()
-                                other_locations_check = ['mumbai', 'india', 'indian', 'rajasthan', 'kerala', 'stockholm', 'sweden', 'swedish']
-                                other_locations_check = [loc for loc in other_locations_check if loc not in location_keywords]
-                                if any(loc in response_start for loc in other_locations_check):
+                                # Exclude if it leads with a place in another country. Only
+                                # the first place counts: 'Indian' restaurants in Kuala Lumpur
+                                # or Little India in Singapore don't make a row about India
+                                query_city_country = gazetteer.country_of(query_city_lower)
+                                leading_country = gazetteer.first_country(response_text[:150])
+                                if query_city_country and leading_country and leading_country != query_city_country:
                                     continue
                         
                         location_filtered.append(row)
@@ -1685,11 +1790,13 @@ class DatasetOnlyChat:
             # REMOVED: Don't fall back to less strict filtering - if no matches, return empty
             # This ensures we don't return irrelevant responses
         
+        self._lap('location_filter')
+        
         # If no rows left after filtering, check if we had original rows
         # For city queries, if location filtering removed everything, check original rows for city matches
         if not retrieved_rows:
             # Check if this is a city query that might have been over-filtered
-            query_locations_check = self._extract_location_from_query(user_query)
+            query_locations_check = analysis.locations
             if query_locations_check['cities']:
                 query_city_check = query_locations_check['cities'][0].lower()
                 # Try to find entries that mention the city in the original retrieved_rows
@@ -1720,9 +1827,9 @@ class DatasetOnlyChat:
             
             # For specific query types, strongly prioritize matching responses
             # If query asks about attractions, prioritize attraction responses
-            query_lower = user_query.lower()
+            query_lower = analysis.lower
             question_lower = str(row.get('question', '')).lower()
-            if 'attraction' in query_lower or 'attractions' in query_lower or 'see' in query_lower or 'things to do' in query_lower:
+            if 'attraction' in query_lower or 'attractions' in query_lower or 'see' in query_lower or 'things to do' in query_lower or intent.get('is_trip_length'):
                 if 'attraction' in response_lower or 'attractions' in response_lower:
                     score += 0.3  # Strong boost for attraction queries
                 # Penalize non-attraction content
@@ -1730,7 +1837,7 @@ class DatasetOnlyChat:
                     score -= 0.2  # Penalize off-topic content
                 
                 # STRICT: If location is specified, require location match for attraction queries
-                query_locations_attr = self._extract_location_from_query(user_query)
+                query_locations_attr = analysis.locations
                 if query_locations_attr['cities'] or query_locations_attr['countries']:
                     response_lower_attr = response_lower
                     question_lower_attr = question_lower
@@ -1816,7 +1923,7 @@ class DatasetOnlyChat:
         if intent.get('is_skiing'):
             skiing_responses = []
             skiing_keywords = ['ski', 'skiing', 'snowboard', 'snowboarding', 'snow', 'winter sport', 'winter sports', 'slope', 'resort', 'niseko', 'hokkaido', 'hakuba', 'nozawa']
-            question_lower = user_query.lower()
+            question_lower = analysis.lower
             
             for row in sorted_rows[:30]:
                 response_lower = str(row['response']).lower()
@@ -1975,7 +2082,7 @@ class DatasetOnlyChat:
         
         # For itinerary queries, check for budget and requirements
         if is_itinerary:
-            query_lower_itinerary = user_query.lower()
+            query_lower_itinerary = analysis.lower
             
             # Check if budget is mentioned in current query OR conversation history
             budget_keywords = ['budget', 'dollar', 'dollars', '$', 'price', 'cost', 'affordable', 'expensive', 'luxury', 'cheap', 'mid-range']
@@ -2011,12 +2118,11 @@ class DatasetOnlyChat:
             attraction_count = 0
             
             # Check for explicit counts
-            import re
-            meal_matches = re.findall(r'(\d+)\s*(?:time|times|meal|meals|eat|eating)', query_lower_itinerary)
+            meal_matches = _MEAL_COUNT_RE.findall(query_lower_itinerary)
             if meal_matches:
                 meal_count = int(meal_matches[0])
             
-            attraction_matches = re.findall(r'(\d+)\s*(?:attraction|attractions|place|places|see|visit)', query_lower_itinerary)
+            attraction_matches = _ATTRACTION_COUNT_RE.findall(query_lower_itinerary)
             if attraction_matches:
                 attraction_count = int(attraction_matches[0])
             
@@ -2240,7 +2346,7 @@ class DatasetOnlyChat:
                     return row['response']
         
         # For attraction queries, prioritize attraction-specific responses BEFORE food queries
-        query_lower_attr_check = user_query.lower()
+        query_lower_attr_check = analysis.lower
         is_attraction_query = any(kw in query_lower_attr_check for kw in ['attraction', 'attractions', 'sight', 'sights', 'see', 'visit', 'place to visit', 'things to see', 'what to see', 'what to visit', 'looking for attractions'])
         
         if is_attraction_query:
@@ -2302,12 +2408,12 @@ class DatasetOnlyChat:
         
         if intent['is_food']:
             # Check if query is too broad (country-level without specific city/region)
-            query_locations = self._extract_location_from_query(user_query)
+            query_locations = analysis.locations
             # Hokkaido is a region, so if it's mentioned, it's not country-only
-            is_country_only = bool(query_locations['countries'] and not query_locations['cities'] and 'hokkaido' not in user_query.lower())
+            is_country_only = bool(query_locations['countries'] and not query_locations['cities'] and 'hokkaido' not in analysis.lower)
             
             # Check if query specifies food type/dish (expanded list)
-            query_lower_food_check = user_query.lower()
+            query_lower_food_check = analysis.lower
             food_type_keywords = [
                 'ramen', 'sushi', 'pizza', 'burger', 'steak', 'pasta', 'seafood', 'vegan', 'vegetarian',
                 'dessert', 'bbq', 'barbecue', 'noodles', 'dimsum', 'dim sum', 'tapas', 'kebabs', 'kebab',
@@ -2366,7 +2472,7 @@ class DatasetOnlyChat:
             # For food questions, STRICTLY prioritize responses that focus on food
             # Filter out responses with too much generic travel content
             # BUT: For city queries, be more lenient - don't filter out entries that mention the city
-            query_locations_food = self._extract_location_from_query(user_query)
+            query_locations_food = analysis.locations
             is_city_query_food = bool(query_locations_food['cities'])
             
             food_scored = []
@@ -2454,7 +2560,7 @@ class DatasetOnlyChat:
             # Filter: Find responses that mention food (even if they also mention other things)
             # Prioritize ones with more food content
             # For city queries, be more lenient - include responses that mention the city
-            query_locations_precheck = self._extract_location_from_query(user_query)
+            query_locations_precheck = analysis.locations
             if query_locations_precheck['cities']:
                 query_city_precheck = query_locations_precheck['cities'][0].lower()
                 food_responses = []
@@ -2477,7 +2583,7 @@ class DatasetOnlyChat:
             
             if not food_responses:
                 # No food responses found - ask clarifying questions
-                query_locations = self._extract_location_from_query(user_query)
+                query_locations = analysis.locations
                 
                 if query_locations['countries']:
                     country = query_locations['countries'][0]
@@ -2496,7 +2602,7 @@ class DatasetOnlyChat:
             food_responses.sort(key=lambda x: x[0], reverse=True)
             
             # STRICT: For city queries, filter to only responses mentioning the city
-            query_locations = self._extract_location_from_query(user_query)
+            query_locations = analysis.locations
             if query_locations['cities']:
                 query_city = query_locations['cities'][0].lower()
                 city_filtered_food = []
@@ -2651,7 +2757,7 @@ class DatasetOnlyChat:
                     return self._format_food_response(response_text)
                 
                 # Otherwise, ask clarifying questions instead of returning generic content
-                query_locations = self._extract_location_from_query(user_query)
+                query_locations = analysis.locations
                 
                 if query_locations['countries']:
                     country = query_locations['countries'][0]
@@ -2670,47 +2776,9 @@ class DatasetOnlyChat:
             # (e.g., "ramen", "sushi", "pizza"), trim the response to only that food.
             # This prevents returning mixed recommendations (e.g., sushi + ramen)
             # when the user only asked for one.
-            #
-            # Detect specific dish keywords in the query
-            dish_keywords = []
-            query_lower_food = user_query.lower()
-            possible_dishes = [
-                'ramen', 'sushi', 'pizza', 'burger', 'burgers', 'steak', 'pasta',
-                'seafood', 'vegan', 'vegetarian', 'dessert', 'bbq', 'barbecue',
-                'noodles', 'dimsum', 'dim sum', 'tapas', 'kebabs', 'kebab', 'bbq',
-                'coffee', 'brunch', 'breakfast'
-            ]
-            for dish in possible_dishes:
-                if dish in query_lower_food:
-                    dish_keywords.append(dish)
-            
-            if dish_keywords:
-                # Split response into sentences/segments and keep only those
-                # that mention the requested dish keyword(s)
-                segments = []
-                # First split by double newlines (paragraphs)
-                for paragraph in response_text.split("\n\n"):
-                    paragraph = paragraph.strip()
-                    if not paragraph:
-                        continue
-                    # Further split into sentences
-                    sentence_candidates = []
-                    for part in paragraph.replace("! ", ". ").replace("? ", ". ").split(". "):
-                        part = part.strip()
-                        if part:
-                            sentence_candidates.append(part)
-                    for sent in sentence_candidates:
-                        sent_lower = sent.lower()
-                        if any(dish in sent_lower for dish in dish_keywords):
-                            segments.append(sent)
-                
-                # If we found dish-specific segments, use them
-                if segments:
-                    trimmed_response = ". ".join(segments)
-                    # Add a period at the end if missing
-                    if not trimmed_response.endswith((".", "!", "?")):
-                        trimmed_response += "."
-                    return trimmed_response
+            trimmed_response = self._trim_to_dishes(response_text, analysis.lower)
+            if trimmed_response:
+                return trimmed_response
             
             # Response is food-focused, format it for better readability
             return self._format_food_response(response_text)
@@ -2718,7 +2786,7 @@ class DatasetOnlyChat:
         if intent['is_accommodation']:
             # First, check if this is a country-level query (e.g. "hotel in japan")
             # Extract location from user_query, but also check conversation history for location context
-            query_locations_acc = self._extract_location_from_query(user_query)
+            query_locations_acc = analysis.locations
             
             # If no location in current query, check conversation history for location context
             if not query_locations_acc['cities'] and not query_locations_acc['countries']:
@@ -2761,7 +2829,7 @@ class DatasetOnlyChat:
                 city_name = query_locations_acc['cities'][0].lower()
             
             # Check if query specifies accommodation type (luxury, budget, mid-range, etc.)
-            query_lower_acc_check = user_query.lower()
+            query_lower_acc_check = analysis.lower
             modifier_keywords_check = [
                 'luxury',
                 'budget',
@@ -2923,13 +2991,7 @@ class DatasetOnlyChat:
                 
                 # If query specified a modifier (luxury / budget / mid-range), return only that type
                 if has_modifier:
-                    focus = None
-                    if 'luxury' in query_lower_acc_check:
-                        focus = 'luxury'
-                    elif 'budget' in query_lower_acc_check:
-                        focus = 'budget'
-                    elif 'mid-range' in query_lower_acc_check or 'mid range' in query_lower_acc_check:
-                        focus = 'mid-range'
+                    focus = self._accommodation_focus(query_lower_acc_check)
                     
                     # Return the best matching response for the specified type
                     best_row = accommodation_responses[0][1]
@@ -3170,7 +3232,7 @@ class DatasetOnlyChat:
             # If specific location is mentioned, prefer shorter, cleaner responses
             if has_specific_location:
                 # For location-specific queries, filter by query topic
-                query_lower = user_query.lower()
+                query_lower = analysis.lower
                 
                 # If query is about specific topic (attractions, food, etc.), filter responses
                 topic_keywords = {
@@ -3187,6 +3249,8 @@ class DatasetOnlyChat:
                     if any(kw in query_lower for kw in keywords):
                         query_topic = topic
                         break
+                if query_topic is None and intent.get('is_trip_length'):
+                    query_topic = 'attraction'
                 
                 # Filter responses by topic if topic is specified
                 if query_topic:
@@ -3284,6 +3348,9 @@ class DatasetOnlyChat:
         """
         Answer user query using only retrieved dataset contexts.
         
+        Without conversation history the answer depends only on the query
+        and top_k, and is served from / stored in the answer cache.
+        
         Args:
             user_query: User's travel question (may already be enhanced with context)
             top_k: Number of context rows to retrieve (5-8 range)
@@ -3292,71 +3359,133 @@ class DatasetOnlyChat:
         Returns:
             Dictionary with response and metadata
         """
+        draft = self.prepare_chat(user_query, top_k, conversation_history)
+        return {'response': '\n\n'.join(self.answer_sections(draft)), **draft.result}
+    
+    def prepare_chat(self, user_query: str, top_k: int = 15, conversation_history: List[Dict] = None) -> ChatDraft:
+        """
+        chat() up to the final formatting: typo correction, analysis,
+        retrieval and selection (or an answer cache hit). The draft's result
+        is the reply's metadata; answer_sections(draft) renders its text.
+        """
+        top_k = max(5, min(25, top_k))
+        if conversation_history or self.answer_cache is None:
+            return self._prepare(user_query, top_k, conversation_history)
+        cached = self.answer_cache.get(user_query, top_k)
+        self._lap('cache')
+        if cached is not None:
+            return _draft(cached)
+        return replace(self._prepare(user_query, top_k), cache_key=(user_query, top_k))
+    
+    def answer_sections(self, draft: ChatDraft) -> Iterator[str]:
+        """
+        The formatting stage of chat(): yields the sections of the answer's
+        text as they are rendered ('\n\n'.join() of them is chat()'s
+        response), then stores the finished answer in the answer cache if the
+        draft was prepared for it.
+        """
+        if draft.render:
+            sections = []
+            for section in self._render_sections(draft.text):
+                sections.append(section)
+                yield section
+            self._lap('formatting')
+        else:
+            sections = list(iter_response_sections(draft.text))
+            yield from sections
+        if draft.cache_key is not None:
+            self.answer_cache.put(*draft.cache_key, {'response': '\n\n'.join(sections), **draft.result})
+    
+    def timed_chat(self, user_query: str, top_k: int = 15, conversation_history: List[Dict] = None) -> Tuple[Dict, Dict[str, float]]:
+        """
+        chat() plus the seconds spent in each of its stages (cache,
+        typo_correction, analysis, context, question_match, retrieval,
+        location_filter, selection, cleanup, formatting, other and total).
+        Stages a call did not reach are absent.
+        """
+        timer = StageTimer()
+        self._timing.timer = timer
+        try:
+            result = self.chat(user_query, top_k=top_k, conversation_history=conversation_history)
+        finally:
+            self._timing.timer = None
+        return result, timer.finish()
+    
+    def _lap(self, stage: str):
+        """End a chat() stage if this thread is being timed (a no-op otherwise)."""
+        timer = getattr(self._timing, 'timer', None)
+        if timer is not None:
+            timer.lap(stage)
+    
+    def _prepare(self, user_query: str, top_k: int, conversation_history: List[Dict] = None) -> ChatDraft:
+        """Uncached prepare_chat(): correct, analyze, retrieve and select."""
         # Correct typos in user query FIRST
         user_query = self._correct_typos(user_query)
+        self._lap('typo_correction')
         
         # Ensure top_k is in valid range (5-25)
         top_k = max(5, min(25, top_k))
         
+        # Analyze the query once; every later stage reads from this
+        analysis = self._analyze_query(user_query)
+        self._lap('analysis')
+        
         # Check if query is too vague FIRST (before retrieval to save processing)
         # This prevents retrieving irrelevant data for vague queries
-        query_words = user_query.lower().strip().split()
-        vague_queries = ['why', 'what', 'how', 'when', 'where', 'who', 'which', 'yes', 'no', 'ok', 'okay', 'hi', 'hello', 'hey', 'thanks', 'thank you']
-        is_vague = (
-            len(query_words) == 1 and query_words[0] in vague_queries or
-            len(user_query.strip()) < 3 or
-            (len(query_words) <= 2 and all(word in vague_queries for word in query_words))
-        )
-        
         # STRICT: If query is vague, ALWAYS return clarifying question immediately
         # This prevents returning random irrelevant responses
-        if is_vague:
-            return {
+        if analysis.is_vague:
+            return _draft({
                 'response': "Sorry, I didn't quite understand that.\n\nCould you please repeat or rephrase your question with a bit more detail? For example:\n\n  1. Which destination are you asking about?\n  2. Are you interested in food, attractions, hotels, transport, or something else?",
                 'retrieved_context_count': 0,
                 'avg_similarity': 0.0,
                 'needs_clarification': True
-            }
+            })
         
         # Enhance query with conversation context FIRST (adds location from previous messages)
         if conversation_history:
             user_query = self._enhance_with_context(user_query, conversation_history)
-        
-        # Enhance query for better retrieval based on intent
-        intent = self._detect_query_intent(user_query)
-        enhanced_query = user_query
-        
-        # If food query, enhance with food keywords to improve retrieval
-        if intent['is_food']:
-            enhanced_query = f"{user_query} restaurant cuisine dining food eat meal"
-        
-        # If accommodation query, enhance with accommodation keywords
-        if intent['is_accommodation']:
-            enhanced_query = f"{user_query} hotel accommodation where to stay lodging"
-        
-        # If surfing query, enhance with surfing keywords to improve retrieval
-        if intent.get('is_surfing'):
-            enhanced_query = f"{user_query} surfing surf wave waves beach"
-        
-        # If mountain query, enhance with mountain keywords to improve retrieval
-        if intent.get('is_mountain'):
-            enhanced_query = f"{user_query} mountain mount peak summit hiking climb hike"
-        
-        # If skiing query, enhance with skiing keywords to improve retrieval
-        if intent.get('is_skiing'):
-            enhanced_query = f"{user_query} skiing ski snowboard snow winter sport slope resort niseko hokkaido"
-        
-        # Retrieve relevant context using TF-IDF
-        retrieved_rows = self.retriever.retrieve(enhanced_query, top_k=top_k)
+            if user_query != analysis.text:
+                analysis = self._analyze_query(user_query)
+            self._lap('context')
+        
+        # Close paraphrases of a dataset question are answered directly,
+        # skipping retrieval and response selection
+        match = self._match_question(analysis)
+        self._lap('question_match')
+        if match is not None:
+            response = self._render_match(match.response, analysis)
+            return _draft({
+                'response': response,
+                'retrieved_context_count': 1,
+                'avg_similarity': match.score,
+                'max_similarity': match.score,
+                'min_similarity': match.score,
+                'retrieved_rows': [self.retriever.row_dict(match.row, match.score)],
+                'matched_question': match.question,
+                'needs_clarification': False
+            }, render=True)
+        
+        # Retrieve relevant context using TF-IDF, with the boost vector of
+        # every detected intent (food, accommodation, surfing, ...) added to
+        # the query vector
+        intent = analysis.intent
+        boosts = [name for name in INTENT_BOOST_KEYWORDS if intent.get(name)]
+        retrieval_query = user_query
+        if intent.get('is_trip_length'):
+            # "3 days" would match visa rows ("90 days"): search for the sights instead
+            retrieval_query = _TRIP_LENGTH_RE.sub(' attractions ', user_query)
+        retrieved_rows = (self.batcher or self.retriever).retrieve(retrieval_query, top_k=top_k, boosts=boosts)
+        self._lap('retrieval')
         
         # Check if we have sufficient context
         if not retrieved_rows:
-            return {
+            return _draft({
                 'response': "I couldn't find relevant information in my knowledge base. Could you try rephrasing your question or provide more details about what you're looking for?",
                 'retrieved_context_count': 0,
                 'needs_clarification': True,
                 'avg_similarity': 0.0
-            }
+            })
         
         # Calculate similarity metrics
         avg_similarity = sum(row['similarity_score'] for row in retrieved_rows) / len(retrieved_rows)
@@ -3365,29 +3494,21 @@ class DatasetOnlyChat:
         
         # Check if query is too vague (single word, very short, or common words)
         # This check MUST happen BEFORE response selection to prevent random answers
-        query_words = user_query.lower().strip().split()
-        vague_queries = ['why', 'what', 'how', 'when', 'where', 'who', 'which', 'yes', 'no', 'ok', 'okay', 'hi', 'hello', 'hey', 'thanks', 'thank you']
-        is_vague = (
-            len(query_words) == 1 and query_words[0] in vague_queries or
-            len(user_query.strip()) < 3 or
-            (len(query_words) <= 2 and all(word in vague_queries for word in query_words))
-        )
-        
+        # (the context-enhanced query can still be vague)
         # STRICT: If query is vague, ALWAYS return clarifying question regardless of similarity
         # This prevents returning random irrelevant responses
-        if is_vague:
-            return {
+        if analysis.is_vague:
+            return _draft({
                 'response': "Sorry, I didn't quite understand that.\n\nCould you please repeat or rephrase your question with a bit more detail? For example:\n\n  1. Which destination are you asking about?\n  2. Are you interested in food, attractions, hotels, transport, or something else?",
                 'retrieved_context_count': len(retrieved_rows),
                 'avg_similarity': avg_similarity,
                 'needs_clarification': True
-            }
+            })
         
         # If similarity scores are very low, return sorry message
         if avg_similarity < 0.08 or max_similarity < 0.15:
             # Ask clarifying questions based on query intent
-            intent = self._detect_query_intent(user_query)
-            query_locations = self._extract_location_from_query(user_query)
+            query_locations = analysis.locations
             
             clarification = "Sorry, I didn't quite understand that from my current data. "
             
@@ -3434,50 +3555,48 @@ class DatasetOnlyChat:
             
             # Only return clarification if it was set (i.e., for country-level or no location queries)
             if clarification:
-                return {
+                return _draft({
                     'response': clarification,
                     'retrieved_context_count': len(retrieved_rows),
                     'avg_similarity': avg_similarity,
                     'needs_clarification': True
-                }
+                })
             # If clarification was skipped (city-level query), continue to return data directly
             # Don't return here - let the code continue to select and return the best response
         
         # Extract location from query to determine if we should check conflicts
-        query_locations = self._extract_location_from_query(user_query)
-        has_specific_location = bool(query_locations['countries'] or query_locations['cities'])
+        query_locations = analysis.locations
+        has_specific_location = analysis.has_location
         
         # Additional validation: Check if similarity is still too low after filtering
         # If max similarity is very low, the retrieved content is likely not relevant
-        # Also check if query is vague (should have been caught earlier, but double-check)
-        query_words_check = user_query.lower().strip().split()
-        vague_check = len(query_words_check) == 1 and query_words_check[0] in ['why', 'what', 'how', 'when', 'where', 'who', 'which', 'yes', 'no', 'ok', 'okay', 'hi', 'hello', 'hey']
-        
-        if vague_check or max_similarity < 0.12:
-            return {
+        # (vague queries were already answered above)
+        if max_similarity < 0.12:
+            return _draft({
                 'response': "I'm sorry, but I couldn't find relevant information for your question in my knowledge base. Could you please provide more details? For example:\n\n  1. Which destination are you interested in?\n  2. What specific information are you looking for?\n  3. What would you like to know about travel?",
                 'retrieved_context_count': len(retrieved_rows),
                 'avg_similarity': avg_similarity,
                 'needs_clarification': True
-            }
+            })
         
         # Select best response from retrieved contexts
         # Store original retrieved_rows before any filtering for fallback
         original_retrieved_rows = retrieved_rows.copy() if retrieved_rows else []
         
         # Select best response from retrieved contexts
-        response = self._select_best_response(retrieved_rows, user_query, original_retrieved_rows, conversation_history)
+        response = self._select_best_response(retrieved_rows, user_query, original_retrieved_rows, conversation_history, analysis=analysis)
+        self._lap('selection')
         
         # Don't format yet — post-processing below may modify the response.
         # Formatting happens once at the very end of this method.
         
         if not response:
-            return {
+            return _draft({
                 'response': "I'm sorry, but I couldn't find relevant information for your question in my knowledge base. Could you please provide more details? For example:\n\n  1. Which destination are you interested in?\n  2. What specific information are you looking for?\n  3. What would you like to know about travel?",
                 'retrieved_context_count': len(retrieved_rows),
                 'avg_similarity': avg_similarity,
                 'needs_clarification': True
-            }
+            })
         
         # Final validation: Check if response is actually relevant to query
         # For very low similarity, ensure response mentions common travel terms
@@ -3489,16 +3608,16 @@ class DatasetOnlyChat:
             
             # If response doesn't seem travel-related and similarity is low, return sorry
             if not has_travel_content and max_similarity < 0.15:
-                return {
+                return _draft({
                     'response': "I'm sorry, but I couldn't find relevant information for your question in my knowledge base. Could you please provide more details? For example:\n\n  1. Which destination are you interested in?\n  2. What specific information are you looking for?\n  3. What would you like to know about travel?",
                     'retrieved_context_count': len(retrieved_rows),
                     'avg_similarity': avg_similarity,
                     'needs_clarification': True
-                }
+                })
         
         # Clean up response: remove duplicate content and filter by topic
         # If query is about specific topic (attractions, food, etc.), extract only relevant parts
-        query_lower = user_query.lower()
+        query_lower = analysis.lower
         
         # STRICT: For topic-specific queries, extract only the relevant section
         # Check if response is too long and contains multiple topics
@@ -3742,27 +3861,11 @@ class DatasetOnlyChat:
         
         if conflict_note:
             response = f"{conflict_note}\n\n{response}"
+        self._lap('cleanup')
         
-        # Format the response with proper indexing and numbered lists.
-        # Always apply _bullets_to_numbered as the final step to ensure
-        # no bullets (•) or dashes (-) remain — only numbered lists.
-        #
-        # Skip _format_response if the text is already well-structured:
-        #   - has bullets (•), dashes (- ), or numbered items (\n  1.)
-        #   - has category headers followed by numbered items (Luxury:\n  1.)
-        import re as _re
-        _already_formatted = (
-            '\u2022' in response
-            or bool(_re.search(r'^\s*-\s', response, _re.MULTILINE))
-            or bool(_re.search(r'^\s*\d+\.\s', response, _re.MULTILINE))
-            or '\n\n' in response  # Already has paragraph structure (from _format_as_paragraphs)
-        )
-        if _already_formatted:
-            response = self._bullets_to_numbered(response)
-        else:
-            response = self._bullets_to_numbered(self._format_response(response))
-        
-        return {
+        # Formatting with proper indexing and numbered lists is left to
+        # answer_sections, so the reply's metadata is ready before its text
+        return _draft({
             'response': response,
             'retrieved_context_count': len(retrieved_rows),
             'avg_similarity': avg_similarity,
@@ -3770,26 +3873,28 @@ class DatasetOnlyChat:
             'min_similarity': min_similarity,
             'retrieved_rows': retrieved_rows,
             'needs_clarification': False
-        }
+        }, render=True)
 
 
 # Global instance
 _rai_service = None
 
 
-def get_rai_service(csv_path: Optional[str] = None) -> DatasetOnlyChat:
+def get_rai_service(csv_path: Optional[str] = None, corpus=None, pack=None) -> DatasetOnlyChat:
     """
     Get or create the dataset-only chat service instance.
     
     Args:
         csv_path: Optional path to CSV file
+        corpus: Optional already-parsed dataset, only used on first creation
+        pack: Optional KnowledgePack, only used on first creation
     
     Returns:
         DatasetOnlyChat instance
     """
     global _rai_service
     if _rai_service is None:
-        _rai_service = DatasetOnlyChat(csv_path=csv_path)
+        _rai_service = DatasetOnlyChat(csv_path=csv_path, corpus=corpus, pack=pack)
     return _rai_service
 
 
@@ -0,0 +1,118 @@
+"""
+TripMate Retrieval Micro-Batcher
+Scores concurrent retrieval requests together: while one batch is being
+scored, requests from other threads queue up, and the next batch takes all
+of them with a single vectorizer pass and sparse matrix product
+(TravelRetriever.retrieve_many). A request that arrives while the batcher
+is idle is scored straight away, so latency without concurrency is the same
+as calling the retriever directly. Under load, the next batch also waits a
+short window for stragglers.
+
+    RETRIEVAL_BATCHING=1              # enable (default off)
+    RETRIEVAL_BATCH_WINDOW_MS=2       # wait before a batch while under load
+    RETRIEVAL_BATCH_MAX=32            # largest batch scored at once
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+
+class _Request:
+    __slots__ = ('query', 'top_k', 'boosts', 'result', 'error', 'lead', 'done')
+
+    def __init__(self, query: str, top_k: int, boosts: Iterable[str]):
+        self.query = query
+        self.top_k = top_k
+        self.boosts = tuple(boosts)
+        self.result = None
+        self.error = None
+        # Set when this request's thread is handed the job of scoring the next batch
+        self.lead = False
+        self.done = threading.Event()
+
+
+class RetrievalBatcher:
+    """
+    Leader/follower batcher in front of a TravelRetriever.
+
+    There is no background thread: the thread whose request finds the
+    batcher idle scores the batch; when it is done it hands the queue over
+    to the oldest waiting request's thread, which scores the next batch.
+    """
+
+    def __init__(self, retriever, window_ms: float = 2.0, max_batch: int = 32):
+        self.retriever = retriever
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.batches = 0
+        self.batched_requests = 0
+        self._lock = threading.Lock()
+        self._pending: List[_Request] = []
+        self._busy = False
+
+    def retrieve(self, query: str, top_k: int = 6, boosts: Iterable[str] = ()) -> List[Dict]:
+        """Same contract as TravelRetriever.retrieve."""
+        request = _Request(query, top_k, boosts)
+        with self._lock:
+            self._pending.append(request)
+            request.lead = not self._busy
+            self._busy = True
+        if not request.lead:
+            request.done.wait()
+        if request.lead:
+            self._run_batch()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _run_batch(self):
+        """Score the queued requests (the caller's own included), then hand over."""
+        with self._lock:
+            under_load = len(self._pending) > 1
+        if under_load and self.window:
+            time.sleep(self.window)
+        with self._lock:
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+        try:
+            results = self.retriever.retrieve_many(
+                [r.query for r in batch], [r.top_k for r in batch], [r.boosts for r in batch]
+            )
+            for request, result in zip(batch, results):
+                request.result = result
+        except Exception as e:
+            for request in batch:
+                request.error = e
+        with self._lock:
+            self.batches += 1
+            self.batched_requests += len(batch)
+            if self._pending:
+                successor = self._pending[0]
+                successor.lead = True
+            else:
+                successor = None
+                self._busy = False
+        for request in batch:
+            request.done.set()
+        if successor is not None:
+            successor.done.set()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'batches': self.batches,
+            'requests': self.batched_requests,
+            'avg_batch_size': self.batched_requests / self.batches if self.batches else 0.0,
+        }
+
+
+def create_retrieval_batcher(retriever) -> Optional[RetrievalBatcher]:
+    """Batcher configured from the environment, or None if batching is off."""
+    if os.getenv("RETRIEVAL_BATCHING", "0").lower() not in ("1", "true", "yes"):
+        return None
+    return RetrievalBatcher(
+        retriever,
+        window_ms=float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "2")),
+        max_batch=int(os.getenv("RETRIEVAL_BATCH_MAX", "32"))
+    )
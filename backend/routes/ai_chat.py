@@ -4,19 +4,26 @@ Uses TF-IDF retrieval to answer questions directly from the dataset.
 No LLM/API calls - pure dataset retrieval.
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+import json
 import os
 import sys
 from routes.auth import verify_token
 
 ai_bp = Blueprint("ai_bp", __name__)
 
+# AI questions per trip on the free plan
+FREE_CHAT_LIMIT = 5
+
 # Import the dataset-only chat service
 try:
     backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     if backend_dir not in sys.path:
         sys.path.insert(0, backend_dir)
-    from retrieval_augmented_ai import get_rai_service
+    from chat_engines import get_engine
+    from gazetteer import get_gazetteer
+    from conversation_context import ConversationState, conversation_key, get_context_store
+    from chat_pool import ChatPoolBusy, get_chat_admission, get_chat_pool
     RAI_SERVICE_AVAILABLE = True
     print("Dataset-only chat service imported successfully")
 except Exception as e:
@@ -26,6 +33,26 @@ except Exception as e:
     RAI_SERVICE_AVAILABLE = False
 
 
+def _refund_question(trip_id, user_id):
+    """Give back a free-plan question that was counted but not answered."""
+    from db import get_db_connection
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """UPDATE ai_chat_usage SET question_count = question_count - 1 
+                   WHERE trip_id = %s AND user_id = %s AND question_count > 0""",
+                (trip_id, user_id)
+            )
+            conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+    except Exception as e:
+        print(f"Error refunding AI chat question: {e}")
+
+
 @ai_bp.route("/chat/usage", methods=["GET"])
 def get_chat_usage():
     """
@@ -75,7 +102,7 @@ def get_chat_usage():
         
         return jsonify({
             "questions_used": question_count,
-            "limit": 5,
+            "limit": FREE_CHAT_LIMIT,
             "is_premium": False
         }), 200
     except Exception as e:
@@ -85,20 +112,21 @@ def get_chat_usage():
         cur.close()
         conn.close()
 
-@ai_bp.route("/chat", methods=["POST"])
-def chat():
+def _parse_chat_request():
     """
-    Handle AI chat requests using dataset-only retrieval.
-    Uses TF-IDF to retrieve relevant context and answers directly from dataset.
+    Authenticate a chat request and read its JSON body.
+    
+    Returns:
+        (payload, data, trip_id, None), or (None, None, None, error response)
     """
     # Check authentication
     token = request.headers.get("Authorization", "").replace("Bearer ", "")
     if not token:
-        return jsonify({"error": "Unauthorized"}), 401
+        return None, None, None, (jsonify({"error": "Unauthorized"}), 401)
     
     payload = verify_token(token)
     if not payload:
-        return jsonify({"error": "Invalid token"}), 401
+        return None, None, None, (jsonify({"error": "Invalid token"}), 401)
     
     data = request.get_json()
     trip_id = data.get("trip_id")
@@ -107,227 +135,221 @@ def chat():
         try:
             trip_id = int(trip_id)
         except (ValueError, TypeError):
-            return jsonify({"error": "Invalid trip ID format"}), 400
-    message = data.get("message", "")
-    conversation_history = data.get("conversation_history", [])  # Last few messages for context
+            return None, None, None, (jsonify({"error": "Invalid trip ID format"}), 400)
     
-    if not message:
-        return jsonify({"error": "Message is required"}), 400
+    if not data.get("message", ""):
+        return None, None, None, (jsonify({"error": "Message is required"}), 400)
     
-    # Check AI chat limit for free users (5 questions per trip)
-    questions_used = 0
-    if not payload.get("is_premium"):
-        if not trip_id:
-            return jsonify({"error": "Trip ID is required for free plan users"}), 400
-        
-        from db import get_db_connection
+    return payload, data, trip_id, None
+
+
+def _limit_reached_response(questions_used):
+    return jsonify({
+        "error": "AI chat limit reached",
+        "message": f"Free plan allows {FREE_CHAT_LIMIT} AI questions per trip. Upgrade to Premium for unlimited questions.",
+        "questions_used": questions_used,
+        "limit": FREE_CHAT_LIMIT
+    }), 403
+
+
+def _count_free_question(payload, trip_id):
+    """
+    Check the AI chat limit for a free user (FREE_CHAT_LIMIT questions per
+    trip) and count this question.
+    
+    The check, the increment and creating the row for a user's first
+    question on a trip are one conditional upsert, which also hands back the
+    new count (LAST_INSERT_ID), so concurrent requests can never push the
+    count past the limit. The count is always read from the database, so
+    refunds and resets from any process apply at once.
+    
+    Returns:
+        (questions_used, None) to go ahead, or (None, error response)
+    """
+    if not trip_id:
+        return None, (jsonify({"error": "Trip ID is required for free plan users"}), 400)
+    
+    from db import get_db_connection
+    from mysql.connector import IntegrityError
+    conn = None
+    cur = None
+    try:
         conn = get_db_connection()
         cur = conn.cursor()
-        
+        cur.execute(
+            """INSERT INTO ai_chat_usage (trip_id, user_id, question_count)
+               VALUES (%s, %s, 1)
+               ON DUPLICATE KEY UPDATE question_count =
+                   IF(question_count < %s, LAST_INSERT_ID(question_count + 1), question_count)""",
+            (trip_id, payload["user_id"], FREE_CHAT_LIMIT)
+        )
+        # Affected rows: 1 the row was created, 2 it was incremented, 0 it
+        # is at the limit (unchanged; connections don't set CLIENT_FOUND_ROWS,
+        # which would count it as 1)
+        if cur.rowcount == 1:
+            questions_used = 1
+        elif cur.rowcount == 2:
+            questions_used = int(cur.lastrowid)
+        else:
+            questions_used = None
+        conn.commit()
+    except IntegrityError as e:
+        # The trip or user doesn't exist (foreign key)
+        print(f"Error tracking AI chat usage: {e}")
+        return None, (jsonify({"error": "Trip not found"}), 404)
+    except Exception as e:
+        import traceback
+        print(f"Error tracking AI chat usage: {e}")
+        print(traceback.format_exc())
+        # Don't block the user on an accounting failure
+        return 0, None
+    finally:
         try:
-            # Get or create AI chat usage record for this trip
-            cur.execute(
-                """SELECT question_count FROM ai_chat_usage 
-                   WHERE trip_id = %s AND user_id = %s""",
-                (trip_id, payload["user_id"])
-            )
-            usage = cur.fetchone()
-            
-            if usage:
-                question_count = usage[0]
-                # CRITICAL: Check BEFORE incrementing - if already at or above limit, block immediately
-                if question_count >= 5:
-                    cur.close()
-                    conn.close()
-                    return jsonify({
-                        "error": "AI chat limit reached",
-                        "message": "Free plan allows 5 AI questions per trip. Upgrade to Premium for unlimited questions.",
-                        "questions_used": question_count,
-                        "limit": 5
-                    }), 403
-            else:
-                # Create new usage record (handle duplicate key error if race condition occurs)
-                try:
-                    cur.execute(
-                        """INSERT INTO ai_chat_usage (trip_id, user_id, question_count) 
-                           VALUES (%s, %s, 0)""",
-                        (trip_id, payload["user_id"])
-                    )
-                    conn.commit()
-                    question_count = 0
-                except Exception as insert_error:
-                    # If INSERT fails (e.g., duplicate key), try SELECT again
-                    conn.rollback()
-                    cur.execute(
-                        """SELECT question_count FROM ai_chat_usage 
-                           WHERE trip_id = %s AND user_id = %s""",
-                        (trip_id, payload["user_id"])
-                    )
-                    usage_retry = cur.fetchone()
-                    if usage_retry:
-                        question_count = usage_retry[0]
-                        if question_count >= 5:
-                            cur.close()
-                            conn.close()
-                            return jsonify({
-                                "error": "AI chat limit reached",
-                                "message": "Free plan allows 5 AI questions per trip. Upgrade to Premium for unlimited questions.",
-                                "questions_used": question_count,
-                                "limit": 5
-                            }), 403
-                    else:
-                        question_count = 0
-            
-            # CRITICAL: Double-check limit before incrementing (safety check)
-            # This prevents any edge cases where count might have changed
-            if question_count >= 5:
+            if cur:
                 cur.close()
+            if conn:
                 conn.close()
-                return jsonify({
-                    "error": "AI chat limit reached",
-                    "message": "Free plan allows 5 AI questions per trip. Upgrade to Premium for unlimited questions.",
-                    "questions_used": question_count,
-                    "limit": 5
-                }), 403
-            
-            # Only increment if we're proceeding with the request (count < 5)
-            # Increment question count BEFORE processing to prevent race conditions
-            cur.execute(
-                """UPDATE ai_chat_usage SET question_count = question_count + 1 
-                   WHERE trip_id = %s AND user_id = %s AND question_count < 5""",
-                (trip_id, payload["user_id"])
-            )
-            conn.commit()
-            
-            # Verify the increment was successful and didn't exceed limit
-            cur.execute(
-                """SELECT question_count FROM ai_chat_usage 
-                   WHERE trip_id = %s AND user_id = %s""",
-                (trip_id, payload["user_id"])
-            )
-            updated_usage = cur.fetchone()
-            if updated_usage:
-                questions_used = int(updated_usage[0]) if updated_usage[0] is not None else 0
-                # Final safety check - if somehow we exceeded 5, block the request
-                if questions_used > 5:
-                    # Rollback by decrementing (shouldn't happen, but safety measure)
-                    cur.execute(
-                        """UPDATE ai_chat_usage SET question_count = 5 
-                           WHERE trip_id = %s AND user_id = %s""",
-                        (trip_id, payload["user_id"])
-                    )
-                    conn.commit()
-                    cur.close()
-                    conn.close()
-                    return jsonify({
-                        "error": "AI chat limit reached",
-                        "message": "Free plan allows 5 AI questions per trip. Upgrade to Premium for unlimited questions.",
-                        "questions_used": 5,
-                        "limit": 5
-                    }), 403
-                print(f"DEBUG: Updated questions_used = {questions_used} (type: {type(questions_used)})")
-            else:
-                questions_used = int(question_count) + 1 if question_count is not None else 1  # Fallback to calculated value
-                print(f"DEBUG: Fallback questions_used = {questions_used}")
-                
-        except Exception as e:
-            import traceback
-            print(f"Error tracking AI chat usage: {e}")
-            print(traceback.format_exc())
-            # Try to get the current count even if there was an error
-            try:
-                conn.rollback()
-                # Try to fetch current count as fallback
-                cur.execute(
-                    """SELECT question_count FROM ai_chat_usage 
-                       WHERE trip_id = %s AND user_id = %s""",
-                    (trip_id, payload["user_id"])
-                )
-                fallback_usage = cur.fetchone()
-                if fallback_usage:
-                    questions_used = int(fallback_usage[0]) if fallback_usage[0] is not None else 0
-                else:
-                    questions_used = 0
-            except:
-                # If we can't even fetch, default to 0 but log it
-                questions_used = 0
-                print("WARNING: Could not fetch question count after error")
-        finally:
-            try:
-                if cur:
-                    cur.close()
-                if conn:
-                    conn.close()
-            except:
-                pass
+        except Exception:
+            pass
+    
+    if questions_used is None:
+        return None, _limit_reached_response(FREE_CHAT_LIMIT)
+    return questions_used, None
+
+
+def _prepare_chat(payload, data, trip_id):
+    """
+    Prepare the answer to a chat message with the dataset-only engine: adds
+    trip locations and conversation context to the query and runs it up to
+    the final formatting (DatasetOnlyChat.prepare_chat).
+    Raises ChatPoolBusy when chat is saturated (the worker pool, or the
+    in-process admission limit without one).
+    
+    Returns:
+        (engine, draft, remember): engine.answer_sections(draft) yields the
+        answer's sections; remember(response) records the finished turn
+    """
+    rai_service = get_engine('dataset')
+    message = data.get("message", "")
+    # Follow-up context is kept server-side per (user, conversation); a
+    # client-sent history (older clients) is still honoured
+    conversation_history = data.get("conversation_history", [])
+    
+    # Get locations from request for context (optional)
+    locations = data.get("locations", [])
+    all_location_names = [loc.get("name", "") for loc in locations if loc.get("name")]
+    
+    # Enhance query with location context if available
+    user_query = message.strip()
+    
+    # IMPORTANT: Only add trip locations if query doesn't explicitly mention a location
+    # This prevents overriding user's explicit location choice (e.g., "buenos aires" should not be overridden by "japan")
+    if all_location_names:
+        # Check if query already mentions a location (any place in the gazetteer)
+        has_explicit_location = get_gazetteer().has_location(user_query)
+        
+        # Only add trip locations if query doesn't explicitly mention a location
+        # This ensures user's explicit location choice takes precedence
+        if not has_explicit_location:
+            # Add location context to help retrieval
+            locations_str = ", ".join(all_location_names)
+            user_query = f"{user_query} {locations_str}"
+    
+    # Enhance query with conversation context if this looks like a follow-up
+    context_store = get_context_store()
+    conversation = conversation_key(data.get("conversation_id"), trip_id)
+    if data.get("reset_context"):
+        context_store.clear(payload["user_id"], conversation)
+    if conversation_history:
+        context = ConversationState.from_history(conversation_history)
+    else:
+        context = context_store.get(payload["user_id"], conversation)
+    enhanced_query = rai_service.apply_context(user_query, context)
+    
+    # Get response using dataset-only retrieval (on the chat worker
+    # pool, so this request thread isn't busy computing it, or on this
+    # thread within the admission limit)
+    chat_pool = get_chat_pool('dataset')
+    if chat_pool is not None:
+        draft = chat_pool.prepare_chat(enhanced_query, top_k=6)
+    else:
+        with get_chat_admission().admit():
+            draft = rai_service.prepare_chat(enhanced_query, top_k=6)
+    
+    def remember(response):
+        # Fold this turn into the conversation's context for the next follow-up
+        context.observe_turn(message, response)
+        context_store.put(payload["user_id"], conversation, context)
+    
+    return rai_service, draft, remember
+
+
+def _answer_chat(payload, data, trip_id):
+    """_prepare_chat() and the formatted answer: the /chat reply and its metadata."""
+    rai_service, draft, remember = _prepare_chat(payload, data, trip_id)
+    response = "\n\n".join(rai_service.answer_sections(draft))
+    remember(response)
+    return {"response": response, **draft.result}
+
+
+def _chat_metadata(result, payload, questions_used):
+    """Everything in a chat reply except the response text."""
+    metadata = {
+        "needs_clarification": result.get("needs_clarification", False),
+        "metadata": {
+            "retrieved_context_count": result.get("retrieved_context_count", 0),
+            "avg_similarity": result.get("avg_similarity", 0.0)
+        }
+    }
+    if not payload.get("is_premium"):
+        # Ensure questions_used is always an integer
+        metadata["questions_used"] = int(questions_used) if questions_used is not None else 0
+        metadata["limit"] = FREE_CHAT_LIMIT
+    return metadata
+
+
+def _busy_response(busy, payload, trip_id):
+    """503 for saturated chat; the free-plan question is given back."""
+    if not payload.get("is_premium"):
+        _refund_question(trip_id, payload["user_id"])
+    return jsonify({
+        "error": "AI chat is busy",
+        "message": "The AI assistant is handling a lot of questions right now. Please try again in a moment.",
+        "retry_after": busy.retry_after
+    }), 503, {"Retry-After": str(busy.retry_after)}
+
+
+@ai_bp.route("/chat", methods=["POST"])
+def chat():
+    """
+    Handle AI chat requests using dataset-only retrieval.
+    Uses TF-IDF to retrieve relevant context and answers directly from dataset.
+    """
+    payload, data, trip_id, error = _parse_chat_request()
+    if error:
+        return error
+    
+    # Check AI chat limit for free users (5 questions per trip)
+    questions_used = 0
+    if not payload.get("is_premium"):
+        questions_used, error = _count_free_question(payload, trip_id)
+        if error:
+            return error
     
     # Use dataset-only chat service
     if RAI_SERVICE_AVAILABLE:
         try:
-            rai_service = get_rai_service()
-            
-            # Get locations from request for context (optional)
-            locations = data.get("locations", [])
-            all_location_names = [loc.get("name", "") for loc in locations if loc.get("name")]
-            
-            # Enhance query with location context if available
-            user_query = message.strip()
-            
-            # IMPORTANT: Only add trip locations if query doesn't explicitly mention a location
-            # This prevents overriding user's explicit location choice (e.g., "buenos aires" should not be overridden by "japan")
-            if all_location_names:
-                # Check if query already mentions a location
-                query_lower = user_query.lower()
-                has_explicit_location = False
-                
-                # Common location keywords to check
-                location_indicators = [
-                    'tokyo', 'kyoto', 'osaka', 'bali', 'bangkok', 'singapore', 'paris', 'london',
-                    'barcelona', 'rome', 'sydney', 'melbourne', 'dubai', 'istanbul', 'cairo',
-                    'buenos aires', 'rio de janeiro', 'lima', 'bogota', 'santiago', 'mexico city',
-                    'new york', 'los angeles', 'chicago', 'san francisco', 'miami', 'seattle',
-                    'japan', 'usa', 'australia', 'thailand', 'india', 'china', 'france', 'italy',
-                    'spain', 'argentina', 'brazil', 'chile', 'peru', 'colombia', 'mexico'
-                ]
-                
-                for indicator in location_indicators:
-                    if indicator in query_lower:
-                        has_explicit_location = True
-                        break
-                
-                # Only add trip locations if query doesn't explicitly mention a location
-                # This ensures user's explicit location choice takes precedence
-                if not has_explicit_location:
-                    # Add location context to help retrieval
-                    locations_str = ", ".join(all_location_names)
-                    user_query = f"{user_query} {locations_str}"
-            
-            # Enhance query with conversation context if this looks like a follow-up
-            enhanced_query = rai_service._enhance_with_context(user_query, conversation_history)
-            
-            # Get response using dataset-only retrieval
-            result = rai_service.chat(enhanced_query, top_k=6)
+            try:
+                result = _answer_chat(payload, data, trip_id)
+            except ChatPoolBusy as busy:
+                return _busy_response(busy, payload, trip_id)
             
             # questions_used is already set above during the increment step
             # Ensure we always return a number for free users (not None)
             response_data = {
                 "response": result.get("response", "I couldn't find a response in my knowledge base. Please try again."),
-                "needs_clarification": result.get("needs_clarification", False),
-                "metadata": {
-                    "retrieved_context_count": result.get("retrieved_context_count", 0),
-                    "avg_similarity": result.get("avg_similarity", 0.0)
-                }
+                **_chat_metadata(result, payload, questions_used)
             }
-            if not payload.get("is_premium"):
-                # Ensure questions_used is always an integer
-                questions_used_value = int(questions_used) if questions_used is not None else 0
-                response_data["questions_used"] = questions_used_value
-                response_data["limit"] = 5
-                print(f"DEBUG: Returning questions_used = {questions_used_value} (type: {type(questions_used_value)})")
-                print(f"DEBUG: Full response_data for free user: {response_data}")
-            else:
-                print(f"DEBUG: Premium user - not including questions_used in response")
-            
             return jsonify(response_data), 200
         
         except Exception as e:
@@ -346,3 +368,74 @@ def chat():
         "response": "The AI chat service is not available. Please ensure the travel dataset is properly configured.",
         "error": "Service unavailable"
     }), 503
+
+
+def _sse(event, data):
+    """One Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@ai_bp.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    Streaming variant of /chat over Server-Sent Events.
+    
+    Events, in order:
+        metadata  - the /chat reply without its text, sent as soon as
+                    retrieval and response selection are done
+        section   - {"index": i, "text": ...} per section of the answer, sent
+                    as the formatting stage renders it (joining the texts
+                    with blank lines gives the /chat response)
+        done      - {}
+    An error after streaming has started is sent as an "error" event.
+    
+    /chat joins the same section generator (DatasetOnlyChat.answer_sections),
+    so the two endpoints give the same answer. Quota, busy and engine errors
+    before the metadata event still get their HTTP status.
+    """
+    payload, data, trip_id, error = _parse_chat_request()
+    if error:
+        return error
+    if not RAI_SERVICE_AVAILABLE:
+        return jsonify({
+            "response": "The AI chat service is not available. Please ensure the travel dataset is properly configured.",
+            "error": "Service unavailable"
+        }), 503
+    
+    questions_used = 0
+    if not payload.get("is_premium"):
+        questions_used, error = _count_free_question(payload, trip_id)
+        if error:
+            return error
+    
+    try:
+        rai_service, draft, remember = _prepare_chat(payload, data, trip_id)
+    except ChatPoolBusy as busy:
+        return _busy_response(busy, payload, trip_id)
+    except Exception as e:
+        print(f"Dataset-only chat service error: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            "response": "I'm having trouble accessing my knowledge base right now. Please try again in a moment.",
+            "error": str(e)
+        }), 500
+    
+    def generate():
+        try:
+            yield _sse("metadata", _chat_metadata(draft.result, payload, questions_used))
+            sections = []
+            for index, text in enumerate(rai_service.answer_sections(draft)):
+                sections.append(text)
+                yield _sse("section", {"index": index, "text": text})
+            remember("\n\n".join(sections))
+            yield _sse("done", {})
+        except Exception as e:
+            print(f"Chat stream error: {e}")
+            yield _sse("error", {"error": str(e)})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
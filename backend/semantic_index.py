@@ -0,0 +1,302 @@
+"""
+TripMate Semantic Index
+LSA (latent semantic analysis) over the retriever's TF-IDF document matrix:
+a truncated SVD projects documents and queries to a few hundred dense
+dimensions, where paraphrases that share few exact terms ("cheap places to
+stay" / "budget accommodation") still land close together. The projected
+document vectors are served from an approximate nearest-neighbour index
+(faiss HNSW or IVF), so a query costs one small projection plus a graph /
+list probe.
+
+TravelRetriever uses it behind rank() / retrieve() when RETRIEVER_SEMANTIC
+is set: 'lsa' ranks by the semantic index alone, 'hybrid' fuses its scores
+with the TF-IDF cosine. The SVD and the ANN index are trained offline and
+saved next to the model files; at startup they are loaded when they still
+match the TF-IDF index, otherwise trained (a few seconds) and saved:
+
+    python semantic_index.py build                   # train and save for the dataset
+    python semantic_index.py sweep                   # ANN recall vs exact search per ef / nprobe
+
+    RETRIEVER_SEMANTIC=off            # 'lsa' or 'hybrid' to enable
+    SEMANTIC_DIMENSIONS=256           # LSA dimensions
+    SEMANTIC_INDEX=hnsw               # 'hnsw', 'ivf' or 'flat' (exact search)
+    SEMANTIC_EF_SEARCH=64             # HNSW: candidates explored per query (recall / latency knob)
+    SEMANTIC_NPROBE=8                 # IVF: lists probed per query (recall / latency knob)
+    SEMANTIC_QUANTIZER=none           # fp16, sq8 or sq4 to store the vectors quantized (see quantization.py)
+    SEMANTIC_HYBRID_WEIGHT=0.3        # share of the LSA score in hybrid mode
+    SEMANTIC_INDEX_PATH=...           # default travel_qa_model/semantic_index
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+from typing import Optional, Tuple
+import faiss
+import numpy as np
+from scipy import sparse
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+from quantization import faiss_index, faiss_quantizer
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INDEX_PATH = os.path.join(BACKEND_DIR, "travel_qa_model", "semantic_index")
+
+SEMANTIC_MODES = ('off', 'lsa', 'hybrid')
+INDEX_KINDS = ('hnsw', 'ivf', 'flat')
+QUANTIZERS = ('none', 'fp16', 'sq8', 'sq4')
+
+# HNSW graph degree and build-time search depth
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+# Rows the ANN index returns per query for hybrid fusion (at least the largest top_k)
+HYBRID_CANDIDATES = 50
+
+MANIFEST = "manifest.json"
+COMPONENTS_FILE = "components.npy"
+INDEX_FILE = "index.faiss"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def semantic_mode(mode: Optional[str] = None) -> str:
+    """'off', 'lsa' or 'hybrid', from mode or RETRIEVER_SEMANTIC (unknown values turn it off)."""
+    mode = (mode or os.getenv("RETRIEVER_SEMANTIC", "off")).strip().lower()
+    if mode not in SEMANTIC_MODES:
+        print(f"Warning: Unknown semantic retrieval mode '{mode}' (known: {', '.join(SEMANTIC_MODES)}); using 'off'")
+        return 'off'
+    return mode
+
+
+def hybrid_weight() -> float:
+    try:
+        return min(1.0, max(0.0, float(os.getenv("SEMANTIC_HYBRID_WEIGHT", "0.3"))))
+    except ValueError:
+        return 0.3
+
+
+def semantic_quantizer(quantizer: Optional[str] = None) -> str:
+    return faiss_quantizer(quantizer, "SEMANTIC_QUANTIZER", QUANTIZERS)
+
+
+def matrix_fingerprint(document_vectors: sparse.csr_matrix, dimensions: int, kind: str, quantizer: str = 'none') -> str:
+    """Identifies the TF-IDF matrix and the settings a semantic index was trained from."""
+    digest = hashlib.sha256(f"{document_vectors.shape}|{dimensions}|{kind}|{quantizer}|{HNSW_M}".encode())
+    for array in (document_vectors.data, document_vectors.indices, document_vectors.indptr):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def _new_index(kind: str, dimensions: int, rows: int, quantizer: str = 'none'):
+    """Empty faiss index over unit vectors (inner product = cosine)."""
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Unknown semantic index '{kind}' (known: {', '.join(INDEX_KINDS)})")
+    index = faiss_index(kind, dimensions, faiss.METRIC_INNER_PRODUCT, quantizer, rows, HNSW_M)
+    if kind == 'hnsw':
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    return index
+
+
+class SemanticIndex:
+    """LSA projection plus an ANN index over the projected, unit-length document vectors."""
+
+    def __init__(self, components: np.ndarray, index, kind: str, fingerprint: str = '', quantizer: str = 'none'):
+        self.components = components  # (dimensions, TF-IDF features) float32
+        # Row per TF-IDF feature, so projecting a sparse query reads contiguous rows
+        self._projection = np.ascontiguousarray(components.T)
+        self.index = index
+        self.kind = kind
+        self.quantizer = quantizer
+        self.fingerprint = fingerprint
+        self.set_search_effort()
+
+    @property
+    def dimensions(self) -> int:
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, document_vectors: sparse.csr_matrix, dimensions: Optional[int] = None,
+            kind: Optional[str] = None, quantizer: Optional[str] = None, seed: int = 0) -> 'SemanticIndex':
+        """Train the SVD on a TF-IDF document matrix and index the projected documents."""
+        dimensions = dimensions or _env_int("SEMANTIC_DIMENSIONS", 256)
+        kind = (kind or os.getenv("SEMANTIC_INDEX", "hnsw")).lower()
+        quantizer = semantic_quantizer(quantizer)
+        fingerprint = matrix_fingerprint(document_vectors, dimensions, kind, quantizer)
+        components = min(dimensions, min(document_vectors.shape) - 1)
+
+        print(f"Training LSA ({components} dimensions) over {document_vectors.shape[0]} documents...")
+        svd = TruncatedSVD(components, algorithm='randomized', n_iter=5, random_state=seed)
+        documents = normalize(svd.fit_transform(document_vectors)).astype(np.float32)
+        print(f"LSA explains {svd.explained_variance_ratio_.sum():.1%} of the TF-IDF variance")
+
+        index = _new_index(kind, components, len(documents), quantizer)
+        if not index.is_trained:
+            index.train(documents)
+        index.add(documents)
+        stored = f", {quantizer} vectors" if quantizer != 'none' else ""
+        print(f"Semantic index ({kind}{stored}) built over {index.ntotal} documents")
+        return cls(svd.components_.astype(np.float32), index, kind, fingerprint, quantizer)
+
+    def set_search_effort(self, ef_search: Optional[int] = None, nprobe: Optional[int] = None):
+        """Recall / latency knob: HNSW efSearch or IVF nprobe (defaults from the environment)."""
+        if self.kind == 'hnsw':
+            self.index.hnsw.efSearch = ef_search or _env_int("SEMANTIC_EF_SEARCH", 64)
+        elif self.kind == 'ivf':
+            self.index.nprobe = min(nprobe or _env_int("SEMANTIC_NPROBE", 8), self.index.nlist)
+
+    def project(self, vectors) -> np.ndarray:
+        """Unit-length LSA vectors (float32) of TF-IDF rows."""
+        # float32 on both sides, or scipy upcasts the whole projection matrix per call
+        dense = np.asarray(sparse.csr_matrix(vectors, dtype=np.float32) @ self._projection)
+        return normalize(dense).astype(np.float32, copy=False)
+
+    def search(self, query_vectors, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(scores, row positions) of the k nearest documents per query; positions are -1 past the end."""
+        return self.index.search(self.project(query_vectors), k)
+
+    def fuse(self, query_vectors, similarities: np.ndarray, weight: float) -> np.ndarray:
+        """
+        (1 - weight) * TF-IDF cosine + weight * LSA cosine.
+
+        Only the HYBRID_CANDIDATES nearest rows of the ANN index get an LSA
+        score (negative cosines count as 0), so the rest of the corpus is
+        never scored densely.
+        """
+        scores, ids = self.search(query_vectors, HYBRID_CANDIDATES)
+        fused = np.asarray(similarities) * (1.0 - weight)
+        for row, (row_ids, row_scores) in enumerate(zip(ids, scores)):
+            found = row_ids >= 0
+            fused[row, row_ids[found]] += weight * np.maximum(row_scores[found], 0.0)
+        return fused
+
+    def nbytes(self) -> int:
+        return int(self.components.nbytes + faiss.serialize_index(self.index).nbytes)
+
+    def save(self, path: str):
+        """Write the index directory (replaced as a whole, never half-written)."""
+        staging = f"{path}.building-{os.getpid()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        np.save(os.path.join(staging, COMPONENTS_FILE), self.components)
+        faiss.write_index(self.index, os.path.join(staging, INDEX_FILE))
+        manifest = {
+            'fingerprint': self.fingerprint,
+            'kind': self.kind,
+            'quantizer': self.quantizer,
+            'dimensions': self.dimensions,
+            'documents': int(self.index.ntotal),
+            'created': datetime.now().isoformat(timespec='seconds'),
+        }
+        with open(os.path.join(staging, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        old = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.rename(path, old)
+        os.rename(staging, path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str, fingerprint: Optional[str] = None) -> Optional['SemanticIndex']:
+        """The saved index at path, or None if there is none or it was trained from something else."""
+        try:
+            with open(os.path.join(path, MANIFEST)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if fingerprint is not None and manifest.get('fingerprint') != fingerprint:
+            return None
+        components = np.load(os.path.join(path, COMPONENTS_FILE))
+        index = faiss.read_index(os.path.join(path, INDEX_FILE))
+        return cls(components, index, manifest['kind'], manifest['fingerprint'], manifest.get('quantizer', 'none'))
+
+
+def load_or_fit(document_vectors: sparse.csr_matrix, path: Optional[str] = None) -> SemanticIndex:
+    """The saved semantic index for this TF-IDF matrix and settings, else a newly trained (and saved) one."""
+    path = path or os.getenv("SEMANTIC_INDEX_PATH", DEFAULT_INDEX_PATH)
+    dimensions = _env_int("SEMANTIC_DIMENSIONS", 256)
+    kind = os.getenv("SEMANTIC_INDEX", "hnsw").lower()
+    quantizer = semantic_quantizer()
+    index = SemanticIndex.load(path, matrix_fingerprint(document_vectors, dimensions, kind, quantizer))
+    if index is not None:
+        print(f"Semantic index loaded from {path} ({index.kind}, {index.dimensions} dimensions)")
+        return index
+    index = SemanticIndex.fit(document_vectors, dimensions, kind, quantizer)
+    try:
+        index.save(path)
+        print(f"Semantic index saved to {path}")
+    except OSError as e:
+        print(f"Warning: Could not save semantic index to {path}: {e}")
+    return index
+
+
+def _dataset_retriever():
+    """TF-IDF retriever over the dataset (semantic retrieval off), built the way the app builds it."""
+    from chat_engines import load_corpus, load_knowledge_pack
+    from travel_retriever import TravelRetriever
+    pack = load_knowledge_pack()
+    if pack is not None:
+        return TravelRetriever(None, pack=pack, semantic='off')
+    return TravelRetriever(None, corpus=load_corpus(), semantic='off')
+
+
+def sweep(retriever, queries, k: int = 10):
+    """Recall@k of the HNSW and IVF indexes against exact search, and latency, per search effort."""
+    query_vectors = retriever.vectorizer.transform([retriever._normalize_text(q) for q in queries])
+    exact = SemanticIndex.fit(retriever.document_vectors, kind='flat', quantizer='none')
+    _, truth = exact.search(query_vectors, k)
+
+    def measure(index):
+        start = time.perf_counter()
+        for i in range(query_vectors.shape[0]):
+            index.search(query_vectors[i], k)
+        per_query_ms = (time.perf_counter() - start) / query_vectors.shape[0] * 1000
+        _, found = index.search(query_vectors, k)
+        recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, truth)])
+        return recall, per_query_ms
+
+    recall, ms = measure(exact)
+    print(f"{'index':<8}{'effort':>8}{'recall@' + str(k):>12}{'ms/query':>10}")
+    print(f"{'flat':<8}{'-':>8}{recall:>12.3f}{ms:>10.3f}")
+    for kind, efforts in (('hnsw', (8, 16, 32, 64, 128, 256)), ('ivf', (1, 2, 4, 8, 16, 32))):
+        index = SemanticIndex.fit(retriever.document_vectors, kind=kind)
+        for effort in efforts:
+            index.set_search_effort(ef_search=effort, nprobe=effort)
+            recall, ms = measure(index)
+            print(f"{kind:<8}{effort:>8}{recall:>12.3f}{ms:>10.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train / inspect the LSA semantic index")
+    parser.add_argument('command', choices=['build', 'sweep'])
+    parser.add_argument('--path', help="index directory (default SEMANTIC_INDEX_PATH or travel_qa_model/semantic_index)")
+    parser.add_argument('--k', type=int, default=10, help="cut-off for the sweep's recall")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, BACKEND_DIR)
+    retriever = _dataset_retriever()
+    if retriever.vectorizer_mode != 'tfidf' or retriever.document_vectors is None:
+        print("Semantic retrieval needs the fitted TF-IDF index (RETRIEVER_VECTORIZER=tfidf)")
+        return 1
+
+    if args.command == 'build':
+        path = args.path or os.getenv("SEMANTIC_INDEX_PATH", DEFAULT_INDEX_PATH)
+        index = SemanticIndex.fit(retriever.document_vectors)
+        index.save(path)
+        print(f"Semantic index {index.fingerprint} saved to {path} ({index.nbytes() / 2 ** 20:.1f} MB)")
+    else:
+        from benchmark_retrieval import script_queries
+        sweep(retriever, script_queries(), args.k)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
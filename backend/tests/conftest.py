@@ -0,0 +1,35 @@
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture(scope="session")
+def chat_engine():
+    """DatasetOnlyChat over the shipped dataset, built once, answer cache off."""
+    previous = os.environ.get('ANSWER_CACHE_SIZE')
+    os.environ['ANSWER_CACHE_SIZE'] = '0'
+    try:
+        from retrieval_augmented_ai import DatasetOnlyChat
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine = DatasetOnlyChat()
+    finally:
+        if previous is None:
+            os.environ.pop('ANSWER_CACHE_SIZE', None)
+        else:
+            os.environ['ANSWER_CACHE_SIZE'] = previous
+    return engine
+
+
+@pytest.fixture
+def ask(chat_engine):
+    """Answer text for a query, as /api/ai/chat asks the engine (top_k=6)."""
+    def ask(query: str) -> str:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return chat_engine.chat(query, top_k=6)['response']
+    return ask
@@ -0,0 +1,110 @@
+import contextlib
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from ai_service import TravelAIService
+
+
+def corpus():
+    rows = []
+    for city in ["Tokyo", "Paris", "Rome", "Oslo"]:
+        rows.append((f"What to eat in {city}?", f"{city} food: try the local dishes at the central market."))
+        rows.append((f"what to eat in {city}", f"{city} food: try the local dishes at the central market."))
+        rows.append((f"Best time to visit {city}?", f"{city} weather: spring and autumn are the best seasons to visit."))
+        rows.append((f"How to get around {city}?", f"{city} transport: the metro and buses cover the city."))
+    return pd.DataFrame(rows, columns=['question', 'response'])
+
+
+def build(model_dir, rows=None, quantizer=None):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return TravelAIService(corpus=corpus() if rows is None else rows, model_dir=str(model_dir), quantizer=quantizer)
+
+
+def test_saved_components_are_reused(tmp_path, monkeypatch):
+    monkeypatch.delenv("NEAR_DUPLICATE_COMPACTION", raising=False)
+    service = build(tmp_path)
+    assert os.path.exists(tmp_path / "knowledge_base.json")
+    index_mtime = os.path.getmtime(tmp_path / "faiss_index.bin")
+    reloaded = build(tmp_path)
+    assert os.path.getmtime(tmp_path / "faiss_index.bin") == index_mtime
+    assert len(reloaded.df) == len(service.df) == 16
+
+
+def test_compaction_setting_change_rebuilds(tmp_path, monkeypatch):
+    monkeypatch.delenv("NEAR_DUPLICATE_COMPACTION", raising=False)
+    assert len(build(tmp_path).df) == 16
+    monkeypatch.setenv("NEAR_DUPLICATE_COMPACTION", "1")
+    monkeypatch.setenv("NEAR_DUPLICATE_THRESHOLD", "0.7")
+    compacted = build(tmp_path)
+    assert len(compacted.df) < 16
+    assert compacted.index.ntotal == len(compacted.df)
+    monkeypatch.setenv("NEAR_DUPLICATE_COMPACTION", "0")
+    assert len(build(tmp_path).df) == 16
+
+
+def test_vectorizer_modes_keep_separate_components(tmp_path, monkeypatch):
+    monkeypatch.delenv("NEAR_DUPLICATE_COMPACTION", raising=False)
+    build(tmp_path)
+    monkeypatch.setenv("AI_VECTORIZER", "hashing")
+    hashed = build(tmp_path)
+    assert os.path.exists(tmp_path / "knowledge_base_hashed.parquet")
+    assert os.path.exists(tmp_path / "knowledge_base_hashed.json")
+    assert hashed.index.ntotal == len(hashed.df) == 16
+    # The TF-IDF components are still there and reused
+    index_mtime = os.path.getmtime(tmp_path / "faiss_index.bin")
+    monkeypatch.setenv("AI_VECTORIZER", "tfidf")
+    build(tmp_path)
+    assert os.path.getmtime(tmp_path / "faiss_index.bin") == index_mtime
+
+
+def test_quantized_index_from_another_corpus_is_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.delenv("NEAR_DUPLICATE_COMPACTION", raising=False)
+    build(tmp_path, quantizer='fp16')
+    # The corpus grows; a full-precision run rewrites the knowledge base
+    grown = pd.concat([corpus(), pd.DataFrame(
+        [("What to eat in Lima?", "Lima food: ceviche by the coast.")], columns=['question', 'response']
+    )], ignore_index=True)
+    assert build(tmp_path, rows=grown).index.ntotal == 17
+    # The fp16 index on disk still covers the old 16 rows
+    quantized = build(tmp_path, rows=grown, quantizer='fp16')
+    assert quantized.index.ntotal == len(quantized.df) == 17
+    # Both index files now match the saved corpus and are reused
+    mtimes = [os.path.getmtime(tmp_path / name) for name in ("faiss_index.bin", "faiss_index_fp16.bin")]
+    build(tmp_path, rows=grown)
+    build(tmp_path, rows=grown, quantizer='fp16')
+    assert [os.path.getmtime(tmp_path / name) for name in ("faiss_index.bin", "faiss_index_fp16.bin")] == mtimes
+
+
+def test_location_mentions_match_a_full_scan(tmp_path, monkeypatch):
+    monkeypatch.delenv("NEAR_DUPLICATE_COMPACTION", raising=False)
+    rows = pd.concat([corpus(), pd.DataFrame(
+        [("Day trips from Lima?", "Lima: take the bus south to Paracas."),
+         ("Where to stay in Peru?", "Peru hotels: Miraflores in Lima is safe and central.")],
+        columns=['question', 'response']
+    )], ignore_index=True)
+    service = build(tmp_path, rows=rows)
+    all_rows = np.arange(len(service.df))
+    for location in ["tokyo", "paris", "lima", "miraflores", "paracas", "nowhere"]:
+        expected = np.array([
+            location in text or any(location in loc.lower() for loc in locs)
+            for text, locs in zip(service._entry_texts, service.df['locations'])
+        ])
+        assert np.array_equal(service.location_mentions(location, all_rows), expected), location
+        assert np.array_equal(service.location_mentions(location, all_rows[::3]), expected[::3]), location
+    # Places outside the curated list are never added to the shared table
+    assert "miraflores" not in service._mention_cache
+
+
+def test_concurrent_answers_match_sequential(tmp_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    monkeypatch.delenv("NEAR_DUPLICATE_COMPACTION", raising=False)
+    service = build(tmp_path)
+    queries = [f"{what} {city}" for city in ["tokyo", "paris", "rome", "oslo", "lima"]
+               for what in ["what to eat in", "best time to visit", "getting around"]]
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = [service.generate_answer(query) for query in queries]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            assert list(pool.map(service.generate_answer, queries * 4)) == expected * 4
@@ -0,0 +1,82 @@
+import pandas as pd
+
+from answer_cache import AnswerCache, normalize_query
+from retrieval_augmented_ai import answer_version
+
+
+def frame():
+    return pd.DataFrame({
+        'question': ["What to eat in Tokyo?", "Best time to visit Oslo?"],
+        'response': ["Try sushi and ramen.", "Summer, from June to August."],
+    })
+
+
+def test_put_get_round_trip(tmp_path):
+    cache = AnswerCache(str(tmp_path / "cache.sqlite3"), "v1")
+    result = {'response': "Try sushi.", 'sources': [{'city': 'Tokyo'}]}
+    cache.put("What to eat in Tokyo?", 6, result)
+    assert cache.get("  what to EAT in tokyo? ", 6) == result
+    assert cache.get("What to eat in Tokyo?", 5) is None
+    assert len(cache) == 1
+
+
+def test_other_version_misses_and_is_purged(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    AnswerCache(path, "v1").put("tokyo food", 6, {'response': "old"})
+    cache = AnswerCache(path, "v2")
+    assert cache.get("tokyo food", 6) is None
+    assert len(AnswerCache(path, "v1")) == 0
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = AnswerCache(str(tmp_path / "cache.sqlite3"), "v1", max_entries=2)
+    cache.put("a", 6, {'response': "a"})
+    cache.put("b", 6, {'response': "b"})
+    cache.get("a", 6)
+    cache.put("c", 6, {'response': "c"})
+    cache.evict()
+    assert cache.contains("a", 6) and cache.contains("c", 6)
+    assert not cache.contains("b", 6)
+
+
+def test_normalize_query():
+    assert normalize_query("  Tokyo   FOOD ") == "tokyo food"
+
+
+def test_answer_version_is_stable():
+    assert answer_version(frame()) == answer_version(frame())
+
+
+def test_answer_version_tracks_dataset():
+    changed = frame()
+    changed.loc[0, 'response'] = "Try tempura."
+    assert answer_version(changed) != answer_version(frame())
+
+
+def test_flipping_a_setting_misses_the_cache(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite3")
+    before = answer_version(frame())
+    AnswerCache(path, before).put("tokyo food", 6, {'response': "sushi"})
+
+    monkeypatch.setenv("QUESTION_MATCH_THRESHOLD", "0.9")
+    after = answer_version(frame())
+    assert after != before
+    assert AnswerCache(path, after).get("tokyo food", 6) is None
+
+
+def test_default_settings_spelled_out_keep_the_version(monkeypatch):
+    before = answer_version(frame())
+    monkeypatch.setenv("QUESTION_MATCH_THRESHOLD", "0.80")
+    monkeypatch.setenv("RETRIEVER_SEMANTIC", "off")
+    monkeypatch.setenv("RETRIEVER_PRECISION", "float64")
+    assert answer_version(frame()) == before
+
+
+def test_answer_version_tracks_every_listed_setting(monkeypatch):
+    before = answer_version(frame())
+    for name, value in [("INTENT_BOOST_WEIGHT", "2.0"), ("INTENT_BOOST_WEIGHTS", "food=0.5"),
+                        ("RETRIEVER_SEMANTIC", "hybrid"), ("RETRIEVER_PRECISION", "int8"),
+                        ("NEAR_DUPLICATE_COMPACTION", "1")]:
+        with monkeypatch.context() as m:
+            m.setenv(name, value)
+            assert answer_version(frame()) != before, name
@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+
+import pytest
+
+import chat_engines
+import chat_pool
+from chat_pool import ChatAdmission, ChatPool, ChatPoolBusy, get_chat_admission, get_chat_pool
+
+
+class EchoEngine:
+    def prepare_chat(self, query, top_k=6):
+        return {'response': query.upper(), 'top_k': top_k, 'pid': os.getpid()}
+
+
+@pytest.fixture
+def echo_engine(monkeypatch):
+    engine = EchoEngine()
+    monkeypatch.setitem(chat_engines.ENGINE_FACTORIES, 'echo', lambda: engine)
+    chat_engines.reset_engines()
+    yield engine
+    chat_engines.reset_engines()
+
+
+def test_pool_is_opt_in(monkeypatch):
+    monkeypatch.delenv("CHAT_POOL_WORKERS", raising=False)
+    assert get_chat_pool('dataset') is None
+
+
+def test_started_pool_answers_in_forked_processes(echo_engine):
+    pool = ChatPool('echo', workers=2, queue_size=2)
+    pool.start()
+    try:
+        executor = pool._executor
+        assert executor._mp_context.get_start_method() == 'fork'
+        result = pool.prepare_chat('tokyo 3 days', top_k=3)
+        assert result['response'] == 'TOKYO 3 DAYS'
+        assert result['top_k'] == 3
+        assert result['pid'] != os.getpid()
+        # Starting again keeps the running processes
+        pool.start()
+        assert pool._executor is executor
+    finally:
+        pool.shutdown()
+
+
+def test_lazy_pool_spawns_instead_of_forking(echo_engine):
+    pool = ChatPool('echo', workers=1, queue_size=0)
+    try:
+        executor = pool._get_executor()
+        assert executor._mp_context.get_start_method() == 'spawn'
+        assert executor._initializer is chat_pool._warm_engine
+        assert executor._initargs == ('echo',)
+    finally:
+        pool.shutdown()
+
+
+def test_saturated_pool_refuses_without_blocking(echo_engine):
+    pool = ChatPool('echo', workers=1, queue_size=0)
+    assert pool._slots.acquire(blocking=False)
+    try:
+        with pytest.raises(ChatPoolBusy) as busy:
+            pool.prepare_chat('paris')
+        assert busy.value.retry_after >= 1
+    finally:
+        pool._slots.release()
+        pool.shutdown()
+
+
+def test_in_process_chat_is_admitted_up_to_its_limit(monkeypatch):
+    monkeypatch.setattr(chat_pool, '_admission', None)
+    monkeypatch.setenv("CHAT_POOL_WORKERS", "2")
+    assert get_chat_admission() is None
+    monkeypatch.delenv("CHAT_POOL_WORKERS")
+    monkeypatch.setenv("CHAT_CONCURRENCY", "1")
+    monkeypatch.setenv("CHAT_POOL_QUEUE", "1")
+    admission = get_chat_admission()
+    assert (admission.concurrency, admission.queue_size) == (1, 1)
+    assert get_chat_admission() is admission
+
+
+def test_saturated_admission_refuses_without_blocking():
+    admission = ChatAdmission(concurrency=1, queue_size=1, timeout=0.05)
+    running = threading.Event()
+    release = threading.Event()
+
+    def chat():
+        with admission.admit():
+            running.set()
+            release.wait()
+
+    first = threading.Thread(target=chat)
+    first.start()
+    running.wait()
+    try:
+        # One waits for the running call and gives up; the queue then has room again
+        with pytest.raises(ChatPoolBusy, match="too long"):
+            with admission.admit():
+                pass
+        assert admission._slots.acquire(blocking=False)
+        try:
+            start = time.perf_counter()
+            with pytest.raises(ChatPoolBusy, match="busy") as busy:
+                with admission.admit():
+                    pass
+            assert time.perf_counter() - start < 0.05
+            assert busy.value.retry_after >= 1
+        finally:
+            admission._slots.release()
+    finally:
+        release.set()
+        first.join()
+    with admission.admit():
+        pass
@@ -0,0 +1,114 @@
+"""
+Free-plan question counting in routes/ai_chat.py against an in-memory
+stand-in for the ai_chat_usage table (unique (trip_id, user_id), foreign
+keys to trips and users) that reports affected rows the way MySQL does for
+INSERT ... ON DUPLICATE KEY UPDATE.
+"""
+
+import pytest
+from flask import Flask
+from mysql.connector import IntegrityError, errorcode
+
+import db
+from routes import ai_chat
+
+
+class UsageTable:
+    def __init__(self, trips=(1,), users=(7,)):
+        self.trips = set(trips)
+        self.users = set(users)
+        self.counts = {}
+        self.statements = []
+
+
+class Cursor:
+    def __init__(self, table):
+        self.table = table
+        self.rowcount = 0
+        self.lastrowid = None
+
+    def execute(self, sql, params):
+        sql = " ".join(sql.split())
+        self.table.statements.append(sql)
+        if sql.startswith("INSERT INTO ai_chat_usage (trip_id, user_id, question_count) VALUES (%s, %s, 1) "
+                          "ON DUPLICATE KEY UPDATE question_count = IF(question_count < %s, LAST_INSERT_ID("):
+            trip_id, user_id, limit = params
+            count = self.table.counts.get((trip_id, user_id))
+            if count is None:
+                if trip_id not in self.table.trips or user_id not in self.table.users:
+                    raise IntegrityError(msg="Cannot add or update a child row", errno=errorcode.ER_NO_REFERENCED_ROW_2)
+                self.table.counts[(trip_id, user_id)] = 1
+                self.rowcount, self.lastrowid = 1, len(self.table.counts)
+            elif count < limit:
+                # An update reports two affected rows; LAST_INSERT_ID(expr) sets lastrowid
+                self.table.counts[(trip_id, user_id)] = self.lastrowid = count + 1
+                self.rowcount = 2
+            else:
+                self.rowcount, self.lastrowid = 0, 0
+        elif sql.startswith("UPDATE ai_chat_usage SET question_count = question_count - 1"):
+            trip_id, user_id = params
+            if self.table.counts.get((trip_id, user_id), 0) > 0:
+                self.table.counts[(trip_id, user_id)] -= 1
+        else:
+            raise AssertionError(f"unexpected statement: {sql}")
+
+    def close(self):
+        pass
+
+
+class Connection:
+    def __init__(self, table):
+        self.table = table
+
+    def cursor(self):
+        return Cursor(self.table)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = UsageTable()
+    monkeypatch.setattr(db, "get_db_connection", lambda: Connection(table))
+    with Flask(__name__).app_context():
+        yield table
+
+
+def count(trip_id=1, user_id=7):
+    return ai_chat._count_free_question({"user_id": user_id}, trip_id)
+
+
+def test_questions_are_counted_up_to_the_limit(table):
+    for expected in range(1, ai_chat.FREE_CHAT_LIMIT + 1):
+        assert count() == (expected, None)
+    questions_used, (response, status) = count()
+    assert questions_used is None
+    assert status == 403
+    assert table.counts[(1, 7)] == ai_chat.FREE_CHAT_LIMIT
+
+
+def test_refund_applies_to_the_next_question(table):
+    table.counts[(1, 7)] = ai_chat.FREE_CHAT_LIMIT
+    assert count()[0] is None
+    ai_chat._refund_question(1, 7)
+    assert count() == (ai_chat.FREE_CHAT_LIMIT, None)
+
+
+def test_unknown_trip_is_not_reported_as_limit_reached(table):
+    questions_used, (response, status) = count(trip_id=99)
+    assert questions_used is None
+    assert status == 404
+    assert table.counts == {}
+
+
+def test_each_question_is_one_statement(table):
+    count()
+    count()
+    table.counts[(1, 7)] = ai_chat.FREE_CHAT_LIMIT
+    count()
+    assert len(table.statements) == 3
+    assert all(sql.startswith("INSERT INTO ai_chat_usage") for sql in table.statements)
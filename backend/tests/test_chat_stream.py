@@ -0,0 +1,47 @@
+"""
+/api/ai/chat/stream against /api/ai/chat: the same answer, its metadata
+first, then its sections.
+"""
+
+import json
+
+import pytest
+from flask import Flask
+
+import conversation_context
+from conversation_context import ConversationContextStore
+from routes import ai_chat
+
+
+@pytest.fixture
+def client(chat_engine, monkeypatch, tmp_path):
+    monkeypatch.setattr(ai_chat, "verify_token", lambda token: {"user_id": 7, "is_premium": True})
+    monkeypatch.setattr(ai_chat, "get_engine", lambda name: chat_engine)
+    monkeypatch.setattr(ai_chat, "get_chat_pool", lambda name: None)
+    monkeypatch.setattr(conversation_context, "_store", ConversationContextStore(str(tmp_path / "contexts.sqlite3")))
+    app = Flask(__name__)
+    app.register_blueprint(ai_chat.ai_bp, url_prefix="/api/ai")
+    return app.test_client()
+
+
+def events(body):
+    for message in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in message.split("\n"))
+        yield lines["event"], json.loads(lines["data"])
+
+
+@pytest.mark.parametrize("message", ["where to stay in paris", "rome 3 days", "hi"])
+def test_stream_gives_the_chat_answer(client, message):
+    request = {"message": message, "conversation_id": message}
+    headers = {"Authorization": "Bearer token"}
+    reply = client.post("/api/ai/chat", json=request, headers=headers).get_json()
+    streamed = client.post("/api/ai/chat/stream", json=request, headers=headers)
+    assert streamed.mimetype == "text/event-stream"
+    received = list(events(streamed.get_data(as_text=True)))
+    names = [name for name, _ in received]
+    assert names[0] == "metadata" and names[-1] == "done"
+    assert set(names[1:-1]) == {"section"}
+    assert received[0][1] == {key: value for key, value in reply.items() if key != "response"}
+    texts = [data["text"] for name, data in received if name == "section"]
+    assert [data["index"] for name, data in received if name == "section"] == list(range(len(texts)))
+    assert "\n\n".join(texts) == reply["response"]
@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+from conversation_context import ConversationContextStore, ConversationState, conversation_key
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ConversationContextStore(str(tmp_path / "context.sqlite3"), ttl=3600, turns=3)
+
+
+def turn(store, conversation, user_message, reply="Here you go."):
+    state = store.get(7, conversation)
+    state.observe_turn(user_message, reply)
+    store.put(7, conversation, state)
+    return store.get(7, conversation)
+
+
+def test_round_trip(store):
+    state = ConversationState()
+    state.observe_turn("hotels in kyoto", "Which area of Kyoto would you like?")
+    store.put(7, "c:tab-1", state)
+    assert store.get(7, "c:tab-1") == state
+    assert store.get(8, "c:tab-1") == ConversationState()
+    store.clear(7, "c:tab-1")
+    assert store.get(7, "c:tab-1") == ConversationState()
+
+
+def test_topic_and_location_expire_after_turns(store):
+    state = turn(store, "c:tab-1", "where to eat in tokyo")
+    assert (state.topic, state.location) == ('food', 'tokyo')
+    turn(store, "c:tab-1", "and in paris?")
+    state = turn(store, "c:tab-1", "thanks")
+    assert (state.topic, state.location) == ('food', 'paris')
+    # Three user messages after "where to eat", food is no longer carried over
+    state = turn(store, "c:tab-1", "ok")
+    assert (state.topic, state.location) == (None, 'paris')
+
+
+def test_matches_client_history_window(store):
+    messages = ["hotels in rome", "luxury", "what about budget", "and the weather"]
+    history = []
+    for message in messages:
+        state = turn(store, "c:tab-1", message)
+        history += [{"role": "user", "content": message}, {"role": "assistant", "content": "Here you go."}]
+        client = ConversationState.from_history(history)
+        assert (state.topic, state.location) == (client.topic, client.location)
+
+
+def test_context_expires_after_ttl(store):
+    turn(store, "c:tab-1", "hotels in rome")
+    store.ttl = 0
+    time.sleep(0.01)
+    assert store.get(7, "c:tab-1") == ConversationState()
+
+
+def test_open_chats_without_a_trip_are_kept_apart(store):
+    first = conversation_key("tab-1", None)
+    second = conversation_key("tab-2", None)
+    assert first != second
+    turn(store, first, "hotels in rome")
+    assert store.get(7, second).location is None
+    assert conversation_key(None, 5) == "trip:5"
+    assert len(conversation_key("x" * 1000, None)) < 100
@@ -0,0 +1,25 @@
+from gazetteer import get_gazetteer, normalize
+
+
+def test_whole_word_matching():
+    gazetteer = get_gazetteer()
+    # 'us' inside words and ordinary words that are airport cities are not places
+    assert gazetteer.extract("campus tours for business travellers") == {'countries': [], 'cities': []}
+    assert gazetteer.extract("Is Kuala Lumpur nice?") == {'countries': [], 'cities': ['kuala lumpur']}
+
+
+def test_leftmost_longest_in_order_of_appearance():
+    gazetteer = get_gazetteer()
+    assert gazetteer.extract("new york and los angeles") == {'countries': [], 'cities': ['new york', 'los angeles']}
+    assert gazetteer.first_country("Singapore attractions: Little India") == 'singapore'
+    assert gazetteer.countries_mentioned("Singapore attractions: Little India") == {'india'}
+    assert gazetteer.countries_mentioned("Singapore attractions: Little India", include_cities=True) == {'india', 'singapore'}
+
+
+def test_aliases_and_accents_map_to_canonical_names():
+    gazetteer = get_gazetteer()
+    assert normalize("São Paulo") == 'sao paulo'
+    assert gazetteer.extract("São Paulo food")['cities'] == ['sao paulo']
+    assert gazetteer.extract("ubud rice terraces")['cities'] == ['bali']
+    assert gazetteer.country_of('mumbai') == 'india'
+    assert gazetteer.country_of('oslo') == 'norway'
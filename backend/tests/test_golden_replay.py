@@ -0,0 +1,41 @@
+import contextlib
+import io
+import json
+import os
+
+from chat_replay import ReplayItem, check_golden, replay
+
+# Answers to the test / training script queries and 150 dataset questions.
+# After an intended change to the answers, refresh it from backend/ with
+#     python chat_replay.py --source scripts,dataset --dataset-sample 150 \
+#         --save-golden tests/golden_answers.json --output /tmp/replay.json
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden_answers.json")
+
+
+def golden_items():
+    with open(GOLDEN_PATH, encoding='utf-8') as f:
+        keys = json.load(f)['answers']
+    items = []
+    for key in keys:
+        top_k, query = key.split('|', 1)
+        items.append(ReplayItem(query, int(top_k)))
+    return items
+
+
+def test_answers_match_the_golden_snapshot(chat_engine):
+    items = golden_items()
+    assert len(items) > 300
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        results, _ = replay(chat_engine, items)
+        check = check_golden(GOLDEN_PATH, results, show=10)
+    assert check['missing'] == 0
+    assert check['mismatched'] == 0, output.getvalue()[-4000:]
+
+
+def test_answers_do_not_depend_on_concurrency(chat_engine):
+    items = golden_items()[:80]
+    with contextlib.redirect_stdout(io.StringIO()):
+        serial, _ = replay(chat_engine, items)
+        threaded, _ = replay(chat_engine, items, concurrency=4)
+    assert [r.response for r in threaded] == [r.response for r in serial]
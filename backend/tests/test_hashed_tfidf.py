@@ -0,0 +1,76 @@
+import contextlib
+import functools
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import hashed_tfidf
+import travel_retriever
+from hashed_tfidf import HashedTfidf
+from travel_retriever import TravelRetriever
+
+
+ROWS = [
+    ("What to eat in Tokyo?", "Tokyo food: try ramen and sushi near the fish market."),
+    ("Best time to visit Tokyo?", "Tokyo weather: spring for cherry blossoms, autumn for leaves."),
+    ("How to get around Paris?", "Paris transport: the metro reaches every arrondissement."),
+    ("What to eat in Paris?", "Paris food: croissants, crepes and bistro dinners."),
+    ("What to eat in Paris?", "Paris food: croissants, crepes and bistro dinners."),
+    ("Best time to visit Rome?", "Rome weather: spring and autumn avoid the summer heat."),
+    ("What to see in Rome?", "Rome attractions: the Colosseum, the Forum and the Vatican."),
+    ("How to get around Rome?", "Rome transport: walk the centre, take the metro further out."),
+]
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "travel_QA.csv"
+    pd.DataFrame(ROWS, columns=['Question', 'Response']).to_csv(path, index=False)
+    return str(path)
+
+
+def build(csv_path, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return TravelRetriever(csv_path, vectorizer_mode='hashing', compact=False, semantic='off', **kwargs)
+
+
+def test_streamed_build_matches_in_memory_build(csv_path, monkeypatch):
+    # Small chunks so the stream spans several of them (and a cross-chunk duplicate)
+    monkeypatch.setattr(travel_retriever, 'iter_csv_chunks', functools.partial(hashed_tfidf.iter_csv_chunks, chunksize=3))
+    streamed = build(csv_path)
+    corpus = pd.read_csv(csv_path)
+    corpus.columns = [col.strip().lower().replace(' ', '_') for col in corpus.columns]
+    in_memory = build(csv_path, corpus=corpus.drop_duplicates())
+
+    assert list(streamed.df.index) == list(in_memory.df.index)
+    assert streamed.vectorizer.n_docs == in_memory.vectorizer.n_docs == 7
+    assert np.array_equal(streamed.vectorizer.doc_freq, in_memory.vectorizer.doc_freq)
+    assert abs(streamed.document_vectors - in_memory.document_vectors).max() < 1e-12
+
+
+def test_add_entries_skips_indexed_questions(csv_path):
+    retriever = build(csv_path)
+    new_rows = pd.DataFrame([
+        ("What to eat in Tokyo?", "Tokyo food: a different answer."),
+        ("What to eat in Oslo?", "Oslo food: salmon and brown cheese."),
+        ("what to eat in  Oslo?", "Oslo food: the same question again."),
+    ], columns=['Question', 'Response'])
+
+    assert retriever.add_entries(new_rows) == 1
+    assert retriever.df.index.is_unique
+    assert len(retriever.df) == retriever.document_vectors.shape[0] == 8
+    assert retriever.df['question'].iloc[-1] == "What to eat in Oslo?"
+    assert retriever.add_entries(new_rows) == 0
+
+
+def test_save_load_round_trip(tmp_path):
+    texts = [response for _, response in ROWS]
+    model = HashedTfidf(n_features=2 ** 12, min_df=2, max_df=0.95)
+    vectors = model.fit_transform(texts)
+    model.save(str(tmp_path / "hashed_tfidf.npz"))
+
+    loaded = HashedTfidf.load(str(tmp_path / "hashed_tfidf.npz"))
+    assert (loaded.min_df, loaded.max_df, loaded.ngram_range) == (2, 0.95, (1, 2))
+    assert abs(loaded.transform(texts) - vectors).max() < 1e-12
@@ -0,0 +1,71 @@
+import contextlib
+import io
+import os
+import shutil
+
+import pytest
+
+from knowledge_pack import QUESTION_INDEX_FILE, TYPO_INDEX_FILE, build_knowledge_pack, open_knowledge_pack
+
+QUERIES = [
+    "where to stay in tokyo",
+    "tokio attractions",
+    "What is the best time to visit Paris?",
+    "3 day itinerary for rome",
+    "street food in bangkok",
+]
+
+
+@pytest.fixture(scope="module")
+def pack_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("pack") / "knowledge_pack")
+    previous = os.environ.get('ANSWER_CACHE_SIZE')
+    os.environ['ANSWER_CACHE_SIZE'] = '0'
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            build_knowledge_pack(path)
+    finally:
+        if previous is None:
+            os.environ.pop('ANSWER_CACHE_SIZE', None)
+        else:
+            os.environ['ANSWER_CACHE_SIZE'] = previous
+    return path
+
+
+def test_engine_from_pack_answers_like_engine_from_csv(pack_path, chat_engine, monkeypatch):
+    from retrieval_augmented_ai import DatasetOnlyChat
+    monkeypatch.setenv('ANSWER_CACHE_SIZE', '0')
+    pack = open_knowledge_pack(pack_path, verify=True)
+    assert pack is not None
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        packed = DatasetOnlyChat(pack=pack)
+    # The lookup indexes came from the pack
+    assert "Building typo correction index" not in output.getvalue()
+    assert "Building question match index" not in output.getvalue()
+    for query in QUERIES:
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert packed.chat(query, top_k=6) == chat_engine.chat(query, top_k=6), query
+
+
+def test_question_index_with_another_threshold_is_rebuilt(pack_path):
+    pack = open_knowledge_pack(pack_path)
+    assert pack.typo_index() is not None
+    assert pack.question_index(0.8) is not None
+    assert pack.question_index(0.9) is None
+
+
+def test_startup_checks_sizes_and_deploy_checks_checksums(pack_path, tmp_path):
+    copy = str(tmp_path / "knowledge_pack")
+    shutil.copytree(pack_path, copy)
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Same size, different bytes: only the checksum check notices
+        with open(os.path.join(copy, TYPO_INDEX_FILE), 'r+b') as f:
+            f.seek(100)
+            f.write(b'\0' * 8)
+        assert open_knowledge_pack(copy) is not None
+        assert open_knowledge_pack(copy, verify=True) is None
+        # A truncated file is refused either way
+        with open(os.path.join(copy, QUESTION_INDEX_FILE), 'r+b') as f:
+            f.truncate(1000)
+        assert open_knowledge_pack(copy) is None
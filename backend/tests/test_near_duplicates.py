@@ -0,0 +1,79 @@
+import random
+
+import numpy as np
+import pandas as pd
+
+from near_duplicates import compact_corpus, find_near_duplicates, lsh_bands, shingles
+
+
+def frame(index=None):
+    return pd.DataFrame({
+        'question': ["What to eat in Tokyo?", "what to eat in tokyo", "What to eat in Paris?", "Best time to visit Oslo?"],
+        'response': ["Tokyo food: sushi, ramen and tempura at Tsukiji.", "Tokyo food: sushi, ramen and tempura at Tsukiji!",
+                     "Paris food: sushi, ramen and tempura at Tsukiji.", "Oslo weather: mild summers, cold winters."],
+    }, index=index)
+
+
+def test_lsh_bands_cover_the_signature():
+    bands, rows = lsh_bands(128, 0.9)
+    assert bands * rows == 128
+    assert (1 / bands) ** (1 / rows) <= 0.9
+
+
+def test_merges_near_duplicates_of_the_same_place_only():
+    compacted, back_references = compact_corpus(frame(), threshold=0.8, num_perm=128)
+    # The Paris row has the same words but is about another place
+    assert list(compacted.index) == [0, 2, 3]
+    assert back_references == {0: [1]}
+
+
+def test_repeated_labels_are_renumbered():
+    # e.g. rows appended with pd.concat without ignore_index
+    compacted, back_references = compact_corpus(frame(index=[0, 1, 0, 1]), threshold=0.8, num_perm=128)
+    assert compacted.index.is_unique
+    assert len(compacted) == 3
+    assert back_references == {0: [1]}
+
+
+def test_find_near_duplicates_is_deterministic():
+    texts = (frame()['question'] + ' ' + frame()['response']).tolist()
+    first = find_near_duplicates(texts, threshold=0.8, num_perm=64)
+    second = find_near_duplicates(texts, threshold=0.8, num_perm=64)
+    assert first.canonical == second.canonical
+
+
+def test_a_bucket_of_copies_is_checked_once_per_row():
+    texts = [f"Tokyo hotel listing {i} with a view of the city and breakfast included" for i in range(500)]
+    clusters = find_near_duplicates(texts, threshold=0.5, num_perm=64)
+    assert clusters.candidate_pairs == len(texts) - 1
+    assert [len(group) for group in clusters.canonical.values()] == [len(texts) - 1]
+
+
+def test_clusters_match_exact_pairwise_jaccard():
+    rng = random.Random(2)
+    words = [f"w{i}" for i in range(300)]
+    texts = []
+    for _ in range(40):
+        base = rng.sample(words, 30)
+        texts.append(' '.join(base))
+        for _ in range(rng.randrange(4)):
+            copy = list(base)
+            copy[rng.randrange(len(copy))] = rng.choice(words)
+            texts.append(' '.join(copy))
+    clusters = find_near_duplicates(texts, threshold=0.7, num_perm=128)
+    sets = [shingles(text) for text in texts]
+    # Connected components of the exact pairs over the threshold
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    for a in range(len(texts)):
+        for b in range(a + 1, len(texts)):
+            inter = len(np.intersect1d(sets[a], sets[b]))
+            if inter / (len(sets[a]) + len(sets[b]) - inter) >= 0.7:
+                parent[max(find(a), find(b))] = min(find(a), find(b))
+    exact = [find(i) for i in range(len(texts))]
+    assert list(clusters.labels) == exact
@@ -0,0 +1,75 @@
+import faiss
+import numpy as np
+import pytest
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from quantization import PRECISIONS, QuantizedTfidf, faiss_index, pq_subvectors, retriever_precision
+
+QUERIES = [
+    "where to stay in tokyo", "best time to visit paris", "street food in bangkok",
+    "how to get around rome", "things to do in barcelona", "kyoto temples",
+    "budget hotels in london", "what to eat in mumbai", "is bali safe", "seoul nightlife",
+]
+
+
+@pytest.fixture(scope="module")
+def tfidf(chat_engine):
+    retriever = chat_engine.retriever
+    queries = retriever.vectorizer.transform([retriever._normalize_text(q) for q in QUERIES])
+    exact = (normalize(queries) @ normalize(retriever.document_vectors).T).toarray()
+    return retriever.document_vectors, queries, exact
+
+
+@pytest.mark.parametrize("precision,tolerance", [('float64', 1e-12), ('float32', 1e-6), ('float16', 1e-3)])
+def test_float_precisions_match_the_exact_cosine(tfidf, precision, tolerance):
+    documents, queries, exact = tfidf
+    assert np.abs(QuantizedTfidf(documents, precision).similarities(queries) - exact).max() < tolerance
+
+
+def test_int8_keeps_the_top_ranks(tfidf):
+    documents, queries, exact = tfidf
+    scores = QuantizedTfidf(documents, 'int8').similarities(queries)
+    for got, want in zip(scores, exact):
+        top = set(np.argsort(-want, kind='stable')[:10])
+        assert len(top & set(np.argsort(-got, kind='stable')[:10])) >= 8
+
+
+def test_lower_precisions_take_less_memory(tfidf):
+    sizes = [QuantizedTfidf(tfidf[0], precision).nbytes() for precision in PRECISIONS]
+    assert sizes == sorted(sizes, reverse=True)
+
+
+def test_unknown_precision_falls_back(monkeypatch, capsys):
+    monkeypatch.setenv("RETRIEVER_PRECISION", "bfloat16")
+    assert retriever_precision() == 'float64'
+    assert "Unknown RETRIEVER_PRECISION" in capsys.readouterr().out
+    assert retriever_precision('INT8') == 'int8'
+
+
+@pytest.mark.parametrize("kind", ['flat', 'hnsw', 'ivf'])
+@pytest.mark.parametrize("quantizer", ['none', 'fp16', 'sq8', 'pq'])
+def test_faiss_indexes_find_their_own_vectors(kind, quantizer):
+    if kind == 'hnsw' and quantizer == 'pq':
+        with pytest.raises(ValueError):
+            faiss_index(kind, 64, faiss.METRIC_L2, quantizer)
+        return
+    rng = np.random.RandomState(0)
+    vectors = rng.standard_normal((2000, 64)).astype(np.float32)
+    index = faiss_index(kind, 64, faiss.METRIC_L2, quantizer, rows=len(vectors))
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    if kind == 'ivf':
+        index.nprobe = index.nlist
+    _, ids = index.search(vectors[:50], 1)
+    hits = np.mean(ids[:, 0] == np.arange(50))
+    assert hits >= (0.8 if quantizer == 'pq' else 0.98)
+
+
+def test_pq_subvectors_divide_the_dimension():
+    for dimension in (64, 100, 256, 10000, 7):
+        m = pq_subvectors(dimension)
+        assert dimension % m == 0 and (m == 1 or dimension // m >= 16)
+    with pytest.raises(ValueError):
+        faiss_index('flat', 8, faiss.METRIC_L2, 'sq2')
@@ -0,0 +1,78 @@
+import pickle
+import random
+
+from question_index import build_question_index, normalize_question, shingles
+
+QUESTIONS = [
+    ("Where are the best restaurants in Paris?", "Paris dining: bistros in the Marais."),
+    ("When is the best time to visit Tokyo?", "Tokyo weather: spring and autumn."),
+    ("How do I get around Rome?", "Rome transportation: walk and take the metro."),
+    ("How do I get around Rome", "Rome transportation: buses reach everywhere."),
+    ("What to see in Kyoto?", "Kyoto attractions: Fushimi Inari and Kinkaku-ji."),
+]
+
+
+def small_index(threshold=0.8):
+    return build_question_index([q for q, _ in QUESTIONS], [r for _, r in QUESTIONS], threshold=threshold)
+
+
+def test_exact_and_reordered_questions_match():
+    index = small_index()
+    match = index.lookup("when is the best time to visit tokyo")
+    assert (match.response, match.row, match.score) == ("Tokyo weather: spring and autumn.", 1, 1.0)
+    assert index.lookup("Paris: where are the best restaurants").score == 1.0
+
+
+def test_near_duplicates_match_above_the_threshold():
+    index = small_index()
+    match = index.lookup("where are the best restaurant in paris")
+    assert match.row == 0 and 0.8 <= match.score < 1.0
+    assert index.lookup("where are the best museums in paris") is None
+
+
+def test_questions_with_conflicting_answers_are_not_answered():
+    index = small_index()
+    assert index.lookup("how do i get around rome?") is None
+    assert len(index) == 4
+
+
+def test_threshold_above_one_only_matches_exactly():
+    index = small_index(threshold=1.01)
+    assert index.lookup("What to see in Kyoto").score == 1.0
+    assert index.lookup("what to see in kyoto japan") is None
+
+
+def test_pickled_index_matches_the_same():
+    index = small_index()
+    restored = pickle.loads(pickle.dumps(index))
+    for text in ["where are the best restaurant in paris", "what to see in kyoto", "rome"]:
+        assert restored.lookup(text) == index.lookup(text)
+
+
+def test_lsh_lookup_agrees_with_exact_jaccard(chat_engine):
+    index = chat_engine.question_index
+    keys = list(index._keys)
+    key_grams = [shingles(key) for key in keys]
+    rng = random.Random(5)
+    found = expected = 0
+    for key in rng.sample(keys, 150):
+        # Drop one letter of one word: a near-duplicate of a dataset question
+        words = key.split()
+        i = rng.randrange(len(words))
+        if len(words[i]) > 3:
+            j = rng.randrange(len(words[i]))
+            words[i] = words[i][:j] + words[i][j + 1:]
+        text = ' '.join(words)
+        grams = shingles(normalize_question(text))
+        best = max(len(grams & other) / len(grams | other) for other in key_grams)
+        match = index.lookup(text)
+        if match is not None:
+            # Whatever LSH finds is a true match, with its exact score
+            other = shingles(normalize_question(match.question))
+            assert abs(match.score - len(grams & other) / len(grams | other)) < 1e-9
+            assert index.threshold <= match.score <= best + 1e-9
+        if best >= index.threshold:
+            expected += 1
+            found += match is not None
+    assert expected > 50
+    assert found / expected > 0.9
@@ -0,0 +1,83 @@
+import pytest
+
+from retrieval_augmented_ai import iter_response_sections, response_sections
+
+
+def test_lone_headers_stay_with_their_block():
+    answer = "Luxury:\n\n- Aman Tokyo\n- Park Hyatt\n\nBudget:\n\n- Khaosan Tokyo\n\nBook early:"
+    assert response_sections(answer) == [
+        "Luxury:\n\n- Aman Tokyo\n- Park Hyatt",
+        "Budget:\n\n- Khaosan Tokyo\n\nBook early:",
+    ]
+
+
+def test_sections_are_yielded_before_the_answer_is_split_through():
+    sections = iter_response_sections("Day 1: Asakusa\n\nDay 2: Shibuya\n\nDay 3: Nikko")
+    assert next(sections) == "Day 1: Asakusa"
+
+
+@pytest.mark.parametrize("query", [
+    "3 day itinerary for tokyo",
+    "where to stay in paris",
+    "mumbai things to do",
+    "paris currency",
+])
+def test_sections_join_back_to_the_answer(ask, query):
+    answer = ask(query)
+    sections = response_sections(answer)
+    assert sections
+    assert "\n\n".join(sections) == answer
+
+
+def test_sections_render_like_the_whole_answer(chat_engine, monkeypatch):
+    responses = list(dict.fromkeys(chat_engine.retriever.df['response'].astype(str)))
+    expected = [chat_engine._render_final(text) for text in responses]
+    # Without the pre-rendered table every section is formatted on its own
+    renderings = {kind: table for kind, table in chat_engine._renderings.items() if kind != 'final'}
+    monkeypatch.setattr(chat_engine, '_renderings', renderings)
+    for text, rendered in zip(responses, expected):
+        assert "\n\n".join(chat_engine._render_sections(text)) == rendered, text[:80]
+
+
+def test_metadata_is_ready_before_the_answer_is_formatted(chat_engine, monkeypatch):
+    rendered = []
+    render_sections = chat_engine._render_sections
+
+    def recording(text):
+        rendered.append(text)
+        return render_sections(text)
+
+    monkeypatch.setattr(chat_engine, '_render_sections', recording)
+    draft = chat_engine.prepare_chat("where to stay in paris", top_k=6)
+    assert draft.render and rendered == []
+    assert draft.result['retrieved_context_count'] > 0
+    assert 'response' not in draft.result
+    sections = chat_engine.answer_sections(draft)
+    first = next(sections)
+    assert len(rendered) == 1
+    answer = "\n\n".join([first, *sections])
+    assert chat_engine.chat("where to stay in paris", top_k=6) == {'response': answer, **draft.result}
+
+
+class DictCache:
+    def __init__(self):
+        self.answers = {}
+
+    def get(self, query, top_k):
+        return self.answers.get((query, top_k))
+
+    def put(self, query, top_k, result):
+        self.answers[(query, top_k)] = result
+
+
+def test_answer_is_cached_once_it_is_formatted(chat_engine, monkeypatch):
+    cache = DictCache()
+    monkeypatch.setattr(chat_engine, 'answer_cache', cache)
+    draft = chat_engine.prepare_chat("mumbai things to do", top_k=6)
+    assert draft.cache_key == ("mumbai things to do", 6)
+    sections = list(chat_engine.answer_sections(draft))
+    cached = cache.get("mumbai things to do", 6)
+    assert cached == {'response': "\n\n".join(sections), **draft.result}
+    hit = chat_engine.prepare_chat("mumbai things to do", top_k=6)
+    assert not hit.render and hit.cache_key is None
+    assert list(chat_engine.answer_sections(hit)) == sections
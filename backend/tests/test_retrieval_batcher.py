@@ -0,0 +1,93 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from retrieval_batcher import RetrievalBatcher, create_retrieval_batcher
+
+QUERIES = [
+    "where to stay in tokyo", "best time to visit paris", "street food in bangkok",
+    "how to get around rome", "things to do in barcelona", "kyoto temples",
+    "budget hotels in london", "what to eat in mumbai",
+]
+
+
+class SlowRetriever:
+    """Records the batches it scores; each batch takes a while."""
+
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.fail_on = fail_on
+
+    def retrieve_many(self, queries, top_ks, boosts):
+        self.batches.append(list(queries))
+        time.sleep(0.02)
+        if self.fail_on in queries:
+            raise ValueError(self.fail_on)
+        return [[{'query': q, 'top_k': k, 'boosts': b}] for q, k, b in zip(queries, top_ks, boosts)]
+
+
+def test_batching_is_opt_in(monkeypatch):
+    monkeypatch.delenv("RETRIEVAL_BATCHING", raising=False)
+    assert create_retrieval_batcher(SlowRetriever()) is None
+    monkeypatch.setenv("RETRIEVAL_BATCHING", "1")
+    monkeypatch.setenv("RETRIEVAL_BATCH_MAX", "4")
+    assert create_retrieval_batcher(SlowRetriever()).max_batch == 4
+
+
+def test_idle_request_is_scored_alone():
+    retriever = SlowRetriever()
+    batcher = RetrievalBatcher(retriever)
+    assert batcher.retrieve("paris", top_k=7, boosts=['is_food']) == [{'query': "paris", 'top_k': 7, 'boosts': ('is_food',)}]
+    assert retriever.batches == [["paris"]]
+
+
+def test_concurrent_requests_share_batches():
+    retriever = SlowRetriever()
+    batcher = RetrievalBatcher(retriever, window_ms=5, max_batch=3)
+    queries = [f"query {i}" for i in range(12)]
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        results = list(pool.map(lambda q: batcher.retrieve(q, top_k=6), queries))
+    # Every thread gets its own answer
+    assert [r[0]['query'] for r in results] == queries
+    assert sorted(q for batch in retriever.batches for q in batch) == sorted(queries)
+    assert max(len(batch) for batch in retriever.batches) <= 3
+    assert batcher.stats()['batches'] < len(queries)
+    assert batcher.stats()['requests'] == len(queries)
+
+
+def test_failed_batch_raises_in_each_of_its_requests():
+    retriever = SlowRetriever(fail_on="bad")
+    batcher = RetrievalBatcher(retriever, window_ms=5)
+    release = threading.Event()
+    errors = []
+
+    def ask(query):
+        release.wait()
+        try:
+            return batcher.retrieve(query)
+        except ValueError as e:
+            errors.append((query, str(e)))
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(ask, q) for q in ["a", "bad", "c", "d"]]
+        release.set()
+        [f.result() for f in futures]
+    failed_batch = next(batch for batch in retriever.batches if "bad" in batch)
+    assert sorted(q for q, _ in errors) == sorted(failed_batch)
+    assert all(message == "bad" for _, message in errors)
+    # The batcher is usable afterwards
+    assert batcher.retrieve("e")[0]['query'] == "e"
+
+
+def test_batched_results_equal_direct_retrieval(chat_engine):
+    retriever = chat_engine.retriever
+    expected = [retriever.retrieve(q, top_k=6) for q in QUERIES]
+    batcher = RetrievalBatcher(retriever, window_ms=2, max_batch=8)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda q: batcher.retrieve(q, top_k=6), QUERIES * 3))
+    for query, got, want in zip(QUERIES * 3, results, expected * 3):
+        assert [row['question'] for row in got] == [row['question'] for row in want], query
+        assert [row['similarity_score'] for row in got] == pytest.approx(
+            [row['similarity_score'] for row in want], abs=1e-9), query
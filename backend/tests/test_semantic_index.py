@@ -0,0 +1,80 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+from scipy import sparse
+
+from semantic_index import HYBRID_CANDIDATES, SemanticIndex, load_or_fit, matrix_fingerprint
+
+QUERIES = [
+    "cheap places to stay in tokyo", "budget accommodation paris", "romantic dinner rome",
+    "kid friendly museums london", "street food bangkok night market", "day trips from kyoto",
+    "getting from the airport to the city centre in seoul", "rainy season in bali",
+]
+
+
+def quiet(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+@pytest.fixture(scope="module")
+def tfidf(chat_engine):
+    retriever = chat_engine.retriever
+    queries = retriever.vectorizer.transform([retriever._normalize_text(q) for q in QUERIES])
+    return retriever.document_vectors, queries
+
+
+@pytest.fixture(scope="module")
+def exact(tfidf):
+    return quiet(SemanticIndex.fit, tfidf[0], dimensions=64, kind='flat', quantizer='none')
+
+
+def test_ann_indexes_find_the_exact_neighbours(tfidf, exact):
+    documents, queries = tfidf
+    _, truth = exact.search(queries, 10)
+    for kind in ('hnsw', 'ivf'):
+        index = quiet(SemanticIndex.fit, documents, dimensions=64, kind=kind, quantizer='none')
+        index.set_search_effort(ef_search=128, nprobe=16)
+        _, found = index.search(queries, 10)
+        recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(found, truth)])
+        assert recall >= 0.9, kind
+
+
+def test_fuse_adds_the_weighted_lsa_cosine(tfidf, exact):
+    documents, queries = tfidf
+    similarities = (queries @ documents.T).toarray()
+    fused = exact.fuse(queries, similarities, 0.3)
+    lsa = exact.project(queries) @ exact.project(documents).T
+    for row in range(len(QUERIES)):
+        candidates = np.argsort(-lsa[row], kind='stable')[:HYBRID_CANDIDATES]
+        expected = similarities[row] * 0.7
+        expected[candidates] += 0.3 * np.maximum(lsa[row, candidates], 0.0)
+        assert np.allclose(fused[row], expected, atol=1e-5)
+
+
+def test_save_load_round_trip(tfidf, exact, tmp_path):
+    documents, queries = tfidf
+    exact.save(str(tmp_path / "semantic"))
+    loaded = SemanticIndex.load(str(tmp_path / "semantic"), exact.fingerprint)
+    assert loaded.kind == 'flat' and loaded.dimensions == exact.dimensions
+    for a, b in zip(loaded.search(queries, 10), exact.search(queries, 10)):
+        assert np.array_equal(a, b)
+    assert SemanticIndex.load(str(tmp_path / "semantic"), "another matrix") is None
+
+
+def test_saved_index_is_only_reused_for_the_same_matrix(tmp_path, monkeypatch):
+    monkeypatch.setenv("SEMANTIC_DIMENSIONS", "8")
+    monkeypatch.setenv("SEMANTIC_INDEX", "flat")
+    monkeypatch.delenv("SEMANTIC_QUANTIZER", raising=False)
+    rng = np.random.RandomState(0)
+    documents = sparse.random(60, 40, density=0.2, format='csr', random_state=rng)
+    path = str(tmp_path / "semantic")
+    first = quiet(load_or_fit, documents, path)
+    assert quiet(load_or_fit, documents, path).fingerprint == first.fingerprint
+    # Same shape and sparsity, other values: trained again
+    changed = documents.copy()
+    changed.data = changed.data[::-1].copy()
+    assert matrix_fingerprint(changed, 8, 'flat') != first.fingerprint
+    assert quiet(load_or_fit, changed, path).fingerprint != first.fingerprint
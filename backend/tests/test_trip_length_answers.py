@@ -0,0 +1,36 @@
+"""
+Golden answers for a city with a bare trip length ("rome 3 days"). Without
+a topic the question is what to fill the days with, so the answer is the
+city's attractions rather than the visa row that "(90 days)" matches or the
+transportation row the response length preference used to pick.
+"""
+
+import pytest
+
+GOLDEN = {
+    "tokyo 3 days": "tokyo attractions",
+    "rome 3 days": "rome attractions",
+    "paris 2 days": "paris attractions",
+    "bangkok 4 days": "bangkok attractions",
+    "bali 7 days": "bali attractions",
+    "new york 4 days": "new york attractions",
+    "istanbul 2 nights": "attractions in istanbul",
+    # A trip length with a topic keeps the topic
+    "tokyo 5 days food": "tokyo dining",
+    "rome 3 days itinerary": "rome 3-day itinerary",
+}
+
+
+@pytest.mark.parametrize("query,expected", sorted(GOLDEN.items()))
+def test_trip_length_answers(ask, query, expected):
+    answer = ask(query)
+    assert expected in answer[:120].lower(), answer[:120]
+
+
+def test_trip_length_intent(chat_engine):
+    detect = chat_engine._detect_query_intent
+    assert detect("rome 3 days")['is_trip_length']
+    assert detect("Kyoto for 2 nights")['is_trip_length']
+    assert not detect("rome 3 days itinerary")['is_trip_length']
+    assert not detect("japan visa 90 days")['is_trip_length']
+    assert not detect("things to do in rome")['is_trip_length']
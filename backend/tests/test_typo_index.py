@@ -0,0 +1,88 @@
+import pickle
+import random
+
+import pytest
+
+from typo_index import TypoIndex, build_typo_index, edit_distance
+
+TEXT = """
+Kyoto temples and gardens are best seen early in the morning. Restaurants
+around the station serve ramen, tempura and sushi. Transportation between
+Osaka and Kyoto is quick by train; accommodation near Gion is expensive.
+Recommendations for museums, markets, castles and shrines change by season.
+""" * 25
+
+
+@pytest.fixture(scope="module")
+def index():
+    index = TypoIndex()
+    index.add_vocabulary([TEXT])
+    for place in ["kyoto", "osaka", "kuala lumpur", "nagasaki", "nara"]:
+        index.add_term(place, 1, is_place=True, is_major=True)
+    index.add_term("kawagoe", 1, is_place=True)
+    return index
+
+
+def brute_force(index, term):
+    """lookup() by comparing term with every dictionary term."""
+    best_key = None
+    for candidate in index.counts:
+        if candidate == term:
+            continue
+        max_distance = index.allowed_distance(term, candidate)
+        if max_distance == 0:
+            continue
+        distance = edit_distance(term, candidate, max_distance)
+        if distance <= max_distance:
+            key = (distance, candidate not in index.places, -index.counts[candidate], candidate)
+            best_key = min(best_key, key) if best_key else key
+    return (best_key[3], best_key[0]) if best_key else None
+
+
+def misspell(word, rng):
+    i = rng.randrange(len(word))
+    edit = rng.choice(['delete', 'insert', 'replace', 'swap'])
+    letter = rng.choice('abcdefghijklmnopqrstuvwxyz')
+    if edit == 'delete':
+        return word[:i] + word[i + 1:]
+    if edit == 'insert':
+        return word[:i] + letter + word[i:]
+    if edit == 'replace':
+        return word[:i] + letter + word[i + 1:]
+    return word[:i] + word[i + 1:i + 2] + word[i] + word[i + 2:]
+
+
+def test_lookup_matches_brute_force(index):
+    rng = random.Random(3)
+    words = sorted(index.counts)
+    queries = [misspell(misspell(rng.choice(words), rng), rng) for _ in range(300)]
+    for term in queries:
+        assert index.lookup(term) == brute_force(index, term), term
+
+
+def test_corrections_keep_case_and_spacing(index):
+    assert index.correct("Resturants in  Kyotto?") == "Restaurants in  Kyoto?"
+    assert index.correct("hotels in kuala lumpar") == "hotels in kuala lumpur"
+    assert index.correct("TRANSPORTATON to NAGASKI") == "TRANSPORTATION to NAGASAKI"
+
+
+def test_known_and_short_words_are_left_alone(index):
+    assert index.correct("temples gardens nara") == "temples gardens nara"
+    # Inflections of dataset words are known words
+    assert index.correct("temple garden seasons") == "temple garden seasons"
+    # Words under five letters are never touched, minor places need six
+    assert index.correct("kyto kawgo kawago") == "kyto kawgo kawagoe"
+
+
+def test_pickled_index_corrects_the_same(index):
+    queries = ["Resturants in Kyto", "kuala lumpar ramen", "shrnies near gion", "temples in naar"]
+    restored = pickle.loads(pickle.dumps(index))
+    assert [restored.correct(q) for q in queries] == [index.correct(q) for q in queries]
+
+
+def test_dataset_index_corrects_places(chat_engine):
+    typo_index = chat_engine.typo_index
+    assert typo_index.correct("tokio attractions") == "tokyo attractions"
+    assert typo_index.correct("hotels in Barcelna") == "hotels in Barcelona"
+    assert typo_index.correct("what to eat in singapore") == "what to eat in singapore"
+    assert len(build_typo_index(["tiny corpus"])) < len(typo_index)
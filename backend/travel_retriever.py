@@ -8,8 +8,35 @@ import re
 import pandas as pd
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Dict, Tuple, Optional
+from sklearn.utils.extmath import safe_sparse_dot
+from sklearn.preprocessing import normalize
+from scipy import sparse
+from typing import Iterable, List, Dict, Tuple, Optional
+from hashed_tfidf import HashedTfidf, build_workers, iter_csv_chunks
+from gazetteer import get_gazetteer
+from near_duplicates import compact_corpus, compaction_enabled
+
+
+def question_type(q_text: str) -> str:
+    """Question type ('where', 'food', ..., 'general') used to improve matching."""
+    q_lower = str(q_text).lower()
+    if any(kw in q_lower for kw in ['where', 'location', 'place', 'destination']):
+        return 'where'
+    elif any(kw in q_lower for kw in ['what', 'which', 'activities', 'attractions', 'things to do']):
+        return 'what'
+    elif any(kw in q_lower for kw in ['when', 'time', 'season', 'best time', 'weather']):
+        return 'when'
+    elif any(kw in q_lower for kw in ['how', 'way', 'method', 'get to', 'travel']):
+        return 'how'
+    elif any(kw in q_lower for kw in ['recommend', 'suggest', 'best', 'top']):
+        return 'recommendation'
+    elif any(kw in q_lower for kw in ['cost', 'price', 'budget', 'expensive', 'cheap']):
+        return 'cost'
+    elif any(kw in q_lower for kw in ['hotel', 'accommodation', 'stay', 'lodging']):
+        return 'accommodation'
+    elif any(kw in q_lower for kw in ['food', 'restaurant', 'cuisine', 'eat', 'dining']):
+        return 'food'
+    return 'general'
 
 
 class TravelRetriever:
@@ -26,19 +53,56 @@ When giving recommendations, give 3–6 options with clear reasons.
 When giving itineraries, provide day-by-day plans.
 If multiple contexts conflict, point it out."""
 
-    def __init__(self, csv_path: str):
+    def __init__(self, csv_path: str, corpus: Optional[pd.DataFrame] = None, vectorizer_mode: Optional[str] = None,
+                 compact: Optional[bool] = None, pack=None, semantic: Optional[str] = None):
         """
         Initialize the retriever with CSV dataset.
         
         Args:
             csv_path: Path to travel_QA CSV file
+            corpus: Optional already-parsed dataset (see chat_engines.load_corpus)
+            vectorizer_mode: 'tfidf' (fitted vocabulary, default) or 'hashing'
+                (fit-free HashedTfidf; supports chunked builds and add_entries).
+                Defaults to the RETRIEVER_VECTORIZER environment variable.
+            compact: Merge near-duplicate QA pairs before indexing (see
+                near_duplicates.py). Defaults to NEAR_DUPLICATE_COMPACTION.
+            pack: Optional KnowledgePack; the prepared frame and fitted TF-IDF
+                index are loaded from it instead of built (see knowledge_pack.py)
+            semantic: 'off', 'lsa' or 'hybrid' LSA retrieval on top of the
+                TF-IDF index (see semantic_index.py). Defaults to RETRIEVER_SEMANTIC.
         """
         self.csv_path = csv_path
+        self.corpus = corpus
+        self.vectorizer_mode = (vectorizer_mode or os.getenv("RETRIEVER_VECTORIZER", "tfidf")).lower()
         self.df = None
         self.vectorizer = None
         self.document_vectors = None
-        self._load_and_prepare_data()
-        self._build_index()
+        # Raw hashed term counts of a streamed build, hashed chunk by chunk
+        # while the CSV is read (hashing mode; consumed by _build_index)
+        self._streamed_counts: Optional[Tuple[pd.Index, sparse.csr_matrix]] = None
+        # (document_vectors, its L2-normalized copy), so the similarity of a
+        # query doesn't renormalize the whole index
+        self._normalized_documents: Optional[Tuple[sparse.csr_matrix, sparse.csr_matrix]] = None
+        # Reduced-precision copy scored instead of the matrix (see quantize)
+        self.precision = 'float64'
+        self.quantized_vectors = None
+        # intent name -> weighted unit query vector (see set_intent_boosts)
+        self.intent_boosts: Dict[str, sparse.csr_matrix] = {}
+        # canonical row's index label -> labels of the near-duplicates merged into it
+        self.near_duplicates: Dict[object, List[object]] = {}
+        # LSA index used by rank() in 'lsa' / 'hybrid' mode (see enable_semantic)
+        self.semantic_mode = 'off'
+        self.semantic = None
+        self.semantic_weight = 0.0
+        if pack is not None:
+            self._load_pack(pack)
+        else:
+            self._load_and_prepare_data()
+            if compaction_enabled() if compact is None else compact:
+                self.df, self.near_duplicates = compact_corpus(self.df)
+            self._build_index()
+        self.quantize()
+        self.enable_semantic(semantic)
 
     def _normalize_text(self, text: str) -> str:
         """Normalize text: lowercase, cleanup whitespace."""
@@ -50,53 +114,12 @@ If multiple contexts conflict, point it out."""
         return text.strip()
 
     def _extract_country(self, question: str, response: str) -> str:
-        """Extract country from question/response text."""
-        text = (question + " " + response).lower()
-        
-        countries = {
-            'usa': ['usa', 'united states', 'america', 'us', 'u.s.', 'colorado', 'california', 'nevada', 'arizona', 'new york', 'los angeles'],
-            'switzerland': ['switzerland', 'swiss', 'zermatt'],
-            'finland': ['finland', 'finnish', 'lapland'],
-            'japan': ['japan', 'japanese', 'tokyo', 'kyoto', 'osaka', 'niseko', 'hakuba', 'hokkaido', 'kamakura', 'kanazawa', 'nara'],
-            'australia': ['australia', 'australian', 'sydney', 'melbourne', 'brisbane', 'perth', 'adelaide', 'queensland', 'victoria', 'tasmania'],
-            'indonesia': ['indonesia', 'indonesian', 'bali', 'jakarta', 'yogyakarta', 'bandung', 'surabaya', 'sumatra', 'java'],
-            'thailand': ['thailand', 'thai', 'bangkok', 'phuket'],
-            'malaysia': ['malaysia', 'malaysian', 'langkawi'],
-            'maldives': ['maldives', 'maldivian'],
-            'india': ['india', 'indian', 'andaman', 'nicobar'],
-            'vietnam': ['vietnam', 'vietnamese', 'da nang', 'ho chi minh'],
-            'italy': ['italy', 'italian', 'rome', 'venice', 'amalfi', 'positano'],
-            'france': ['france', 'french', 'paris'],
-            'spain': ['spain', 'spanish', 'madrid', 'barcelona'],
-            'iceland': ['iceland', 'icelandic'],
-            'canada': ['canada', 'canadian', 'banff'],
-            'chile': ['chile', 'chilean', 'patagonia'],
-            'argentina': ['argentina', 'argentinian', 'patagonia'],
-            'new zealand': ['new zealand', 'zealand', 'queenstown', 'fiordland'],
-            'philippines': ['philippines', 'filipino']
-        }
-        
-        for country, keywords in countries.items():
-            if any(keyword in text for keyword in keywords):
-                return country
-        return ""
+        """Extract country from question/response text (first place mentioned that has one)."""
+        return get_gazetteer().first_country(question + " " + response)
 
     def _extract_city(self, question: str, response: str) -> str:
         """Extract city from question/response text."""
-        text = (question + " " + response).lower()
-        
-        cities = [
-            'aspen', 'lake tahoe', 'zermatt', 'lapland', 'niseko', 'sydney', 'melbourne',
-            'brisbane', 'perth', 'adelaide', 'bali', 'jakarta', 'yogyakarta', 'bandung',
-            'tokyo', 'kyoto', 'osaka', 'bangkok', 'phuket', 'langkawi', 'da nang',
-            'rome', 'venice', 'paris', 'madrid', 'barcelona', 'banff', 'sedona',
-            'positano', 'queenstown', 'kamakura', 'kanazawa', 'nara'
-        ]
-        
-        for city in cities:
-            if city in text:
-                return city.title()
-        return ""
+        return get_gazetteer().first_city(question + " " + response).title()
 
     def _extract_tags(self, question: str, response: str) -> str:
         """Extract tags/keywords from question/response."""
@@ -160,8 +183,29 @@ If multiple contexts conflict, point it out."""
 
     def _load_and_prepare_data(self):
         """Load CSV and expand with additional columns."""
-        print(f"Loading dataset from {self.csv_path}...")
-        self.df = pd.read_csv(self.csv_path)
+        if self.corpus is not None:
+            print("Using shared travel corpus...")
+            self.df = self.corpus.copy()
+        elif self.vectorizer_mode == 'hashing':
+            # Stream the CSV; rows are expanded and hashed chunk by chunk
+            print(f"Streaming dataset from {self.csv_path}...")
+            chunks = []
+            
+            def documents():
+                for chunk in iter_csv_chunks(self.csv_path):
+                    chunk = self._prepare_frame(chunk)
+                    chunks.append(chunk)
+                    yield chunk['searchable_document'].tolist()
+            
+            hasher = self._new_hashed_vectorizer()
+            counts = list(hasher.hash_chunks(documents(), workers=build_workers()))
+            self.df = pd.concat(chunks)
+            self._streamed_counts = (self.df.index, sparse.vstack(counts, format='csr'))
+            print(f"Dataset prepared with {len(self.df)} entries")
+            return
+        else:
+            print(f"Loading dataset from {self.csv_path}...")
+            self.df = pd.read_csv(self.csv_path)
         
         # Standardize column names
         self.df.columns = [col.strip().lower().replace(' ', '_') for col in self.df.columns]
@@ -171,57 +215,43 @@ If multiple contexts conflict, point it out."""
         self.df = self.df.drop_duplicates()
         print(f"Loaded {len(self.df)} entries (removed {initial_count - len(self.df)} duplicates)")
         
+        self.df = self._prepare_frame(self.df)
+        
+        print(f"Dataset prepared with {len(self.df)} entries")
+
+    def _prepare_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Add metadata columns and the searchable document to a block of rows."""
+        df = df.copy()
         # Expand dataset with new columns
         print("Expanding dataset with metadata columns...")
-        self.df['country'] = self.df.apply(
+        df['country'] = df.apply(
             lambda row: self._extract_country(str(row.get('question', '')), str(row.get('response', ''))),
             axis=1
         )
-        self.df['city'] = self.df.apply(
+        df['city'] = df.apply(
             lambda row: self._extract_city(str(row.get('question', '')), str(row.get('response', ''))),
             axis=1
         )
-        self.df['tags'] = self.df.apply(
+        df['tags'] = df.apply(
             lambda row: self._extract_tags(str(row.get('question', '')), str(row.get('response', ''))),
             axis=1
         )
-        self.df['season'] = self.df.apply(
+        df['season'] = df.apply(
             lambda row: self._extract_season(str(row.get('question', '')), str(row.get('response', ''))),
             axis=1
         )
-        self.df['traveler_type'] = self.df.apply(
+        df['traveler_type'] = df.apply(
             lambda row: self._extract_traveler_type(str(row.get('question', '')), str(row.get('response', ''))),
             axis=1
         )
         
         # Normalize text fields
         print("Normalizing text fields...")
-        self.df['question_normalized'] = self.df['question'].apply(self._normalize_text)
-        self.df['response_normalized'] = self.df['response'].apply(self._normalize_text)
+        df['question_normalized'] = df['question'].apply(self._normalize_text)
+        df['response_normalized'] = df['response'].apply(self._normalize_text)
         
         # Extract question type for better matching
-        def extract_question_type(q_text):
-            """Extract question type to improve matching."""
-            q_lower = str(q_text).lower()
-            if any(kw in q_lower for kw in ['where', 'location', 'place', 'destination']):
-                return 'where'
-            elif any(kw in q_lower for kw in ['what', 'which', 'activities', 'attractions', 'things to do']):
-                return 'what'
-            elif any(kw in q_lower for kw in ['when', 'time', 'season', 'best time', 'weather']):
-                return 'when'
-            elif any(kw in q_lower for kw in ['how', 'way', 'method', 'get to', 'travel']):
-                return 'how'
-            elif any(kw in q_lower for kw in ['recommend', 'suggest', 'best', 'top']):
-                return 'recommendation'
-            elif any(kw in q_lower for kw in ['cost', 'price', 'budget', 'expensive', 'cheap']):
-                return 'cost'
-            elif any(kw in q_lower for kw in ['hotel', 'accommodation', 'stay', 'lodging']):
-                return 'accommodation'
-            elif any(kw in q_lower for kw in ['food', 'restaurant', 'cuisine', 'eat', 'dining']):
-                return 'food'
-            return 'general'
-        
-        self.df['question_type'] = self.df['question'].apply(extract_question_type)
+        df['question_type'] = df['question'].apply(question_type)
         
         # Create combined searchable document per row (enhanced with question type)
         def create_searchable_doc(row):
@@ -238,15 +268,23 @@ If multiple contexts conflict, point it out."""
             combined = " ".join(parts)
             return self._normalize_text(combined)
         
-        self.df['searchable_document'] = self.df.apply(create_searchable_doc, axis=1)
+        df['searchable_document'] = df.apply(create_searchable_doc, axis=1)
         
-        print(f"Dataset prepared with {len(self.df)} entries")
+        return df
 
-    def _build_index(self):
-        """Build TF-IDF index from searchable documents."""
-        print("Building TF-IDF index...")
-        
-        self.vectorizer = TfidfVectorizer(
+    def _load_pack(self, pack):
+        """Take the prepared frame and the fitted TF-IDF index from a knowledge pack."""
+        print(f"Loading knowledge pack {pack.version}...")
+        self.vectorizer_mode = 'tfidf'
+        self.df = pack.frame()
+        self.near_duplicates = pack.near_duplicates()
+        self.vectorizer = self._new_tfidf_vectorizer()
+        self.document_vectors = pack.load_tfidf(self.vectorizer)
+        print(f"Knowledge pack loaded: {len(self.df)} entries, vocabulary size {len(self.vectorizer.vocabulary_)}")
+
+    def _new_tfidf_vectorizer(self) -> TfidfVectorizer:
+        """The (unfitted) TF-IDF vectorizer of the default index."""
+        return TfidfVectorizer(
             max_features=10000,
             ngram_range=(1, 2),  # Unigrams and bigrams
             min_df=2,  # Ignore terms in < 2 documents
@@ -255,57 +293,256 @@ If multiple contexts conflict, point it out."""
             lowercase=True,
             strip_accents='unicode'
         )
+
+    def _new_hashed_vectorizer(self) -> HashedTfidf:
+        """The (empty) HashedTfidf of the hashing index."""
+        return HashedTfidf(
+            n_features=2 ** 18,
+            ngram_range=(1, 2),  # Unigrams and bigrams
+            min_df=2,  # Ignore terms in < 2 documents
+            max_df=0.95,  # Ignore terms in > 95% documents
+            stop_words='english',
+            lowercase=True,
+            strip_accents='unicode'
+        )
+
+    def _build_index(self):
+        """Build TF-IDF index from searchable documents."""
+        documents = self.df['searchable_document'].tolist()
+        
+        if self.vectorizer_mode == 'hashing':
+            print("Building hashed TF-IDF index...")
+            self.vectorizer = self._new_hashed_vectorizer()
+            if self._streamed_counts is not None:
+                # Counts were hashed while streaming; keep the rows compaction kept
+                labels, counts = self._streamed_counts
+                self._streamed_counts = None
+                counts = counts[labels.get_indexer(self.df.index)]
+                self.vectorizer.partial_fit_counts(counts)
+                self.document_vectors = self.vectorizer.weight(counts)
+            else:
+                self.document_vectors = self.vectorizer.fit_transform(documents)
+            print(f"Hashed TF-IDF index built over {self.vectorizer.n_docs} documents")
+            return
+        
+        print("Building TF-IDF index...")
+        
+        self.vectorizer = self._new_tfidf_vectorizer()
         
         # Fit and transform documents
-        documents = self.df['searchable_document'].tolist()
         self.document_vectors = self.vectorizer.fit_transform(documents)
         
         print(f"TF-IDF index built with vocabulary size: {len(self.vectorizer.vocabulary_)}")
 
-    def retrieve(self, query: str, top_k: int = 6) -> List[Dict]:
+    def enable_semantic(self, mode: Optional[str] = None, index=None):
+        """
+        Switch LSA retrieval on or off (see semantic_index.py).
+        
+        Args:
+            mode: 'off', 'lsa' (rank by the semantic index alone) or 'hybrid'
+                (fuse it with the TF-IDF cosine). Defaults to RETRIEVER_SEMANTIC.
+            index: Optional SemanticIndex to use; by default the saved one
+                matching this TF-IDF index is loaded (or trained and saved)
+        """
+        from semantic_index import hybrid_weight, load_or_fit, semantic_mode
+        mode = semantic_mode(mode)
+        if mode != 'off' and (self.vectorizer_mode != 'tfidf' or self.document_vectors is None):
+            print("Warning: Semantic retrieval needs the fitted TF-IDF index (RETRIEVER_VECTORIZER=tfidf); leaving it off")
+            mode = 'off'
+        if mode == 'off':
+            self.semantic_mode, self.semantic = 'off', None
+            return
+        self.semantic = index if index is not None else load_or_fit(self.document_vectors)
+        self.semantic_weight = hybrid_weight()
+        self.semantic_mode = mode
+        print(f"Semantic retrieval: {mode}")
+
+    def quantize(self, precision: Optional[str] = None):
+        """
+        Score queries against a float32 / float16 / int8 copy of the document
+        matrix (see quantization.py); 'float64' scores the matrix itself.
+        Defaults to RETRIEVER_PRECISION.
+        """
+        from quantization import QuantizedTfidf, retriever_precision
+        self.precision = retriever_precision(precision)
+        if self.precision == 'float64' or self.document_vectors is None:
+            self.quantized_vectors = None
+            return
+        self.quantized_vectors = QuantizedTfidf(self.document_vectors, self.precision)
+        print(f"Document vectors quantized to {self.precision} ({self.quantized_vectors.nbytes() / 2 ** 20:.1f} MB)")
+
+    def add_entries(self, new_rows: pd.DataFrame, update_idf: bool = True) -> int:
+        """
+        Append question/response rows to a hashed index without refitting.
+        Rows whose question is already indexed are skipped; added rows get
+        new index labels after the existing ones.
+        
+        Args:
+            new_rows: DataFrame with at least 'question' and 'response' columns
+            update_idf: Also fold the new rows into the document frequencies
+                (existing document vectors keep their original weights)
+        
+        Returns:
+            Number of rows added
+        """
+        if self.vectorizer_mode != 'hashing':
+            raise ValueError("add_entries requires vectorizer_mode='hashing'; the fitted TF-IDF index must be rebuilt")
+        
+        new_rows = new_rows.copy()
+        new_rows.columns = [col.strip().lower().replace(' ', '_') for col in new_rows.columns]
+        new_rows = self._prepare_frame(new_rows.drop_duplicates())
+        new_rows = new_rows[
+            ~new_rows['question_normalized'].isin(self.df['question_normalized']) &
+            ~new_rows['question_normalized'].duplicated()
+        ]
+        if new_rows.empty:
+            return 0
+        start = int(self.df.index.max()) + 1 if len(self.df) else 0
+        new_rows.index = pd.RangeIndex(start, start + len(new_rows))
+        
+        counts = self.vectorizer.hash_counts(new_rows['searchable_document'].tolist())
+        if update_idf:
+            self.vectorizer.partial_fit_counts(counts)
+        self.document_vectors = sparse.vstack(
+            [self.document_vectors, self.vectorizer.weight(counts)], format='csr'
+        )
+        self.df = pd.concat([self.df, new_rows])
+        if self.quantized_vectors is not None:
+            self.quantize(self.precision)
+        return len(new_rows)
+
+    def set_intent_boosts(self, keywords: Dict[str, str], weights: Optional[Dict[str, float]] = None):
+        """
+        Precompute intent boost vectors in the index's vector space.
+        
+        Args:
+            keywords: intent name -> keyword text describing the intent
+            weights: intent name -> weight of its (unit length) boost vector
+                relative to the unit query vector (default 1.0)
+        """
+        weights = weights or {}
+        self.intent_boosts = {}
+        if self.vectorizer is None:
+            return
+        for intent, text in keywords.items():
+            vector = normalize(self.vectorizer.transform([self._normalize_text(text)]))
+            self.intent_boosts[intent] = (vector * float(weights.get(intent, 1.0))).tocsr()
+
+    def retrieve(self, query: str, top_k: int = 6, boosts: Iterable[str] = ()) -> List[Dict]:
         """
         Retrieve top-k most relevant rows using TF-IDF cosine similarity.
         
         Args:
             query: User query string
             top_k: Number of results to retrieve (default 6, range 5-8)
+            boosts: Intent names whose precomputed boost vectors are added
+                to the query vector (see set_intent_boosts)
         
         Returns:
             List of dictionaries containing retrieved rows with similarity scores
         """
+        return self.retrieve_many([query], [top_k], [boosts])[0]
+    
+    def retrieve_many(self, queries: List[str], top_ks: List[int], boosts: Optional[List[Iterable[str]]] = None) -> List[List[Dict]]:
+        """
+        retrieve() for several queries at once: one vectorizer pass and one
+        sparse product against the document matrix for the whole batch.
+        
+        Args:
+            queries: User query strings
+            top_ks: Number of results for each query
+            boosts: Intent boosts for each query (see retrieve)
+        
+        Returns:
+            One retrieve() result per query, in order
+        """
+        return [
+            [self.row_dict(idx, score) for idx, score in zip(indices, scores)]
+            for indices, scores in self.rank(queries, top_ks, boosts)
+        ]
+    
+    def rank(self, queries: List[str], top_ks: List[int], boosts: Optional[List[Iterable[str]]] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Top-k row positions (in self.df) and cosine similarities for each query.
+        
+        Args:
+            queries: User query strings
+            top_ks: Number of results for each query (clamped to 5-25)
+            boosts: Intent boosts for each query (see retrieve)
+        
+        Returns:
+            One (indices, similarities) pair per query, best first
+        """
         if self.vectorizer is None or self.document_vectors is None:
-            return []
-        
-        # Normalize query
-        query_normalized = self._normalize_text(query)
-        
-        # Vectorize query
-        query_vector = self.vectorizer.transform([query_normalized])
-        
-        # Compute cosine similarity
-        similarities = cosine_similarity(query_vector, self.document_vectors)[0]
-        
-        # Get top-k indices
-        top_k = max(5, min(25, top_k))  # Ensure between 5-25
-        top_indices = np.argsort(similarities)[::-1][:top_k]
-        
-        # Build results
-        results = []
-        for idx in top_indices:
-            row = self.df.iloc[idx]
-            results.append({
-                'question': str(row.get('question', '')),
-                'response': str(row.get('response', '')),
-                'country': str(row.get('country', '')),
-                'city': str(row.get('city', '')),
-                'tags': str(row.get('tags', '')),
-                'season': str(row.get('season', '')),
-                'traveler_type': str(row.get('traveler_type', '')),
-                'question_type': str(row.get('question_type', '')),  # Include question type
-                'similarity_score': float(similarities[idx])
-            })
-        
-        return results
+            return [(np.array([], dtype=np.int64), np.array([])) for _ in queries]
+        
+        # Normalize and vectorize the queries
+        query_vectors = self.vectorizer.transform([self._normalize_text(q) for q in queries])
+        
+        # Add the boost vector of every active intent (they combine, and no
+        # extra text is tokenized per request)
+        if boosts is not None:
+            rows = []
+            for query_boosts in boosts:
+                row = sparse.csr_matrix((1, query_vectors.shape[1]))
+                for intent in query_boosts:
+                    boost = self.intent_boosts.get(intent)
+                    if boost is not None:
+                        row = row + boost
+                rows.append(row)
+            query_vectors = query_vectors + sparse.vstack(rows, format='csr')
+        
+        if self.semantic_mode == 'lsa':
+            return self._rank_semantic(query_vectors, top_ks)
+        
+        if self.quantized_vectors is not None:
+            similarities = self.quantized_vectors.similarities(query_vectors)
+        else:
+            # Cosine similarity (same arithmetic as sklearn's cosine_similarity)
+            similarities = safe_sparse_dot(normalize(query_vectors), self._unit_documents().T, dense_output=True)
+        if self.semantic_mode == 'hybrid':
+            similarities = self.semantic.fuse(query_vectors, similarities, self.semantic_weight)
+        
+        ranked = []
+        for row_similarities, top_k in zip(similarities, top_ks):
+            # Get top-k indices
+            top_k = max(5, min(25, top_k))  # Ensure between 5-25
+            top_indices = np.argsort(row_similarities)[::-1][:top_k]
+            ranked.append((top_indices, row_similarities[top_indices]))
+        return ranked
+    
+    def _rank_semantic(self, query_vectors, top_ks: List[int]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """rank() by the LSA index alone: nearest rows of the ANN index, no scan of the TF-IDF matrix."""
+        top_ks = [max(5, min(25, top_k)) for top_k in top_ks]
+        scores, ids = self.semantic.search(query_vectors, max(top_ks))
+        ranked = []
+        for row_scores, row_ids, top_k in zip(scores, ids, top_ks):
+            found = row_ids[:top_k] >= 0
+            ranked.append((row_ids[:top_k][found].astype(np.int64), row_scores[:top_k][found].astype(np.float64)))
+        return ranked
+    
+    def _unit_documents(self) -> sparse.csr_matrix:
+        """L2-normalized document_vectors, recomputed only when the index changes."""
+        cached = self._normalized_documents
+        if cached is None or cached[0] is not self.document_vectors:
+            cached = (self.document_vectors, normalize(self.document_vectors))
+            self._normalized_documents = cached
+        return cached[1]
+    
+    def row_dict(self, idx: int, similarity: float) -> Dict:
+        """Dataset row at position idx in the shape returned by retrieve()."""
+        row = self.df.iloc[idx]
+        return {
+            'question': str(row.get('question', '')),
+            'response': str(row.get('response', '')),
+            'country': str(row.get('country', '')),
+            'city': str(row.get('city', '')),
+            'tags': str(row.get('tags', '')),
+            'season': str(row.get('season', '')),
+            'traveler_type': str(row.get('traveler_type', '')),
+            'question_type': str(row.get('question_type', '')),  # Include question type
+            'similarity_score': float(similarity)
+        }
 
     def format_context_for_ai(self, retrieved_rows: List[Dict]) -> str:
         """
@@ -368,17 +605,25 @@ Answer:"""
         return prompt
 
 
-def create_retriever(csv_path: Optional[str] = None) -> TravelRetriever:
+def create_retriever(csv_path: Optional[str] = None, corpus: Optional[pd.DataFrame] = None, pack=None) -> TravelRetriever:
     """
     Factory function to create TravelRetriever instance.
     Tries multiple possible CSV paths.
     
     Args:
         csv_path: Optional path to CSV file
+        corpus: Optional already-parsed dataset shared with other engines
+        pack: Optional KnowledgePack to load the prepared index from
     
     Returns:
         TravelRetriever instance
     """
+    if pack is not None:
+        return TravelRetriever(csv_path, pack=pack)
+    
+    if corpus is not None:
+        return TravelRetriever(csv_path, corpus=corpus)
+    
     if csv_path and os.path.exists(csv_path):
         return TravelRetriever(csv_path)
     
@@ -0,0 +1,307 @@
+"""
+TripMate Typo Correction Index
+SymSpell-style deletion dictionary for correcting misspelled words and place
+names in chat queries. Every dictionary term is indexed under the strings
+obtained by deleting up to max_distance characters from its prefix, so a lookup
+only generates the deletes of the query word and checks the few terms that
+share one - no scan over the dictionary.
+"""
+
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+from gazetteer import get_gazetteer
+
+
+# Known misspellings that are always corrected (checked before the fuzzy index)
+COMMON_TYPOS = {
+    'aatractions': 'attractions',
+    'atractions': 'attractions',
+    'atraction': 'attraction',
+    'accomodation': 'accommodation',
+    'acomodation': 'accommodation',
+    'accomodations': 'accommodations',
+    'resturant': 'restaurant',
+    'resturants': 'restaurants',
+    'recomendations': 'recommendations',
+    'recomendation': 'recommendation',
+    'recomend': 'recommend',
+    'recomended': 'recommended',
+    'itenerary': 'itinerary',
+    'iteneraries': 'itineraries',
+    'trasportation': 'transportation',
+    'trasport': 'transport',
+    'hokkadio': 'hokkaido',
+    'hokkido': 'hokkaido',
+    'hokkado': 'hokkaido',
+    'tokio': 'tokyo',
+    'tokyio': 'tokyo',
+    'tokyoo': 'tokyo',
+}
+
+_WORD_RE = re.compile(r"[A-Za-zÀ-ɏ]+(?:'[A-Za-z]+)?")
+
+
+def strip_accents(text: str) -> str:
+    """'São Paulo' -> 'Sao Paulo'."""
+    if text.isascii():
+        return text
+    return ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Optimal string alignment distance (adjacent transpositions count as 1), capped at max_distance + 1."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev_prev = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        row_min = cur[0]
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev_prev[j - 2] + 1)
+            row_min = min(row_min, cur[j])
+        if row_min > max_distance:
+            return max_distance + 1
+        prev_prev, prev = prev, cur
+    return prev[-1]
+
+
+# Longest multi-word place name (in words) considered for phrase corrections
+MAX_PHRASE_WORDS = 4
+
+# Bound on memoized lookups per index
+LOOKUP_CACHE_SIZE = 10000
+
+# Suffixes stripped when deciding whether an inflected word is already known
+_SUFFIXES = ("'s", 'ies', 'es', 's', 'ed', 'ing', 'ly', 'er', 'ers', 'est')
+
+
+class TypoIndex:
+    """
+    Deletion-dictionary spelling corrector.
+
+    Terms are words from the dataset vocabulary (weighted by frequency) and
+    place names (single or multi-word). Only words that are not themselves
+    known are corrected; among equally close candidates place names win,
+    then more frequent terms.
+
+    Without a full English lexicon the dataset vocabulary is the only notion
+    of a "real" word, so fuzzy corrections are deliberately conservative:
+    the first letter must match, words under five letters are never
+    touched, well-known places accept one edit (two from eight letters up),
+    obscure airport towns and frequent dataset words only one edit on words
+    of six / seven letters or more.
+    """
+
+    def __init__(self, max_distance: int = 2, prefix_length: int = 7, min_target_count: int = 20):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.min_target_count = min_target_count
+        self.counts: Dict[str, int] = {}
+        self.places: Set[str] = set()
+        self.major_places: Set[str] = set()
+        self.max_phrase_words = 1
+        self._deletes: Dict[str, object] = {}  # delete -> term or [terms]
+        # First two letters of multi-word place names (cheap filter before phrase lookups)
+        self._phrase_starts: Set[str] = set()
+        self._lookup_cache: Dict[str, Optional[Tuple[str, int]]] = {}
+
+    def __len__(self):
+        return len(self.counts)
+
+    def _delete_variants(self, term: str) -> Set[str]:
+        """All strings made by deleting up to max_distance characters from the term's prefix."""
+        prefix = term[:self.prefix_length]
+        variants = {prefix}
+        frontier = {prefix}
+        for _ in range(self.max_distance):
+            next_frontier = set()
+            for word in frontier:
+                if len(word) <= 1:
+                    continue
+                for i in range(len(word)):
+                    next_frontier.add(word[:i] + word[i + 1:])
+            next_frontier -= variants
+            variants |= next_frontier
+            frontier = next_frontier
+        return variants
+
+    def add_term(self, term: str, count: int = 1, is_place: bool = False, is_major: bool = False):
+        """Add (or re-weight) a dictionary term."""
+        term = term.lower()
+        if not term:
+            return
+        if term not in self.counts:
+            # Most deletes map to a single term; store those as a bare string
+            # instead of a one-element list to keep the dictionary small
+            deletes = self._deletes
+            for variant in self._delete_variants(term):
+                existing = deletes.get(variant)
+                if existing is None:
+                    deletes[variant] = term
+                elif isinstance(existing, str):
+                    deletes[variant] = [existing, term]
+                else:
+                    existing.append(term)
+            self.counts[term] = 0
+        self.counts[term] += count
+        if is_place:
+            self.places.add(term)
+            if is_major:
+                self.major_places.add(term)
+            if ' ' in term:
+                self.max_phrase_words = min(max(self.max_phrase_words, len(term.split())), MAX_PHRASE_WORDS)
+                self._phrase_starts.add(term[:2])
+        self._lookup_cache.clear()
+
+    def add_vocabulary(self, texts: Iterable[str]):
+        """Add every word of the given texts, counted by frequency."""
+        counter = Counter()
+        for text in texts:
+            counter.update(_WORD_RE.findall(strip_accents(str(text)).lower()))
+        for word, count in counter.items():
+            if len(word) > 1:
+                self.add_term(word, count)
+
+    def is_known(self, term: str) -> bool:
+        """Word seen in the dataset, a stop word or place name, or an inflection of a dataset word."""
+        if term in self.counts or term in ENGLISH_STOP_WORDS:
+            return True
+        for suffix in _SUFFIXES:
+            if term.endswith(suffix) and len(term) - len(suffix) >= 3:
+                stem = term[:-len(suffix)]
+                for base in (stem, stem + 'e', stem + 'y' if suffix == 'ies' else None):
+                    if base in self.counts and base not in self.places:
+                        return True
+        return False
+
+    def allowed_distance(self, term: str, candidate: str) -> int:
+        """Edits allowed to turn term into candidate."""
+        if len(term) < 5 or term[0] != candidate[0]:
+            return 0
+        if candidate in self.major_places:
+            return 1 if len(term) < 8 else 2
+        if candidate in self.places:
+            return 1 if len(term) >= 6 else 0
+        if self.counts.get(candidate, 0) >= self.min_target_count:
+            return 1 if len(term) >= 7 else 0
+        return 0
+
+    def lookup(self, term: str) -> Optional[Tuple[str, int]]:
+        """Best (correction, distance) for term, or None if nothing is close enough."""
+        term = term.lower()
+        if len(term) < 5:
+            return None
+        if term in self._lookup_cache:
+            return self._lookup_cache[term]
+        best = None
+        best_key = None
+        seen = set()
+        for variant in self._delete_variants(term):
+            candidates = self._deletes.get(variant, ())
+            if isinstance(candidates, str):
+                candidates = (candidates,)
+            for candidate in candidates:
+                if candidate in seen or candidate == term:
+                    continue
+                seen.add(candidate)
+                max_distance = self.allowed_distance(term, candidate)
+                if max_distance == 0:
+                    continue
+                distance = edit_distance(term, candidate, max_distance)
+                if distance > max_distance:
+                    continue
+                key = (distance, candidate not in self.places, -self.counts[candidate], candidate)
+                if best_key is None or key < best_key:
+                    best, best_key = candidate, key
+        result = (best, best_key[0]) if best is not None else None
+        if len(self._lookup_cache) >= LOOKUP_CACHE_SIZE:
+            self._lookup_cache.clear()
+        self._lookup_cache[term] = result
+        return result
+
+    def correct(self, text: str) -> str:
+        """
+        Correct misspelled words and place names in text.
+        Punctuation, spacing and capitalization of the original are kept.
+        """
+        tokens = list(_WORD_RE.finditer(text))
+        if not tokens:
+            return text
+        words = [strip_accents(m.group(0)).lower() for m in tokens]
+        known = [self.is_known(w) for w in words]
+        replacements = {}  # token index -> (span end token index, replacement)
+        i = 0
+        while i < len(words):
+            word = words[i]
+            if word in COMMON_TYPOS:
+                replacements[i] = (i, COMMON_TYPOS[word])
+                i += 1
+                continue
+            # Multi-word place names ("kuala lumpar" -> "kuala lumpur")
+            matched = False
+            max_n = min(self.max_phrase_words, len(words) - i) if word[:2] in self._phrase_starts else 1
+            for n in range(max_n, 1, -1):
+                span = words[i:i + n]
+                if all(known[i:i + n]):
+                    continue
+                phrase = ' '.join(span)
+                if phrase in self.places:
+                    break
+                hit = self.lookup(phrase)
+                if hit and hit[0] in self.places and len(hit[0].split()) == n:
+                    replacements[i] = (i + n - 1, hit[0])
+                    i += n
+                    matched = True
+                    break
+            if matched:
+                continue
+            if not known[i]:
+                hit = self.lookup(word)
+                if hit and ' ' not in hit[0]:
+                    replacements[i] = (i, hit[0])
+            i += 1
+
+        if not replacements:
+            return text
+
+        pieces = []
+        last = 0
+        for start, (end, replacement) in sorted(replacements.items()):
+            original = text[tokens[start].start():tokens[end].end()]
+            pieces.append(text[last:tokens[start].start()])
+            pieces.append(_match_case(original, replacement))
+            last = tokens[end].end()
+        pieces.append(text[last:])
+        return ''.join(pieces)
+
+
+def _match_case(original: str, replacement: str) -> str:
+    """Carry the capitalization style of original over to replacement."""
+    if original.isupper() and len(original) > 1:
+        return replacement.upper()
+    if original[:1].isupper():
+        return replacement.title()
+    return replacement
+
+
+def build_typo_index(texts: Iterable[str] = (), extra_places: Iterable[str] = ()) -> TypoIndex:
+    """Index built from dataset texts and the gazetteer's place names (curated ones as seeds)."""
+    index = TypoIndex()
+    index.add_vocabulary(texts)
+    gazetteer = get_gazetteer()
+    seed_places = set(gazetteer.curated) | set(extra_places)
+    all_places = {name for name in gazetteer.place_names() if all(_WORD_RE.fullmatch(w) for w in name.split())}
+    for place in seed_places | all_places:
+        # Places the dataset actually talks about are "major" correction targets
+        is_major = place in seed_places or all(index.counts.get(w, 0) >= 5 for w in place.split())
+        index.add_term(place, 1, is_place=True, is_major=is_major)
+    for correct in COMMON_TYPOS.values():
+        index.add_term(correct, index.min_target_count)
+    return index
@@ -3,6 +3,47 @@ import axios from "axios";
 import { useFreeQuota } from "../hooks/useFreeQuota";
 import API_URL from "../config";
 
+// Reads a /api/ai/chat/stream reply (Server-Sent Events): calls onText with
+// the answer received so far after every section, resolves with the metadata.
+// Throws on an "error" event or if the stream ends before "done".
+async function readChatStream(res, onText) {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  const sections = [];
+  let metadata = {};
+  let finished = false;
+  let buffer = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const message = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = "message";
+      let data = "";
+      message.split("\n").forEach((line) => {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      });
+      const payload = data ? JSON.parse(data) : {};
+      if (event === "metadata") {
+        metadata = payload;
+      } else if (event === "section") {
+        sections[payload.index] = payload.text;
+        onText(sections.join("\n\n"));
+      } else if (event === "done") {
+        finished = true;
+      } else if (event === "error") {
+        throw new Error(payload.error || "Chat stream failed");
+      }
+    }
+  }
+  if (!finished) throw new Error("The answer was cut off. Please try again.");
+  return metadata;
+}
+
 export default function AIChat({ locations, photos, token, user, tripId }) {
   // Extract destination from locations (first is origin, rest are destinations)
   const getDestinationMessage = () => {
@@ -29,6 +70,8 @@ export default function AIChat({ locations, photos, token, user, tripId }) {
   const [isLoading, setIsLoading] = useState(false);
   const messagesEndRef = useRef(null);
   const pendingMessageIdRef = useRef(null); // Track pending message to prevent double increments
+  // Server-side follow-up context is kept per open chat, not per trip
+  const conversationIdRef = useRef(`${Date.now()}-${Math.random().toString(36).slice(2)}`);
 
   // Use the free quota hook
   const {
@@ -96,60 +139,79 @@ export default function AIChat({ locations, photos, token, user, tripId }) {
       incrementOptimistic();
     }
 
+    // Set once the (still empty) assistant bubble of a streamed answer is shown
+    let streamStarted = false;
+    // Shows an error as the assistant's reply, in place of a streamed bubble
+    const showError = (content) => {
+      setMessages((prev) => [...(streamStarted ? prev.slice(0, -1) : prev), { role: "assistant", content }]);
+    };
+
     try {
-      // Send last 4 messages for context (2 user + 2 assistant)
-      const conversationHistory = messages.slice(-4).map(msg => ({
-        role: msg.role,
-        content: msg.content
-      }));
-      
-      const res = await axios.post(`${API_URL}/api/ai/chat`, {
-        message: messageToSend,
-        locations: locations,
-        photos: photos,
-        trip_id: tripId,
-        conversation_history: conversationHistory
-      }, {
-        headers: { Authorization: `Bearer ${token}` }
+      // Conversation context is kept by the server; only ask it to start
+      // over on the first question of this chat
+      const res = await fetch(`${API_URL}/api/ai/chat/stream`, {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+          Authorization: `Bearer ${token}`
+        },
+        body: JSON.stringify({
+          message: messageToSend,
+          locations: locations,
+          photos: photos,
+          trip_id: tripId,
+          conversation_id: conversationIdRef.current,
+          reset_context: messages.length <= 1
+        })
+      });
+      if (!res.ok) {
+        // Same shape as an axios error so the handling below covers both
+        const data = await res.json().catch(() => ({}));
+        const requestError = new Error(data.error || `Request failed with status ${res.status}`);
+        requestError.response = { status: res.status, data };
+        throw requestError;
+      }
+
+      // Step 2: Render the answer section by section as it streams in
+      setMessages((prev) => [...prev, { role: "assistant", content: "" }]);
+      streamStarted = true;
+      const data = await readChatStream(res, (text) => {
+        setMessages((prev) => [...prev.slice(0, -1), { role: "assistant", content: text }]);
       });
 
-      // Step 2: On success, update from server response (backend is source of truth)
-      if (res.status === 200) {
-        setMessages((prev) => [...prev, { role: "assistant", content: res.data.response }]);
+      // On success, update from server response (backend is source of truth)
+      if (!user?.is_premium) {
+        console.log("[AIChat] Server response:", data);
+        console.log("[AIChat] questions_used from server:", data.questions_used, "type:", typeof data.questions_used);
         
-        if (!user?.is_premium) {
-          console.log("[AIChat] Server response:", res.data);
-          console.log("[AIChat] questions_used from server:", res.data.questions_used, "type:", typeof res.data.questions_used);
-          
-          // Always sync from backend after successful response to ensure accuracy
-          // This is more reliable than trusting the response value which might be 0 if there was an error
-          setTimeout(async () => {
-            try {
-              const usageRes = await axios.get(`${API_URL}/api/ai/chat/usage`, {
-                params: { trip_id: tripId },
-                headers: { Authorization: `Bearer ${token}` }
-              });
-              const serverCount = usageRes.data.questions_used;
-              console.log("[AIChat] Synced from usage endpoint:", serverCount);
-              if (serverCount !== undefined && serverCount !== null) {
-                updateFromServer(serverCount);
-              }
-            } catch (syncError) {
-              console.error("[AIChat] Error syncing from usage endpoint:", syncError);
-              // Only use response value if it's not 0 (0 might indicate an error)
-              if (res.data.questions_used !== undefined && res.data.questions_used !== null && res.data.questions_used > 0) {
-                updateFromServer(res.data.questions_used);
-              } else {
-                console.warn("[AIChat] Response has invalid questions_used value, keeping current count");
-              }
+        // Always sync from backend after successful response to ensure accuracy
+        // This is more reliable than trusting the response value which might be 0 if there was an error
+        setTimeout(async () => {
+          try {
+            const usageRes = await axios.get(`${API_URL}/api/ai/chat/usage`, {
+              params: { trip_id: tripId },
+              headers: { Authorization: `Bearer ${token}` }
+            });
+            const serverCount = usageRes.data.questions_used;
+            console.log("[AIChat] Synced from usage endpoint:", serverCount);
+            if (serverCount !== undefined && serverCount !== null) {
+              updateFromServer(serverCount);
+            }
+          } catch (syncError) {
+            console.error("[AIChat] Error syncing from usage endpoint:", syncError);
+            // Only use response value if it's not 0 (0 might indicate an error)
+            if (data.questions_used !== undefined && data.questions_used !== null && data.questions_used > 0) {
+              updateFromServer(data.questions_used);
+            } else {
+              console.warn("[AIChat] Response has invalid questions_used value, keeping current count");
             }
-          }, 200); // Small delay to ensure backend has committed
-          
-          // Update immediately from response if it's a valid non-zero value
-          // (Don't update if it's 0, as that might indicate an error - wait for sync instead)
-          if (res.data.questions_used !== undefined && res.data.questions_used !== null && res.data.questions_used > 0) {
-            updateFromServer(res.data.questions_used);
           }
+        }, 200); // Small delay to ensure backend has committed
+        
+        // Update immediately from response if it's a valid non-zero value
+        // (Don't update if it's 0, as that might indicate an error - wait for sync instead)
+        if (data.questions_used !== undefined && data.questions_used !== null && data.questions_used > 0) {
+          updateFromServer(data.questions_used);
         }
       }
     } catch (error) {
@@ -164,10 +226,7 @@ export default function AIChat({ locations, photos, token, user, tripId }) {
       // Check if it's a limit reached error (403)
       if (errorResponse?.status === 403) {
         const errorMessage = errorResponse?.data?.message || errorResponse?.data?.error || "AI chat limit reached";
-        setMessages((prev) => [...prev, {
-          role: "assistant",
-          content: errorMessage
-        }]);
+        showError(errorMessage);
         // Update from server if available (might be at limit)
         if (errorResponse?.data?.questions_used !== undefined) {
           updateFromServer(errorResponse.data.questions_used);
@@ -175,11 +234,10 @@ export default function AIChat({ locations, photos, token, user, tripId }) {
         setInput("");
       } else {
         // Other errors - show error message
-        const errorMessage = errorResponse?.data?.error || errorResponse?.data?.message || "Sorry, I encountered an error. Please try again.";
-        setMessages((prev) => [...prev, {
-          role: "assistant",
-          content: errorMessage
-        }]);
+        // A failed stream has no response; its "error" event carries the text
+        const errorMessage = errorResponse?.data?.error || errorResponse?.data?.message ||
+          (streamStarted && error.message) || "Sorry, I encountered an error. Please try again.";
+        showError(errorMessage);
       }
     } finally {
       setIsLoading(false);